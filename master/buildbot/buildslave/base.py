@@ -57,7 +57,8 @@ class AbstractBuildSlave(service.BuildbotService, object):
     def checkConfig(self, name, password, max_builds=None,
                     notify_on_missing=None,
                     missing_timeout=10 * 60,   # Ten minutes
-                    properties=None, locks=None, keepalive_interval=3600):
+                    properties=None, locks=None, keepalive_interval=3600,
+                    compress_updates=False):
         """
         @param name: botname this machine will supply when it connects
         @param password: password this machine will supply when
@@ -71,6 +72,8 @@ class AbstractBuildSlave(service.BuildbotService, object):
         @param locks: A list of locks that must be acquired before this slave
                       can be used
         @type locks: dictionary
+        @param compress_updates: if true, ask the slave to compress the
+                                 output of shell commands
         """
         self.name = name = ascii2unicode(name)
 
@@ -114,6 +117,8 @@ class AbstractBuildSlave(service.BuildbotService, object):
         self.missing_timeout = missing_timeout
         self.missing_timer = None
 
+        self.compress_updates = compress_updates
+
         # a protocol connection, if we're currently connected
         self.conn = None
 
@@ -224,7 +229,8 @@ class AbstractBuildSlave(service.BuildbotService, object):
     @defer.inlineCallbacks
     def reconfigService(self, name, password, max_builds=None,
                         notify_on_missing=None, missing_timeout=3600,
-                        properties=None, locks=None, keepalive_interval=3600):
+                        properties=None, locks=None, keepalive_interval=3600,
+                        compress_updates=False):
         # Given a BuildSlave config arguments, configure this one identically.
         # Because BuildSlave objects are remotely referenced, we can't replace them
         # without disconnecting the slave, yet there's no reason to do that.
@@ -238,6 +244,7 @@ class AbstractBuildSlave(service.BuildbotService, object):
         if locks:
             self.access = locks
         self.notify_on_missing = notify_on_missing
+        self.compress_updates = compress_updates
 
         if self.missing_timeout != missing_timeout:
             running_missing_timer = self.missing_timer
@@ -56,13 +56,40 @@ class PollingChangeSource(ChangeSource):
         ChangeSource.__init__(self, name)
         self.pollInterval = pollInterval
         self.pollAtLaunch = pollAtLaunch
+        # the number of changes added by the current poll, and the factor by
+        # which the poll scheduler has lengthened pollInterval
+        self.pollChangeCount = 0
+        self.pollBackoff = 1
 
     def poll(self):
         pass
 
+    def addChange(self, **kwargs):
+        """
+        Add a change with the data API, counting it for the poll scheduler.
+        """
+        self.pollChangeCount += 1
+        return self.master.data.updates.addChange(**kwargs)
+
+    def addChanges(self, changes):
+        """
+        Add a list of changes with the data API, counting them for the poll
+        scheduler.
+        """
+        self.pollChangeCount += len(changes)
+        return self.master.data.updates.addChanges(changes)
+
+    def _getPollScheduler(self):
+        # sources belonging to the change manager share its scheduler
+        return getattr(self.parent, 'pollScheduler', None)
+
     @poll_method
     def doPoll(self):
-        d = defer.maybeDeferred(self.poll)
+        scheduler = self._getPollScheduler()
+        if scheduler:
+            d = scheduler.poll(self)
+        else:
+            d = defer.maybeDeferred(self.poll)
         d.addErrback(log.err, 'while polling for changes')
         return d
 
@@ -70,7 +97,11 @@ class PollingChangeSource(ChangeSource):
         self.doPoll()
 
     def activate(self):
-        self.doPoll.start(interval=self.pollInterval, now=self.pollAtLaunch)
+        scheduler = self._getPollScheduler()
+        delay = scheduler.startDelay(self) if scheduler else 0
+        self.pollBackoff = 1
+        self.doPoll.start(interval=self.pollInterval, now=self.pollAtLaunch,
+                          delay=delay)
 
     def deactivate(self):
         return self.doPoll.stop()
@@ -136,7 +136,7 @@ class BitbucketPullrequestPoller(base.PollingChangeSource):
                     # update database
                     yield self._setCurrentRev(nr, revision)
                     # emit the change
-                    yield self.master.data.updates.addChange(
+                    yield self.addChange(
                         author=ascii2unicode(author),
                         revision=ascii2unicode(revision),
                         revlink=ascii2unicode(revlink),
@@ -15,6 +15,7 @@
 
 from __future__ import with_statement
 
+import datetime
 import time
 
 from buildbot.util import datetime2epoch
@@ -28,6 +29,48 @@ from buildbot import util
 from buildbot.process.properties import Properties
 
 
+def convertChangeArgs(kwargs):
+    """
+    Convert the arguments of the deprecated C{master.addChange}, which may
+    use old argument names, datetimes and bytestrings, into arguments for
+    the data API's C{addChange}.
+    """
+    kwargs = kwargs.copy()
+
+    def handle_deprec(oldname, newname):
+        if oldname not in kwargs:
+            return kwargs.get(newname)
+        old = kwargs.pop(oldname)
+        if old is not None:
+            if kwargs.get(newname) is None:
+                log.msg("WARNING: change source is using deprecated "
+                        "addChange parameter '%s'" % oldname)
+                return old
+            raise TypeError("Cannot provide '%s' and '%s' to addChange"
+                            % (oldname, newname))
+        return kwargs.get(newname)
+
+    kwargs['author'] = handle_deprec("who", "author")
+    kwargs['when_timestamp'] = handle_deprec("when", "when_timestamp")
+
+    # timestamp must be an epoch timestamp now
+    if isinstance(kwargs.get('when_timestamp'), datetime.datetime):
+        kwargs['when_timestamp'] = datetime2epoch(kwargs['when_timestamp'])
+
+    # unicodify stuff
+    for k in ('comments', 'author', 'revision', 'branch', 'category',
+              'revlink', 'repository', 'codebase', 'project'):
+        if k in kwargs:
+            kwargs[k] = util.ascii2unicode(kwargs[k])
+    if kwargs.get('files'):
+        kwargs['files'] = [util.ascii2unicode(f)
+                           for f in kwargs['files']]
+    if kwargs.get('properties'):
+        kwargs['properties'] = dict((util.ascii2unicode(k), v)
+                                    for k, v in kwargs['properties'].iteritems())
+    return kwargs
+
+
 class Change:
 
     """I represent a single change to the source tree. This may involve several
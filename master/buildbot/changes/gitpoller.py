@@ -19,7 +19,10 @@ import re
 import urllib
 
 from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
 from twisted.internet import utils
+from twisted.python import failure
 from twisted.python import log
 
 from buildbot import config
@@ -33,6 +36,97 @@ class GitError(Exception):
     """Raised when git exits with code 128."""
 
 
+class GitLogParser(object):
+
+    """
+    Incremental parser for the output of C{git log -z --name-only} with
+    L{format}, which is fed as it arrives.  Completed commits are appended
+    to C{commits} as C{(rev, timestamp, author, comments, files)} tuples of
+    undecoded strings.
+
+    Each commit starts with an empty field, which cannot be confused with a
+    file name; the fields are followed by the commit's files, the first of
+    which is preceded by a newline.
+    """
+
+    format = '%x00%H%x00%ct%x00%aN <%aE>%x00%s%n%b'
+
+    def __init__(self):
+        self.buffer = ''
+        self.current = None
+        self.commits = []
+
+    def feed(self, data):
+        fields = (self.buffer + data).split('\0')
+        # the last field may be incomplete
+        self.buffer = fields.pop()
+        for field in fields:
+            self._field(field)
+
+    def close(self):
+        if self.buffer:
+            self._field(self.buffer)
+            self.buffer = ''
+        self._finishCommit()
+
+    def _field(self, field):
+        current = self.current
+        if current is None or (not field and len(current) >= 4):
+            self._finishCommit()
+            self.current = []
+        elif len(current) < 4:
+            current.append(field)
+        else:
+            if len(current) == 4:
+                current.append([])
+                if field.startswith('\n'):
+                    field = field[1:]
+            current[4].append(field)
+
+    def _finishCommit(self):
+        current = self.current
+        if current:
+            if len(current) < 4:
+                raise EnvironmentError('incomplete commit in git log output')
+            rev, timestamp, author, comments = current[:4]
+            files = current[4] if len(current) > 4 else []
+            self.commits.append((rev, timestamp, author, comments, files))
+        self.current = None
+
+
+class _StreamingProcessProtocol(protocol.ProcessProtocol):
+
+    """
+    Pass the standard output of a process to C{outputReceived} as it
+    arrives, and fire C{deferred} with C{(stderr, exit code)} at the end.
+    """
+
+    def __init__(self, outputReceived, deferred):
+        self.outputReceived = outputReceived
+        self.deferred = deferred
+        self.stderr = []
+        self.failure = None
+
+    def outReceived(self, data):
+        if self.failure:
+            return
+        try:
+            self.outputReceived(data)
+        except Exception:
+            # report the error once the process is done
+            self.failure = failure.Failure()
+
+    def errReceived(self, data):
+        self.stderr.append(data)
+
+    def processEnded(self, reason):
+        if self.failure:
+            self.deferred.errback(self.failure)
+        else:
+            self.deferred.callback(
+                (''.join(self.stderr), reason.value.exitCode))
+
+
 class GitPoller(base.PollingChangeSource, StateMixin):
 
     """This source will poll a remote git repo for changes and submit
@@ -40,14 +134,17 @@ class GitPoller(base.PollingChangeSource, StateMixin):
 
     compare_attrs = ("repourl", "branches", "workdir",
                      "pollInterval", "gitbin", "usetimestamps",
-                     "category", "project", "pollAtLaunch")
+                     "category", "project", "pollAtLaunch",
+                     "batchMetadata", "reference", "skipUnchangedFetch")
 
     def __init__(self, repourl, branches=None, branch=None,
                  workdir=None, pollInterval=10 * 60,
                  gitbin='git', usetimestamps=True,
                  category=None, project=None,
                  pollinterval=-2, fetch_refspec=None,
-                 encoding='utf-8', name=None, pollAtLaunch=False):
+                 encoding='utf-8', name=None, pollAtLaunch=False,
+                 batchMetadata=False, reference=None,
+                 skipUnchangedFetch=False):
 
         # for backward compatibility; the parameter used to be spelled with 'i'
         if pollinterval != -2:
@@ -76,6 +173,9 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         self.gitbin = gitbin
         self.workdir = workdir
         self.usetimestamps = usetimestamps
+        self.batchMetadata = batchMetadata
+        self.reference = reference
+        self.skipUnchangedFetch = skipUnchangedFetch
         self.category = category if callable(category) else ascii2unicode(category)
         self.project = ascii2unicode(project)
         self.changeCount = 0
@@ -93,6 +193,8 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         if not os.path.isabs(self.workdir):
             self.workdir = os.path.join(self.master.basedir, self.workdir)
             log.msg("gitpoller: using workdir '%s'" % self.workdir)
+        if self.reference and not os.path.isabs(self.reference):
+            self.reference = os.path.join(self.master.basedir, self.reference)
 
         d = self.getState('lastRev', {})
 
@@ -119,21 +221,41 @@ class GitPoller(base.PollingChangeSource, StateMixin):
 
         return str
 
-    def _getBranches(self):
-        d = self._dovccmd('ls-remote', [self.repourl])
+    def _getRemoteRefs(self, patterns=()):
+        """
+        List the remote references matching PATTERNS, or all of them, as
+        (ref, sha) tuples in the order given by git.
+        """
+        d = self._dovccmd('ls-remote', [self.repourl] + list(patterns))
 
         @d.addCallback
         def parseRemote(rows):
-            branches = []
+            refs = []
             for row in rows.splitlines():
                 if '\t' not in row:
                     # Not a useful line
                     continue
                 sha, ref = row.split("\t")
-                branches.append(ref)
-            return branches
+                refs.append((ref, sha))
+            return refs
         return d
 
+    def _getBranches(self):
+        d = self._getRemoteRefs()
+        d.addCallback(lambda refs: [ref for ref, sha in refs])
+        return d
+
+    def _filterBranches(self, branches):
+        if callable(self.branches):
+            return filter(self.branches, branches)
+        return filter(self._headsFilter, branches)
+
+    def _remoteRef(self, branch):
+        """The full name of BRANCH in the output of ls-remote."""
+        if branch.startswith('refs/'):
+            return branch
+        return 'refs/heads/' + branch
+
     def _headsFilter(self, branch):
         """Filter out remote references that don't begin with 'refs/heads'."""
         return branch.startswith("refs/heads/")
@@ -148,6 +270,25 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         return "refs/buildbot/%s/%s" % (urllib.quote(self.repourl, ''),
                                         self._removeHeads(branch))
 
+    def _setReference(self):
+        """
+        Make the object store of the repository at C{reference} an
+        alternate of the workdir's, so objects found there are not fetched
+        again.
+        """
+        objects = os.path.join(self.reference, 'objects')
+        if not os.path.isdir(objects):
+            # not a bare repository
+            objects = os.path.join(self.reference, '.git', 'objects')
+        alternates = os.path.join(self.workdir, 'objects', 'info',
+                                  'alternates')
+        if os.path.exists(alternates):
+            with open(alternates) as f:
+                if objects in f.read().splitlines():
+                    return
+        with open(alternates, 'a') as f:
+            f.write(objects + '\n')
+
     @defer.inlineCallbacks
     def poll(self):
         try:
@@ -155,14 +296,34 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         except GitError, e:
             log.msg(e.args[0])
             return
+        if self.reference:
+            self._setReference()
 
         branches = self.branches
-        if branches is True or callable(branches):
+        remoteRevs = None
+        if self.skipUnchangedFetch:
+            # ask for the tracked branches only, unless they are selected
+            # from the remote's list
+            patterns = []
+            if branches is not True and not callable(branches):
+                patterns = [self._remoteRef(branch) for branch in branches]
+            remoteRefs = yield self._getRemoteRefs(patterns)
+            remoteRevs = dict(remoteRefs)
+            if branches is True or callable(branches):
+                branches = self._filterBranches(
+                    [ref for ref, sha in remoteRefs])
+            # branches that cannot be found in the list are always fetched
+            branches = [branch for branch in branches
+                        if remoteRevs.get(self._remoteRef(branch))
+                        != self.lastRev.get(branch)
+                        or branch not in self.lastRev]
+            if not branches:
+                log.msg('gitpoller: no branches of "%s" have moved'
+                        % (self.repourl,))
+                return
+        elif branches is True or callable(branches):
             branches = yield self._getBranches()
-            if callable(self.branches):
-                branches = filter(self.branches, branches)
-            else:
-                branches = filter(self._headsFilter, branches)
+            branches = self._filterBranches(branches)
 
         refspecs = [
             '+%s:%s' % (self._removeHeads(branch), self._trackerBranch(branch))
@@ -178,10 +339,24 @@ class GitPoller(base.PollingChangeSource, StateMixin):
 
         revs = {}
         log.msg('gitpoller: processing changes from "%s"' % (self.repourl,))
+        parsedRevs = {}
+        if self.batchMetadata and branches:
+            try:
+                rows = yield self._dovccmd(
+                    'rev-parse', [self._trackerBranch(branch)
+                                  for branch in branches], path=self.workdir)
+                parsedRevs = dict(zip(branches, rows.split()))
+            except Exception:
+                # fall back to parsing each branch separately, so that one
+                # bad branch doesn't keep the others from being processed
+                pass
         for branch in branches:
             try:
-                rev = yield self._dovccmd(
-                    'rev-parse', [self._trackerBranch(branch)], path=self.workdir)
+                rev = parsedRevs.get(branch)
+                if rev is None:
+                    rev = yield self._dovccmd(
+                        'rev-parse', [self._trackerBranch(branch)],
+                        path=self.workdir)
                 revs[branch] = str(rev)
                 yield self._process_changes(revs[branch], branch)
             except Exception:
@@ -266,14 +441,20 @@ class GitPoller(base.PollingChangeSource, StateMixin):
             pass
 
         # get the change list
-        revListArgs = ([r'--format=%H', r'%s' % newRev] +
-                       [r'^%s' % rev for rev in self.lastRev.values()] +
-                       [r'--'])
+        revRange = ([r'%s' % newRev] +
+                    [r'^%s' % rev for rev in self.lastRev.values()] +
+                    [r'--'])
         self.changeCount = 0
-        results = yield self._dovccmd('log', revListArgs, path=self.workdir)
+        if self.batchMetadata:
+            commits = yield self._get_commits(revRange)
+            revList = [commit[0] for commit in commits]
+            metadata = dict((commit[0], commit[1:]) for commit in commits)
+        else:
+            results = yield self._dovccmd('log', [r'--format=%H'] + revRange,
+                                          path=self.workdir)
+            revList = results.split()
 
         # process oldest change first
-        revList = results.split()
         revList.reverse()
         self.changeCount = len(revList)
         self.lastRev[branch] = newRev
@@ -282,7 +463,14 @@ class GitPoller(base.PollingChangeSource, StateMixin):
             log.msg('gitpoller: processing %d changes: %s from "%s" branch "%s"'
                     % (self.changeCount, revList, self.repourl, branch))
 
+        changes = []
         for rev in revList:
+            if self.batchMetadata:
+                timestamp, author, files, comments = metadata[rev]
+                changes.append(self._changeDict(rev, branch, timestamp,
+                                                author, files, comments))
+                continue
+
             dl = defer.DeferredList([
                 self._get_commit_timestamp(rev),
                 self._get_commit_author(rev),
@@ -300,20 +488,71 @@ class GitPoller(base.PollingChangeSource, StateMixin):
 
             timestamp, author, files, comments = [r[1] for r in results]
 
-            yield self.master.data.updates.addChange(
-                author=author, revision=ascii2unicode(rev), files=files,
-                comments=comments, when_timestamp=timestamp,
-                branch=ascii2unicode(self._removeHeads(branch)),
-                project=self.project, repository=ascii2unicode(self.repourl),
-                category=self.category, src=u'git')
+            changes.append(self._changeDict(rev, branch, timestamp, author,
+                                            files, comments))
+
+        if changes:
+            yield self.addChanges(changes)
+
+    def _changeDict(self, rev, branch, timestamp, author, files, comments):
+        return dict(
+            author=author, revision=ascii2unicode(rev), files=files,
+            comments=comments, when_timestamp=timestamp,
+            branch=ascii2unicode(self._removeHeads(branch)),
+            project=self.project, repository=ascii2unicode(self.repourl),
+            category=self.category, src=u'git')
+
+    def _get_commits(self, revRange):
+        """
+        Get the metadata of all commits in C{revRange} with a single C{git
+        log}, parsing its output as it arrives.  Returns a list of C{(rev,
+        timestamp, author, files, comments)} tuples, newest first, with the
+        same values as the C{_get_commit_*} methods.
+        """
+        parser = GitLogParser()
+        args = ['-z', '--name-only', '--format=' + parser.format] + revRange
+        d = self._dovccmdStream('log', args, parser.feed, path=self.workdir)
+
+        @d.addCallback
+        def process(_):
+            parser.close()
+            commits = []
+            for rev, timestamp, author, comments, files in parser.commits:
+                if self.usetimestamps:
+                    try:
+                        timestamp = int(timestamp)
+                    except Exception:
+                        log.msg('gitpoller: caught exception converting output \'%s\' to timestamp' % timestamp)
+                        raise
+                else:
+                    timestamp = None
+                author = self._decode(author)
+                if len(author) == 0:
+                    raise EnvironmentError('could not get commit author for rev')
+                # with -z, file names are not quoted
+                files = [self._decode(file) for file in files]
+                comments = self._decode(comments.strip())
+                commits.append((rev, timestamp, author, files, comments))
+            return commits
+        return d
+
+    def _encodeArg(self, arg):
+        if isinstance(arg, list):
+            return [self._encodeArg(a) for a in arg]
+        elif isinstance(arg, unicode):
+            return arg.encode("ascii")
+        return arg
+
+    def _checkExitCode(self, code, stderr, command, args, path):
+        if code != 0:
+            if code == 128:
+                raise GitError('command %s %s in %s on repourl %s failed with exit code %d: %s'
+                               % (command, args, path, self.repourl, code, stderr))
+            raise EnvironmentError('command %s %s in %s on repourl %s failed with exit code %d: %s'
+                                   % (command, args, path, self.repourl, code, stderr))
 
     def _dovccmd(self, command, args, path=None):
-        def encodeArg(arg):
-            if isinstance(arg, list):
-                return [encodeArg(a) for a in arg]
-            elif isinstance(arg, unicode):
-                return arg.encode("ascii")
-            return arg
+        encodeArg = self._encodeArg
         d = utils.getProcessOutputAndValue(encodeArg(self.gitbin),
                                            encodeArg([command] + args),
                                            path=encodeArg(path), env=os.environ)
@@ -324,15 +563,27 @@ class GitPoller(base.PollingChangeSource, StateMixin):
                                         path):
             "utility to handle the result of getProcessOutputAndValue"
             (stdout, stderr, code) = res
-            if code != 0:
-                if code == 128:
-                    raise GitError('command %s %s in %s on repourl %s failed with exit code %d: %s'
-                                   % (command, args, path, self.repourl, code, stderr))
-                raise EnvironmentError('command %s %s in %s on repourl %s failed with exit code %d: %s'
-                                       % (command, args, path, self.repourl, code, stderr))
+            self._checkExitCode(code, stderr, command, args, path)
             return stdout.strip()
         d.addCallback(_convert_nonzero_to_failure,
                       command,
                       args,
                       path)
         return d
+
+    def _dovccmdStream(self, command, args, outputReceived, path=None):
+        """
+        Like L{_dovccmd}, but pass the standard output to C{outputReceived}
+        as it arrives instead of collecting it.
+        """
+        encodeArg = self._encodeArg
+        d = defer.Deferred()
+        gitbin = encodeArg(self.gitbin)
+        reactor.spawnProcess(_StreamingProcessProtocol(outputReceived, d),
+                             gitbin, [gitbin] + encodeArg([command] + args),
+                             env=os.environ, path=encodeArg(path))
+
+        @d.addCallback
+        def check((stderr, code)):
+            self._checkExitCode(code, stderr, command, args, path)
+        return d
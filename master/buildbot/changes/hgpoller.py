@@ -274,10 +274,11 @@ class HgPoller(base.PollingChangeSource):
 
         log.msg('hgpoller: processing %d changes: %r in %r'
                 % (len(revNodeList), revNodeList, self._absWorkdir()))
+        changes = []
         for rev, node in revNodeList:
             timestamp, author, files, comments = yield self._getRevDetails(
                 node)
-            yield self.master.data.updates.addChange(
+            changes.append(dict(
                 author=author,
                 revision=unicode(node),
                 files=files,
@@ -287,10 +288,13 @@ class HgPoller(base.PollingChangeSource):
                 category=ascii2unicode(self.category),
                 project=ascii2unicode(self.project),
                 repository=ascii2unicode(self.repourl),
-                src=u'hg')
-            # writing after addChange so that a rev is never missed,
-            # but at once to avoid impact from later errors
-            yield self._setCurrentRev(rev, oid=oid)
+                src=u'hg'))
+        if not changes:
+            return
+        yield self.addChanges(changes)
+        # writing after addChanges so that a rev is never missed; the changes
+        # are added in a single transaction, so either all or none are there
+        yield self._setCurrentRev(revNodeList[-1][0], oid=oid)
 
     def _processChangesFailure(self, f):
         log.msg('hgpoller: repo poll failed')
@@ -13,15 +13,93 @@
 #
 # Copyright Buildbot Team Members
 
+import random
+
 from buildbot import interfaces
 from buildbot import util
 from buildbot.process import metrics
 from buildbot.util import service
 from twisted.internet import defer
+from twisted.internet import reactor
 from twisted.python import log
 from zope.interface import implements
 
 
+class PollScheduler(object):
+
+    """
+    Runs the polls of the change manager's L{PollingChangeSource}s, as
+    configured by C{c['polling']}: it spreads the sources' first polls over
+    C{jitter} times their interval, runs at most C{maxConcurrent} polls at
+    once, and doubles the interval of a source after each poll that finds no
+    changes, up to C{maxBackoff} times its C{pollInterval}.
+    """
+
+    def __init__(self):
+        self.maxConcurrent = None
+        self.jitter = 0
+        self.maxBackoff = 1
+        self.running = 0
+        # Deferreds of the polls waiting for a slot, oldest first
+        self.waiting = []
+        # for tests
+        self._reactor = reactor
+        self._random = random.random
+
+    def reconfig(self, polling):
+        self.maxConcurrent = polling['maxConcurrent']
+        self.jitter = polling['jitter']
+        self.maxBackoff = polling['maxBackoff']
+        self._startWaiting()
+
+    def startDelay(self, source):
+        """
+        Return the number of seconds SOURCE should wait before starting to
+        poll.
+        """
+        return self._random() * self.jitter * source.pollInterval
+
+    @defer.inlineCallbacks
+    def poll(self, source):
+        """
+        Call SOURCE's C{poll} method once a slot is free, and adapt its
+        interval to the number of changes it found.
+        """
+        queued = self._reactor.seconds()
+        d = defer.Deferred()
+        self.waiting.append(d)
+        self._startWaiting()
+        yield d
+
+        started = self._reactor.seconds()
+        metrics.MetricTimeEvent.log('poll.%s.wait' % (source.name,),
+                                    started - queued)
+        source.pollChangeCount = 0
+        try:
+            yield defer.maybeDeferred(source.poll)
+        finally:
+            self.running -= 1
+            metrics.MetricTimeEvent.log('poll.%s' % (source.name,),
+                                        self._reactor.seconds() - started)
+            self._startWaiting()
+
+        if source.pollChangeCount:
+            source.pollBackoff = 1
+        else:
+            source.pollBackoff = min(source.pollBackoff * 2, self.maxBackoff)
+        source.doPoll.setInterval(source.pollInterval * source.pollBackoff)
+
+    def _startWaiting(self):
+        while self.waiting and (self.maxConcurrent is None
+                                or self.running < self.maxConcurrent):
+            self.running += 1
+            self.waiting.pop(0).callback(None)
+        metrics.MetricCountEvent.log('poll.running', self.running,
+                                     absolute=True)
+        metrics.MetricCountEvent.log('poll.waiting', len(self.waiting),
+                                     absolute=True)
+
+
 class ChangeManager(service.ReconfigurableServiceMixin, service.AsyncMultiService):
 
     """
@@ -41,12 +119,15 @@ class ChangeManager(service.ReconfigurableServiceMixin, service.AsyncMultiServic
         service.AsyncMultiService.__init__(self)
         self.setName('change_manager')
         self.master = master
+        self.pollScheduler = PollScheduler()
 
     @defer.inlineCallbacks
     def reconfigServiceWithBuildbotConfig(self, new_config):
         timer = metrics.Timer("ChangeManager.reconfigServiceWithBuildbotConfig")
         timer.start()
 
+        self.pollScheduler.reconfig(new_config.polling)
+
         removed, added = util.diffSets(
             set(self),
             new_config.change_sources)
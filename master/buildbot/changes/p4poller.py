@@ -297,7 +297,7 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
                         branch_files[branch] = [file]
 
             for branch in branch_files:
-                yield self.master.data.updates.addChange(
+                yield self.addChange(
                     author=who,
                     files=branch_files[branch],
                     comments=comments,
@@ -419,8 +419,9 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
 
     @defer.inlineCallbacks
     def submit_changes(self, changes):
-        for chdict in changes:
-            yield self.master.data.updates.addChange(src=u'svn', **chdict)
+        if changes:
+            yield self.addChanges(
+                [dict(chdict, src=u'svn') for chdict in changes])
 
     def finished_ok(self, res):
         if self.cachepath:
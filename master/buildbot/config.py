@@ -23,6 +23,7 @@ import warnings
 from buildbot import interfaces
 from buildbot import locks
 from buildbot import util
+from buildbot.db import logs as db_logs
 from buildbot.revlinks import default_revlink_matcher
 from buildbot.util import config as util_config
 from buildbot.util import safeTranslate
@@ -31,6 +32,7 @@ from buildbot.www import auth
 from buildbot.www import avatar
 from twisted.python import failure
 from twisted.python import log
+from urlparse import urlparse
 
 
 class ConfigErrors(Exception):
@@ -79,6 +81,9 @@ class MasterConfig(util.ComparableMixin):
         self.eventHorizon = 50
         self.logHorizon = None
         self.buildHorizon = None
+        self.stateBufferTime = 0
+        self.logBufferSize = 256 * 1024
+        self.logBufferTime = 0
         self.logCompressionLimit = 4 * 1024
         self.logCompressionMethod = 'bz2'
         self.logEncoding = 'utf-8'
@@ -108,6 +113,12 @@ class MasterConfig(util.ComparableMixin):
         self.caches = dict(
             Builds=15,
             Changes=10,
+            digests=50,
+        )
+        self.polling = dict(
+            maxConcurrent=None,
+            jitter=0,
+            maxBackoff=1,
         )
         self.schedulers = {}
         self.builders = []
@@ -129,11 +140,14 @@ class MasterConfig(util.ComparableMixin):
         "buildbotURL", "buildCacheSize", "builders", "buildHorizon", "caches",
         "change_source", "codebaseGenerator", "changeCacheSize", "changeHorizon",
         'db', "db_poll_interval", "db_url", "eventHorizon",
+        "logBufferSize", "logBufferTime",
         "logCompressionLimit", "logCompressionMethod", "logEncoding",
         "logHorizon", "logMaxSize", "logMaxTailSize", "manhole",
-        "collapseRequests", "metrics", "mq", "multiMaster", "prioritizeBuilders",
+        "collapseRequests", "metrics", "mq", "multiMaster", "polling",
+        "prioritizeBuilders",
         "projectName", "projectURL", "properties", "protocols", "revlink",
-        "schedulers", "services", "slavePortnum", "slaves", "status", "title", "titleURL",
+        "schedulers", "services", "slavePortnum", "slaves", "stateBufferTime",
+        "status", "title", "titleURL",
         "user_managers", "validation", 'www'
     ])
     compare_attrs = list(_known_config_keys)
@@ -236,6 +250,7 @@ class MasterConfig(util.ComparableMixin):
             config.load_mq(filename, config_dict)
             config.load_metrics(filename, config_dict)
             config.load_caches(filename, config_dict)
+            config.load_polling(filename, config_dict)
             config.load_schedulers(filename, config_dict)
             config.load_builders(filename, config_dict)
             config.load_slaves(filename, config_dict)
@@ -293,12 +308,21 @@ class MasterConfig(util.ComparableMixin):
         copy_int_param('logHorizon')
         copy_int_param('buildHorizon')
 
+        copy_int_param('logBufferSize')
+        copy_param('logBufferTime', check_type=(int, float),
+                   check_type_name='a number')
+        copy_param('stateBufferTime', check_type=(int, float),
+                   check_type_name='a number')
+
         copy_int_param('logCompressionLimit')
 
         if 'logCompressionMethod' in config_dict:
             logCompressionMethod = config_dict.get('logCompressionMethod')
-            if logCompressionMethod not in ('bz2', 'gz'):
-                error("c['logCompressionMethod'] must be 'bz2' or 'gz'")
+            if logCompressionMethod == 'lz4' and 'lz4' not in db_logs.COMPRESSION_METHODS:
+                error("c['logCompressionMethod'] is 'lz4', but the python "
+                      "module 'lz4' is not installed")
+            elif logCompressionMethod not in ('raw', 'bz2', 'gz', 'lz4'):
+                error("c['logCompressionMethod'] must be 'raw', 'bz2', 'gz' or 'lz4'")
             self.logCompressionMethod = logCompressionMethod
 
         copy_int_param('logMaxSize')
@@ -429,6 +453,15 @@ class MasterConfig(util.ComparableMixin):
             error("unrecognized keys in c['mq']: %s"
                   % (', '.join(unk),))
 
+        url = self.mq.get('url')
+        if url is not None and not (isinstance(url, basestring)
+                                    and url.startswith('redis://')):
+            error("c['mq']['url'] must be a redis:// URL")
+        elif url is not None:
+            database = urlparse(url).path.strip('/')
+            if database and not database.isdigit():
+                error("the database in c['mq']['url'] must be a number")
+
     def load_metrics(self, filename, config_dict):
         # we don't try to validate metrics keys
         if 'metrics' in config_dict:
@@ -467,6 +500,33 @@ class MasterConfig(util.ComparableMixin):
                 error(msg)
             self.caches['Changes'] = config_dict['changeCacheSize']
 
+    def load_polling(self, filename, config_dict):
+        if 'polling' not in config_dict:
+            return
+        polling = config_dict['polling']
+        if not isinstance(polling, dict):
+            error("c['polling'] must be a dictionary")
+            return
+
+        unknown = set(polling) - set(self.polling)
+        if unknown:
+            error("unknown c['polling'] key(s) %s" %
+                  ', '.join(sorted(unknown)))
+            return
+
+        maxConcurrent = polling.get('maxConcurrent')
+        if maxConcurrent is not None and (
+                not isinstance(maxConcurrent, int) or maxConcurrent < 1):
+            error("c['polling']['maxConcurrent'] must be None or a "
+                  "positive integer")
+        jitter = polling.get('jitter', 0)
+        if not isinstance(jitter, (int, float)) or not 0 <= jitter <= 1:
+            error("c['polling']['jitter'] must be a number between 0 and 1")
+        maxBackoff = polling.get('maxBackoff', 1)
+        if not isinstance(maxBackoff, (int, float)) or maxBackoff < 1:
+            error("c['polling']['maxBackoff'] must be a number of at least 1")
+        self.polling.update(polling)
+
     def load_schedulers(self, filename, config_dict):
         if 'schedulers' not in config_dict:
             return
@@ -593,7 +653,8 @@ class MasterConfig(util.ComparableMixin):
                        'rest_minimum_version', 'allowed_origins', 'jsonp',
                        'plugins', 'auth', 'avatar_methods', 'logfileName',
                        'logRotateLength', 'maxRotatedFiles', 'versions',
-                       'change_hook_dialects', 'change_hook_auth'])
+                       'change_hook_dialects', 'change_hook_auth',
+                       'change_hook_queue'])
         unknown = set(www_cfg.iterkeys()) - allowed
         if unknown:
             error("unknown www configuration parameter(s) %s" %
@@ -613,6 +674,21 @@ class MasterConfig(util.ComparableMixin):
                     cleaned_versions.append(v)
             www_cfg['versions'] = cleaned_versions
 
+        queue = www_cfg.get('change_hook_queue')
+        if queue is not None and not isinstance(queue, (bool, dict)):
+            error('Invalid www configuration value of change_hook_queue')
+        elif isinstance(queue, dict):
+            unknown = set(queue) - set(['maxSize', 'batchSize'])
+            if unknown:
+                error("unknown change_hook_queue option(s) %s" %
+                      (', '.join(unknown),))
+            for key in ('maxSize', 'batchSize'):
+                value = queue.get(key, 1)
+                if (not isinstance(value, int) or isinstance(value, bool)
+                        or value < 1):
+                    error("change_hook_queue option %s must be a positive "
+                          "integer" % (key,))
+
         self.www.update(www_cfg)
 
     def load_services(self, filename, config_dict):
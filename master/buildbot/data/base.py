@@ -88,6 +88,18 @@ class Endpoint(object):
     def startConsuming(self, callback, options, kwargs):
         raise NotImplementedError
 
+    @defer.inlineCallbacks
+    def mapResults(self, fn, results):
+        # apply fn, which may return a Deferred, to each result, keeping the
+        # pagination of a ListResult
+        rv = []
+        for r in results:
+            rv.append((yield fn(r)))
+        if isinstance(results, ListResult):
+            rv = ListResult(rv, offset=results.offset, total=results.total,
+                            limit=results.limit)
+        defer.returnValue(rv)
+
     def __repr__(self):
         return "endpoint for " + self.pathPatterns
 
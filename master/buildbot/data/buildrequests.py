@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.data import types
 from buildbot.db.buildrequests import AlreadyClaimedError
 
@@ -107,6 +108,16 @@ class BuildRequestsEndpoint(Db2DataMixin, base.Endpoint):
         /builders/n:builderid/buildrequests
     """
     rootLinkName = 'buildrequests'
+    fieldMapping = {
+        'buildrequestid': 'buildrequests.id',
+        'buildsetid': 'buildrequests.buildsetid',
+        'builderid': 'buildrequests.builderid',
+        'priority': 'buildrequests.priority',
+        'claimed_by_masterid': 'buildrequest_claims.masterid',
+        'results': 'buildrequests.results',
+        'submitted_at': 'buildrequests.submitted_at',
+        'complete_at': 'buildrequests.complete_at',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
@@ -122,13 +133,14 @@ class BuildRequestsEndpoint(Db2DataMixin, base.Endpoint):
             claimed = resultSpec.popBooleanFilter('claimed')
 
         bsid = resultSpec.popOneFilter('buildsetid', 'eq')
+        resultSpec.fieldMapping = self.fieldMapping
         buildrequests = yield self.master.db.buildrequests.getBuildRequests(
             builderid=builderid,
             complete=complete,
             claimed=claimed,
-            bsid=bsid)
-        defer.returnValue(
-            [(yield self.db2data(br)) for br in buildrequests])
+            bsid=bsid,
+            resultSpec=resultSpec)
+        defer.returnValue((yield self.mapResults(self.db2data, buildrequests)))
 
     def startConsuming(self, callback, options, kwargs):
         return self.master.mq.startConsuming(callback,
@@ -164,10 +176,14 @@ class BuildRequest(base.ResourceType):
 
     @defer.inlineCallbacks
     def generateEvent(self, brids, event):
+        # get the build requests in a single query, and munge the results for
+        # the notifications
+        brs = yield self.master.data.get(
+            ('buildrequests',),
+            filters=[resultspec.Filter('buildrequestid', 'eq', list(brids))])
+        brs = dict((br['buildrequestid'], br) for br in brs)
         for _id in brids:
-            # get the build and munge the result for the notification
-            br = yield self.master.data.get(('buildrequests', str(_id)))
-            self.produceEvent(br, event)
+            self.produceEvent(brs.get(_id), event)
 
     @defer.inlineCallbacks
     def callDbBuildRequests(self, brids, db_callable, event, **kw):
@@ -242,4 +258,7 @@ class BuildRequest(base.ResourceType):
     @base.updateMethod
     @defer.inlineCallbacks
     def unclaimExpiredRequests(self, old, _reactor=reactor):
-        yield self.master.db.buildrequests.unclaimExpiredRequests(old, _reactor=_reactor)
+        brids = yield self.master.db.buildrequests.unclaimExpiredRequests(
+            old, _reactor=_reactor)
+        if brids:
+            yield self.generateEvent(brids, "unclaimed")
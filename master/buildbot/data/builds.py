@@ -85,18 +85,31 @@ class BuildsEndpoint(Db2DataMixin, base.Endpoint):
         /buildrequests/n:buildrequestid/builds
     """
     rootLinkName = 'builds'
+    fieldMapping = {
+        'buildid': 'builds.id',
+        'number': 'builds.number',
+        'builderid': 'builds.builderid',
+        'buildrequestid': 'builds.buildrequestid',
+        'buildslaveid': 'builds.buildslaveid',
+        'masterid': 'builds.masterid',
+        'started_at': 'builds.started_at',
+        'complete_at': 'builds.complete_at',
+        'state_string': 'builds.state_string',
+        'results': 'builds.results',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
         # following returns None if no filter
         # true or false, if there is a complete filter
         complete = resultSpec.popBooleanFilter("complete")
+        resultSpec.fieldMapping = self.fieldMapping
         builds = yield self.master.db.builds.getBuilds(
             builderid=kwargs.get('builderid'),
             buildrequestid=kwargs.get('buildrequestid'),
-            complete=complete)
-        defer.returnValue(
-            [(yield self.db2data(dbdict)) for dbdict in builds])
+            complete=complete,
+            resultSpec=resultSpec)
+        defer.returnValue((yield self.mapResults(self.db2data, builds)))
 
     def startConsuming(self, callback, options, kwargs):
         builderid = kwargs.get('builderid')
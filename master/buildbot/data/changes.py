@@ -30,14 +30,17 @@ from twisted.python import log
 class FixerMixin(object):
 
     @defer.inlineCallbacks
-    def _fixChange(self, change):
+    def _fixChange(self, change, fetchSourcestamp=True):
         # TODO: make these mods in the DB API
         if change:
             change = change.copy()
             change['when_timestamp'] = datetime2epoch(change['when_timestamp'])
 
-            sskey = ('sourcestamps', str(change['sourcestampid']))
-            change['sourcestamp'] = yield self.master.data.get(sskey)
+            if fetchSourcestamp:
+                sskey = ('sourcestamps', str(change['sourcestampid']))
+                change['sourcestamp'] = yield self.master.data.get(sskey)
+            else:
+                change['sourcestamp'] = None
             del change['sourcestampid']
         defer.returnValue(change)
 
@@ -64,6 +67,19 @@ class ChangesEndpoint(FixerMixin, base.Endpoint):
         /sourcestamps/n:ssid/changes
     """
     rootLinkName = 'changes'
+    fieldMapping = {
+        'changeid': 'changes.changeid',
+        'author': 'changes.author',
+        'comments': 'changes.comments',
+        'revision': 'changes.revision',
+        'when_timestamp': 'changes.when_timestamp',
+        'branch': 'changes.branch',
+        'category': 'changes.category',
+        'revlink': 'changes.revlink',
+        'repository': 'changes.repository',
+        'project': 'changes.project',
+        'codebase': 'changes.codebase',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
@@ -78,10 +94,16 @@ class ChangesEndpoint(FixerMixin, base.Endpoint):
             else:
                 changes = []
         else:
-            changes = yield self.master.db.changes.getChanges()
+            resultSpec.fieldMapping = self.fieldMapping
+            changes = yield self.master.db.changes.getChanges(
+                resultSpec=resultSpec)
 
-        changes = [(yield self._fixChange(ch)) for ch in changes]
-        defer.returnValue(changes)
+        # the sourcestamp is not worth fetching if it will be dropped
+        fetchSourcestamp = (not resultSpec.fields
+                            or 'sourcestamp' in resultSpec.fields)
+        defer.returnValue((yield self.mapResults(
+            lambda change: self._fixChange(change, fetchSourcestamp),
+            changes)))
 
     def startConsuming(self, callback, options, kwargs):
         return self.master.mq.startConsuming(callback,
@@ -123,6 +145,48 @@ class Change(base.ResourceType):
                   src=None, _reactor=reactor):
         metrics.MetricCountEvent.log("added_changes", 1)
 
+        chdict = yield self._prepareChange(
+            files=files, comments=comments, author=author, revision=revision,
+            when_timestamp=when_timestamp, branch=branch, category=category,
+            revlink=revlink, properties=properties, repository=repository,
+            codebase=codebase, project=project, src=src)
+
+        # add the Change to the database
+        changeid = yield self.master.db.changes.addChange(_reactor=_reactor,
+                                                          **chdict)
+
+        yield self._changeAdded(changeid, revision)
+        defer.returnValue(changeid)
+
+    @base.updateMethod
+    @defer.inlineCallbacks
+    def addChanges(self, changes, _reactor=reactor):
+        """
+        Add several changes, each given as a dictionary of the arguments of
+        L{addChange}, in a single database transaction.  The events for the
+        new changes are produced once they are all in the database.  Returns
+        the list of new change ids.
+        """
+        metrics.MetricCountEvent.log("added_changes", len(changes))
+
+        chdicts = []
+        for change in changes:
+            chdict = yield self._prepareChange(**change)
+            chdicts.append(chdict)
+
+        changeids = yield self.master.db.changes.addChanges(chdicts,
+                                                            _reactor=_reactor)
+
+        for changeid, change in zip(changeids, changes):
+            yield self._changeAdded(changeid, change.get('revision'))
+        defer.returnValue(changeids)
+
+    @defer.inlineCallbacks
+    def _prepareChange(self, files=None, comments=None, author=None,
+                       revision=None, when_timestamp=None, branch=None,
+                       category=None, revlink=u'', properties=None,
+                       repository=u'', codebase=None, project=u'', src=None):
+        # returns the arguments for the db API's addChange
         if properties is None:
             properties = {}
         # add the source to the properties
@@ -169,8 +233,7 @@ class Change(base.ResourceType):
         else:
             codebase = codebase or u''
 
-        # add the Change to the database
-        changeid = yield self.master.db.changes.addChange(
+        defer.returnValue(dict(
             author=author,
             files=files,
             comments=comments,
@@ -183,9 +246,10 @@ class Change(base.ResourceType):
             repository=repository,
             codebase=codebase,
             project=project,
-            uid=uid,
-            _reactor=_reactor)
+            uid=uid))
 
+    @defer.inlineCallbacks
+    def _changeAdded(self, changeid, revision):
         # get the change and munge the result for the notification
         change = yield self.master.data.get(('changes', str(changeid)))
         change = copy.deepcopy(change)
@@ -194,5 +258,3 @@ class Change(base.ResourceType):
         # log, being careful to handle funny characters
         msg = u"added change with revision %s to database" % (revision,)
         log.msg(msg.encode('utf-8', 'replace'))
-
-        defer.returnValue(changeid)
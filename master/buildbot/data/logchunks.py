@@ -107,18 +107,63 @@ class RawLogChunkEndpoint(LogChunkEndpointBase):
             dbdict = yield self.master.db.logs.getLog(logid)
             if not dbdict:
                 return
-        lastline = max(0, dbdict['num_lines'] - 1)
+        reader = RawLogReader(self.master, logid, dbdict['num_lines'],
+                              stripChannel=dbdict['type'] == 's')
+        defer.returnValue({
+            'raw': reader,
+            'mime-type': u'text/html' if dbdict['type'] == 'h' else u'text/plain',
+            'filename': dbdict['slug']})
+
+
+class RawLogReader(object):
+
+    """
+    Read the content of a log a few chunks at a time, so that even huge logs
+    can be sent without holding them in memory.  Each call to C{read} returns
+    a Deferred firing with the next piece of text, or None at the end of the
+    log.  For stream logs, the channel prefix is stripped from each line.
+    """
+
+    pieceSize = 65536
+
+    def __init__(self, master, logid, num_lines, stripChannel=False):
+        self.master = master
+        self.logid = logid
+        self.num_lines = num_lines
+        self.stripChannel = stripChannel
+        self.nextLine = 0
 
+    @defer.inlineCallbacks
+    def read(self):
+        if self.nextLine >= self.num_lines:
+            return
+        lastline = yield self.master.db.logs.getLogLinesEnd(
+            self.logid, self.nextLine, self.pieceSize)
+        if lastline is None:
+            return
+        lastline = min(lastline, self.num_lines - 1)
         logLines = yield self.master.db.logs.getLogLines(
-            logid, 0, lastline)
+            self.logid, self.nextLine, lastline)
 
-        if dbdict['type'] == 's':
-            logLines = "\n".join([line[1:] for line in logLines.splitlines()])
+        if self.stripChannel:
+            logLines = u"\n".join([line[1:]
+                                   for line in logLines.split(u'\n')[:-1]])
+            # lines are separated, not terminated, by newlines
+            if self.nextLine > 0:
+                logLines = u'\n' + logLines
 
-        defer.returnValue({
-            'raw': logLines,
-            'mime-type': u'text/html' if dbdict['type'] == 'h' else u'text/plain',
-            'filename': dbdict['slug']})
+        self.nextLine = lastline + 1
+        defer.returnValue(logLines)
+
+    @defer.inlineCallbacks
+    def readAll(self):
+        pieces = []
+        while True:
+            piece = yield self.read()
+            if piece is None:
+                break
+            pieces.append(piece)
+        defer.returnValue(u''.join(pieces))
 
 
 class LogChunk(base.ResourceType):
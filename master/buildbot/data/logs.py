@@ -74,6 +74,14 @@ class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
         /builders/n:builderid/builds/n:build_number/steps/i:step_name/logs
         /builders/n:builderid/builds/n:build_number/steps/n:step_number/logs
     """
+    fieldMapping = {
+        'logid': 'logs.id',
+        'name': 'logs.name',
+        'slug': 'logs.slug',
+        'stepid': 'logs.stepid',
+        'num_lines': 'logs.num_lines',
+        'type': 'logs.type',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
@@ -81,8 +89,10 @@ class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
         if not stepid:
             defer.returnValue([])
             return
-        logs = yield self.master.db.logs.getLogs(stepid=stepid)
-        defer.returnValue([(yield self.db2data(dbdict)) for dbdict in logs])
+        resultSpec.fieldMapping = self.fieldMapping
+        logs = yield self.master.db.logs.getLogs(stepid=stepid,
+                                                 resultSpec=resultSpec)
+        defer.returnValue((yield self.mapResults(self.db2data, logs)))
 
 
 class Log(base.ResourceType):
@@ -176,8 +176,8 @@ class Master(base.ResourceType):
         # unclaim all of the build requests owned by the deactivated instance
         buildrequests = yield self.master.db.buildrequests.getBuildRequests(
             complete=False, claimed=masterid)
-        yield self.master.db.buildrequests.unclaimBuildRequests(
-            brids=[br['buildrequestid'] for br in buildrequests])
+        yield self.master.data.updates.unclaimBuildRequests(
+            [br['buildrequestid'] for br in buildrequests])
 
     @defer.inlineCallbacks
     def _masterDeactivated(self, masterid, name):
@@ -13,7 +13,11 @@
 #
 # Copyright Buildbot Team Members
 
+import datetime
+import sqlalchemy as sa
+
 from buildbot.data import base
+from buildbot.util import datetime2epoch
 
 
 class Filter(object):
@@ -50,6 +54,27 @@ class Filter(object):
         f = ops[self.op]
         return (d for d in data if f(d[fld], v))
 
+    def _sqlClause(self, col):
+        # return a where clause equivalent to this filter on the given column,
+        # or None if the filter cannot be expressed in SQL.  Python 2 sorts None
+        # before any other value, while SQL comparisons with NULL are never
+        # true, so NULLs are handled explicitly.
+        values = [datetime2epoch(v) if isinstance(v, datetime.datetime) else v
+                  for v in self.values]
+        if None in values:
+            if values != [None] or self.op not in ('eq', 'ne'):
+                return None
+            return col == None if self.op == 'eq' else col != None
+        if len(values) == 1:
+            clause = self.singular_operators[self.op](col, values)
+        elif self.op == 'eq':
+            clause = col.in_(values)
+        else:
+            clause = ~col.in_(values)
+        if col.nullable and self.op in ('ne', 'lt', 'le'):
+            clause = sa.or_(clause, col == None)
+        return clause
+
 
 def nonecmp(a, b):
     # Some fields are nullable, and could raise TypeException, when REST is requesting sorting
@@ -65,7 +90,8 @@ def nonecmp(a, b):
 
 class ResultSpec(object):
 
-    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset']
+    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset',
+                 'fieldMapping']
 
     def __init__(self, filters=None, fields=None, order=None,
                  limit=None, offset=None):
@@ -74,6 +100,8 @@ class ResultSpec(object):
         self.order = order
         self.limit = limit
         self.offset = offset
+        # maps data fields to 'table.column' names; set by the endpoint
+        self.fieldMapping = None
 
     def __repr__(self):
         return "ResultSpec(**" + repr(dict(filters=self.filters, fields=self.fields, order=self.order,
@@ -116,6 +144,103 @@ class ResultSpec(object):
         del self.fields[i]
         return True
 
+    def _findColumn(self, query, field):
+        name = (self.fieldMapping or {}).get(field)
+        if name is None:
+            return None
+        tablename, colname = name.split('.')
+        froms = list(query.froms)
+        while froms:
+            frm = froms.pop()
+            if isinstance(frm, sa.sql.expression.Join):
+                froms.extend([frm.left, frm.right])
+            elif getattr(frm, 'name', None) == tablename:
+                return frm.c[colname]
+
+    def _orderClauses(self, query):
+        clauses = []
+        for k in self.order:
+            desc = k[0] == '-'
+            col = self._findColumn(query, k[1:] if desc else k)
+            if col is None:
+                return None
+            # sort NULLs first, as nonecmp does
+            if col.nullable:
+                isnull = sa.case([(col == None, 0)], else_=1)
+                clauses.append(isnull.desc() if desc else isnull)
+            clauses.append(col.desc() if desc else col)
+        return clauses
+
+    def _projectQuery(self, query):
+        # select NULL in place of the columns that are not needed for the
+        # requested fields, nor for the filters and order left to apply
+        if not self.fields:
+            return query
+        needed = set(self.fields)
+        needed.update(f.field for f in self.filters)
+        needed.update(k.lstrip('-') for k in self.order or [])
+        keep = set()
+        for field in needed:
+            col = self._findColumn(query, field)
+            if col is None:
+                return query
+            keep.add(id(col))
+        columns = [c if id(getattr(c, 'element', c)) in keep
+                   else sa.null().label(c.name)
+                   for c in query.inner_columns]
+        return query.with_only_columns(columns)
+
+    def thd_execute(self, conn, query, dictFromRow):
+        """
+        Execute QUERY on CONN, first applying as much of this result spec to it
+        as can be expressed in SQL: filters on mapped fields and, if all
+        filters could be applied, the ordering and then pagination.  The
+        applied parts are removed from the result spec, leaving the rest to be
+        applied by L{apply}.  If the selected fields, and those needed by the
+        rest of the result spec, are all mapped, only their columns are fetched
+        and the others are NULL.  Rows are converted with DICTFROMROW.  If
+        pagination was applied, a L{base.ListResult} with the total number of
+        matching rows, counted in the database, is returned.
+        """
+        remaining = []
+        for f in self.filters:
+            col = self._findColumn(query, f.field)
+            clause = f._sqlClause(col) if col is not None else None
+            if clause is None:
+                remaining.append(f)
+            else:
+                query = query.where(clause)
+        self.filters = remaining
+
+        paginated = False
+        if not remaining:
+            countQuery = query
+            order = self._orderClauses(query) if self.order else []
+            if order is not None:
+                self.order = None
+                if order:
+                    # keep the query's own ordering as a tie-breaker, as
+                    # sorting in Python would
+                    existing = list(query._order_by_clause)
+                    query = query.order_by(None).order_by(*(order + existing))
+                if self.limit is not None or self.offset is not None:
+                    paginated = True
+                    offset, limit = self.offset, self.limit
+                    query = query.limit(limit).offset(offset)
+                    self.removePagination()
+
+        res = conn.execute(self._projectQuery(query))
+        rv = [dictFromRow(row) for row in res.fetchall()]
+        if not paginated:
+            return rv
+
+        countQuery = sa.select([sa.func.count()]).select_from(
+            countQuery.order_by(None).alias('matching'))
+        rv = base.ListResult(rv)
+        rv.offset, rv.limit = offset, limit
+        rv.total = conn.execute(countQuery).scalar()
+        return rv
+
     def apply(self, data):
         if data is None:
             return data
@@ -141,9 +266,10 @@ class ResultSpec(object):
 
             # item collection
             if isinstance(data, base.ListResult):
-                # if pagination was applied, then fields, etc. must be empty
-                assert not fields and not order and not filters, \
-                    "endpoint must apply fields, order, and filters if it performs pagination"
+                # if pagination was applied, then order and filters must be
+                # empty; fields are applied below
+                assert not order and not filters, \
+                    "endpoint must apply order and filters if it performs pagination"
                 offset, total = data.offset, data.total
                 limit = data.limit
             else:
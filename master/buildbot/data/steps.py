@@ -73,6 +73,16 @@ class StepsEndpoint(Db2DataMixin, base.BuildNestingMixin, base.Endpoint):
         /builds/n:buildid/steps
         /builders/n:builderid/builds/n:build_number/steps
     """
+    fieldMapping = {
+        'stepid': 'steps.id',
+        'number': 'steps.number',
+        'name': 'steps.name',
+        'buildid': 'steps.buildid',
+        'started_at': 'steps.started_at',
+        'complete_at': 'steps.complete_at',
+        'state_string': 'steps.state_string',
+        'results': 'steps.results',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
@@ -82,8 +92,10 @@ class StepsEndpoint(Db2DataMixin, base.BuildNestingMixin, base.Endpoint):
             buildid = yield self.getBuildid(kwargs)
             if buildid is None:
                 return
-        steps = yield self.master.db.steps.getSteps(buildid=buildid)
-        defer.returnValue([(yield self.db2data(dbdict)) for dbdict in steps])
+        resultSpec.fieldMapping = self.fieldMapping
+        steps = yield self.master.db.steps.getSteps(buildid=buildid,
+                                                    resultSpec=resultSpec)
+        defer.returnValue((yield self.mapResults(self.db2data, steps)))
 
     def startConsuming(self, callback, options, kwargs):
         if 'stepid' in kwargs:
@@ -76,7 +76,8 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         return self.db.pool.do(thd)
 
     def getBuildRequests(self, builderid=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None,
+                         resultSpec=None):
         def thd(conn):
             reqs_tbl = self.db.model.buildrequests
             claims_tbl = self.db.model.buildrequest_claims
@@ -109,10 +110,12 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             if repository is not None:
                 q = q.where(sstamps_tbl.c.repository == repository)
 
+            def dictFromRow(row):
+                return self._brdictFromRow(row, self.db.master.masterid)
+            if resultSpec is not None:
+                return resultSpec.thd_execute(conn, q, dictFromRow)
             res = conn.execute(q)
-
-            return [self._brdictFromRow(row, self.db.master.masterid)
-                    for row in res.fetchall()]
+            return [dictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
 
     def claimBuildRequests(self, brids, claimed_at=None, _reactor=reactor):
@@ -242,31 +245,40 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             claims_tbl = self.db.model.buildrequest_claims
             old_epoch = _reactor.seconds() - old
 
-            # select any expired requests, and delete each one individually
-            expired_brids = sa.select([reqs_tbl.c.id],
-                                      whereclause=(reqs_tbl.c.complete != 1))
-            res = conn.execute(claims_tbl.delete(
-                (claims_tbl.c.claimed_at < old_epoch) &
-                claims_tbl.c.brid.in_(expired_brids)))
-            return res.rowcount
+            # select any expired requests, and delete their claims
+            transaction = conn.begin()
+            q = sa.select([claims_tbl.c.brid],
+                          from_obj=[claims_tbl.join(reqs_tbl)],
+                          whereclause=((reqs_tbl.c.complete != 1)
+                                       & (claims_tbl.c.claimed_at < old_epoch)))
+            expired_brids = sorted(row.brid for row in conn.execute(q))
+            iterator = iter(expired_brids)
+            while True:
+                batch = list(itertools.islice(iterator, 100))
+                if not batch:
+                    break
+                conn.execute(claims_tbl.delete(claims_tbl.c.brid.in_(batch)))
+            transaction.commit()
+            return expired_brids
         d = self.db.pool.do(thd)
 
         @d.addCallback
-        def log_nonzero_count(count):
-            if count != 0:
+        def log_nonzero_count(brids):
+            if brids:
                 log.msg("unclaimed %d expired buildrequests (over %d seconds "
-                        "old)" % (count, old))
+                        "old)" % (len(brids), old))
+            return brids
         return d
 
     @staticmethod
     def _brdictFromRow(row, master_masterid):
         claimed = False
-        claimed_by_masterid = None
         claimed_at = None
         if row.claimed_at is not None:
             claimed_at = row.claimed_at
             claimed = True
-            claimed_by_masterid = row.masterid
+        # NULL unless there is a claim, since this comes from an outer join
+        claimed_by_masterid = row.masterid
 
         def mkdt(epoch):
             if epoch:
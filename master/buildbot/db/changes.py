@@ -50,13 +50,16 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
 
         return self.db.pool.do(thd)
 
-    @defer.inlineCallbacks
-    def addChange(self, author=None, files=None, comments=None, is_dir=None,
-                  revision=None, when_timestamp=None, branch=None,
-                  category=None, revlink='', properties=None, repository='', codebase='',
-                  project='', uid=None, _reactor=reactor):
+    def _checkChange(self, author=None, files=None, comments=None,
+                     is_dir=None, revision=None, when_timestamp=None,
+                     branch=None, category=None, revlink='', properties=None,
+                     repository='', codebase='', project='', uid=None,
+                     _reactor=reactor):
+        # validate the arguments of addChange, returning them with defaults
+        # filled in
         assert project is not None, "project must be a string, not None"
         assert repository is not None, "repository must be a string, not None"
+        assert codebase is not None, "codebase must be a string, not None"
 
         if is_dir is not None:
             log.msg("WARNING: change source is providing deprecated "
@@ -82,6 +85,27 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         self.checkLength(ch_tbl.c.repository, repository)
         self.checkLength(ch_tbl.c.project, project)
 
+        return dict(author=author, files=files, comments=comments,
+                    revision=revision, when_timestamp=when_timestamp,
+                    branch=branch, category=category, revlink=revlink,
+                    properties=properties, repository=repository,
+                    codebase=codebase, project=project, uid=uid)
+
+    @defer.inlineCallbacks
+    def addChange(self, author=None, files=None, comments=None, is_dir=None,
+                  revision=None, when_timestamp=None, branch=None,
+                  category=None, revlink='', properties=None, repository='', codebase='',
+                  project='', uid=None, _reactor=reactor):
+        ch = self._checkChange(
+            author=author, files=files, comments=comments, is_dir=is_dir,
+            revision=revision, when_timestamp=when_timestamp, branch=branch,
+            category=category, revlink=revlink, properties=properties,
+            repository=repository, codebase=codebase, project=project,
+            uid=uid, _reactor=_reactor)
+        when_timestamp = ch['when_timestamp']
+        properties = ch['properties']
+        ch_tbl = self.db.model.changes
+
         # calculate the sourcestamp first, before adding it
         ssid = yield self.db.sourcestamps.findSourceStampId(
             revision=revision, branch=branch, repository=repository,
@@ -147,6 +171,123 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             return changeid
         defer.returnValue((yield self.db.pool.do(thd)))
 
+    def addChanges(self, changes, _reactor=reactor):
+        # Documentation is in developer/db.rst
+        changes = [self._checkChange(_reactor=_reactor, **ch)
+                   for ch in changes]
+        if not changes:
+            return defer.succeed([])
+        created_at = _reactor.seconds()
+
+        def thd(conn, no_recurse=False):
+            transaction = conn.begin()
+            try:
+                changeids = self._addChanges_thd(conn, changes, created_at)
+            except (sa.exc.IntegrityError, sa.exc.ProgrammingError):
+                # an overlapping call added one of the sourcestamps first;
+                # try it all over again, but only once
+                transaction.rollback()
+                if no_recurse:
+                    raise
+                return thd(conn, no_recurse=True)
+            except Exception:
+                transaction.rollback()
+                raise
+            transaction.commit()
+            return changeids
+        return self.db.pool.do(thd)
+
+    def _addChanges_thd(self, conn, changes, created_at):
+        ch_tbl = self.db.model.changes
+        ss_tbl = self.db.model.sourcestamps
+
+        # find the sourcestamps by hash, adding those that are missing
+        ss_hashes = [self.hashColumns(ch['branch'], ch['revision'],
+                                      ch['repository'], ch['project'],
+                                      ch['codebase'], None)
+                     for ch in changes]
+        ssids = self._findSourceStampIds_thd(conn, set(ss_hashes))
+        missing = {}
+        for ss_hash, ch in zip(ss_hashes, changes):
+            if ss_hash not in ssids and ss_hash not in missing:
+                missing[ss_hash] = dict(
+                    branch=ch['branch'], revision=ch['revision'],
+                    repository=ch['repository'], codebase=ch['codebase'],
+                    project=ch['project'], patchid=None, ss_hash=ss_hash,
+                    created_at=created_at)
+        if missing:
+            conn.execute(ss_tbl.insert(), missing.values())
+            ssids.update(self._findSourceStampIds_thd(conn, missing))
+
+        # each change is the parent of the next one on the same branch, so
+        # only the first change on each branch needs its parent looked up
+        parents = {}
+        files, properties, users = [], [], []
+        changeids = []
+        for ss_hash, ch in zip(ss_hashes, changes):
+            key = (ch['branch'], ch['repository'], ch['project'],
+                   ch['codebase'])
+            if key not in parents:
+                q = sa.select([ch_tbl.c.changeid],
+                              whereclause=((ch_tbl.c.branch == key[0]) &
+                                           (ch_tbl.c.repository == key[1]) &
+                                           (ch_tbl.c.project == key[2]) &
+                                           (ch_tbl.c.codebase == key[3])),
+                              order_by=sa.desc(ch_tbl.c.changeid),
+                              limit=1)
+                parents[key] = conn.scalar(q)
+
+            r = conn.execute(ch_tbl.insert(), dict(
+                author=ch['author'],
+                comments=ch['comments'],
+                branch=ch['branch'],
+                revision=ch['revision'],
+                revlink=ch['revlink'],
+                when_timestamp=datetime2epoch(ch['when_timestamp']),
+                category=ch['category'],
+                repository=ch['repository'],
+                codebase=ch['codebase'],
+                project=ch['project'],
+                sourcestampid=ssids[ss_hash],
+                parent_changeids=parents[key]))
+            changeid = r.inserted_primary_key[0]
+            parents[key] = changeid
+            changeids.append(changeid)
+
+            for f in ch['files'] or []:
+                self.checkLength(self.db.model.change_files.c.filename, f)
+                files.append(dict(changeid=changeid, filename=f))
+            for k, v in ch['properties'].iteritems():
+                prop = dict(changeid=changeid, property_name=k,
+                            property_value=json.dumps(v))
+                self.checkLength(self.db.model.change_properties.c.property_name,
+                                 prop['property_name'])
+                self.checkLength(self.db.model.change_properties.c.property_value,
+                                 prop['property_value'])
+                properties.append(prop)
+            if ch['uid']:
+                users.append(dict(changeid=changeid, uid=ch['uid']))
+
+        # and add the files, properties and users of all changes at once
+        for tbl, rows in ((self.db.model.change_files, files),
+                          (self.db.model.change_properties, properties),
+                          (self.db.model.change_users, users)):
+            if rows:
+                conn.execute(tbl.insert(), rows)
+        return changeids
+
+    def _findSourceStampIds_thd(self, conn, ss_hashes):
+        ss_tbl = self.db.model.sourcestamps
+        ssids = {}
+        remaining = list(ss_hashes)
+        while remaining:
+            batch, remaining = remaining[:100], remaining[100:]
+            q = sa.select([ss_tbl.c.id, ss_tbl.c.ss_hash],
+                          whereclause=ss_tbl.c.ss_hash.in_(batch))
+            for row in conn.execute(q):
+                ssids[row.ss_hash] = row.id
+        return ssids
+
     @base.cached("chdicts")
     def getChange(self, changeid):
         assert changeid >= 0
@@ -248,7 +389,33 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                                         for changeid in changeids])
         return d
 
-    def getChanges(self):
+    def getChanges(self, resultSpec=None):
+        if resultSpec is not None:
+            fields = resultSpec.fields
+
+            files = not fields or 'files' in fields
+            properties = not fields or 'properties' in fields
+
+            def thd(conn):
+                # fetch the rows, then the ancillary data of all of them at
+                # once, skipping the ancillary data that was not selected
+                q = self.db.model.changes.select()
+                chdicts = resultSpec.thd_execute(conn, q,
+                                                 self._chdict_from_change_row)
+                self._thd_add_ancillary_data(conn, chdicts, files=files,
+                                             properties=properties)
+                return chdicts
+            d = self.db.pool.do(thd)
+
+            @d.addCallback
+            def cache(chdicts):
+                # complete changes can be used by getChange
+                if files and properties:
+                    for chdict in chdicts:
+                        self.getChange.cache.put(chdict['changeid'], chdict)
+                return chdicts
+            return d
+
         def thd(conn):
             # get the changeids from the 'changes' table
             changes_tbl = self.db.model.changes
@@ -325,60 +492,75 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                         table.delete(table.c.changeid.in_(batch)))
         return self.db.pool.do(thd)
 
+    def _thd_add_ancillary_data(self, conn, chdicts, files=True,
+                                properties=True):
+        # This method must be run in a db.pool thread, and adds the files and
+        # properties of CHDICTS, from 'changes' table rows, with one query per
+        # table for each batch of changes.
+        change_files_tbl = self.db.model.change_files
+        change_properties_tbl = self.db.model.change_properties
+
+        bychangeid = dict((chdict['changeid'], chdict) for chdict in chdicts)
+        changeids = sorted(bychangeid)
+        while changeids:
+            batch, changeids = changeids[:100], changeids[100:]
+            if files:
+                query = change_files_tbl.select(
+                    whereclause=change_files_tbl.c.changeid.in_(batch))
+                for r in conn.execute(query):
+                    bychangeid[r.changeid]['files'].append(r.filename)
+            if properties:
+                query = change_properties_tbl.select(
+                    whereclause=change_properties_tbl.c.changeid.in_(batch))
+                for r in conn.execute(query):
+                    try:
+                        v, s = self._split_vs(json.loads(r.property_value))
+                        bychangeid[r.changeid]['properties'][
+                            r.property_name] = (v, s)
+                    except ValueError:
+                        pass
+
+    @staticmethod
+    def _split_vs(vs):
+        # properties must be given without a source, so strip that, but be
+        # flexible in case users have used a development version where the
+        # change properties were recorded incorrectly
+        try:
+            v, s = vs
+            if s != "Change":
+                v, s = vs, "Change"
+        except (ValueError, TypeError):
+            v, s = vs, "Change"
+        return v, s
+
     def _chdict_from_change_row_thd(self, conn, ch_row):
         # This method must be run in a db.pool thread, and returns a chdict
         # given a row from the 'changes' table
-        change_files_tbl = self.db.model.change_files
-        change_properties_tbl = self.db.model.change_properties
+        chdict = self._chdict_from_change_row(ch_row)
+        self._thd_add_ancillary_data(conn, [chdict])
+        return chdict
 
+    @staticmethod
+    def _chdict_from_change_row(ch_row):
+        # returns a chdict without its files and properties
         if ch_row.parent_changeids:
             parent_changeids = [ch_row.parent_changeids]
         else:
             parent_changeids = []
 
-        chdict = ChDict(
+        return ChDict(
             changeid=ch_row.changeid,
             parent_changeids=parent_changeids,
             author=ch_row.author,
-            files=[],  # see below
+            files=[],
             comments=ch_row.comments,
             revision=ch_row.revision,
             when_timestamp=epoch2datetime(ch_row.when_timestamp),
             branch=ch_row.branch,
             category=ch_row.category,
             revlink=ch_row.revlink,
-            properties={},  # see below
+            properties={},
             repository=ch_row.repository,
             codebase=ch_row.codebase,
             project=ch_row.project,
-            sourcestampid=int(ch_row.sourcestampid))
-
-        query = change_files_tbl.select(
-            whereclause=(change_files_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            chdict['files'].append(r.filename)
-
-        # and properties must be given without a source, so strip that, but
-        # be flexible in case users have used a development version where the
-        # change properties were recorded incorrectly
-        def split_vs(vs):
-            try:
-                v, s = vs
-                if s != "Change":
-                    v, s = vs, "Change"
-            except (ValueError, TypeError):
-                v, s = vs, "Change"
-            return v, s
-
-        query = change_properties_tbl.select(
-            whereclause=(change_properties_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            try:
-                v, s = split_vs(json.loads(r.property_value))
-                chdict['properties'][r.property_name] = (v, s)
-            except ValueError:
-                pass
-
-        return chdict
+            sourcestampid=ch_row.sourcestampid)
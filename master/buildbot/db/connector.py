@@ -131,6 +131,13 @@ class DBConnector(service.ReconfigurableServiceMixin, service.AsyncMultiService)
         return service.ReconfigurableServiceMixin.reconfigServiceWithBuildbotConfig(self,
                                                                                     new_config)
 
+    @defer.inlineCallbacks
+    def stopService(self):
+        # write out any buffered log content and state before shutting down
+        yield self.logs.flushLogs()
+        yield self.state.flushState()
+        yield service.AsyncMultiService.stopService(self)
+
     def _doCleanup(self):
         """
         Perform any periodic database cleanup tasks.
@@ -13,12 +13,52 @@
 #
 # Copyright Buildbot Team Members
 
+import array
+import bz2
+import re
 import sqlalchemy as sa
+import threading
+import zlib
 
 from buildbot.db import base
+from buildbot.util import lru
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python import failure
 from twisted.python import log
 
+try:
+    from lz4 import frame as lz4frame
+    assert lz4frame
+except ImportError:
+    lz4frame = None
+
+
+def _identity(data):
+    return data
+
+# Compression methods for log chunks, keyed by the name used in
+# c['logCompressionMethod'].  The 'id' is stored in the 'compressed' column of
+# the logchunks table, so it must never change once assigned.
+COMPRESSION_METHODS = {
+    'raw': dict(id=0, compress=_identity, decompress=_identity),
+    'gz': dict(id=1, compress=zlib.compress, decompress=zlib.decompress),
+    'bz2': dict(id=2, compress=bz2.compress, decompress=bz2.decompress),
+}
+if lz4frame:
+    COMPRESSION_METHODS['lz4'] = dict(id=3, compress=lz4frame.compress,
+                                      decompress=lz4frame.decompress)
+COMPRESSION_BY_ID = dict((m['id'], m) for m in COMPRESSION_METHODS.itervalues())
+
+
+def decompressChunk(content, compressed):
+    try:
+        method = COMPRESSION_BY_ID[compressed]
+    except KeyError:
+        raise RuntimeError("log chunk uses unsupported compression method %d"
+                           % (compressed,))
+    return method['decompress'](content)
+
 
 class LogsConnectorComponent(base.DBConnectorComponent):
 
@@ -26,6 +66,33 @@ class LogsConnectorComponent(base.DBConnectorComponent):
     # for MySQL appears to be max_packet_size (default 1M).
     MAX_CHUNK_SIZE = 65536
 
+    # number of chunks for which line offsets are kept in memory; each entry
+    # is at most a few hundred kilobytes
+    LINE_OFFSETS_CACHE_SIZE = 100
+
+    def __init__(self, connector):
+        base.DBConnectorComponent.__init__(self, connector)
+        # line offsets are computed and used in db threads, so the cache is
+        # guarded by a lock
+        self._lineOffsetsCache = lru.LRUCache(lambda key: None,
+                                              self.LINE_OFFSETS_CACHE_SIZE)
+        self._lineOffsetsLock = threading.Lock()
+
+        # appends waiting to be written, in order, as (logid, content, d);
+        # flushLogs adds entries with a logid of None
+        self._pendingAppends = []
+        self._pendingSize = 0
+        self._flushForced = False
+        self._flushTimer = None
+        # the running flush, if any, and the logs it is writing
+        self._flushing = None
+        self._flushingLogids = set()
+        # num_lines for each unfinished log this master has appended to, so
+        # that it need not be re-read for every append
+        self._numLines = {}
+        # for tests
+        self._reactor = reactor
+
     def _getLog(self, whereclause):
         def thd(conn):
             q = self.db.model.logs.select(whereclause=whereclause)
@@ -46,12 +113,14 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         tbl = self.db.model.logs
         return self._getLog((tbl.c.slug == slug) & (tbl.c.stepid == stepid))
 
-    def getLogs(self, stepid):
+    def getLogs(self, stepid, resultSpec=None):
         def thd(conn):
             tbl = self.db.model.logs
             q = tbl.select()
             q = q.where(tbl.c.stepid == stepid)
             q = q.order_by(tbl.c.id)
+            if resultSpec is not None:
+                return resultSpec.thd_execute(conn, q, self._logdictFromRow)
             res = conn.execute(q)
             return [self._logdictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -68,24 +137,64 @@ class LogsConnectorComponent(base.DBConnectorComponent):
             q = q.order_by(tbl.c.first_line)
             rv = []
             for row in conn.execute(q):
-                assert not row.compressed, "compressed rows not supported yet"
-                content = row.content.decode('utf-8')
-                if row.first_line < first_line:
-                    idx = -1
-                    count = first_line - row.first_line
-                    for _ in xrange(count):
-                        idx = content.index('\n', idx + 1)
-                    content = content[idx + 1:]
-                if row.last_line > last_line:
-                    idx = len(content) + 1
-                    count = row.last_line - last_line
-                    for _ in xrange(count):
-                        idx = content.rindex('\n', 0, idx)
-                    content = content[:idx]
-                rv.append(content)
+                content = decompressChunk(row.content, row.compressed)
+                if row.first_line < first_line or row.last_line > last_line:
+                    # slice the encoded content; this is safe because no
+                    # character but u'\n' maps to b'\n' in UTF-8
+                    offsets = self._getLineOffsets(logid, row, content)
+                    start, end = 0, len(content)
+                    if row.first_line < first_line:
+                        start = offsets[first_line - row.first_line]
+                    if row.last_line > last_line:
+                        end = offsets[last_line - row.first_line + 1] - 1
+                    content = content[start:end]
+                rv.append(content.decode('utf-8'))
             return u'\n'.join(rv) + u'\n' if rv else u''
         return self.db.pool.do(thd)
 
+    def getLogLinesEnd(self, logid, first_line, size):
+        def thd(conn):
+            tbl = self.db.model.logchunks
+            q = sa.select([tbl.c.last_line,
+                           sa.func.length(tbl.c.content).label('length')])
+            q = q.where(tbl.c.logid == logid)
+            q = q.where(tbl.c.last_line >= first_line)
+            q = q.order_by(tbl.c.first_line)
+            # logs that are still running may have many tiny chunks; don't
+            # fetch all of them
+            q = q.limit(1000)
+            res = conn.execute(q)
+            end = None
+            total = 0
+            for row in res:
+                total += row.length
+                if end is not None and total > size:
+                    break
+                end = row.last_line
+            res.close()
+            return end
+        return self.db.pool.do(thd)
+
+    _newline_re = re.compile('\n')
+
+    def _getLineOffsets(self, logid, row, content):
+        """
+        Return an array of the byte offsets at which each line of the given
+        chunk row starts in its (decompressed) CONTENT.  Chunks are immutable
+        once written, except that compressLog replaces them with chunks having
+        a different line range or compression, so this is cached by those
+        values.
+        """
+        key = (logid, row.first_line, row.last_line, row.compressed)
+        with self._lineOffsetsLock:
+            offsets = self._lineOffsetsCache.get(key)
+        if offsets is None:
+            offsets = array.array('L', [0])
+            offsets.extend(m.end() for m in self._newline_re.finditer(content))
+            with self._lineOffsetsLock:
+                self._lineOffsetsCache.put(key, offsets)
+        return offsets
+
     def addLog(self, stepid, name, slug, type):
         assert type in 'tsh', "Log type must be one of t, s, or h"
 
@@ -104,36 +213,137 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         # check for trailing newline and strip it for storage -- chunks omit
         # the trailing newline
         assert content[-1] == u'\n'
-        content = content[:-1]
+        d = defer.Deferred()
+        self._pendingAppends.append((logid, content[:-1], d))
+        # logBufferSize is in bytes, as written to the database
+        self._pendingSize += len(content.encode('utf-8'))
+        self._scheduleFlush()
+        return d
 
-        def thd(conn):
-            q = sa.select([self.db.model.logs.c.num_lines])
-            q = q.where(self.db.model.logs.c.id == logid)
-            res = conn.execute(q)
-            row = res.fetchone()
-            res.close()
-            if not row:
-                return  # ignore a missing log
+    def flushLogs(self):
+        d = defer.Deferred()
+        if not self._pendingAppends and not self._flushing:
+            d.callback(None)
+            return d
+        self._pendingAppends.append((None, None, d))
+        self._flushForced = True
+        self._scheduleFlush()
+        return d
 
-            # Break the content up into chunks.  This takes advantage of the
-            # fact that no character but u'\n' maps to b'\n' in UTF-8.
+    def _hasPendingAppends(self, logid):
+        if logid in self._flushingLogids:
+            return True
+        return any(a[0] == logid for a in self._pendingAppends)
 
-            first_line = chunk_first_line = row[0]
-            remaining = content.encode('utf-8')
-            while remaining:
-                chunk, remaining = self._splitBigChunk(remaining, logid)
+    def _scheduleFlush(self):
+        # a running flush reschedules itself when it completes
+        if self._flushing or not self._pendingAppends:
+            return
+        config = self.master.config
+        if self._flushForced or self._pendingSize >= config.logBufferSize:
+            self._flush()
+        elif not self._flushTimer:
+            self._flushTimer = self._reactor.callLater(config.logBufferTime,
+                                                       self._flush)
+
+    def _flush(self):
+        if self._flushTimer:
+            if self._flushTimer.active():
+                self._flushTimer.cancel()
+            self._flushTimer = None
+        batch = self._pendingAppends
+        self._pendingAppends = []
+        self._pendingSize = 0
+        self._flushForced = False
 
+        appends = [(logid, content) for logid, content, _ in batch
+                   if logid is not None]
+        self._flushingLogids = set(logid for logid, _ in appends)
+        d = self._flushing = self.db.pool.do(self._thdAppendLogs, appends)
+
+        @d.addBoth
+        def done(res):
+            self._flushing = None
+            self._flushingLogids = set()
+            results = iter(res) if not isinstance(res, failure.Failure) else None
+            for logid, _, waiter in batch:
+                if logid is None:
+                    waiter.callback(None)
+                elif results is None:
+                    waiter.errback(res)
+                else:
+                    waiter.callback(next(results))
+            self._scheduleFlush()
+
+    def _thdAppendLogs(self, conn, appends):
+        """
+        Write APPENDS, a list of (logid, content) tuples, in a single
+        transaction, returning the (first_line, last_line) of each, or None
+        for missing logs.  Consecutive appends to the same log are stored
+        together.
+        """
+        logsTbl = self.db.model.logs
+        chunksTbl = self.db.model.logchunks
+
+        logids = []
+        for logid, _ in appends:
+            if logid not in logids:
+                logids.append(logid)
+        numLines = {}
+        unknown = []
+        for logid in logids:
+            if logid in self._numLines:
+                numLines[logid] = self._numLines[logid]
+            else:
+                unknown.append(logid)
+        if unknown:
+            q = sa.select([logsTbl.c.id, logsTbl.c.num_lines])
+            q = q.where(logsTbl.c.id.in_(unknown))
+            for row in conn.execute(q):
+                numLines[row.id] = row.num_lines
+
+        firstLines = numLines.copy()
+        contents = {}
+        results = []
+        for logid, content in appends:
+            if logid not in numLines:
+                results.append(None)  # ignore a missing log
+                continue
+            first_line = numLines[logid]
+            last_line = first_line + content.count(u'\n')
+            numLines[logid] = last_line + 1
+            contents.setdefault(logid, []).append(content)
+            results.append((first_line, last_line))
+
+        # Break the content up into chunks.  This takes advantage of the
+        # fact that no character but u'\n' maps to b'\n' in UTF-8.
+        chunkRows = []
+        for logid in logids:
+            if logid not in contents:
+                continue
+            chunk_first_line = firstLines[logid]
+            remaining = u'\n'.join(contents[logid]).encode('utf-8')
+            while remaining is not None:
+                chunk, remaining = self._splitBigChunk(remaining, logid)
                 last_line = chunk_first_line + chunk.count('\n')
-                conn.execute(self.db.model.logchunks.insert(),
-                             dict(logid=logid, first_line=chunk_first_line,
-                                  last_line=last_line, content=chunk,
-                                  compressed=0))
+                chunkRows.append(dict(logid=logid,
+                                      first_line=chunk_first_line,
+                                      last_line=last_line, content=chunk,
+                                      compressed=0))
                 chunk_first_line = last_line + 1
 
-            conn.execute(self.db.model.logs.update(whereclause=(self.db.model.logs.c.id == logid)),
-                         num_lines=last_line + 1)
-            return (first_line, last_line)
-        return self.db.pool.do(thd)
+        if chunkRows:
+            transaction = conn.begin()
+            conn.execute(chunksTbl.insert(), chunkRows)
+            q = logsTbl.update(whereclause=(logsTbl.c.id == sa.bindparam('_logid')))
+            q = q.values(num_lines=sa.bindparam('_num_lines'))
+            conn.execute(q, [dict(_logid=logid, _num_lines=numLines[logid])
+                             for logid in contents])
+            transaction.commit()
+
+        for logid in contents:
+            self._numLines[logid] = numLines[logid]
+        return results
 
     def _splitBigChunk(self, content, logid):
         """
@@ -167,16 +377,92 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         else:
             return truncline, content[i + 1:]
 
+    @defer.inlineCallbacks
     def finishLog(self, logid):
+        # make sure everything appended so far is written first
+        if self._hasPendingAppends(logid):
+            yield self.flushLogs()
+        self._numLines.pop(logid, None)
+
         def thd(conn):
             tbl = self.db.model.logs
             q = tbl.update(whereclause=(tbl.c.id == logid))
             conn.execute(q, complete=1)
-        return self.db.pool.do(thd)
+        yield self.db.pool.do(thd)
 
     def compressLog(self, logid):
-        # TODO: compression not supported yet
-        return defer.succeed(None)
+        method = self.master.config.logCompressionMethod
+        limit = self.master.config.logCompressionLimit
+        if limit is False:
+            method = 'raw'
+
+        def thd(conn):
+            tbl = self.db.model.logchunks
+
+            # first, find runs of uncompressed chunks that can be merged into
+            # a single chunk, without fetching their content
+            q = sa.select([tbl.c.first_line, tbl.c.last_line,
+                           sa.func.length(tbl.c.content).label('length'),
+                           tbl.c.compressed])
+            q = q.where(tbl.c.logid == logid)
+            q = q.order_by(tbl.c.first_line)
+            groups = []
+            group = None
+            for row in conn.execute(q):
+                if row.compressed:
+                    # already compressed; leave it alone
+                    group = None
+                    continue
+                # chunks omit the trailing newline, so joining adds one byte
+                if group and group['length'] + 1 + row.length < self.MAX_CHUNK_SIZE:
+                    group['last_line'] = row.last_line
+                    group['length'] += 1 + row.length
+                    group['count'] += 1
+                else:
+                    group = dict(first_line=row.first_line,
+                                 last_line=row.last_line,
+                                 length=row.length, count=1)
+                    groups.append(group)
+
+            saved = 0
+            for group in groups:
+                if group['count'] == 1 and group['length'] < limit:
+                    # too small to be worth rewriting
+                    continue
+                saved += self._thdCompressChunks(conn, logid, group, method)
+            return saved
+        return self.db.pool.do(thd)
+
+    def _thdCompressChunks(self, conn, logid, group, method):
+        tbl = self.db.model.logchunks
+        inGroup = ((tbl.c.logid == logid) &
+                   (tbl.c.first_line >= group['first_line']) &
+                   (tbl.c.last_line <= group['last_line']))
+
+        q = sa.select([tbl.c.content], whereclause=inGroup)
+        q = q.order_by(tbl.c.first_line)
+        res = conn.execute(q)
+        content = '\n'.join(row.content for row in res)
+        res.close()
+
+        compressed = 0
+        stored = content
+        if method != 'raw' and len(content) >= self.master.config.logCompressionLimit:
+            packed = COMPRESSION_METHODS[method]['compress'](content)
+            # incompressible content is better left alone
+            if len(packed) < len(content):
+                compressed = COMPRESSION_METHODS[method]['id']
+                stored = packed
+
+        # replace the group atomically, so readers never see missing lines
+        transaction = conn.begin()
+        conn.execute(tbl.delete(whereclause=inGroup))
+        conn.execute(tbl.insert(),
+                     dict(logid=logid, first_line=group['first_line'],
+                          last_line=group['last_line'], content=stored,
+                          compressed=compressed))
+        transaction.commit()
+        return group['length'] - len(stored)
 
     def _logdictFromRow(self, row):
         rv = dict(row)
@@ -167,7 +167,8 @@ class Model(base.DBConnectorComponent):
                          sa.Column('first_line', sa.Integer, nullable=False),
                          sa.Column('last_line', sa.Integer, nullable=False),
                          # log contents, including a terminating newline, encoded in utf-8 or,
-                         # if 'compressed' is true, compressed with gzip
+                         # if 'compressed' is nonzero, compressed with the method identified by
+                         # that value in buildbot.db.logs.COMPRESSION_METHODS
                          sa.Column('content', sa.LargeBinary(65536)),
                          sa.Column('compressed', sa.SmallInteger, nullable=False),
                          )
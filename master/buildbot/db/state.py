@@ -18,6 +18,9 @@ import sqlalchemy.exc
 
 from buildbot.db import base
 from buildbot.util import json
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python import failure
 
 
 class _IdNotFoundError(Exception):
@@ -31,6 +34,25 @@ class ObjDict(dict):
 class StateConnectorComponent(base.DBConnectorComponent):
     # Documentation is in developer/db.rst
 
+    def __init__(self, connector):
+        base.DBConnectorComponent.__init__(self, connector)
+        # the JSON value of each state this master last read or wrote, by
+        # objectid and name; None for values known to be missing.  Only
+        # unwritten values are read from here, the rest are used to skip
+        # writes that would not change anything, unless several masters
+        # share the database.
+        self._values = {}
+        # values waiting to be written, by (objectid, name), and the
+        # Deferreds waiting for them
+        self._pendingValues = {}
+        self._pendingWaiters = []
+        self._flushTimer = None
+        # the running flush, if any, and the values it is writing
+        self._flushing = None
+        self._flushingKeys = set()
+        # for tests
+        self._reactor = reactor
+
     def getObjectId(self, name, class_name):
         # defer to a cached method that only takes one parameter (a tuple)
         d = self._getObjectId((name, class_name))
@@ -89,12 +111,37 @@ class StateConnectorComponent(base.DBConnectorComponent):
     class Thunk:
         pass
 
+    def _isUnwritten(self, objectid, name):
+        key = (objectid, name)
+        return key in self._pendingValues or key in self._flushingKeys
+
     def getState(self, objectid, name, default=Thunk):
-        def thd(conn):
-            return self.thdGetState(conn, objectid, name, default=default)
-        return self.db.pool.do(thd)
+        if self._isUnwritten(objectid, name):
+            d = defer.succeed(self._values[objectid][name])
+        else:
+            # another master may have changed the value since it was cached
+            def thd(conn):
+                return self._thdGetStateJson(conn, objectid, name)
+            d = self.db.pool.do(thd)
+
+            @d.addCallback
+            def remember(value_json):
+                values = self._values.setdefault(objectid, {})
+                # a value set while reading takes precedence
+                if not self._isUnwritten(objectid, name):
+                    values[name] = value_json
+                return values[name]
+
+        @d.addCallback
+        def decode(value_json):
+            return self._decodeState(objectid, name, value_json, default)
+        return d
 
     def thdGetState(self, conn, objectid, name, default=Thunk):
+        value_json = self._thdGetStateJson(conn, objectid, name)
+        return self._decodeState(objectid, name, value_json, default)
+
+    def _thdGetStateJson(self, conn, objectid, name):
         object_state_tbl = self.db.model.object_state
 
         q = sa.select([object_state_tbl.c.value_json],
@@ -103,31 +150,138 @@ class StateConnectorComponent(base.DBConnectorComponent):
         res = conn.execute(q)
         row = res.fetchone()
         res.close()
+        return row.value_json if row else None
 
-        if not row:
+    def _decodeState(self, objectid, name, value_json, default):
+        if value_json is None:
             if default is self.Thunk:
                 raise KeyError("no such state value '%s' for object %d" %
                                (name, objectid))
             return default
         try:
-            return json.loads(row.value_json)
+            return json.loads(value_json)
         except ValueError:
             raise TypeError("JSON error loading state value '%s' for %d" %
                             (name, objectid))
 
     def setState(self, objectid, name, value):
-        def thd(conn):
-            return self.thdSetState(conn, objectid, name, value)
-        return self.db.pool.do(thd)
+        try:
+            value_json = self._encodeState(value)
+            self.checkLength(self.db.model.object_state.c.name, name)
+        except (TypeError, RuntimeError):
+            # fail now, rather than failing the flush for every other value
+            return defer.fail()
+
+        values = self._values.setdefault(objectid, {})
+        # with several masters, another one may have changed the value since
+        # this master last read or wrote it
+        if (values.get(name) == value_json
+                and not self.master.config.multiMaster
+                and not self._isUnwritten(objectid, name)):
+            # already stored
+            return defer.succeed(None)
+        values[name] = value_json
+        self._pendingValues[(objectid, name)] = value_json
+        d = defer.Deferred()
+        self._pendingWaiters.append(d)
+        self._scheduleFlush()
+        return d
 
-    def thdSetState(self, conn, objectid, name, value):
+    def flushState(self):
+        if not self._pendingValues and not self._flushing:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._pendingWaiters.append(d)
+        self._scheduleFlush(force=True)
+        return d
+
+    def _scheduleFlush(self, force=False):
+        # a running flush reschedules itself when it completes
+        if self._flushing or not self._pendingWaiters:
+            return
+        if force:
+            self._flush()
+        elif not self._flushTimer:
+            self._flushTimer = self._reactor.callLater(
+                self.master.config.stateBufferTime, self._flush)
+
+    def _flush(self):
+        if self._flushTimer:
+            if self._flushTimer.active():
+                self._flushTimer.cancel()
+            self._flushTimer = None
+        values, self._pendingValues = self._pendingValues, {}
+        waiters, self._pendingWaiters = self._pendingWaiters, []
+        self._flushingKeys = set(values)
+        d = self._flushing = self.db.pool.do(self._thdSetStates, values)
+
+        @d.addCallback
+        def forgetLost(lost):
+            # values another master wrote first are read again when needed
+            for objectid, name in lost:
+                if (objectid, name) not in self._pendingValues:
+                    self._values[objectid].pop(name, None)
+
+        @d.addErrback
+        def forgetFailed(f):
+            for objectid, name in values:
+                if (objectid, name) not in self._pendingValues:
+                    self._values[objectid].pop(name, None)
+            return f
+
+        @d.addBoth
+        def done(res):
+            self._flushing = None
+            self._flushingKeys = set()
+            for waiter in waiters:
+                if isinstance(res, failure.Failure):
+                    waiter.errback(res)
+                else:
+                    waiter.callback(None)
+            self._scheduleFlush()
+
+    def _thdSetStates(self, conn, values):
+        """
+        Write VALUES, a dictionary of JSON values keyed by (objectid, name),
+        returning the keys whose insert lost a race with another master.
+        Existing values are updated in a single transaction.
+        """
         object_state_tbl = self.db.model.object_state
 
+        missing = []
+        transaction = conn.begin()
+        q = object_state_tbl.update(
+            whereclause=((object_state_tbl.c.objectid == sa.bindparam('_objectid'))
+                         & (object_state_tbl.c.name == sa.bindparam('_name'))))
+        for (objectid, name), value_json in sorted(values.iteritems()):
+            res = conn.execute(q, _objectid=objectid, _name=name,
+                               value_json=value_json)
+            if res.rowcount == 0:
+                missing.append((objectid, name))
+        transaction.commit()
+
+        # a failed insert aborts the transaction on some databases, so new
+        # values are added one at a time
+        lost = []
+        for objectid, name in missing:
+            if not self._thdSetStateJson(conn, objectid, name,
+                                         values[(objectid, name)]):
+                lost.append((objectid, name))
+        return lost
+
+    def _encodeState(self, value):
         try:
-            value_json = json.dumps(value)
+            return json.dumps(value)
         except (TypeError, ValueError):
             raise TypeError("Error encoding JSON for %r" % (value,))
 
+    def thdSetState(self, conn, objectid, name, value):
+        value_json = self._encodeState(value)
+        self._thdSetStateJson(conn, objectid, name, value_json)
+
+    def _thdSetStateJson(self, conn, objectid, name, value_json):
+        object_state_tbl = self.db.model.object_state
+
         self.checkLength(object_state_tbl.c.name, name)
 
         def update():
@@ -150,14 +304,15 @@ class StateConnectorComponent(base.DBConnectorComponent):
         # win.
 
         if update():
-            return
+            return True
 
         self._test_timing_hook(conn)
 
         try:
             insert()
         except (sqlalchemy.exc.IntegrityError, sqlalchemy.exc.ProgrammingError):
-            pass  # someone beat us to it - oh well
+            return False  # someone beat us to it - oh well
+        return True
 
     def _test_timing_hook(self, conn):
         # called so tests can simulate another process inserting a database row
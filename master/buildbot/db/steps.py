@@ -53,12 +53,14 @@ class StepsConnectorComponent(base.DBConnectorComponent):
             return rv
         return self.db.pool.do(thd)
 
-    def getSteps(self, buildid):
+    def getSteps(self, buildid, resultSpec=None):
         def thd(conn):
             tbl = self.db.model.steps
             q = tbl.select()
             q = q.where(tbl.c.buildid == buildid)
             q = q.order_by(tbl.c.number)
+            if resultSpec is not None:
+                return resultSpec.thd_execute(conn, q, self._stepdictFromRow)
             res = conn.execute(q)
             return [self._stepdictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -177,5 +179,6 @@ class StepsConnectorComponent(base.DBConnectorComponent):
             complete_at=mkdt(row.complete_at),
             state_string=row.state_string,
             results=row.results,
-            urls=json.loads(row.urls_json),
+            # urls_json is NULL if a result spec did not select it
+            urls=json.loads(row.urls_json) if row.urls_json else [],
             hidden=bool(row.hidden))
@@ -14,7 +14,6 @@
 # Copyright Buildbot Team Members
 
 
-import datetime
 import os
 import signal
 import socket
@@ -50,9 +49,7 @@ from buildbot.process.builder import BuilderControl
 from buildbot.process.users.manager import UserManagerManager
 from buildbot.schedulers.manager import SchedulerManager
 from buildbot.status.master import Status
-from buildbot.util import ascii2unicode
 from buildbot.util import check_functional_environment
-from buildbot.util import datetime2epoch
 from buildbot.util import service
 from buildbot.util.eventual import eventually
 from buildbot.www import service as wwwservice
@@ -401,38 +398,7 @@ class BuildMaster(service.ReconfigurableServiceMixin, service.MasterService):
         kwargs['who'] = who
         kwargs['files'] = files
         kwargs['comments'] = comments
-
-        def handle_deprec(oldname, newname):
-            if oldname not in kwargs:
-                return
-            old = kwargs.pop(oldname)
-            if old is not None:
-                if kwargs.get(newname) is None:
-                    log.msg("WARNING: change source is using deprecated "
-                            "addChange parameter '%s'" % oldname)
-                    return old
-                raise TypeError("Cannot provide '%s' and '%s' to addChange"
-                                % (oldname, newname))
-            return kwargs.get(newname)
-
-        kwargs['author'] = handle_deprec("who", "author")
-        kwargs['when_timestamp'] = handle_deprec("when", "when_timestamp")
-
-        # timestamp must be an epoch timestamp now
-        if isinstance(kwargs.get('when_timestamp'), datetime.datetime):
-            kwargs['when_timestamp'] = datetime2epoch(kwargs['when_timestamp'])
-
-        # unicodify stuff
-        for k in ('comments', 'author', 'revision', 'branch', 'category',
-                  'revlink', 'repository', 'codebase', 'project'):
-            if k in kwargs:
-                kwargs[k] = ascii2unicode(kwargs[k])
-        if kwargs.get('files'):
-            kwargs['files'] = [ascii2unicode(f)
-                               for f in kwargs['files']]
-        if kwargs.get('properties'):
-            kwargs['properties'] = dict((ascii2unicode(k), v)
-                                        for k, v in kwargs['properties'].iteritems())
+        kwargs = changes.convertChangeArgs(kwargs)
 
         # pass the converted call on to the data API
         changeid = yield self.data.updates.addChange(**kwargs)
@@ -24,6 +24,10 @@ class MQConnector(service.ReconfigurableServiceMixin, service.AsyncMultiService)
             'class': "buildbot.mq.simple.SimpleMQ",
             'keys': set(['debug']),
         },
+        'redis': {
+            'class': "buildbot.mq.redismq.RedisMQ",
+            'keys': set(['debug', 'url', 'prefix']),
+        },
     }
 
     def __init__(self, master):
@@ -0,0 +1,415 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import pprint
+import uuid
+
+from buildbot.mq import base
+from buildbot.mq import simple
+from buildbot.util import json
+from buildbot.util import service
+from buildbot.util import toJson
+from buildbot.util import tuplematch
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.python import log
+from urlparse import urlparse
+
+
+class RedisError(Exception):
+    pass
+
+
+class IncompleteReply(Exception):
+    pass
+
+
+def parseReply(buf, pos):
+    """
+    Parse a single RESP value starting at POS in BUF, returning the value and
+    the position following it; raises L{IncompleteReply} if BUF does not
+    contain all of it yet.  Error replies are returned as L{RedisError}
+    instances.
+    """
+    end = buf.find('\r\n', pos)
+    if end == -1:
+        raise IncompleteReply
+    kind, line = buf[pos], buf[pos + 1:end]
+    pos = end + 2
+    if kind == '+':
+        return line, pos
+    elif kind == '-':
+        return RedisError(line), pos
+    elif kind == ':':
+        return int(line), pos
+    elif kind == '$':
+        length = int(line)
+        if length == -1:
+            return None, pos
+        if len(buf) < pos + length + 2:
+            raise IncompleteReply
+        return buf[pos:pos + length], pos + length + 2
+    elif kind == '*':
+        count = int(line)
+        if count == -1:
+            return None, pos
+        items = []
+        for _ in xrange(count):
+            item, pos = parseReply(buf, pos)
+            items.append(item)
+        return items, pos
+    raise RedisError("unexpected reply type %r" % (kind,))
+
+
+class RespProtocol(protocol.Protocol):
+
+    """
+    A minimal client for the Redis serialization protocol (RESP), supporting
+    pipelined commands and publish/subscribe.  Replies are matched to commands
+    in order; once subscribed, published messages are passed to the factory's
+    C{messageReceived}.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.replyDeferreds = []
+
+    def connectionMade(self):
+        self.factory.connected(self)
+
+    def connectionLost(self, reason):
+        replyDeferreds, self.replyDeferreds = self.replyDeferreds, []
+        for d in replyDeferreds:
+            d.errback(reason)
+        self.factory.disconnected(self)
+
+    @staticmethod
+    def encodeCommand(args):
+        parts = ['*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, unicode):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, str):
+                arg = str(arg)
+            parts.append('$%d\r\n%s\r\n' % (len(arg), arg))
+        return ''.join(parts)
+
+    def sendCommands(self, commands):
+        """
+        Send COMMANDS, a list of argument tuples, in a single write, and return
+        a list of Deferreds firing with their replies.
+        """
+        ds = [defer.Deferred() for _ in commands]
+        self.replyDeferreds.extend(ds)
+        self.transport.write(''.join(self.encodeCommand(c) for c in commands))
+        return ds
+
+    def sendCommand(self, *args):
+        return self.sendCommands([args])[0]
+
+    def dataReceived(self, data):
+        self.buffer += data
+        pos = 0
+        while pos < len(self.buffer):
+            try:
+                reply, pos = parseReply(self.buffer, pos)
+            except IncompleteReply:
+                break
+            self.replyReceived(reply)
+        self.buffer = self.buffer[pos:]
+
+    def replyReceived(self, reply):
+        if (isinstance(reply, list) and reply
+                and reply[0] in ('message', 'pmessage')):
+            self.factory.messageReceived(reply[-2], reply[-1])
+            return
+        if not self.replyDeferreds:
+            log.msg("unexpected reply from redis: %r" % (reply,))
+            return
+        d = self.replyDeferreds.pop(0)
+        if isinstance(reply, RedisError):
+            d.errback(reply)
+        else:
+            d.callback(reply)
+
+
+class RespClientFactory(protocol.ReconnectingClientFactory):
+
+    protocol = RespProtocol
+    maxDelay = 30
+
+    def __init__(self, mq, subscriber=False):
+        self.mq = mq
+        self.subscriber = subscriber
+
+    def connected(self, proto):
+        if not self.continueTrying:
+            # connected after the service was stopped
+            proto.transport.loseConnection()
+            return
+        self.resetDelay()
+        self.mq.connected(proto, self.subscriber)
+
+    def disconnected(self, proto):
+        self.mq.disconnected(proto, self.subscriber)
+
+    def messageReceived(self, channel, data):
+        self.mq.messageReceived(channel, data)
+
+
+class RedisMQ(service.ReconfigurableServiceMixin, base.MQBase):
+
+    """
+    A message queue that delivers messages to consumers on this master
+    directly, and to other masters through a Redis server's publish/subscribe
+    channel.  Messages produced during the same reactor iteration are
+    published together.  Persistent queues keep the messages missed while
+    they are not consuming in a Redis list for each master, so they survive a
+    restart of the master.
+    """
+
+    def __init__(self, master):
+        base.MQBase.__init__(self, master)
+        self.qrefs = tuplematch.TupleIndex()
+        self.persistent_qrefs = {}
+        self.debug = False
+        self.url = None
+        self.prefix = None
+        # identifies messages produced by this master, which are delivered
+        # locally and must be ignored when they come back from the server
+        self.instanceId = uuid.uuid4().hex
+
+        self.database = None
+        self.connection = None
+        self.subscription = None
+        self.factories = []
+        self.connectionWaiters = []
+        # commands waiting to be sent, and messages waiting to be published
+        self.pendingCommands = []
+        self.pendingMessages = []
+        self.flushCall = None
+        # for tests
+        self._reactor = reactor
+
+    def reconfigServiceWithBuildbotConfig(self, new_config):
+        self.debug = new_config.mq.get('debug', False)
+        url = new_config.mq.get('url', 'redis://localhost:6379')
+        prefix = new_config.mq.get('prefix', 'buildbot')
+        if self.url is None:
+            self.url, self.prefix = url, prefix
+        elif (url, prefix) != (self.url, self.prefix):
+            log.msg("changes to c['mq']['url'] or c['mq']['prefix'] "
+                    "require a restart of the master")
+        return service.ReconfigurableServiceMixin.reconfigServiceWithBuildbotConfig(self,
+                                                                                    new_config)
+
+    @property
+    def channel(self):
+        return '%s:mq' % (self.prefix,)
+
+    def queueKey(self, persistent_name):
+        # every master sees every message, so each keeps its own queue
+        return '%s:queue:%s:%s' % (self.prefix, self.master.name,
+                                   persistent_name)
+
+    # connection handling
+
+    def startService(self):
+        base.MQBase.startService(self)
+        parsed = urlparse(self.url)
+        host, port = parsed.hostname or 'localhost', parsed.port or 6379
+        self.database = parsed.path.strip('/') or None
+        for subscriber in (False, True):
+            factory = RespClientFactory(self, subscriber)
+            self.factories.append(factory)
+            self._reactor.connectTCP(host, port, factory)
+
+    def stopService(self):
+        for factory in self.factories:
+            factory.stopTrying()
+        d = defer.succeed(None)
+        if self.connection:
+            self._flush()
+            # wait for everything sent so far to be acknowledged
+            d = self.connection.sendCommand('PING')
+            d.addErrback(lambda _: None)
+
+        @d.addCallback
+        def disconnect(_):
+            for proto in (self.connection, self.subscription):
+                if proto:
+                    proto.transport.loseConnection()
+            self.factories = []
+            return base.MQBase.stopService(self)
+        return d
+
+    def connected(self, proto, subscriber):
+        if self.database is None:
+            self._ready(proto, subscriber)
+            return
+        d = proto.sendCommand('SELECT', self.database)
+        d.addCallbacks(lambda _: self._ready(proto, subscriber),
+                       self._selectFailed, errbackArgs=(proto,))
+
+    def _selectFailed(self, why, proto):
+        log.err(why, "while selecting redis database %s" % (self.database,))
+        proto.transport.loseConnection()
+
+    def _ready(self, proto, subscriber):
+        if subscriber:
+            self.subscription = proto
+            proto.sendCommand('SUBSCRIBE', self.channel)
+        else:
+            self.connection = proto
+            waiters, self.connectionWaiters = self.connectionWaiters, []
+            for d in waiters:
+                d.callback(proto)
+            self._scheduleFlush()
+
+    def disconnected(self, proto, subscriber):
+        if subscriber and proto is self.subscription:
+            self.subscription = None
+        elif proto is self.connection:
+            self.connection = None
+        log.msg("lost connection to the redis server at %s" % (self.url,))
+
+    def whenConnected(self):
+        if self.connection:
+            return defer.succeed(self.connection)
+        d = defer.Deferred()
+        self.connectionWaiters.append(d)
+        return d
+
+    # batching
+
+    def _scheduleFlush(self):
+        if self.flushCall or not self.connection:
+            return
+        if self.pendingMessages or self.pendingCommands:
+            self.flushCall = self._reactor.callLater(0, self._flush)
+
+    def _flush(self):
+        if self.flushCall:
+            if self.flushCall.active():
+                self.flushCall.cancel()
+            self.flushCall = None
+        if not self.connection:
+            # sent once the connection is re-established
+            return
+        commands, self.pendingCommands = self.pendingCommands, []
+        if self.pendingMessages:
+            msgs, self.pendingMessages = self.pendingMessages, []
+            body = json.dumps(dict(master=self.instanceId, msgs=msgs),
+                              default=toJson)
+            commands.append(('PUBLISH', self.channel, body))
+        if not commands:
+            return
+        for d in self.connection.sendCommands(commands):
+            d.addErrback(log.err, 'while sending messages to redis')
+
+    # producing and consuming
+
+    def produce(self, routingKey, data):
+        if self.debug:
+            log.msg("MSG: %s\n%s" % (routingKey, pprint.pformat(data)))
+        self.deliver(routingKey, data)
+        self.pendingMessages.append((routingKey, data))
+        self._scheduleFlush()
+
+    def deliver(self, routingKey, data):
+        for qref in self.qrefs.match(routingKey):
+            qref.invoke(routingKey, data)
+
+    def messageReceived(self, channel, body):
+        try:
+            body = json.loads(body)
+            if body['master'] == self.instanceId:
+                return
+            msgs = body['msgs']
+        except Exception:
+            log.err(None, 'while decoding message from redis')
+            return
+        for routingKey, data in msgs:
+            self.deliver(tuple(routingKey), data)
+
+    def addToPersistentQueue(self, persistent_name, routingKey, data):
+        body = json.dumps([routingKey, data], default=toJson)
+        self.pendingCommands.append(('RPUSH', self.queueKey(persistent_name),
+                                     body))
+        self._scheduleFlush()
+
+    @defer.inlineCallbacks
+    def drainPersistentQueue(self, persistent_name):
+        key = self.queueKey(persistent_name)
+        conn = yield self.whenConnected()
+        # make sure anything added to the queue is sent first
+        self._flush()
+        ds = conn.sendCommands([('MULTI',), ('LRANGE', key, 0, -1),
+                                ('DEL', key), ('EXEC',)])
+        replies = yield defer.gatherResults(ds)
+        defer.returnValue([(tuple(rk), data) for rk, data in
+                           (json.loads(body) for body in replies[-1][0])])
+
+    @defer.inlineCallbacks
+    def startConsuming(self, callback, filter, persistent_name=None):
+        if persistent_name:
+            qref = self.persistent_qrefs.get(persistent_name)
+            if not qref:
+                qref = PersistentQueueRef(self, filter, persistent_name)
+                self.qrefs.add(filter, qref)
+                self.persistent_qrefs[persistent_name] = qref
+            qref.startDraining()
+            missed = yield self.drainPersistentQueue(persistent_name)
+            qref.startConsuming(callback, missed)
+        else:
+            qref = simple.QueueRef(self, callback, filter)
+            self.qrefs.add(filter, qref)
+        defer.returnValue(qref)
+
+
+class PersistentQueueRef(simple.QueueRef):
+
+    __slots__ = ['persistent_name', 'draining']
+
+    def __init__(self, mq, filter, persistent_name):
+        simple.QueueRef.__init__(self, mq, None, filter)
+        self.persistent_name = persistent_name
+        self.draining = None
+
+    def startDraining(self):
+        # messages produced while the stored queue is fetched are kept here,
+        # so that they are delivered after the stored ones
+        self.callback = self.addToQueue
+        if self.draining is None:
+            self.draining = []
+
+    def startConsuming(self, callback, missed):
+        self.callback = callback
+        draining, self.draining = self.draining or [], None
+
+        # invoke for every message that was missed
+        for routingKey, data in missed + draining:
+            self.invoke(routingKey, data)
+
+    def stopConsuming(self):
+        self.callback = self.addToQueue
+
+    def addToQueue(self, routingKey, data):
+        if self.draining is not None:
+            self.draining.append((routingKey, data))
+        else:
+            self.mq.addToPersistentQueue(self.persistent_name, routingKey,
+                                         data)
@@ -26,7 +26,7 @@ class SimpleMQ(service.ReconfigurableServiceMixin, base.MQBase):
 
     def __init__(self, master):
         base.MQBase.__init__(self, master)
-        self.qrefs = []
+        self.qrefs = tuplematch.TupleIndex()
         self.persistent_qrefs = {}
         self.debug = False
 
@@ -38,9 +38,8 @@ class SimpleMQ(service.ReconfigurableServiceMixin, base.MQBase):
     def produce(self, routingKey, data):
         if self.debug:
             log.msg("MSG: %s\n%s" % (routingKey, pprint.pformat(data)))
-        for qref in self.qrefs:
-            if tuplematch.matchTuple(routingKey, qref.filter):
-                qref.invoke(routingKey, data)
+        for qref in self.qrefs.match(routingKey):
+            qref.invoke(routingKey, data)
 
     def startConsuming(self, callback, filter, persistent_name=None):
         if persistent_name:
@@ -49,11 +48,11 @@ class SimpleMQ(service.ReconfigurableServiceMixin, base.MQBase):
                 qref.startConsuming(callback)
             else:
                 qref = PersistentQueueRef(self, callback, filter)
-                self.qrefs.append(qref)
+                self.qrefs.add(filter, qref)
                 self.persistent_qrefs[persistent_name] = qref
         else:
             qref = QueueRef(self, callback, filter)
-            self.qrefs.append(qref)
+            self.qrefs.add(filter, qref)
         return defer.succeed(qref)
 
 
@@ -68,10 +67,7 @@ class QueueRef(base.QueueRef):
 
     def stopConsuming(self):
         self.callback = None
-        try:
-            self.mq.qrefs.remove(self)
-        except ValueError:
-            pass
+        self.mq.qrefs.remove(self.filter, self)
 
 
 class PersistentQueueRef(QueueRef):
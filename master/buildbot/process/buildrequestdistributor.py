@@ -27,6 +27,165 @@ from twisted.python.failure import Failure
 
 import random
 
+from collections import OrderedDict
+
+
+class UnclaimedBuildRequests(object):
+
+    """
+    The unclaimed build requests of a builder, as dictionaries from the data
+    API, oldest first.  Requests are added and removed by id in constant time;
+    adding a request older than the newest one defers re-sorting until the
+    requests are next read.
+    """
+
+    def __init__(self, brdicts=()):
+        self._brdicts = OrderedDict()
+        self._sorted = True
+        for brdict in sorted(brdicts, key=lambda brd: brd['submitted_at']):
+            self.add(brdict)
+
+    def __len__(self):
+        return len(self._brdicts)
+
+    def __iter__(self):
+        self._sort()
+        # iterate over a copy, so that requests can be removed meanwhile
+        return iter(self._brdicts.values())
+
+    def get(self, brid):
+        return self._brdicts.get(brid)
+
+    def first(self):
+        self._sort()
+        for brdict in self._brdicts.itervalues():
+            return brdict
+
+    def add(self, brdict):
+        brid = brdict['buildrequestid']
+        if brid in self._brdicts:
+            return
+        if self._brdicts and self._sorted:
+            newest = self._brdicts[next(reversed(self._brdicts))]
+            if brdict['submitted_at'] < newest['submitted_at']:
+                self._sorted = False
+        self._brdicts[brid] = brdict
+
+    def remove(self, brid):
+        self._brdicts.pop(brid, None)
+
+    def copy(self):
+        self._sort()
+        rv = UnclaimedBuildRequests()
+        rv._brdicts = self._brdicts.copy()
+        return rv
+
+    def _sort(self):
+        if not self._sorted:
+            self._brdicts = OrderedDict(
+                sorted(self._brdicts.iteritems(),
+                       key=lambda item: item[1]['submitted_at']))
+            self._sorted = True
+
+
+class BuildRequestIndex(object):
+
+    """
+    The unclaimed build requests of each builder, fetched from the data API
+    the first time they are needed, and then kept up to date from the build
+    request messages.  The botmaster also relies on these messages to start
+    builds for new requests, so in a multi-master configuration the message
+    queue must be shared between masters.  Requests changed without a
+    message are picked up when they are fetched again, after C{MAX_AGE}
+    seconds.
+    """
+
+    MAX_AGE = 300
+
+    def __init__(self, master):
+        self.master = master
+        self.builders = {}
+        self._fetchedAt = {}
+        # messages received while fetching a builder's requests, which are
+        # applied once the fetch is complete
+        self._fetching = {}
+        self._fetchLock = defer.DeferredLock()
+        self._consumers = []
+        # for tests
+        self._reactor = reactor
+
+    @defer.inlineCallbacks
+    def startConsuming(self):
+        for event in ('new', 'unclaimed', 'claimed', 'complete'):
+            consumer = yield self.master.mq.startConsuming(
+                self._buildRequestMessage, ('buildrequests', None, event))
+            self._consumers.append(consumer)
+
+    def stopConsuming(self):
+        for consumer in self._consumers:
+            consumer.stopConsuming()
+        self._consumers = []
+        self.builders = {}
+        self._fetchedAt = {}
+
+    def getUnclaimed(self, builderid):
+        """
+        Get the L{UnclaimedBuildRequests} of a builder, which must not be
+        modified by the caller.
+        """
+        if builderid in self.builders:
+            age = self._reactor.seconds() - self._fetchedAt[builderid]
+            if age < self.MAX_AGE:
+                return defer.succeed(self.builders[builderid])
+            self.invalidate(builderid)
+        return self._fetchLock.run(self._fetchUnclaimed, builderid)
+
+    def invalidate(self, builderid):
+        # forget the builder's requests, which are fetched again when next
+        # needed
+        self.builders.pop(builderid, None)
+        self._fetchedAt.pop(builderid, None)
+
+    def removeClaimed(self, builderid, brids):
+        requests = self.builders.get(builderid)
+        if requests is not None:
+            for brid in brids:
+                requests.remove(brid)
+
+    @defer.inlineCallbacks
+    def _fetchUnclaimed(self, builderid):
+        if builderid in self.builders:
+            defer.returnValue(self.builders[builderid])
+        self._fetching[builderid] = messages = []
+        fetchedAt = self._reactor.seconds()
+        try:
+            brdicts = yield self.master.data.get(
+                ('builders', builderid, 'buildrequests'),
+                [resultspec.Filter('claimed', 'eq', [False])])
+        finally:
+            del self._fetching[builderid]
+        requests = UnclaimedBuildRequests(brdicts)
+        for event, msg in messages:
+            self._applyMessage(requests, event, msg)
+        # without the messages, the requests would soon be out of date
+        if self._consumers:
+            self.builders[builderid] = requests
+            self._fetchedAt[builderid] = fetchedAt
+        defer.returnValue(requests)
+
+    def _buildRequestMessage(self, key, msg):
+        builderid = msg['builderid']
+        if builderid in self._fetching:
+            self._fetching[builderid].append((key[-1], msg))
+        elif builderid in self.builders:
+            self._applyMessage(self.builders[builderid], key[-1], msg)
+
+    def _applyMessage(self, requests, event, msg):
+        if event in ('new', 'unclaimed'):
+            requests.add(msg)
+        else:
+            requests.remove(msg['buildrequestid'])
+
 
 class BuildChooserBase(object):
     #
@@ -44,12 +203,19 @@ class BuildChooserBase(object):
     # The default implementation of this class implements a default
     # chooseNextBuild() that delegates out to two other functions:
     #   * bc.popNextBuild() - get the next (slave, breq) pair
+    #
+    # If claiming the chosen build requests fails, the chooser is told with
+    #    * bc.claimFailed(slave, breqs)
+    # and is then asked for the next build as usual.
 
     def __init__(self, bldr, master):
         self.bldr = bldr
         self.master = master
         self.breqCache = {}
         self.unclaimedBrdicts = None
+        # a BuildRequestIndex to get the unclaimed build requests from,
+        # rather than fetching them
+        self.requestIndex = None
 
     @defer.inlineCallbacks
     def chooseNextBuild(self):
@@ -68,24 +234,30 @@ class BuildChooserBase(object):
         # it's just one breq
         raise NotImplementedError("Subclasses must implement this!")
 
+    def claimFailed(self, slave, breqs):
+        # The build requests were claimed elsewhere; they were already removed
+        # from the caches when they were chosen, so there is nothing to do
+        pass
+
     # - Helper functions that are generally useful to all subclasses -
     @defer.inlineCallbacks
     def _fetchUnclaimedBrdicts(self):
-        # Sets up a cache of all the unclaimed brdicts. The cache is
+        # Sets up a cache of all the unclaimed brdicts, as an
+        # UnclaimedBuildRequests instance, oldest first. The cache is
         # saved at self.unclaimedBrdicts cache. If the cache already
         # exists, this function does nothing. If a refetch is desired, set
         # the self.unclaimedBrdicts to None before calling."""
         if self.unclaimedBrdicts is None:
-            # TODO: use order of the DATA API
-            brdicts = yield self.master.data.get(('builders',
-                                                  (yield self.bldr.getBuilderId()),
-                                                  'buildrequests'),
-                                                 [resultspec.Filter('claimed',
-                                                                    'eq',
-                                                                    [False])])
-            # sort by submitted_at, so the first is the oldest
-            brdicts.sort(key=lambda brd: brd['submitted_at'])
-            self.unclaimedBrdicts = brdicts
+            builderid = yield self.bldr.getBuilderId()
+            if self.requestIndex is not None:
+                # copy, as requests are removed from the cache when chosen
+                requests = yield self.requestIndex.getUnclaimed(builderid)
+                self.unclaimedBrdicts = requests.copy()
+            else:
+                brdicts = yield self.master.data.get(
+                    ('builders', builderid, 'buildrequests'),
+                    [resultspec.Filter('claimed', 'eq', [False])])
+                self.unclaimedBrdicts = UnclaimedBuildRequests(brdicts)
         defer.returnValue(self.unclaimedBrdicts)
 
     @defer.inlineCallbacks
@@ -107,11 +279,7 @@ class BuildChooserBase(object):
         if breq is None:
             return None
 
-        brid = breq.id
-        for brdict in self.unclaimedBrdicts:
-            if brid == brdict['buildrequestid']:
-                return brdict
-        return None
+        return self.unclaimedBrdicts.get(breq.id)
 
     def _removeBuildRequest(self, breq):
         # Remove a BuildrRequest object (and its brdict)
@@ -120,9 +288,7 @@ class BuildChooserBase(object):
         if breq is None:
             return
 
-        brdict = self._getBrdictForBuildRequest(breq)
-        if brdict is not None:
-            self.unclaimedBrdicts.remove(brdict)
+        self.unclaimedBrdicts.remove(breq.id)
 
         if breq.id in self.breqCache:
             del self.breqCache[breq.id]
@@ -237,7 +403,7 @@ class BasicBuildChooser(BuildChooserBase):
                 nextBreq = None
         else:
             # otherwise just return the first build
-            brdict = self.unclaimedBrdicts[0]
+            brdict = self.unclaimedBrdicts.first()
             nextBreq = yield self._getBuildRequestForBrdict(brdict)
 
         defer.returnValue(nextBreq)
@@ -283,6 +449,10 @@ class BasicBuildChooser(BuildChooserBase):
         # push the slaves back to the front
         self.preferredSlaves[:0] = slaves
 
+    def claimFailed(self, slave, breqs):
+        # the slave is still free, so offer it for the next build
+        self._unpopSlaves([slave])
+
     def canStartBuild(self, slave, breq):
         return self.bldr.canStartBuild(slave, breq)
 
@@ -317,6 +487,13 @@ class BuildRequestDistributor(service.AsyncService):
 
         self._pendingMSBOCalls = []
 
+        self.requestIndex = BuildRequestIndex(self.master)
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield self.requestIndex.startConsuming()
+        yield service.AsyncService.startService(self)
+
     @defer.inlineCallbacks
     def stopService(self):
         # Lots of stuff happens asynchronously here, so we need to let it all
@@ -332,6 +509,8 @@ class BuildRequestDistributor(service.AsyncService):
         if self._pendingMSBOCalls:
             yield defer.DeferredList(self._pendingMSBOCalls)
 
+        self.requestIndex.stopConsuming()
+
     def maybeStartBuildsOn(self, new_builders):
         """
         Try to start any builds that can be started right now.  This function
@@ -500,21 +679,26 @@ class BuildRequestDistributor(service.AsyncService):
             claimed_at = epoch2datetime(claimed_at_epoch)
             if not (yield self.master.data.updates.claimBuildRequests(
                     brids, claimed_at=claimed_at)):
-                # some brids were already claimed, so start over
-                bc = self.createBuildChooser(bldr, self.master)
+                # some brids were already claimed, presumably by another
+                # master; the chooser has already dropped them, so let it
+                # carry on, but fetch the builder's requests afresh next time,
+                # and then retry any of these that are still unclaimed
+                self.requestIndex.invalidate((yield bldr.getBuilderId()))
+                bc.claimFailed(slave, breqs)
+                self.botmaster.maybeStartBuildsForBuilder(bldr.name)
                 continue
+            self.requestIndex.removeClaimed((yield bldr.getBuilderId()), brids)
 
-            # the claim was successful, so publish a message for each brid
-            for brid in brids:
-                # TODO: inefficient..
-                brdict = yield self.master.db.buildrequests.getBuildRequest(brid)
-                key = ('buildsets', str(brdict['buildsetid']),
+            # the claim was successful, so publish a message for each brid,
+            # using what the chosen build requests already know
+            for breq in breqs:
+                key = ('buildsets', str(breq.bsid),
                        'builders', str(-1),
-                       'buildrequests', str(brdict['buildrequestid']), 'claimed')
+                       'buildrequests', str(breq.id), 'claimed')
                 msg = dict(
-                    bsid=brdict['buildsetid'],
-                    brid=brdict['buildrequestid'],
-                    buildername=brdict['buildername'],
+                    bsid=breq.bsid,
+                    brid=breq.id,
+                    buildername=ascii2unicode(breq.buildername),
                     builderid=-1,
                     # TODO:
                     # claimed_at=claimed_at_epoch,
@@ -525,14 +709,16 @@ class BuildRequestDistributor(service.AsyncService):
             buildStarted = yield bldr.maybeStartBuild(slave, breqs)
             if not buildStarted:
                 yield self.master.data.updates.unclaimBuildRequests(brids)
+                # the requests are unclaimed again
+                self.requestIndex.invalidate((yield bldr.getBuilderId()))
 
                 for breq in breqs:
                     bsid = breq.bsid
                     buildername = ascii2unicode(breq.buildername)
                     brid = breq.id
-                    key = ('buildsets', str(brdict['buildsetid']),
+                    key = ('buildsets', str(bsid),
                            'builders', str(-1),
-                           'buildrequests', str(brdict['buildrequestid']), 'unclaimed')
+                           'buildrequests', str(brid), 'unclaimed')
                     msg = dict(brid=brid, bsid=bsid, buildername=buildername,
                                builderid=-1)
                     self.master.mq.produce(key, msg)
@@ -542,8 +728,11 @@ class BuildRequestDistributor(service.AsyncService):
                 self.botmaster.maybeStartBuildsForBuilder(self.name)
 
     def createBuildChooser(self, bldr, master):
-        # just instantiate the build chooser requested
-        return self.BuildChooser(bldr, master)
+        # just instantiate the build chooser requested, and have it use the
+        # index of unclaimed build requests
+        bc = self.BuildChooser(bldr, master)
+        bc.requestIndex = self.requestIndex
+        return bc
 
     def _quiet(self):
         # shim for tests
@@ -31,10 +31,11 @@ class Log(object):
         self.name = name
 
         self.subPoint = util.subscription.SubscriptionPoint("%r log" % (name,))
+        self.chunkSubPoint = util.subscription.SubscriptionPoint(
+            "%r log chunks" % (name,))
         self.subscriptions = {}
         self.finished = False
         self.finishWaiters = []
-        self.lock = defer.DeferredLock()
         self.decoder = decoder
 
     @staticmethod
@@ -62,17 +63,29 @@ class Log(object):
     def subscribe(self, callback):
         return self.subPoint.subscribe(callback)
 
+    def subscribeChunks(self, callback):
+        # like subscribe, but the callback gets a LineChunk, shared by all of
+        # the chunk subscribers, rather than the text
+        return self.chunkSubPoint.subscribe(callback)
+
+    def _deliver(self, stream, lines):
+        self.subPoint.deliver(stream, lines)
+        if self.chunkSubPoint.subscriptions:
+            chunk = None
+            if lines is not None:
+                chunk = lineboundaries.LineChunk(lines)
+            self.chunkSubPoint.deliver(stream, chunk)
+
     # adding lines
 
-    @defer.inlineCallbacks
     def addRawLines(self, lines):
         # used by subclasses to add lines that are already appropriately
-        # formatted for the log type, and newline-terminated
+        # formatted for the log type, and newline-terminated.  The database
+        # buffers and orders appends, so there is no need to wait for one to
+        # complete before starting the next.
         assert lines[-1] == '\n'
         assert not self.finished
-        yield self.lock.acquire()
-        yield self.master.data.updates.appendLog(self.logid, lines)
-        yield self.lock.release()
+        return self.master.data.updates.appendLog(self.logid, lines)
 
     # completion
 
@@ -94,7 +107,7 @@ class Log(object):
         yield self.master.data.updates.finishLog(self.logid)
 
         # notify subscribers *after* finishing the log
-        self.subPoint.deliver(None, None)
+        self._deliver(None, None)
 
         # notify those waiting for finish
         for d in self.finishWaiters:
@@ -114,7 +127,7 @@ class PlainLog(Log):
         def wholeLines(lines):
             if not isinstance(lines, unicode):
                 lines = self.decoder(lines)
-            self.subPoint.deliver(None, lines)
+            self._deliver(None, lines)
             return self.addRawLines(lines)
         self.lbf = lineboundaries.LineBoundaryFinder(wholeLines)
 
@@ -158,7 +171,7 @@ class StreamLog(Log):
                 if not isinstance(lines, unicode):
                     lines = self.decoder(lines)
                 # deliver the un-annotated version to subscribers
-                self.subPoint.deliver(stream, lines)
+                self._deliver(stream, lines)
                 # strip the last character, as the regexp will add a
                 # prefix character after the trailing newline
                 self.addRawLines(self.pat.sub(stream, lines)[:-1])
@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 from buildbot import interfaces
+from buildbot.util import lineboundaries
 from zope.interface import implements
 
 
@@ -49,6 +50,50 @@ class LogObserver(object):
         pass
 
 
+class LogChunkObserver(LogObserver):
+
+    """
+    An observer which gets each block of whole lines delivered by the log as
+    a L{buildbot.util.lineboundaries.LineChunk}, so that it can handle all of
+    the lines at once instead of being called for each one.  The chunk is
+    shared with the log's other chunk observers, so its lines are only split
+    out once.
+    """
+
+    def setLog(self, loog):
+        loog.subscribeChunks(self.gotChunk)
+
+    def gotChunk(self, stream, chunk):
+        if chunk is None:
+            self.finishReceived()
+        elif stream is None or stream == 'o':
+            self.outChunkReceived(chunk)
+        elif stream == 'e':
+            self.errChunkReceived(chunk)
+        elif stream == 'h':
+            self.headerChunkReceived(chunk)
+
+    # text delivered by other means, e.g., by fake logs, is made into chunks
+
+    def outReceived(self, data):
+        self.outChunkReceived(lineboundaries.LineChunk(data))
+
+    def errReceived(self, data):
+        self.errChunkReceived(lineboundaries.LineChunk(data))
+
+    def headerReceived(self, data):
+        self.headerChunkReceived(lineboundaries.LineChunk(data))
+
+    def outChunkReceived(self, chunk):
+        pass
+
+    def errChunkReceived(self, chunk):
+        pass
+
+    def headerChunkReceived(self, chunk):
+        pass
+
+
 class LogLineObserver(LogObserver):
     stdoutDelimiter = "\n"
     stderrDelimiter = "\n"
@@ -127,7 +172,7 @@ class LineConsumerLogObserver(LogLineObserver):
             self.generator.close()
 
 
-class OutputProgressObserver(LogObserver):
+class OutputProgressObserver(LogChunkObserver):
     length = 0
 
     def __init__(self, name):
@@ -138,11 +183,16 @@ class OutputProgressObserver(LogObserver):
             self.length += len(data)
         self.step.setProgress(self.name, self.length)
 
+    def gotChunk(self, stream, chunk):
+        if chunk is not None:
+            self.length += len(chunk.text)
+        self.step.setProgress(self.name, self.length)
+
 
-class BufferLogObserver(LogObserver):
+class BufferLogObserver(LogChunkObserver):
 
     def __init__(self, wantStdout=True, wantStderr=False):
-        LogObserver.__init__(self)
+        LogChunkObserver.__init__(self)
         self.stdout = [] if wantStdout else None
         self.stderr = [] if wantStderr else None
 
@@ -154,6 +204,12 @@ class BufferLogObserver(LogObserver):
         if self.stderr is not None:
             self.stderr.append(data)
 
+    def outChunkReceived(self, chunk):
+        self.outReceived(chunk.text)
+
+    def errChunkReceived(self, chunk):
+        self.errReceived(chunk.text)
+
     def _get(self, chunks):
         if chunks is None or not chunks:
             return u''
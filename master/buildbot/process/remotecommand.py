@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+import zlib
+
 from buildbot import util
 from buildbot.buildslave.protocols import base
 from buildbot.process import metrics
@@ -59,6 +61,9 @@ class RemoteCommand(base.RemoteCommandImpl):
         self.args = args
         self.ignore_updates = ignore_updates
         self.decodeRC = decodeRC
+        self.decompressors = {}
+        # fires once the updates received so far have been handled
+        self._pendingUpdates = defer.succeed(None)
         self.conn = None
         self.buildslave = None
         self.step = None
@@ -182,18 +187,51 @@ class RemoteCommand(base.RemoteCommandImpl):
         max_updatenum = 0
         for (update, num) in updates:
             # log.msg("update[%d]:" % num)
-            try:
-                if self.active and not self.ignore_updates:
-                    self.remoteUpdate(update)
-            except Exception:
-                # log failure, terminate build, let slave retire the update
-                self._finished(Failure())
-                # TODO: what if multiple updates arrive? should
-                # skip the rest but ack them all
+            # slaves send interleaved output as several updates in one
+            # message; each is handled once the previous one has been, and
+            # once one fails the command is finished, so the rest are skipped
+            # but still acked
+            if self.active and not self.ignore_updates:
+                self._pendingUpdates.addCallback(self._handleUpdate, update)
             if num > max_updatenum:
                 max_updatenum = num
         return max_updatenum
 
+    def _handleUpdate(self, _, update):
+        if not self.active:
+            return
+        d = defer.maybeDeferred(self._decompressUpdate, update)
+        d.addCallback(self.remoteUpdate)
+        d.addErrback(self._updateFailed)
+        return d
+
+    def _decompressUpdate(self, update):
+        # 'zlib': (stream, data), where stream is 'stdout', 'stderr', 'header'
+        # or ('log', logname), and the data for each stream continues one
+        # zlib stream, so updates must be decompressed in the order they
+        # were sent
+        if 'zlib' not in update:
+            return update
+        update = update.copy()
+        stream, data = update.pop('zlib')
+        if isinstance(stream, (tuple, list)):
+            stream = tuple(stream)
+        if stream not in self.decompressors:
+            self.decompressors[stream] = zlib.decompressobj()
+        data = self.decompressors[stream].decompress(data)
+        if isinstance(stream, tuple):
+            update['log'] = (stream[1], data)
+        else:
+            update[stream] = data
+        return update
+
+    def _updateFailed(self, why):
+        # log failure, terminate build, let slave retire the update
+        if self.active:
+            self._finished(why)
+        else:
+            log.err(why, "while handling an update for %s" % (self,))
+
     def remote_complete(self, failure=None):
         """
         Called by the slave's L{buildbot.slave.bot.SlaveBuilder} to
@@ -204,10 +242,12 @@ class RemoteCommand(base.RemoteCommandImpl):
         @rtype: None
         """
         self.buildslave.messageReceivedFromSlave()
-        # call the real remoteComplete a moment later, but first return an
+        # call the real remoteComplete a moment later, once the updates sent
+        # before the completion have been handled, but first return an
         # acknowledgement so the slave can retire the completion message.
         if self.active:
-            eventually(self._finished, failure)
+            self._pendingUpdates.addCallback(
+                lambda _: eventually(self._finished, failure))
         return None
 
     def _unwrap(self, log):
@@ -386,6 +426,9 @@ class RemoteShellCommand(RemoteCommand):
                 self.args['dir'] = self.args['workdir']
             if self.step.slaveVersionIsOlderThan("shell", "2.16"):
                 self.args.pop('sigtermTime', None)
+            if (getattr(self.buildslave, 'compress_updates', False)
+                    and not self.step.slaveVersionIsOlderThan("shell", "2.20")):
+                self.args['compress'] = 'zlib'
         what = "command '%s' in dir '%s'" % (self.fake_command,
                                              self.args['workdir'])
         log.msg(what)
@@ -13,9 +13,13 @@
 #
 # Copyright Buildbot Team Members
 
+import bz2
+import copy
+import hashlib
 import os
 import tarfile
 import tempfile
+import zlib
 try:
     from cStringIO import StringIO
     assert StringIO
@@ -24,6 +28,8 @@ except ImportError:
 
 
 from buildbot.buildslave.protocols import base
+from twisted.internet import defer
+from twisted.internet import threads
 
 """
 module for regrouping all FileWriterImpl and FileReaderImpl away from steps
@@ -82,6 +88,18 @@ class FileWriter(base.FileWriterImpl):
         if self.mode is not None:
             os.chmod(self.destfile, self.mode)
 
+    def skip(self):
+        """
+        Called when the slave did not send the file, because the destination
+        already has the same content: leave it, but apply the mode.
+        """
+        self.fp.close()
+        self.fp = None
+        os.unlink(self.tmpname)
+        self.tmpname = None
+        if self.mode is not None:
+            os.chmod(self.destfile, self.mode)
+
     def cancel(self):
         # unclean shutdown, the file is probably truncated, so delete it
         # altogether rather than deliver a corrupted file
@@ -94,42 +112,220 @@ class FileWriter(base.FileWriterImpl):
                 os.unlink(self.tmpname)
 
 
-class DirectoryWriter(FileWriter):
+class TarExtractor(object):
 
     """
-    A DirectoryWriter is implemented as a FileWriter, with an added post-processing
-    step to unpack the archive, once the transfer has completed.
+    Extract a tar archive, optionally compressed, into C{destroot} as its data
+    is passed to L{feed}, without storing the archive.  Only the member
+    headers are buffered; the content of each file is written out as it
+    arrives.  L{close} finishes the extraction, and L{abort} removes whatever
+    was created so far.
     """
 
-    def __init__(self, destroot, maxsize, compress, mode):
+    # a header (with any extended headers) that cannot be parsed from this
+    # much data never will be
+    maxHeaderSize = 1024 * 1024
+
+    def __init__(self, destroot, compress):
         self.destroot = destroot
-        self.compress = compress
+        if compress == 'bz2':
+            self.decompressor = bz2.BZ2Decompressor()
+        elif compress == 'gz':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decompressor = None
 
-        self.fd, self.tarname = tempfile.mkstemp()
-        os.close(self.fd)
+        # used only to parse headers and for its extraction helpers; an
+        # archive with no members opens without error
+        self.archive = tarfile.TarFile(
+            fileobj=StringIO(tarfile.NUL * tarfile.RECORDSIZE), mode='r')
 
-        FileWriter.__init__(self, self.tarname, maxsize, mode)
+        self.buffer = ''
+        self.fp = None
+        self.member = None
+        self.remaining = 0
+        self.skip = 0
+        self.done = False
+        self.directories = []
+        # paths created by this extraction, in order, for abort
+        self.created = []
+
+    def feed(self, data):
+        if self.decompressor:
+            try:
+                data = self.decompressor.decompress(data)
+            except EOFError:
+                # data after the end of a bz2 stream
+                return
+        self._process(data)
+
+    def close(self):
+        if self.decompressor and hasattr(self.decompressor, 'flush'):
+            self._process(self.decompressor.flush())
+        if self.fp or (self.buffer and not self.done):
+            raise tarfile.ReadError("unexpected end of data")
+
+        # set the attributes of directories last, as extractall does
+        self.directories.sort(key=lambda tarinfo: tarinfo.name, reverse=True)
+        for tarinfo in self.directories:
+            self._setAttributes(tarinfo, self._targetPath(tarinfo))
+        self.directories = []
+
+    def abort(self):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+        for path in reversed(self.created):
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    os.rmdir(path)
+                else:
+                    os.unlink(path)
+            except OSError:
+                pass
+        self.created = []
+
+    def _process(self, data):
+        self.buffer += data
+        while self.buffer and not self.done:
+            if self.fp:
+                chunk = self.buffer[:self.remaining]
+                self.buffer = self.buffer[len(chunk):]
+                self.fp.write(chunk)
+                self.remaining -= len(chunk)
+                if not self.remaining:
+                    self.fp.close()
+                    self.fp = None
+                    self._setAttributes(self.member,
+                                        self._targetPath(self.member))
+            elif self.skip:
+                skipped = min(self.skip, len(self.buffer))
+                self.buffer = self.buffer[skipped:]
+                self.skip -= skipped
+            elif not self._nextMember():
+                break
+        if self.done:
+            # the rest is padding
+            self.buffer = ''
+
+    def _nextMember(self):
+        self.archive.fileobj = StringIO(self.buffer)
+        try:
+            tarinfo = tarfile.TarInfo.fromtarfile(self.archive)
+        except tarfile.EOFHeaderError:
+            self.done = True
+            return False
+        except (tarfile.EmptyHeaderError, tarfile.TruncatedHeaderError,
+                tarfile.SubsequentHeaderError), e:
+            # wait for the rest of the header
+            if len(self.buffer) > self.maxHeaderSize:
+                raise tarfile.ReadError(str(e))
+            return False
+        except tarfile.HeaderError, e:
+            raise tarfile.ReadError(str(e))
+        self.buffer = self.buffer[tarinfo.offset_data:]
+
+        targetpath = self._targetPath(tarinfo)
+        self._noteCreated(targetpath)
+        if tarinfo.isreg() or tarinfo.type not in tarfile.SUPPORTED_TYPES:
+            upperdirs = os.path.dirname(targetpath)
+            if upperdirs and not os.path.exists(upperdirs):
+                os.makedirs(upperdirs)
+            self.fp = open(targetpath, 'wb')
+            self.member = tarinfo
+            self.remaining = tarinfo.size
+            self.skip = self._padded(tarinfo.size) - tarinfo.size
+            if not self.remaining:
+                self.fp.close()
+                self.fp = None
+                self._setAttributes(tarinfo, targetpath)
+        else:
+            if tarinfo.isdir():
+                # extract directories with a safe mode, as extractall does
+                self.directories.append(tarinfo)
+                tarinfo = copy.copy(tarinfo)
+                tarinfo.mode = 0700
+            self.archive.extract(tarinfo, self.destroot)
+        return True
+
+    def _padded(self, size):
+        blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+        if remainder:
+            blocks += 1
+        return blocks * tarfile.BLOCKSIZE
+
+    def _targetPath(self, tarinfo):
+        targetpath = os.path.join(self.destroot, tarinfo.name).rstrip('/')
+        return targetpath.replace('/', os.sep)
+
+    def _noteCreated(self, path):
+        missing = []
+        while path and not os.path.lexists(path):
+            missing.append(path)
+            path = os.path.dirname(path)
+        self.created.extend(reversed(missing))
+
+    def _setAttributes(self, tarinfo, targetpath):
+        try:
+            self.archive.chown(tarinfo, targetpath)
+            if not tarinfo.issym():
+                self.archive.chmod(tarinfo, targetpath)
+                self.archive.utime(tarinfo, targetpath)
+        except tarfile.ExtractError:
+            # ignored, as by extractall
+            pass
+
+
+class DirectoryWriter(base.FileWriterImpl):
+
+    """
+    A DirectoryWriter unpacks the archive sent by the slave into C{destroot}
+    as it arrives, and removes what was unpacked if the transfer is
+    cancelled.
+    """
+
+    def __init__(self, destroot, maxsize, compress, mode):
+        self.destroot = destroot
+        self.remaining = maxsize
+        self.extractor = TarExtractor(destroot, compress)
+
+    def remote_write(self, data):
+        """
+        Called from remote slave to unpack L{data} within boundaries of
+        L{maxsize}
+        """
+        if self.extractor is None:
+            return
+        if self.remaining is not None:
+            data = data[:self.remaining]
+            self.remaining -= len(data)
+        try:
+            self.extractor.feed(data)
+        except Exception:
+            self.cancel()
+            raise
 
     def remote_unpack(self):
         """
         Called by remote slave to state that no more data will be transfered
         """
-        # Make sure remote_close is called, otherwise atomic rename wont happen
-        self.remote_close()
-
-        # Map configured compression to a TarFile setting
-        if self.compress == 'bz2':
-            mode = 'r|bz2'
-        elif self.compress == 'gz':
-            mode = 'r|gz'
-        else:
-            mode = 'r'
+        if self.extractor is None:
+            return
+        try:
+            self.extractor.close()
+        except Exception:
+            self.cancel()
+            raise
+        self.extractor = None
 
-        # Unpack archive and clean up after self
-        archive = tarfile.open(name=self.tarname, mode=mode)
-        archive.extractall(path=self.destroot)
-        archive.close()
-        os.remove(self.tarname)
+    def remote_close(self):
+        self.remote_unpack()
+
+    def cancel(self):
+        # unclean shutdown, so remove the partially unpacked directory
+        if self.extractor:
+            self.extractor.abort()
+            self.extractor = None
 
 
 class FileReader(base.FileReaderImpl):
@@ -196,3 +392,49 @@ class StringFileReader(FileReader):
 
     def __init__(self, s):
         FileReader.__init__(self, StringIO(s))
+
+
+def fileDigest(path):
+    """Return the hex SHA-256 digest of the content of the file at PATH"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(65536)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class DigestDict(dict):
+    # the digests cache keeps weak references to its values, and a plain
+    # string cannot be weakly referenced
+    pass
+
+
+def _digestFile(key):
+    d = threads.deferToThread(fileDigest, key[0])
+    d.addCallback(lambda digest: DigestDict(digest=digest))
+    return d
+
+
+@defer.inlineCallbacks
+def getFileDigest(master, path):
+    """
+    Return the content digest of the file at C{path}, as compared with the
+    digest of a slave-side file to decide whether to transfer it.
+
+    Digests are kept in the master's C{digests} cache, keyed by path along
+    with the file's size, modification time and change time, so the digest
+    is computed (in a thread) again whenever one of those differs.  The
+    change time cannot be set, so it catches files replaced while keeping
+    their size and modification time.  Entries for files that changed or are
+    no longer transferred are simply evicted from the cache.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime, st.st_ctime)
+
+    cache = master.caches.get_cache('digests', _digestFile)
+    digestDict = yield cache.get(key)
+    defer.returnValue(digestDict['digest'])
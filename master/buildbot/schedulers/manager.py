@@ -16,6 +16,7 @@
 from buildbot import util
 from buildbot.process import metrics
 from buildbot.util import service as util_service
+from buildbot.util import timerwheel
 from twisted.application import service
 from twisted.internet import defer
 from twisted.python import log
@@ -29,6 +30,8 @@ class SchedulerManager(util_service.ReconfigurableServiceMixin,
         service.MultiService.__init__(self)
         self.setName('scheduler_manager')
         self.master = master
+        # shared by the timed schedulers, and kept across reconfigs
+        self.timerWheel = timerwheel.TimerWheel()
 
     @defer.inlineCallbacks
     def reconfigServiceWithBuildbotConfig(self, new_config):
@@ -13,6 +13,9 @@
 #
 # Copyright Buildbot Team Members
 
+import bisect
+import weakref
+
 from zope.interface import implements
 
 from buildbot import config
@@ -29,6 +32,72 @@ from twisted.internet import reactor
 from twisted.python import log
 
 
+class Timetable(object):
+
+    """
+    The upcoming fire times of a cron specification, computed in batches and
+    shared by every scheduler using the same specification.
+    """
+
+    batchSize = 64
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.start = None
+        self.times = []
+
+    def _compute(self, start, until=None):
+        cron = croniter.croniter(self.spec, start)
+        times = []
+        while len(times) < self.batchSize:
+            t = cron.get_next(float)
+            if until is not None and t >= until:
+                break
+            times.append(t)
+        return times
+
+    def getNext(self, after):
+        """
+        Return the first fire time strictly after AFTER.
+        """
+        if self.start is None or after < self.start:
+            times = self._compute(after, until=self.times[0]
+                                  if self.times else None)
+            if len(times) < self.batchSize and self.times:
+                # joined up with the computed times
+                self.times = times + self.times
+            else:
+                self.times = times
+            self.start = after
+        elif after >= self.times[-1]:
+            times = self._compute(self.times[-1])
+            if after >= times[-1]:
+                # too far ahead to keep the earlier times
+                self.start = after
+                times = self._compute(after)
+            else:
+                times = self.times + times
+                # keep the previous batch for schedulers that are behind
+                drop = len(times) - 2 * self.batchSize
+                if drop > 0:
+                    self.start = times[drop - 1]
+                    times = times[drop:]
+            self.times = times
+        return self.times[bisect.bisect_right(self.times, after)]
+
+
+# timetables are kept as long as a scheduler refers to them, so that they
+# survive a reconfig which replaces the schedulers using them
+_timetables = weakref.WeakValueDictionary()
+
+
+def getTimetable(spec):
+    timetable = _timetables.get(spec)
+    if timetable is None:
+        timetable = _timetables[spec] = Timetable(spec)
+    return timetable
+
+
 class Timed(base.BaseScheduler, AbsoluteSourceStampsMixin):
 
     """
@@ -199,6 +268,16 @@ class Timed(base.BaseScheduler, AbsoluteSourceStampsMixin):
         "Similar to util.now, but patchable by tests"
         return util.now(self._reactor)
 
+    def _getTimerWheel(self):
+        # the scheduler manager runs the timers of all timed schedulers
+        return getattr(self.parent, 'timerWheel', None)
+
+    def _callLater(self, delay, fn):
+        wheel = self._getTimerWheel()
+        if wheel is not None:
+            return wheel.callLater(delay, fn)
+        return self._reactor.callLater(delay, fn)
+
     def _scheduleNextBuild_locked(self):
         # clear out the existing timer
         if self.actuateAtTimer:
@@ -219,8 +298,8 @@ class Timed(base.BaseScheduler, AbsoluteSourceStampsMixin):
                     log.msg(("%s scheduler <%s>: missed scheduled build time"
                              " - building immediately") %
                             (self.__class__.__name__, self.name))
-                self.actuateAtTimer = self._reactor.callLater(untilNext,
-                                                              self._actuate)
+                self.actuateAtTimer = self._callLater(untilNext,
+                                                      self._actuate)
         return d
 
     def _actuate(self):
@@ -281,6 +360,7 @@ class NightlyBase(Timed):
         self.dayOfMonth = dayOfMonth
         self.month = month
         self.dayOfWeek = dayOfWeek
+        self._timetable = None
 
     def _timeToCron(self, time, isDayOfWeek=False):
         if isinstance(time, int):
@@ -308,16 +388,19 @@ class NightlyBase(Timed):
 
         return ','.join([str(s) for s in time])  # Convert the list to a string
 
+    def getTimetable(self):
+        if self._timetable is None:
+            sched = '%s %s %s %s %s' % (self._timeToCron(self.minute),
+                                        self._timeToCron(self.hour),
+                                        self._timeToCron(self.dayOfMonth),
+                                        self._timeToCron(self.month),
+                                        self._timeToCron(self.dayOfWeek, True))
+            self._timetable = getTimetable(sched)
+        return self._timetable
+
     def getNextBuildTime(self, lastActuated):
         dateTime = lastActuated or self.now()
-        sched = '%s %s %s %s %s' % (self._timeToCron(self.minute),
-                                    self._timeToCron(self.hour),
-                                    self._timeToCron(self.dayOfMonth),
-                                    self._timeToCron(self.month),
-                                    self._timeToCron(self.dayOfWeek, True))
-        cron = croniter.croniter(sched, dateTime)
-        nextdate = cron.get_next(float)
-        return defer.succeed(nextdate)
+        return defer.succeed(self.getTimetable().getNext(dateTime))
 
 
 class Nightly(NightlyBase):
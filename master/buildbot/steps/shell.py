@@ -16,6 +16,8 @@
 
 import inspect
 import re
+import sre_constants
+import sre_parse
 
 from buildbot import config
 from buildbot.process import buildstep
@@ -365,6 +367,220 @@ class Configure(ShellCommand):
     command = ["./configure"]
 
 
+def _compilePattern(pattern):
+    if pattern is not None and isinstance(pattern, basestring):
+        return re.compile(pattern)
+    return pattern
+
+
+def _requiredLiteral(regex):
+    """
+    Return a tuple (literal, ignoreCase) where literal is the longest ASCII
+    string that every match of the compiled REGEX contains, lower-cased if
+    REGEX ignores case; or None if there is no such string.
+    """
+    try:
+        flags = regex.flags
+        if flags & re.LOCALE:
+            return None
+        parsed = sre_parse.parse(regex.pattern, flags)
+    except Exception:
+        return None
+    best = run = ''
+    for op, av in parsed:
+        if op == sre_constants.LITERAL and av < 128:
+            run += chr(av)
+            if len(run) > len(best):
+                best = run
+        else:
+            run = ''
+    if not best:
+        return None
+    ignoreCase = bool(flags & re.IGNORECASE)
+    if ignoreCase:
+        best = best.lower()
+    return best, ignoreCase
+
+
+def _mayContain(line, literal):
+    if literal is None:
+        return True
+    literal, ignoreCase = literal
+    if ignoreCase:
+        line = line.lower()
+    return literal in line
+
+
+class WarningScanner(object):
+
+    """
+    Scan the lines of a L{WarningCountingShellCommand}'s output for warnings
+    and directory changes, a chunk at a time.  Lines are only matched against
+    a pattern if they contain the literal text that every match of it must
+    contain, and chunks with no such text are skipped altogether.
+    """
+
+    def __init__(self, step):
+        self.step = step
+        self.warningRe = _compilePattern(step.warningPattern)
+        self.enterRe = _compilePattern(step.directoryEnterPattern)
+        self.leaveRe = _compilePattern(step.directoryLeavePattern)
+        self.warningLiteral = _requiredLiteral(self.warningRe)
+        self.enterLiteral = self.enterRe and _requiredLiteral(self.enterRe)
+        self.leaveLiteral = self.leaveRe and _requiredLiteral(self.leaveRe)
+        step.loggedWarnings = []
+
+    def scanLines(self, lines):
+        if not lines:
+            return
+        text = '\n'.join(lines)
+        texts = {False: text}
+
+        def inText(literal):
+            if literal is None:
+                return True
+            literal, ignoreCase = literal
+            if ignoreCase not in texts:
+                texts[ignoreCase] = text.lower()
+            return literal in texts[ignoreCase]
+
+        if ((self.enterRe and inText(self.enterLiteral)) or
+                (self.leaveRe and inText(self.leaveLiteral))):
+            # directory changes have to be seen in order with the warnings
+            for line in lines:
+                self.scanLine(line)
+        elif self.warningLiteral is None:
+            for line in lines:
+                self.checkWarning(line)
+        elif inText(self.warningLiteral):
+            literal, ignoreCase = self.warningLiteral
+            self._scanLiteralLines(text, texts[ignoreCase], literal)
+
+    def _scanLiteralLines(self, text, searched, literal):
+        # only visit the lines containing the literal; SEARCHED is TEXT or
+        # its lower-cased version, which has the same length
+        pos = searched.find(literal)
+        while pos >= 0:
+            start = text.rfind('\n', 0, pos) + 1
+            end = text.find('\n', pos)
+            if end < 0:
+                end = len(text)
+            self.checkWarning(text[start:end])
+            pos = searched.find(literal, end + 1)
+
+    def scanLine(self, line):
+        step = self.step
+        if self.enterRe and _mayContain(line, self.enterLiteral):
+            match = self.enterRe.search(line)
+            if match:
+                step.directoryStack.append(match.group(1))
+                return
+        if (self.leaveRe and step.directoryStack and
+                _mayContain(line, self.leaveLiteral) and
+                self.leaveRe.search(line)):
+            step.directoryStack.pop()
+            return
+        if _mayContain(line, self.warningLiteral):
+            self.checkWarning(line)
+
+    def checkWarning(self, line):
+        match = self.warningRe.match(line)
+        if match:
+            self.step.maybeAddWarning(self.step.loggedWarnings, line, match)
+
+
+class SuppressionIndex(object):
+
+    """
+    Find the suppressions whose FILE-RE may match a file name without trying
+    all of them.  A FILE-RE whose required literal text contains a whole word
+    (letters, digits and underscores with another character on either side)
+    can only match file names containing that word, so it is only tried for
+    those.
+    """
+
+    wordRe = re.compile(r'[A-Za-z0-9_]+')
+
+    def __init__(self, suppressions):
+        self.suppressions = suppressions
+        self.literals = {}
+        self.byWord = {}
+        self.unindexed = []
+        for i, suppression in enumerate(suppressions):
+            fileRe = suppression[0]
+            word = None
+            if fileRe is not None:
+                if fileRe not in self.literals:
+                    self.literals[fileRe] = _requiredLiteral(fileRe)
+                word = self._indexWord(self.literals[fileRe])
+            if word is None:
+                self.unindexed.append(i)
+            else:
+                self.byWord.setdefault(word, []).append(i)
+
+    def _indexWord(self, literal):
+        if literal is None or literal[1]:
+            return None
+        literal = literal[0]
+        best = None
+        for match in self.wordRe.finditer(literal):
+            if match.start() == 0 or match.end() == len(literal):
+                continue
+            if best is None or len(match.group()) > len(best):
+                best = match.group()
+        return best
+
+    def match(self, file):
+        positions = list(self.unindexed)
+        for word in set(self.wordRe.findall(file)):
+            positions.extend(self.byWord.get(word, ()))
+        positions.sort()
+
+        # match each distinct FILE-RE only once, and only if the file
+        # contains its literal text
+        fileMatches = {}
+        suppressions = []
+        for i in positions:
+            suppression = self.suppressions[i]
+            fileRe = suppression[0]
+            if fileRe is not None:
+                if fileRe not in fileMatches:
+                    fileMatches[fileRe] = bool(
+                        _mayContain(file, self.literals[fileRe]) and
+                        fileRe.match(file))
+                if not fileMatches[fileRe]:
+                    continue
+            suppressions.append(suppression)
+        return suppressions
+
+
+class WarningLogObserver(logobserver.LogChunkObserver):
+
+    """
+    Pass all of the lines of each chunk of a log to a L{WarningScanner} at
+    once.
+    """
+
+    # longer lines are ignored
+    max_length = 16384
+
+    def __init__(self):
+        logobserver.LogChunkObserver.__init__(self)
+        self.scanner = None
+
+    def _chunkReceived(self, chunk):
+        # the scanner is only created with the first data, as the observer is
+        # created with the step
+        if self.scanner is None:
+            self.scanner = WarningScanner(self.step)
+        lines = chunk.lines
+        if len(chunk.text) > self.max_length:
+            lines = [line for line in lines if len(line) <= self.max_length]
+        self.scanner.scanLines(lines)
+
+    outChunkReceived = errChunkReceived = headerChunkReceived = _chunkReceived
+
+
 class WarningCountingShellCommand(ShellCommand, CompositeStepMixin):
     renderables = ['suppressionFile']
 
@@ -404,14 +620,22 @@ class WarningCountingShellCommand(ShellCommand, CompositeStepMixin):
         ShellCommand.__init__(self, **kwargs)
 
         self.suppressions = []
+        # the suppressions which may apply to the warnings of each file
+        self.suppressionIndex = None
+        self.suppressionsByFile = {}
         self.directoryStack = []
 
         self.warnCount = 0
         self.loggedWarnings = []
 
-        self.addLogObserver(
-            'stdio',
-            logobserver.LineConsumerLogObserver(self.warningLogConsumer))
+        if (self.warningLogConsumer.im_func is
+                WarningCountingShellCommand.warningLogConsumer.im_func):
+            observer = WarningLogObserver()
+        else:
+            # a subclass consumes the lines itself
+            observer = logobserver.LineConsumerLogObserver(
+                self.warningLogConsumer)
+        self.addLogObserver('stdio', observer)
 
     def addSuppression(self, suppressionList):
         """
@@ -440,6 +664,28 @@ class WarningCountingShellCommand(ShellCommand, CompositeStepMixin):
             if warnRe is not None and isinstance(warnRe, basestring):
                 warnRe = re.compile(warnRe)
             self.suppressions.append((fileRe, warnRe, start, end))
+        self.suppressionIndex = None
+        self.suppressionsByFile = {}
+
+    def getSuppressions(self, file):
+        """
+        Return the suppressions whose FILE-RE matches FILE, which may be None
+        to match all of them.  The result is remembered for each file, as
+        compilers tend to warn about the same files many times."""
+        if file is None:
+            return self.suppressions
+        try:
+            return self.suppressionsByFile[file]
+        except KeyError:
+            pass
+        if len(self.suppressionsByFile) >= 1000:
+            self.suppressionsByFile.clear()
+
+        if self.suppressionIndex is None:
+            self.suppressionIndex = SuppressionIndex(self.suppressions)
+        suppressions = self.suppressionIndex.match(file)
+        self.suppressionsByFile[file] = suppressions
+        return suppressions
 
     def warnExtractWholeLine(self, line, match):
         """
@@ -459,42 +705,15 @@ class WarningCountingShellCommand(ShellCommand, CompositeStepMixin):
         return (file, lineNo, text)
 
     def warningLogConsumer(self):
-        # Now compile a regular expression from whichever warning pattern we're
-        # using
-        wre = self.warningPattern
-        if isinstance(wre, str):
-            wre = re.compile(wre)
-
-        directoryEnterRe = self.directoryEnterPattern
-        if (directoryEnterRe is not None
-                and isinstance(directoryEnterRe, basestring)):
-            directoryEnterRe = re.compile(directoryEnterRe)
-
-        directoryLeaveRe = self.directoryLeavePattern
-        if (directoryLeaveRe is not None
-                and isinstance(directoryLeaveRe, basestring)):
-            directoryLeaveRe = re.compile(directoryLeaveRe)
-
         # Check if each line in the output from this command matched our
         # warnings regular expressions. If did, bump the warnings count and
-        # add the line to the collection of lines with warnings
-        self.loggedWarnings = []
+        # add the line to the collection of lines with warnings.  Unless a
+        # subclass overrides this method, a WarningLogObserver scans whole
+        # chunks of lines instead.
+        scanner = WarningScanner(self)
         while True:
             stream, line = yield
-            if directoryEnterRe:
-                match = directoryEnterRe.search(line)
-                if match:
-                    self.directoryStack.append(match.group(1))
-                    continue
-            if (directoryLeaveRe and
-                self.directoryStack and
-                    directoryLeaveRe.search(line)):
-                self.directoryStack.pop()
-                continue
-
-            match = wre.match(line)
-            if match:
-                self.maybeAddWarning(self.loggedWarnings, line, match)
+            scanner.scanLine(line)
 
     def maybeAddWarning(self, warnings, line, match):
         if self.suppressions:
@@ -507,14 +726,12 @@ class WarningCountingShellCommand(ShellCommand, CompositeStepMixin):
                     file = "%s/%s" % (currentDirectory, file)
 
             # Skip adding the warning if any suppression matches.
-            for fileRe, warnRe, start, end in self.suppressions:
-                if not (file is None or fileRe is None or fileRe.match(file)):
-                    continue
-                if not (warnRe is None or warnRe.search(text)):
-                    continue
+            for fileRe, warnRe, start, end in self.getSuppressions(file):
                 if not ((start is None and end is None) or
                         (lineNo is not None and start <= lineNo and end >= lineNo)):
                     continue
+                if not (warnRe is None or warnRe.search(text)):
+                    continue
                 return
 
         warnings.append(line)
@@ -53,6 +53,42 @@ class _TransferBuildStep(BuildStep):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.workdir = workdir
 
+    def setWindow(self, window):
+        if not isinstance(window, int) or window < 1:
+            config.error('window must be a positive integer')
+        self.window = window
+
+    def addWindowArg(self, command, args):
+        # only ask for pipelined blocks from slaves that know how to do it;
+        # older slaves would reject the unknown argument
+        if self.window <= 1:
+            return
+        if self.slaveVersionIsOlderThan(command, "2.17"):
+            log.msg("buildslave does not support windowed %s; "
+                    "transferring one block at a time" % command)
+            return
+        args['window'] = self.window
+
+    def addDigestArg(self, command, args, path):
+        # let the slave skip the transfer if its file has the same content as
+        # the one on the master
+        if not self.dedup or not os.path.isfile(path):
+            return defer.succeed(None)
+        if self.slaveVersionIsOlderThan(command, "2.18"):
+            log.msg("buildslave does not support content digests for %s; "
+                    "transferring the file" % command)
+            return defer.succeed(None)
+        d = remotetransfer.getFileDigest(self.master, path)
+
+        @d.addCallback
+        def setDigest(digest):
+            args['digest'] = digest
+
+        @d.addErrback
+        def noDigest(f):
+            log.err(f, 'while computing the digest of %s' % path)
+        return d
+
     def runTransferCommand(self, cmd, writer=None):
         # Run a transfer step, add a callback to extract the command status,
         # add an error handler that cancels the writer.
@@ -63,6 +99,11 @@ class _TransferBuildStep(BuildStep):
         def checkResult(_):
             if writer and cmd.didFail():
                 writer.cancel()
+            skipped = cmd.updates.get('skipped')
+            if skipped and not cmd.didFail():
+                self.setStatistic('bytes_skipped', skipped[-1])
+                if writer:
+                    writer.skip()
             return FAILURE if cmd.didFail() else SUCCESS
 
         @d.addErrback
@@ -88,7 +129,7 @@ class FileUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
-                 keepstamp=False, url=None,
+                 keepstamp=False, url=None, window=1, dedup=False,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -102,6 +143,8 @@ class FileUpload(_TransferBuildStep):
         self.mode = mode
         self.keepstamp = keepstamp
         self.url = url
+        self.setWindow(window)
+        self.dedup = dedup
 
     def start(self):
         self.checkSlaveHasCommand("uploadFile")
@@ -137,9 +180,14 @@ class FileUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
         }
+        self.addWindowArg('uploadFile', args)
 
-        cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
-        d = self.runTransferCommand(cmd, fileWriter)
+        d = self.addDigestArg('uploadFile', args, masterdest)
+
+        @d.addCallback
+        def run(_):
+            cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
+            return self.runTransferCommand(cmd, fileWriter)
         d.addCallback(self.finished).addErrback(self.failed)
 
 
@@ -151,7 +199,7 @@ class DirectoryUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16 * 1024,
-                 compress=None, url=None, **buildstep_kwargs):
+                 compress=None, url=None, window=1, **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
         self.slavesrc = slavesrc
@@ -163,6 +211,7 @@ class DirectoryUpload(_TransferBuildStep):
                 "'compress' must be one of None, 'gz', or 'bz2'")
         self.compress = compress
         self.url = url
+        self.setWindow(window)
 
     def start(self):
         self.checkSlaveHasCommand("uploadDirectory")
@@ -193,6 +242,7 @@ class DirectoryUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'compress': self.compress
         }
+        self.addWindowArg('uploadDirectory', args)
 
         cmd = makeStatusRemoteCommand(self, 'uploadDirectory', args)
         d = self.runTransferCommand(cmd, dirWriter)
@@ -207,7 +257,8 @@ class MultipleFileUpload(_TransferBuildStep):
 
     def __init__(self, slavesrcs, masterdest,
                  workdir=None, maxsize=None, blocksize=16 * 1024,
-                 mode=None, compress=None, keepstamp=False, url=None, **buildstep_kwargs):
+                 mode=None, compress=None, keepstamp=False, url=None, window=1,
+                 **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
         self.slavesrcs = slavesrcs
@@ -224,6 +275,7 @@ class MultipleFileUpload(_TransferBuildStep):
         self.compress = compress
         self.keepstamp = keepstamp
         self.url = url
+        self.setWindow(window)
 
     def uploadFile(self, source, masterdest):
         fileWriter = remotetransfer.FileWriter(masterdest, self.maxsize, self.mode)
@@ -236,6 +288,7 @@ class MultipleFileUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
         }
+        self.addWindowArg('uploadFile', args)
 
         cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
         return self.runTransferCommand(cmd, fileWriter)
@@ -251,6 +304,7 @@ class MultipleFileUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'compress': self.compress
         }
+        self.addWindowArg('uploadDirectory', args)
 
         cmd = makeStatusRemoteCommand(self, 'uploadDirectory', args)
         return self.runTransferCommand(cmd, dirWriter)
@@ -344,7 +398,7 @@ class FileDownload(_TransferBuildStep):
 
     def __init__(self, mastersrc, slavedest,
                  workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
-                 **buildstep_kwargs):
+                 window=1, dedup=False, **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
         self.mastersrc = mastersrc
@@ -355,6 +409,8 @@ class FileDownload(_TransferBuildStep):
             config.error(
                 'mode must be an integer or None')
         self.mode = mode
+        self.setWindow(window)
+        self.dedup = dedup
 
     def start(self):
         self.checkSlaveHasCommand("downloadFile")
@@ -390,9 +446,14 @@ class FileDownload(_TransferBuildStep):
             'workdir': self.workdir,
             'mode': self.mode,
         }
+        self.addWindowArg('downloadFile', args)
 
-        cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
-        d = self.runTransferCommand(cmd)
+        d = self.addDigestArg('downloadFile', args, source)
+
+        @d.addCallback
+        def run(_):
+            cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
+            return self.runTransferCommand(cmd)
         d.addCallback(self.finished).addErrback(self.failed)
 
 
@@ -54,6 +54,30 @@ class RawTestsEndpoint(base.Endpoint):
         })
 
 
+class RawStreamTestsEndpoint(base.Endpoint):
+    isCollection = False
+    isRaw = True
+    pathPatterns = "/rawstreamtest"
+
+    class Reader(object):
+
+        def __init__(self, pieces):
+            self.pieces = pieces
+            self.reads = 0
+
+        def read(self):
+            self.reads += 1
+            return defer.succeed(self.pieces.pop(0) if self.pieces else None)
+
+    def get(self, resultSpec, kwargs):
+        self.reader = self.Reader([u'val', u'ue\n', u'\N{SNOWMAN}'])
+        return defer.succeed({
+            "filename": "test.txt",
+            "mime-type": "text/test",
+            'raw': self.reader
+        })
+
+
 class FailEndpoint(base.Endpoint):
     isCollection = False
     pathPatterns = "/test/fail"
@@ -80,7 +104,8 @@ class TestEndpoint(base.Endpoint):
 class Test(base.ResourceType):
     name = "test"
     plural = "tests"
-    endpoints = [TestsEndpoint, TestEndpoint, FailEndpoint, RawTestsEndpoint]
+    endpoints = [TestsEndpoint, TestEndpoint, FailEndpoint, RawTestsEndpoint,
+                 RawStreamTestsEndpoint]
 
     class EntityType(types.Entity):
         id = types.Integer()
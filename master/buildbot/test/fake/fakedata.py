@@ -115,6 +115,14 @@ class FakeUpdates(object):
         self.changesAdded[-1].pop('self')
         return defer.succeed(len(self.changesAdded))
 
+    @defer.inlineCallbacks
+    def addChanges(self, changes):
+        changeids = []
+        for change in changes:
+            changeid = yield self.addChange(**change)
+            changeids.append(changeid)
+        defer.returnValue(changeids)
+
     def masterActive(self, name, masterid):
         self.testcase.assertIsInstance(name, unicode)
         self.testcase.assertIsInstance(masterid, int)
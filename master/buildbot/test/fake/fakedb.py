@@ -28,6 +28,7 @@ from buildbot.db import changesources
 from buildbot.db import schedulers
 from buildbot.test.util import validation
 from buildbot.util import datetime2epoch
+from buildbot.util import epoch2datetime
 from buildbot.util import json
 
 from twisted.internet import defer
@@ -755,6 +756,8 @@ class FakeChangesComponent(FakeDBComponent):
                   codebase='', project='', uid=None, _reactor=reactor):
         if properties is None:
             properties = {}
+        if when_timestamp is None:
+            when_timestamp = epoch2datetime(_reactor.seconds())
 
         if self.changes:
             changeid = max(self.changes.iterkeys()) + 1
@@ -790,6 +793,14 @@ class FakeChangesComponent(FakeDBComponent):
 
         defer.returnValue(changeid)
 
+    @defer.inlineCallbacks
+    def addChanges(self, changes, _reactor=reactor):
+        changeids = []
+        for change in changes:
+            changeid = yield self.addChange(_reactor=_reactor, **change)
+            changeids.append(changeid)
+        defer.returnValue(changeids)
+
     def getLatestChangeid(self):
         if self.changes:
             return defer.succeed(max(self.changes.iterkeys()))
@@ -825,7 +836,8 @@ class FakeChangesComponent(FakeDBComponent):
         chdicts = [self._chdict(self.changes[id]) for id in ids[-count:]]
         return defer.succeed(chdicts)
 
-    def getChanges(self):
+    # the result spec is left to be applied in memory by the data API
+    def getChanges(self, resultSpec=None):
         chdicts = [self._chdict(v) for v in self.changes.values()]
         return defer.succeed(chdicts)
 
@@ -1545,6 +1557,9 @@ class FakeStateComponent(FakeDBComponent):
         self.states[objectid][name] = json.dumps(value)
         return defer.succeed(None)
 
+    def flushState(self):
+        return defer.succeed(None)
+
     # fake methods
 
     def fakeState(self, name, class_name, **kwargs):
@@ -1609,6 +1624,7 @@ class FakeBuildRequestsComponent(FakeDBComponent):
                 row.claimed_by_masterid = claim_row.masterid
             else:
                 row.claimed_at = None
+                row.masterid = None
             builder = yield self.db.builders.getBuilder(row.builderid)
             row.buildername = builder["name"]
             defer.returnValue(self._brdictFromRow(row))
@@ -1617,7 +1633,8 @@ class FakeBuildRequestsComponent(FakeDBComponent):
 
     @defer.inlineCallbacks
     def getBuildRequests(self, builderid=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None,
+                         resultSpec=None):
         rv = []
         for br in self.reqs.itervalues():
             if builderid and br.builderid != builderid:
@@ -1635,6 +1652,7 @@ class FakeBuildRequestsComponent(FakeDBComponent):
                 br.claimed_by_masterid = claim_row.masterid
             else:
                 br.claimed_at = None
+                br.masterid = None
             if claimed is not None:
                 if isinstance(claimed, bool):
                     if claimed:
@@ -1717,6 +1735,7 @@ class FakeBuildRequestsComponent(FakeDBComponent):
     def unclaimExpiredRequests(self, old, _reactor=reactor):
         old_epoch = _reactor.seconds() - old
 
+        unclaimed = []
         for br in self.reqs.itervalues():
             if br.complete == 1:
                 continue
@@ -1724,6 +1743,8 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             claim_row = self.claims.get(br.id)
             if claim_row and claim_row.claimed_at < old_epoch:
                 del self.claims[br.id]
+                unclaimed.append(br.id)
+        return defer.succeed(sorted(unclaimed))
 
     def _brdictFromRow(self, row):
         return buildrequests.BuildRequestsConnectorComponent._brdictFromRow(row, self.MASTER_ID)
@@ -1799,7 +1820,8 @@ class FakeBuildsComponent(FakeDBComponent):
                 return defer.succeed(self._row2dict(row))
         return defer.succeed(None)
 
-    def getBuilds(self, builderid=None, buildrequestid=None, complete=None):
+    def getBuilds(self, builderid=None, buildrequestid=None, complete=None,
+                  resultSpec=None):
         ret = []
         for (id, row) in self.builds.items():
             if builderid is not None and row['builderid'] != builderid:
@@ -1905,7 +1927,7 @@ class FakeStepsComponent(FakeDBComponent):
                 return defer.succeed(self._row2dict(row))
             return defer.succeed(None)
 
-    def getSteps(self, buildid):
+    def getSteps(self, buildid, resultSpec=None):
         ret = []
 
         for row in self.steps.itervalues():
@@ -2040,7 +2062,7 @@ class FakeLogsComponent(FakeDBComponent):
             return defer.succeed(None)
         return defer.succeed(self._row2dict(row))
 
-    def getLogs(self, stepid):
+    def getLogs(self, stepid, resultSpec=None):
         return defer.succeed([
             self._row2dict(row)
             for row in self.logs.itervalues()
@@ -2053,6 +2075,17 @@ class FakeLogsComponent(FakeDBComponent):
         rv = lines[first_line:last_line + 1]
         return defer.succeed(u'\n'.join(rv) + u'\n' if rv else u'')
 
+    def getLogLinesEnd(self, logid, first_line, size):
+        lines = self.log_lines.get(logid, [])
+        if first_line >= len(lines):
+            return defer.succeed(None)
+        end = first_line
+        total = len(lines[first_line]) + 1
+        while end + 1 < len(lines) and total + len(lines[end + 1]) + 1 <= size:
+            end += 1
+            total += len(lines[end]) + 1
+        return defer.succeed(end)
+
     def addLog(self, stepid, name, slug, type):
         id = self._newId()
         self.logs[id] = dict(id=id, stepid=stepid,
@@ -2073,13 +2106,16 @@ class FakeLogsComponent(FakeDBComponent):
         num_lines = self.logs[logid]['num_lines'] = len(lines)
         return defer.succeed((num_lines - len(content), num_lines - 1))
 
+    def flushLogs(self):
+        return defer.succeed(None)
+
     def finishLog(self, logid):
         if id in self.logs:
             self.logs['id'].complete = 1
         return defer.succeed(None)
 
     def compressLog(self, logid):
-        return defer.succeed(None)
+        return defer.succeed(0)
 
 
 class FakeUsersComponent(FakeDBComponent):
@@ -0,0 +1,164 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.mq.redismq import IncompleteReply
+from buildbot.mq.redismq import parseReply
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+
+
+class _Error(str):
+    pass
+
+
+class FakeRedisProtocol(protocol.Protocol):
+
+    """
+    Server side of a connection to L{FakeRedisServer}; requests are parsed
+    with the client's parser, since a request is an array of bulk strings.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.multi = None
+
+    def connectionMade(self):
+        self.factory.clients.append(self)
+
+    def connectionLost(self, reason):
+        self.factory.clients.remove(self)
+        self.factory.unsubscribe(self)
+        waiters, self.factory.clientWaiters = self.factory.clientWaiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def dataReceived(self, data):
+        self.buffer += data
+        pos = 0
+        while pos < len(self.buffer):
+            try:
+                args, pos = parseReply(self.buffer, pos)
+            except IncompleteReply:
+                break
+            self.commandReceived(args)
+        self.buffer = self.buffer[pos:]
+
+    def commandReceived(self, args):
+        cmd = args[0].upper()
+        self.factory.commands.append(tuple([cmd] + args[1:]))
+        if self.multi is not None and cmd != 'EXEC':
+            self.multi.append(args)
+            self.sendReply('QUEUED')
+        elif cmd == 'MULTI':
+            self.multi = []
+            self.sendReply('OK')
+        elif cmd == 'EXEC':
+            multi, self.multi = self.multi, None
+            self.sendReply([self.factory.execute(self, a) for a in multi])
+        else:
+            self.sendReply(self.factory.execute(self, args))
+
+    def sendReply(self, reply):
+        self.transport.write(self.encodeReply(reply))
+
+    def encodeReply(self, reply):
+        if isinstance(reply, _Error):
+            return '-%s\r\n' % (reply,)
+        elif reply is None:
+            return '$-1\r\n'
+        elif isinstance(reply, (int, long)):
+            return ':%d\r\n' % (reply,)
+        elif isinstance(reply, list):
+            return '*%d\r\n%s' % (len(reply),
+                                  ''.join(self.encodeReply(r) for r in reply))
+        elif reply == 'OK' or reply == 'QUEUED' or reply == 'PONG':
+            return '+%s\r\n' % (reply,)
+        return '$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class FakeRedisServer(protocol.ServerFactory):
+
+    """
+    An in-process stand-in for a Redis server, implementing only the commands
+    used by L{buildbot.mq.redismq.RedisMQ}.  Use C{start} to listen on a
+    loopback port, and C{stop} to shut down and wait for all clients to
+    disconnect.
+    """
+
+    protocol = FakeRedisProtocol
+
+    def __init__(self):
+        self.lists = {}
+        self.subscriptions = {}
+        self.clients = []
+        self.clientWaiters = []
+        self.commands = []
+        self.port = None
+
+    def start(self):
+        self.port = reactor.listenTCP(0, self, interface='127.0.0.1')
+        return 'redis://127.0.0.1:%d' % (self.port.getHost().port,)
+
+    @defer.inlineCallbacks
+    def stop(self):
+        yield self.port.stopListening()
+        while self.clients:
+            for client in self.clients:
+                client.transport.loseConnection()
+            d = defer.Deferred()
+            self.clientWaiters.append(d)
+            yield d
+
+    def subscribers(self):
+        return [client for subscribers in self.subscriptions.itervalues()
+                for client in subscribers]
+
+    def unsubscribe(self, client):
+        for subscribers in self.subscriptions.itervalues():
+            if client in subscribers:
+                subscribers.remove(client)
+
+    def disconnectAll(self):
+        for client in self.clients[:]:
+            client.transport.loseConnection()
+
+    def execute(self, client, args):
+        cmd, args = args[0].upper(), args[1:]
+        if cmd == 'PING':
+            return 'PONG'
+        elif cmd == 'SELECT':
+            if not args[0].isdigit():
+                return _Error('ERR invalid DB index')
+            return 'OK'
+        elif cmd == 'SUBSCRIBE':
+            self.subscriptions.setdefault(args[0], []).append(client)
+            return ['subscribe', args[0], 1]
+        elif cmd == 'PUBLISH':
+            subscribers = self.subscriptions.get(args[0], [])
+            for subscriber in subscribers:
+                subscriber.sendReply(['message', args[0], args[1]])
+            return len(subscribers)
+        elif cmd == 'RPUSH':
+            lst = self.lists.setdefault(args[0], [])
+            lst.extend(args[1:])
+            return len(lst)
+        elif cmd == 'LRANGE':
+            lst = self.lists.get(args[0], [])
+            start, stop = int(args[1]), int(args[2])
+            return lst[start:None if stop == -1 else stop + 1]
+        elif cmd == 'DEL':
+            return int(self.lists.pop(args[0], None) is not None)
+        return _Error('ERR unknown command %r' % (cmd,))
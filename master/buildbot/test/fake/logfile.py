@@ -30,6 +30,8 @@ class FakeLogFile(object):
         self.finished = False
         self.step = step
         self.subPoint = util.subscription.SubscriptionPoint("%r log" % (name,))
+        self.chunkSubPoint = util.subscription.SubscriptionPoint(
+            "%r log chunks" % (name,))
 
     def getName(self):
         return self.name
@@ -38,6 +40,10 @@ class FakeLogFile(object):
         log.msg("NOTE: fake logfile subscription never produces anything")
         return self.subPoint.subscribe(callback)
 
+    def subscribeChunks(self, callback):
+        log.msg("NOTE: fake logfile subscription never produces anything")
+        return self.chunkSubPoint.subscribe(callback)
+
     def _getLbf(self, stream, meth):
         try:
             return self.lbfs[stream]
@@ -22,6 +22,7 @@ from twisted.internet import defer
 
 class FakeSlave(object):
     slavename = 'test'
+    compress_updates = False
 
     def __init__(self, master):
         self.master = master
@@ -28,6 +28,11 @@ def fakeMasterForHooks():
         master.addedChanges.append(kwargs)
         return defer.succeed(Mock())
     master.addChange = addChange
+
+    def addChanges(changes):
+        master.addedChanges.extend(changes)
+        return defer.succeed(range(len(changes)))
+    master.data.updates.addChanges = addChanges
     return master
 
 
@@ -152,6 +152,7 @@ class TestAbstractBuildSlave(unittest.TestCase):
         self.assertEqual(bs.max_builds, None)
         self.assertEqual(bs.notify_on_missing, [])
         self.assertEqual(bs.missing_timeout, 10 * 60)
+        self.assertEqual(bs.compress_updates, False)
         self.assertEqual(bs.properties.getProperty('slavename'), 'bot')
         self.assertEqual(bs.access, [])
 
@@ -162,13 +163,15 @@ class TestAbstractBuildSlave(unittest.TestCase):
                                 notify_on_missing=['me@me.com'],
                                 missing_timeout=120,
                                 properties={'a': 'b'},
-                                locks=[lock1, lock2])
+                                locks=[lock1, lock2],
+                                compress_updates=True)
 
         self.assertEqual(bs.max_builds, 2)
         self.assertEqual(bs.notify_on_missing, ['me@me.com'])
         self.assertEqual(bs.missing_timeout, 120)
         self.assertEqual(bs.properties.getProperty('a'), 'b')
         self.assertEqual(bs.access, [lock1, lock2])
+        self.assertEqual(bs.compress_updates, True)
 
     def test_constructor_notify_on_missing_not_list(self):
         bs = ConcreteBuildSlave('bot', 'pass',
@@ -202,7 +205,8 @@ class TestAbstractBuildSlave(unittest.TestCase):
                                     max_builds=3,
                                     notify_on_missing=['her@me.com'],
                                     missing_timeout=121,
-                                    properties={'a': 'c'})
+                                    properties={'a': 'c'},
+                                    compress_updates=True)
 
         old.updateSlave = mock.Mock(side_effect=lambda: defer.succeed(None))
 
@@ -211,6 +215,7 @@ class TestAbstractBuildSlave(unittest.TestCase):
         self.assertEqual(old.max_builds, 3)
         self.assertEqual(old.notify_on_missing, ['her@me.com'])
         self.assertEqual(old.missing_timeout, 121)
+        self.assertEqual(old.compress_updates, True)
         self.assertEqual(old.properties.getProperty('a'), 'c')
         self.assertEqual(old.registration.updates, ['bot'])
         self.assertTrue(old.updateSlave.called)
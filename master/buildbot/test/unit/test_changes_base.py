@@ -16,7 +16,9 @@
 import mock
 
 from buildbot.changes import base
+from buildbot.changes import manager
 from buildbot.test.util import changesource
+from buildbot.util import service
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
@@ -178,3 +180,37 @@ class TestPollingChangeSource(changesource.ChangeSourceMixin, unittest.TestCase)
             self.assertEqual(loops, [0.0, 5.0, 10.0])
         reactor.callWhenRunning(d.callback, None)
         return d
+
+    def test_pollScheduler(self):
+        scheduler = manager.PollScheduler()
+        scheduler.reconfig(dict(maxConcurrent=1, jitter=0.5, maxBackoff=2))
+        scheduler._reactor = self.clock
+        scheduler._random = lambda: 1.0
+        parent = service.AsyncMultiService()
+        parent.pollScheduler = scheduler
+        self.changesource.setServiceParent(parent)
+
+        # track when poll() gets called; the third poll finds changes
+        loops = []
+
+        def poll():
+            loops.append(self.clock.seconds())
+            if len(loops) == 3:
+                self.changesource.addChange(author=u'me', comments=u'fix',
+                                            revision=u'1234')
+        self.changesource.poll = poll
+
+        self.changesource.pollInterval = 10
+        self.startChangeSource()
+
+        d = defer.Deferred()
+        d.addCallback(self.runClockFor, 80)
+
+        @d.addCallback
+        def check(_):
+            # the first poll is delayed by 5 seconds of jitter, and the
+            # interval doubles while no changes are found
+            self.assertEqual(loops, [15.0, 35.0, 55.0, 65.0])
+            self.assertEqual(len(self.master.data.updates.changesAdded), 1)
+        reactor.callWhenRunning(d.callback, None)
+        return d
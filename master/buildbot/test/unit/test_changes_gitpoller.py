@@ -24,6 +24,9 @@ from buildbot.test.util import config
 from buildbot.test.util import gpo
 from buildbot.test.util import logging
 from twisted.internet import defer
+from twisted.internet import error
+from twisted.internet import reactor
+from twisted.python import failure
 from twisted.trial import unittest
 
 # Test that environment variables get propagated to subprocesses (See #2116)
@@ -152,6 +155,55 @@ class GitOutputParsing(gpo.GetProcessOutputMixin, unittest.TestCase):
     # _get_changes is tested in TestGitPoller, below
 
 
+# the output of git log -z --name-only with GitLogParser.format for three
+# commits, newest first; the merge and the oldest have no files
+BATCH_LOG_OUTPUT = (
+    '\0' '9118f4ab71963d23d02d4bdc54876ac8bf05acf2' '\0' '1273258100' '\0'
+    'by <by@example.com>' '\0' "Merge branch 'x'\n" '\0'
+    '\0' '4423cdbcbb89c14e50dd5f4152415afd686c5241' '\0' '1273258009' '\0'
+    'by <by@example.com>' '\0' 'second\n\nwith a body\n' '\0'
+    '\n' 'b c' '\0' 'd/\xc3\xa9' '\0'
+    '\0' '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a' '\0' '1273258000' '\0'
+    'me <me@example.com>' '\0' 'first\n' '\0')
+
+
+class GitLogParser(unittest.TestCase):
+
+    def parse(self, output, chunksize):
+        parser = gitpoller.GitLogParser()
+        for i in range(0, len(output), chunksize):
+            parser.feed(output[i:i + chunksize])
+        parser.close()
+        return parser.commits
+
+    def test_parse(self):
+        expected = [
+            ('9118f4ab71963d23d02d4bdc54876ac8bf05acf2', '1273258100',
+             'by <by@example.com>', "Merge branch 'x'\n", []),
+            ('4423cdbcbb89c14e50dd5f4152415afd686c5241', '1273258009',
+             'by <by@example.com>', 'second\n\nwith a body\n',
+             ['b c', 'd/\xc3\xa9']),
+            ('64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a', '1273258000',
+             'me <me@example.com>', 'first\n', []),
+        ]
+        for chunksize in (1, 3, 7, len(BATCH_LOG_OUTPUT)):
+            self.assertEqual(self.parse(BATCH_LOG_OUTPUT, chunksize), expected)
+
+    def test_commits_available_while_parsing(self):
+        parser = gitpoller.GitLogParser()
+        parser.feed(BATCH_LOG_OUTPUT[:-40])
+        self.assertEqual([c[0] for c in parser.commits],
+                         ['9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+                          '4423cdbcbb89c14e50dd5f4152415afd686c5241'])
+
+    def test_empty(self):
+        self.assertEqual(self.parse('', 1), [])
+
+    def test_incomplete(self):
+        self.assertRaises(EnvironmentError,
+                          lambda: self.parse(BATCH_LOG_OUTPUT[:70], 10))
+
+
 class TestGitPoller(gpo.GetProcessOutputMixin,
                     changesource.ChangeSourceMixin,
                     logging.LoggingMixin,
@@ -1108,6 +1160,315 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
         return d
 
 
+class TestGitPollerBatchMetadata(gpo.GetProcessOutputMixin,
+                                 changesource.ChangeSourceMixin,
+                                 logging.LoggingMixin,
+                                 unittest.TestCase):
+
+    REPOURL = 'git@example.com:foo/baz.git'
+    REPOURL_QUOTED = 'git%40example.com%3Afoo%2Fbaz.git'
+
+    def setUp(self):
+        self.setUpGetProcessOutput()
+        self.setUpLogging()
+        self.patch(reactor, 'spawnProcess', self.spawnProcess)
+        d = self.setUpChangeSource()
+
+        @d.addCallback
+        def create_poller(_):
+            self.poller = gitpoller.GitPoller(self.REPOURL, batchMetadata=True,
+                                              usetimestamps=True,
+                                              branches=['master', 'release'])
+            self.poller.master = self.master
+            self.poller.lastRev = {
+                'master': 'fa3ae8ed68e664d4db24798611b352e3c6509930',
+                'release': 'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+            }
+        return d
+
+    def tearDown(self):
+        return self.tearDownChangeSource()
+
+    def spawnProcess(self, proto, bin, args, env=None, path=None):
+        # run the expected command, delivering its output in small pieces
+        d = self.patched_getProcessOutputAndValue(bin, args[1:], env=env,
+                                                  path=path)
+
+        @d.addCallback
+        def deliver((stdout, stderr, code)):
+            for i in range(0, len(stdout), 5):
+                proto.outReceived(stdout[i:i + 5])
+            if stderr:
+                proto.errReceived(stderr)
+            if code:
+                reason = error.ProcessTerminated(exitCode=code)
+            else:
+                reason = error.ProcessDone(0)
+            proto.processEnded(failure.Failure(reason))
+
+    def expectInitAndFetch(self):
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+master:refs/buildbot/%s/master' % self.REPOURL_QUOTED,
+                       '+release:refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work'),
+        )
+
+    def expectLog(self, *revRange):
+        return gpo.Expect('git', 'log', '-z', '--name-only',
+                          '--format=' + gitpoller.GitLogParser.format,
+                          *(revRange + ('--',))).path('gitpoller-work')
+
+    @defer.inlineCallbacks
+    def test_poll(self):
+        self.expectInitAndFetch()
+        self.expectCommands(
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/master' % self.REPOURL_QUOTED,
+                       'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2\n'
+                    'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5\n'),
+            self.expectLog('9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+                           '^bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+                           '^fa3ae8ed68e664d4db24798611b352e3c6509930')
+            .stdout(BATCH_LOG_OUTPUT),
+            self.expectLog('bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+                           '^bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+                           '^9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev, {
+            'master': '9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+            'release': 'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+        })
+        self.assertEqual(
+            [(c['revision'], c['author'], c['files'], c['comments'],
+              c['when_timestamp'], c['branch'])
+             for c in self.master.data.updates.changesAdded], [
+                ('64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
+                 u'me <me@example.com>', [], u'first', 1273258000, u'master'),
+                ('4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                 u'by <by@example.com>', [u'b c', u'd/\xe9'],
+                 u'second\n\nwith a body', 1273258009, u'master'),
+                ('9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+                 u'by <by@example.com>', [], u"Merge branch 'x'",
+                 1273258100, u'master'),
+            ])
+
+    @defer.inlineCallbacks
+    def test_poll_rev_parse_fails(self):
+        self.expectInitAndFetch()
+        self.expectCommands(
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/master' % self.REPOURL_QUOTED,
+                       'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .exit(128),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .exit(128),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2\n'),
+            self.expectLog('9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+                           '^bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+                           '^fa3ae8ed68e664d4db24798611b352e3c6509930'),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev['release'],
+                         '9118f4ab71963d23d02d4bdc54876ac8bf05acf2')
+        self.assertEqual(len(self.flushLoggedErrors(gitpoller.GitError)), 1)
+
+    @defer.inlineCallbacks
+    def test_poll_log_fails(self):
+        self.poller.branches = ['master']
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+master:refs/buildbot/%s/master' % self.REPOURL_QUOTED)
+            .path('gitpoller-work'),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
+            self.expectLog('4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                           '^bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5',
+                           '^fa3ae8ed68e664d4db24798611b352e3c6509930')
+            .stdout(BATCH_LOG_OUTPUT[:50]).stderr('fatal: oops').exit(1),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.master.data.updates.changesAdded, [])
+        errors = self.flushLoggedErrors(EnvironmentError)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('fatal: oops', str(errors[0].value))
+
+
+class TestGitPollerSkipUnchangedFetch(gpo.GetProcessOutputMixin,
+                                      changesource.ChangeSourceMixin,
+                                      unittest.TestCase):
+
+    REPOURL = 'git@example.com:foo/baz.git'
+    REPOURL_QUOTED = 'git%40example.com%3Afoo%2Fbaz.git'
+    MASTER_REV = 'fa3ae8ed68e664d4db24798611b352e3c6509930'
+    RELEASE_REV = 'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5'
+    NEW_REV = '4423cdbcbb89c14e50dd5f4152415afd686c5241'
+
+    def setUp(self):
+        self.setUpGetProcessOutput()
+        return self.setUpChangeSource()
+
+    def tearDown(self):
+        return self.tearDownChangeSource()
+
+    def makePoller(self, branches=['master', 'release'], **kwargs):
+        self.poller = gitpoller.GitPoller(self.REPOURL, branches=branches,
+                                          skipUnchangedFetch=True, **kwargs)
+        self.poller.master = self.master
+        self.poller.lastRev = {
+            'master': self.MASTER_REV,
+            'release': self.RELEASE_REV,
+        }
+
+    def expectLsRemote(self, *refs):
+        return gpo.Expect('git', 'ls-remote', self.REPOURL, *refs)
+
+    @defer.inlineCallbacks
+    def test_poll_unchanged(self):
+        self.makePoller()
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            self.expectLsRemote('refs/heads/master', 'refs/heads/release')
+            .stdout('%s\trefs/heads/master\n%s\trefs/heads/release\n'
+                    % (self.MASTER_REV, self.RELEASE_REV)),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev, {
+            'master': self.MASTER_REV,
+            'release': self.RELEASE_REV,
+        })
+
+    @defer.inlineCallbacks
+    def test_poll_moved(self):
+        self.makePoller()
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            self.expectLsRemote('refs/heads/master', 'refs/heads/release')
+            .stdout('%s\trefs/heads/master\n%s\trefs/heads/release\n'
+                    % (self.MASTER_REV, self.NEW_REV)),
+            # only the branch that moved is fetched
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+release:refs/buildbot/%s/release'
+                       % self.REPOURL_QUOTED)
+            .path('gitpoller-work'),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout(self.NEW_REV + '\n'),
+            gpo.Expect('git', 'log', '--format=%H', self.NEW_REV,
+                       '^' + self.RELEASE_REV, '^' + self.MASTER_REV, '--')
+            .path('gitpoller-work'),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev, {
+            'master': self.MASTER_REV,
+            'release': self.NEW_REV,
+        })
+
+    @defer.inlineCallbacks
+    def test_poll_missing_branch(self):
+        self.makePoller(branches=['master', 'release'])
+        self.poller.lastRev = {'master': self.MASTER_REV}
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            self.expectLsRemote('refs/heads/master', 'refs/heads/release')
+            .stdout('%s\trefs/heads/master\n' % (self.MASTER_REV,)),
+            # not in the list, so let fetch report the problem
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+release:refs/buildbot/%s/release'
+                       % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stderr("fatal: couldn't find remote ref release\n").exit(128),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev, {'master': self.MASTER_REV})
+
+    @defer.inlineCallbacks
+    def test_poll_allBranches(self):
+        self.makePoller(branches=True)
+        self.poller.lastRev = {'refs/heads/master': self.MASTER_REV}
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            self.expectLsRemote()
+            .stdout('%s\trefs/heads/master\n%s\trefs/heads/release\n'
+                    '%s\trefs/pull/1/head\n'
+                    % (self.MASTER_REV, self.NEW_REV, self.NEW_REV)),
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+release:refs/buildbot/%s/release'
+                       % self.REPOURL_QUOTED)
+            .path('gitpoller-work'),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout(self.NEW_REV + '\n'),
+            gpo.Expect('git', 'log', '--format=%H', self.NEW_REV,
+                       '^' + self.MASTER_REV, '--')
+            .path('gitpoller-work'),
+        )
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual(self.poller.lastRev, {
+            'refs/heads/master': self.MASTER_REV,
+            'refs/heads/release': self.NEW_REV,
+        })
+
+    @defer.inlineCallbacks
+    def test_reference(self):
+        basedir = os.path.abspath(self.mktemp())
+        workdir = os.path.join(basedir, 'work')
+        os.makedirs(os.path.join(workdir, 'objects', 'info'))
+        shared = os.path.join(basedir, 'shared')
+        os.makedirs(os.path.join(shared, 'objects'))
+        self.makePoller(workdir=workdir, reference=shared)
+
+        for _ in range(2):
+            self.expectCommands(
+                gpo.Expect('git', 'init', '--bare', workdir),
+                self.expectLsRemote('refs/heads/master', 'refs/heads/release')
+                .stdout('%s\trefs/heads/master\n%s\trefs/heads/release\n'
+                        % (self.MASTER_REV, self.RELEASE_REV)),
+            )
+            yield self.poller.poll()
+            self.assertAllCommandsRan()
+
+        with open(os.path.join(workdir, 'objects', 'info',
+                               'alternates')) as f:
+            self.assertEqual(f.read(), os.path.join(shared, 'objects') + '\n')
+
+
 class TestGitPollerConstructor(unittest.TestCase, config.ConfigErrorsMixin):
 
     def test_deprecatedFetchRefspec(self):
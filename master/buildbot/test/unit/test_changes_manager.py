@@ -17,6 +17,8 @@ import mock
 
 from buildbot.changes import manager
 from buildbot.util import service
+from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -30,6 +32,8 @@ class TestChangeManager(unittest.TestCase):
         self.master = mock.Mock()
         self.cm = manager.ChangeManager(self.master)
         self.new_config = mock.Mock()
+        self.new_config.polling = dict(maxConcurrent=None, jitter=0,
+                                       maxBackoff=1)
 
     def make_sources(self, n):
         for i in range(n):
@@ -62,3 +66,142 @@ class TestChangeManager(unittest.TestCase):
             self.assertIdentical(src1.parent, None)
             self.assertIdentical(src1.master, None)
         return d
+
+    def test_reconfigService_polling(self):
+        self.new_config.change_sources = []
+        self.new_config.polling = dict(maxConcurrent=3, jitter=0.5,
+                                       maxBackoff=8)
+
+        d = self.cm.reconfigServiceWithBuildbotConfig(self.new_config)
+
+        @d.addCallback
+        def check(_):
+            scheduler = self.cm.pollScheduler
+            self.assertEqual((scheduler.maxConcurrent, scheduler.jitter,
+                              scheduler.maxBackoff), (3, 0.5, 8))
+        return d
+
+
+class FakePollingSource(object):
+
+    pollInterval = 60
+
+    def __init__(self, name):
+        self.name = name
+        self.pollChangeCount = 0
+        self.pollBackoff = 1
+        self.doPoll = mock.Mock()
+        self.polls = []
+
+    def poll(self):
+        d = defer.Deferred()
+        self.polls.append(d)
+        return d
+
+    def finishPoll(self, changes=0, failure=None):
+        self.pollChangeCount += changes
+        d = self.polls.pop(0)
+        if failure:
+            d.errback(failure)
+        else:
+            d.callback(None)
+
+
+class TestPollScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = manager.PollScheduler()
+        self.scheduler._reactor = self.clock = task.Clock()
+        self.scheduler.reconfig(dict(maxConcurrent=None, jitter=0,
+                                     maxBackoff=1))
+
+    def test_startDelay(self):
+        self.scheduler.reconfig(dict(maxConcurrent=None, jitter=0.2,
+                                     maxBackoff=1))
+        self.scheduler._random = lambda: 0.5
+        self.assertEqual(self.scheduler.startDelay(FakePollingSource('a')), 6)
+
+    def test_startDelay_no_jitter(self):
+        self.assertEqual(self.scheduler.startDelay(FakePollingSource('a')), 0)
+
+    def test_maxConcurrent(self):
+        self.scheduler.reconfig(dict(maxConcurrent=2, jitter=0,
+                                     maxBackoff=1))
+        sources = [FakePollingSource(name) for name in 'abc']
+        done = [self.scheduler.poll(src) for src in sources]
+        self.assertEqual([len(src.polls) for src in sources], [1, 1, 0])
+        self.assertEqual(len(self.scheduler.waiting), 1)
+
+        sources[1].finishPoll()
+        self.assertTrue(done[1].called)
+        self.assertEqual([len(src.polls) for src in sources], [1, 0, 1])
+
+        sources[0].finishPoll()
+        sources[2].finishPoll()
+        self.assertEqual(self.scheduler.running, 0)
+        return defer.gatherResults(done)
+
+    def test_maxConcurrent_raised(self):
+        self.scheduler.reconfig(dict(maxConcurrent=1, jitter=0,
+                                     maxBackoff=1))
+        sources = [FakePollingSource(name) for name in 'ab']
+        for src in sources:
+            self.scheduler.poll(src)
+        self.assertEqual([len(src.polls) for src in sources], [1, 0])
+        self.scheduler.reconfig(dict(maxConcurrent=None, jitter=0,
+                                     maxBackoff=1))
+        self.assertEqual([len(src.polls) for src in sources], [1, 1])
+
+    @defer.inlineCallbacks
+    def test_failure(self):
+        self.scheduler.reconfig(dict(maxConcurrent=1, jitter=0,
+                                     maxBackoff=4))
+        sources = [FakePollingSource(name) for name in 'ab']
+        done = [self.scheduler.poll(src) for src in sources]
+        sources[0].finishPoll(failure=RuntimeError('oops'))
+        yield self.assertFailure(done[0], RuntimeError)
+        # the interval is left alone, and the next poll runs
+        self.assertFalse(sources[0].doPoll.setInterval.called)
+        self.assertEqual(len(sources[1].polls), 1)
+        sources[1].finishPoll()
+        yield done[1]
+
+    @defer.inlineCallbacks
+    def test_backoff(self):
+        self.scheduler.reconfig(dict(maxConcurrent=None, jitter=0,
+                                     maxBackoff=5))
+        src = FakePollingSource('a')
+        intervals = []
+        for changes in [0, 0, 0, 0, 2, 0]:
+            d = self.scheduler.poll(src)
+            src.finishPoll(changes)
+            yield d
+            intervals.append(src.doPoll.setInterval.call_args[0][0])
+        self.assertEqual(intervals, [120, 240, 300, 300, 60, 120])
+
+    @defer.inlineCallbacks
+    def test_no_backoff(self):
+        src = FakePollingSource('a')
+        d = self.scheduler.poll(src)
+        src.finishPoll()
+        yield d
+        src.doPoll.setInterval.assert_called_with(60)
+
+    @defer.inlineCallbacks
+    def test_metrics(self):
+        self.scheduler.reconfig(dict(maxConcurrent=1, jitter=0,
+                                     maxBackoff=1))
+        sources = [FakePollingSource(name) for name in 'ab']
+        with mock.patch('buildbot.process.metrics.MetricTimeEvent.log') as log:
+            done = [self.scheduler.poll(src) for src in sources]
+            self.clock.advance(3)
+            sources[0].finishPoll()
+            self.clock.advance(2)
+            sources[1].finishPoll()
+            yield defer.gatherResults(done)
+        self.assertEqual(sorted(log.call_args_list), sorted([
+            mock.call('poll.a.wait', 0),
+            mock.call('poll.a', 3),
+            mock.call('poll.b.wait', 3),
+            mock.call('poll.b', 2),
+        ]))
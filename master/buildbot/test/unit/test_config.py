@@ -27,6 +27,7 @@ from buildbot import interfaces
 from buildbot import locks
 from buildbot import revlinks
 from buildbot.changes import base as changes_base
+from buildbot.db import logs as db_logs
 from buildbot.process import factory
 from buildbot.process import properties
 from buildbot.schedulers import base as schedulers_base
@@ -46,6 +47,9 @@ global_defaults = dict(
     eventHorizon=50,
     logHorizon=None,
     buildHorizon=None,
+    stateBufferTime=0,
+    logBufferSize=262144,
+    logBufferTime=0,
     logCompressionLimit=4096,
     logCompressionMethod='bz2',
     logEncoding='utf-8',
@@ -178,7 +182,8 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
                 db_url='sqlite:///state.sqlite'),
             mq=dict(type='simple'),
             metrics=None,
-            caches=dict(Changes=10, Builds=15),
+            caches=dict(Changes=10, Builds=15, digests=50),
+            polling=dict(maxConcurrent=None, jitter=0, maxBackoff=1),
             schedulers={},
             builders=[],
             slaves=[],
@@ -307,6 +312,7 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
         self.failUnless(rv.load_db.called)
         self.failUnless(rv.load_metrics.called)
         self.failUnless(rv.load_caches.called)
+        self.failUnless(rv.load_polling.called)
         self.failUnless(rv.load_schedulers.called)
         self.failUnless(rv.load_builders.called)
         self.failUnless(rv.load_slaves.called)
@@ -442,6 +448,26 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_global_buildHorizon(self):
         self.do_test_load_global(dict(buildHorizon=10), buildHorizon=10)
 
+    def test_load_global_logBufferSize(self):
+        self.do_test_load_global(dict(logBufferSize=1024),
+                                 logBufferSize=1024)
+
+    def test_load_global_logBufferTime(self):
+        self.do_test_load_global(dict(logBufferTime=0.5),
+                                 logBufferTime=0.5)
+
+    def test_load_global_logBufferTime_invalid(self):
+        self.cfg.load_global(self.filename, dict(logBufferTime='1s'))
+        self.assertConfigError(self.errors, "must be a number")
+
+    def test_load_global_stateBufferTime(self):
+        self.do_test_load_global(dict(stateBufferTime=10),
+                                 stateBufferTime=10)
+
+    def test_load_global_stateBufferTime_invalid(self):
+        self.cfg.load_global(self.filename, dict(stateBufferTime='1m'))
+        self.assertConfigError(self.errors, "must be a number")
+
     def test_load_global_logCompressionLimit(self):
         self.do_test_load_global(dict(logCompressionLimit=10),
                                  logCompressionLimit=10)
@@ -453,7 +479,19 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_global_logCompressionMethod_invalid(self):
         self.cfg.load_global(self.filename,
                              dict(logCompressionMethod='foo'))
-        self.assertConfigError(self.errors, "must be 'bz2' or 'gz'")
+        self.assertConfigError(self.errors, "must be 'raw', 'bz2', 'gz' or 'lz4'")
+
+    def test_load_global_logCompressionMethod_raw(self):
+        self.do_test_load_global(dict(logCompressionMethod='raw'),
+                                 logCompressionMethod='raw')
+
+    def test_load_global_logCompressionMethod_lz4_missing(self):
+        self.patch(db_logs, 'COMPRESSION_METHODS',
+                   dict((k, v) for k, v in db_logs.COMPRESSION_METHODS.items()
+                        if k != 'lz4'))
+        self.cfg.load_global(self.filename,
+                             dict(logCompressionMethod='lz4'))
+        self.assertConfigError(self.errors, "module 'lz4' is not installed")
 
     def test_load_global_codebaseGenerator(self):
         func = lambda _: "dummy"
@@ -609,6 +647,23 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                          dict(mq=dict(bar='bar')))
         self.assertConfigError(self.errors, "unrecognized keys in")
 
+    def test_load_mq_redis(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(type='redis', url='redis://mq:6379/1',
+                                      prefix='bb')))
+        self.assertResults(mq=dict(type='redis', url='redis://mq:6379/1',
+                                   prefix='bb'))
+
+    def test_load_mq_redis_bad_url(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(type='redis', url='http://mq:6379')))
+        self.assertConfigError(self.errors, "must be a redis:// URL")
+
+    def test_load_mq_redis_bad_database(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(type='redis', url='redis://mq/foo')))
+        self.assertConfigError(self.errors, "must be a number")
+
     def test_load_metrics_defaults(self):
         self.cfg.load_metrics(self.filename, {})
         self.assertResults(metrics=None)
@@ -624,7 +679,7 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
 
     def test_load_caches_defaults(self):
         self.cfg.load_caches(self.filename, {})
-        self.assertResults(caches=dict(Changes=10, Builds=15))
+        self.assertResults(caches=dict(Changes=10, Builds=15, digests=50))
 
     def test_load_caches_invalid(self):
         self.cfg.load_caches(self.filename, dict(caches=13))
@@ -633,7 +688,7 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_caches_buildCacheSize(self):
         self.cfg.load_caches(self.filename,
                              dict(buildCacheSize=13))
-        self.assertResults(caches=dict(Builds=13, Changes=10))
+        self.assertResults(caches=dict(Builds=13, Changes=10, digests=50))
 
     def test_load_caches_buildCacheSize_and_caches(self):
         self.cfg.load_caches(self.filename,
@@ -643,17 +698,50 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_caches_changeCacheSize(self):
         self.cfg.load_caches(self.filename,
                              dict(changeCacheSize=13))
-        self.assertResults(caches=dict(Changes=13, Builds=15))
+        self.assertResults(caches=dict(Changes=13, Builds=15, digests=50))
 
     def test_load_caches_changeCacheSize_and_caches(self):
         self.cfg.load_caches(self.filename,
                              dict(changeCacheSize=13, caches=dict(changes=11)))
         self.assertConfigError(self.errors, "cannot specify")
 
+    def test_load_polling_defaults(self):
+        self.cfg.load_polling(self.filename, {})
+        self.assertResults(polling=dict(maxConcurrent=None, jitter=0,
+                                        maxBackoff=1))
+
+    def test_load_polling(self):
+        self.cfg.load_polling(self.filename,
+                              dict(polling=dict(maxConcurrent=10, jitter=0.5)))
+        self.assertResults(polling=dict(maxConcurrent=10, jitter=0.5,
+                                        maxBackoff=1))
+
+    def test_load_polling_invalid(self):
+        self.cfg.load_polling(self.filename, dict(polling=13))
+        self.assertConfigError(self.errors, "must be a dictionary")
+
+    def test_load_polling_unknown_key(self):
+        self.cfg.load_polling(self.filename, dict(polling=dict(limit=3)))
+        self.assertConfigError(self.errors, "unknown c['polling'] key(s) limit")
+
+    def test_load_polling_bad_maxConcurrent(self):
+        self.cfg.load_polling(self.filename,
+                              dict(polling=dict(maxConcurrent=0)))
+        self.assertConfigError(self.errors, "positive integer")
+
+    def test_load_polling_bad_jitter(self):
+        self.cfg.load_polling(self.filename, dict(polling=dict(jitter=2)))
+        self.assertConfigError(self.errors, "between 0 and 1")
+
+    def test_load_polling_bad_maxBackoff(self):
+        self.cfg.load_polling(self.filename,
+                              dict(polling=dict(maxBackoff=0.5)))
+        self.assertConfigError(self.errors, "at least 1")
+
     def test_load_caches(self):
         self.cfg.load_caches(self.filename,
                              dict(caches=dict(foo=1)))
-        self.assertResults(caches=dict(Changes=10, Builds=15, foo=1))
+        self.assertResults(caches=dict(Changes=10, Builds=15, digests=50, foo=1))
 
     def test_load_caches_not_int_err(self):
         """
@@ -878,6 +966,37 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         self.cfg.load_www(self.filename, {'www': dict(versions=custom_versions)})
         self.assertConfigError(self.errors, 'Invalid www configuration value of versions')
 
+    def test_load_www_change_hook_queue(self):
+        queue = dict(maxSize=50, batchSize=10)
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(change_hook_queue=queue)))
+        self.assertResults(www=dict(port=None,
+                                    plugins={}, auth={'name': 'NoAuth'},
+                                    avatar_methods={'name': 'gravatar'},
+                                    change_hook_queue=queue,
+                                    logfileName='http.log'))
+
+    def test_load_www_change_hook_queue_invalid(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(change_hook_queue=10)))
+        self.assertConfigError(
+            self.errors,
+            'Invalid www configuration value of change_hook_queue')
+
+    def test_load_www_change_hook_queue_bad_option(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(change_hook_queue=dict(batchSize=0))))
+        self.assertConfigError(
+            self.errors,
+            'change_hook_queue option batchSize must be a positive integer')
+
+    def test_load_www_change_hook_queue_bool_option(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(change_hook_queue=dict(maxSize=True))))
+        self.assertConfigError(
+            self.errors,
+            'change_hook_queue option maxSize must be a positive integer')
+
     def test_load_www_unknown(self):
         self.cfg.load_www(self.filename,
                           dict(www=dict(foo="bar")))
@@ -26,6 +26,7 @@ from buildbot.util import UTC
 
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -146,7 +147,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             builderid=None,
             bsid=None,
             complete=None,
-            claimed=None)
+            claimed=None,
+            resultSpec=mock.ANY)
 
     @defer.inlineCallbacks
     def testGetFilters(self):
@@ -164,7 +166,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             builderid=None,
             bsid=55,
             complete=False,
-            claimed=True)
+            claimed=True,
+            resultSpec=mock.ANY)
 
     @defer.inlineCallbacks
     def testGetClaimedByMasterIdFilters(self):
@@ -180,7 +183,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             builderid=None,
             bsid=None,
             complete=None,
-            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID)
+            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID,
+            resultSpec=mock.ANY)
 
 
 class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
@@ -236,6 +240,30 @@ class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
             _reactor=reactor)
         self.assertTrue(res)
 
+    @defer.inlineCallbacks
+    def testClaimBuildRequestsEvents(self):
+        self.master.db.insertTestData([
+            fakedb.Builder(id=77, name='bbb'),
+            fakedb.Buildset(id=8822),
+            fakedb.BuildRequest(id=44, buildsetid=8822, builderid=77),
+            fakedb.BuildRequest(id=55, buildsetid=8822, builderid=77),
+            fakedb.BuildRequest(id=66, buildsetid=8822, builderid=77),
+        ])
+        get = mock.Mock(wraps=self.master.data.get)
+        self.patch(self.master.data, 'get', get)
+        res = yield self.rtype.claimBuildRequests([55, 44],
+                                                  claimed_at=self.CLAIMED_AT)
+        self.assertTrue(res)
+        # the build requests are fetched together, and an event is produced
+        # for each, in order
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(
+            [(k, m['buildrequestid'], m['claimed'])
+             for k, m in self.master.mq.productions
+             if k[:1] == ('buildrequests',)],
+            [(('buildrequests', '55', 'claimed'), 55, True),
+             (('buildrequests', '44', 'claimed'), 44, True)])
+
     @defer.inlineCallbacks
     def testFakeDataClaimBuildRequestsNoneArgs(self):
         res = yield self.master.data.updates.claimBuildRequests([])
@@ -484,6 +512,25 @@ class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
         res = yield self.master.data.updates.unclaimExpiredRequests(0)
         self.assertEqual(res, None)
 
+    @defer.inlineCallbacks
+    def testUnclaimExpiredRequestsEvents(self):
+        self.master.db.insertTestData([
+            fakedb.Builder(id=77, name='bbb'),
+            fakedb.Buildset(id=8822),
+            fakedb.BuildRequest(id=44, buildsetid=8822, builderid=77),
+            fakedb.BuildRequestClaim(brid=44, masterid=88,
+                                     claimed_at=266761875),
+            fakedb.BuildRequest(id=55, buildsetid=8822, builderid=77),
+        ])
+        clock = task.Clock()
+        clock.advance(266761875 + 1000)
+        yield self.rtype.unclaimExpiredRequests(600, _reactor=clock)
+        self.assertEqual(
+            [(k, m['buildrequestid'], m['claimed'])
+             for k, m in self.master.mq.productions
+             if k[:1] == ('buildrequests',)],
+            [(('buildrequests', '44', 'unclaimed'), 44, False)])
+
     @defer.inlineCallbacks
     def testUnclaimExpiredRequests(self):
         unclaimExpiredRequestsMock = mock.Mock(return_value=defer.succeed(None))
@@ -144,6 +144,13 @@ class Change(interfaces.InterfaceTests, unittest.TestCase):
                       project=u'', src=None):
             pass
 
+    def test_signature_addChanges(self):
+        @self.assertArgSpecMatches(
+            self.master.data.updates.addChanges,  # fake
+            self.rtype.addChanges)  # real
+        def addChanges(self, changes):
+            pass
+
     def do_test_addChange(self, kwargs,
                           expectedRoutingKey, expectedMessage, expectedRow,
                           expectedChangeUsers=[]):
@@ -312,3 +319,44 @@ class Change(interfaces.InterfaceTests, unittest.TestCase):
         )
         return self.do_test_addChange(kwargs,
                                       expectedRoutingKey, expectedMessage, expectedRow)
+
+    @defer.inlineCallbacks
+    def test_addChanges(self):
+        clock = task.Clock()
+        clock.advance(10000000)
+        kwargs = dict(author=u'warner', branch=u'warnerdb',
+                      category=u'devel', comments=u'fix whitespace',
+                      files=[u'master/buildbot/__init__.py'],
+                      project=u'Buildbot', repository=u'git://warner',
+                      revision=u'0e92a098b', revlink=u'http://warner/0e92a098b',
+                      when_timestamp=256738404)
+        changeids = yield self.rtype.addChanges([
+            dict(kwargs, properties={u'foo': 20}),
+            dict(kwargs, revision=u'1f03b109c', comments=u'again'),
+        ], _reactor=clock)
+
+        self.assertEqual(changeids, [500, 501])
+        second = dict(self.changeEvent, changeid=501, revision=u'1f03b109c',
+                      comments=u'again', parent_changeids=[500],
+                      properties={})
+        second['sourcestamp'] = dict(self.changeEvent['sourcestamp'],
+                                     revision=u'1f03b109c', ssid=101)
+        self.master.mq.assertProductions([
+            (('changes', '500', 'new'), self.changeEvent),
+            (('changes', '501', 'new'), second),
+        ])
+        self.master.db.changes.assertChange(501, fakedb.Change(
+            changeid=501,
+            author='warner',
+            comments='again',
+            branch='warnerdb',
+            revision='1f03b109c',
+            revlink='http://warner/0e92a098b',
+            when_timestamp=256738404,
+            category='devel',
+            repository='git://warner',
+            codebase='',
+            project='Buildbot',
+            sourcestampid=101,
+            parent_changeids=[500],
+        ))
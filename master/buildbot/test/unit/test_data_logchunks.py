@@ -177,15 +177,12 @@ class RawLogChunkEndpoint(LogChunkEndpointBase):
     endpointname = "raw"
 
     def validateData(self, data):
-        self.assertIsInstance(data['raw'], unicode)
+        self.assertIsInstance(data['raw'], logchunks.RawLogReader)
         self.assertIsInstance(data['mime-type'], unicode)
         self.assertIsInstance(data['filename'], unicode)
 
     @defer.inlineCallbacks
     def do_test_chunks(self, path, logid, expLines):
-        # get the whole thing in one go
-        logchunk = yield self.callGet(path)
-        self.validateData(logchunk)
         if logid == 60:
             expContent = u'\n'.join([line[1:] for line in expLines])
             expFilename = "stdio"
@@ -193,5 +190,28 @@ class RawLogChunkEndpoint(LogChunkEndpointBase):
             expContent = u'\n'.join(expLines) + '\n'
             expFilename = "errors"
 
-        self.assertEqual(logchunk,
-                         {'filename': expFilename, 'mime-type': u"text/plain", 'raw': expContent})
+        # get the whole thing in one go, and then a few lines at a time
+        for pieceSize in 65536, 1, 20:
+            self.patch(logchunks.RawLogReader, 'pieceSize', pieceSize)
+            logchunk = yield self.callGet(path)
+            self.validateData(logchunk)
+            raw = yield logchunk.pop('raw').readAll()
+            self.assertEqual(raw, expContent)
+            self.assertEqual(logchunk,
+                             {'filename': expFilename, 'mime-type': u"text/plain"})
+
+    @defer.inlineCallbacks
+    def test_get_pieces(self):
+        self.patch(logchunks.RawLogReader, 'pieceSize', 20)
+        logchunk = yield self.callGet(('logs', 61, self.endpointname))
+        reader = logchunk['raw']
+        self.assertEqual((yield reader.read()), u'00000000\n00000001\n')
+        self.assertEqual((yield reader.read()), u'00000002\n00000003\n')
+        reader.nextLine = 98
+        self.assertEqual((yield reader.read()), u'00000098\n00000099\n')
+        self.assertEqual((yield reader.read()), None)
+
+    @defer.inlineCallbacks
+    def test_get_empty(self):
+        logchunk = yield self.callGet(('logs', 62, self.endpointname))
+        self.assertEqual((yield logchunk['raw'].readAll()), u'')
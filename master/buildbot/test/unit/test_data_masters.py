@@ -300,7 +300,8 @@ class Master(interfaces.InterfaceTests, unittest.TestCase):
             rtype_obj._masterDeactivated = m
 
         # and the update methods..
-        for meth in 'finishBuild', 'finishStep', 'finishLog':
+        for meth in ('finishBuild', 'finishStep', 'finishLog',
+                     'unclaimBuildRequests'):
             m = mock.create_autospec(getattr(self.master.data.updates, meth))
             m.side_effect = lambda *args, **kwargs: defer.succeed(None)
             setattr(self.master.data.updates, meth, m)
@@ -319,6 +320,8 @@ class Master(interfaces.InterfaceTests, unittest.TestCase):
         updates.finishLog.assert_called_with(logid=2000)
         updates.finishStep.assert_called_with(stepid=200, results=RETRY, hidden=False)
         updates.finishBuild.assert_called_with(buildid=13, results=RETRY)
+        # and unclaimed its build request, so that other masters hear of it
+        updates.unclaimBuildRequests.assert_called_with([82])
 
         self.assertEqual(self.master.mq.productions, [
             (('masters', '14', 'stopped'),
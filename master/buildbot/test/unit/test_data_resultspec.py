@@ -15,9 +15,11 @@
 
 import datetime
 import random
+import sqlalchemy as sa
 
 from buildbot.data import base
 from buildbot.data import resultspec
+from buildbot.util import epoch2datetime
 from twisted.trial import unittest
 
 
@@ -263,6 +265,165 @@ class ResultSpec(unittest.TestCase):
         self.assertEqual(rs.fields, ['foo', 'bar'])
 
 
+class SQLPushdown(unittest.TestCase):
+
+    # rows of (id, num, name, when) where num and when are nullable
+    rows = [
+        (1, 5, u'a', 1000),
+        (2, None, u'b', 3000),
+        (3, 7, u'c', None),
+        (4, 5, u'd', 2000),
+        (5, None, u'e', 1000),
+        (6, 9, u'a', 4000),
+    ]
+
+    fieldMapping = {
+        'id': 'things.id',
+        'num': 'things.num',
+        'name': 'things.name',
+        'when': 'things.when_at',
+    }
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        metadata = sa.MetaData()
+        self.tbl = sa.Table('things', metadata,
+                            sa.Column('id', sa.Integer, primary_key=True),
+                            sa.Column('num', sa.Integer, nullable=True),
+                            sa.Column('name', sa.Unicode(10), nullable=False),
+                            sa.Column('when_at', sa.Integer, nullable=True),
+                            sa.Column('hidden', sa.Integer, nullable=False))
+        metadata.create_all(self.engine)
+        self.engine.execute(self.tbl.insert(), [
+            dict(id=id, num=num, name=name, when_at=when, hidden=id % 2)
+            for id, num, name, when in self.rows])
+
+    def dictFromRow(self, row):
+        return dict(id=row.id, num=row.num, name=row.name,
+                    when=epoch2datetime(row.when_at) if row.when_at else None,
+                    hidden=bool(row.hidden))
+
+    def mkspec(self, **kwargs):
+        filters = [resultspec.Filter(*f) for f in kwargs.pop('filters', [])]
+        return resultspec.ResultSpec(filters=filters, **kwargs)
+
+    def query(self, spec):
+        conn = self.engine.connect()
+        try:
+            return spec.thd_execute(conn, self.tbl.select(), self.dictFromRow)
+        finally:
+            conn.close()
+
+    def assertPushdownMatches(self, pushed=True, **kwargs):
+        # applying the spec in SQL and then in memory gives the same result
+        # as applying it in memory only
+        spec = self.mkspec(**kwargs)
+        spec.fieldMapping = self.fieldMapping
+        got = spec.apply(self.query(spec))
+        everything = [self.dictFromRow(row)
+                      for row in self.engine.execute(self.tbl.select())]
+        exp = self.mkspec(**kwargs).apply(everything)
+        self.assertEqual(got, exp)
+        self.assertEqual((got.offset, got.total, got.limit),
+                         (exp.offset, exp.total, exp.limit))
+        if pushed:
+            self.assertEqual((spec.filters, spec.order), ([], None))
+        return spec
+
+    def test_filters(self):
+        for op in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            self.assertPushdownMatches(filters=[('num', op, [5])])
+            self.assertPushdownMatches(filters=[('name', op, [u'b'])])
+        self.assertPushdownMatches(filters=[('num', 'eq', [5, 7])])
+        self.assertPushdownMatches(filters=[('num', 'ne', [5, 7])])
+        self.assertPushdownMatches(filters=[('num', 'eq', [None])])
+        self.assertPushdownMatches(filters=[('num', 'ne', [None])])
+
+    def test_filters_datetime(self):
+        self.assertPushdownMatches(
+            filters=[('when', 'eq', [epoch2datetime(1000),
+                                     epoch2datetime(4000)])])
+        # datetimes cannot be compared to None in Python
+        spec = self.mkspec(filters=[('when', 'lt', [epoch2datetime(2500)])],
+                           order=['id'])
+        spec.fieldMapping = self.fieldMapping
+        self.assertEqual([d['id'] for d in self.query(spec)], [1, 3, 4, 5])
+
+    def test_filter_not_pushed(self):
+        spec = self.assertPushdownMatches(
+            pushed=False,
+            filters=[('hidden', 'eq', [True]), ('num', 'eq', [5])],
+            order=['-name'], limit=1)
+        # the mapped filter was applied in SQL; the rest are left for apply
+        self.assertEqual([f.field for f in spec.filters], ['hidden'])
+        self.assertEqual(spec.order, ['-name'])
+        self.assertEqual(spec.limit, 1)
+
+    def test_filter_None_in_list_not_pushed(self):
+        self.assertPushdownMatches(pushed=False,
+                                   filters=[('num', 'eq', [None, 5])])
+
+    def test_order(self):
+        for order in (['id'], ['-id'], ['num'], ['-num'], ['num', '-id'],
+                      ['-when', 'name'], ['name']):
+            self.assertPushdownMatches(order=order)
+
+    def test_order_not_pushed(self):
+        spec = self.assertPushdownMatches(pushed=False,
+                                          order=['hidden', 'id'], limit=2)
+        self.assertEqual(spec.order, ['hidden', 'id'])
+        self.assertEqual(spec.limit, 2)
+
+    def test_pagination(self):
+        for offset, limit in [(0, 2), (2, 2), (5, 10), (10, 2), (3, None),
+                              (None, 4)]:
+            spec = self.assertPushdownMatches(
+                filters=[('num', 'ne', [7])], order=['-num', 'id'],
+                offset=offset, limit=limit)
+            self.assertEqual((spec.offset, spec.limit), (None, None))
+
+    def test_pagination_result(self):
+        spec = self.mkspec(order=['id'], offset=2, limit=3)
+        spec.fieldMapping = self.fieldMapping
+        res = self.query(spec)
+        self.assertEqual([d['id'] for d in res], [3, 4, 5])
+        self.assertEqual((res.offset, res.total, res.limit), (2, 6, 3))
+
+    def test_pagination_with_fields(self):
+        self.assertPushdownMatches(fields=['id', 'name'], order=['-id'],
+                                   limit=2)
+
+    def test_no_mapping(self):
+        spec = self.mkspec(filters=[('num', 'eq', [5])], order=['id'],
+                           limit=1)
+        res = self.query(spec)
+        self.assertEqual(len(res), 6)
+        self.assertEqual(len(spec.filters), 1)
+
+    def test_projection(self):
+        spec = self.mkspec(fields=['id', 'name'], filters=[('num', 'eq', [5])])
+        spec.fieldMapping = self.fieldMapping
+        res = self.query(spec)
+        # the unselected columns are not fetched
+        self.assertEqual(res, [
+            dict(id=1, num=None, name=u'a', when=None, hidden=False),
+            dict(id=4, num=None, name=u'd', when=None, hidden=False)])
+        self.assertEqual(spec.apply(res), [dict(id=1, name=u'a'),
+                                           dict(id=4, name=u'd')])
+
+    def test_projection_keeps_remaining_filters_and_order(self):
+        self.assertPushdownMatches(
+            pushed=False, fields=['name', 'num', 'when'],
+            filters=[('num', 'eq', [None, 5])], order=['-when'])
+
+    def test_projection_unmapped_field(self):
+        spec = self.mkspec(fields=['id', 'hidden'])
+        spec.fieldMapping = self.fieldMapping
+        res = self.query(spec)
+        self.assertEqual(res[0], dict(id=1, num=5, name=u'a',
+                                      when=epoch2datetime(1000), hidden=True))
+
+
 class NoneCmp(unittest.TestCase):
 
     def test_nonecmp(self):
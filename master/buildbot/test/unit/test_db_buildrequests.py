@@ -693,9 +693,15 @@ class Tests(interfaces.InterfaceTests):
         clock.advance(self.CLAIMED_AT_EPOCH)
 
         meth = self.db.buildrequests.unclaimExpiredRequests
-        return self.do_test_unclaimMethod(
-            lambda: meth(100, _reactor=clock),
-            [47, 49])
+        unclaimed = []
+
+        def unclaim():
+            d = meth(100, _reactor=clock)
+            d.addCallback(unclaimed.extend)
+            return d
+        d = self.do_test_unclaimMethod(unclaim, [47, 49])
+        d.addCallback(lambda _: self.assertEqual(unclaimed, [49]))
+        return d
 
     def test_unclaimBuildRequests(self):
         to_unclaim = [
@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+from buildbot.data import resultspec
 from buildbot.db import builds
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -90,7 +91,8 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getBuilds(self):
         @self.assertArgSpecMatches(self.db.builds.getBuilds)
-        def getBuilds(self, builderid=None, buildrequestid=None, complete=None):
+        def getBuilds(self, builderid=None, buildrequestid=None, complete=None,
+                      resultSpec=None):
             pass
 
     def test_signature_addBuild(self):
@@ -281,6 +283,22 @@ class Tests(interfaces.InterfaceTests):
 
 class RealTests(Tests):
 
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('builderid', 'eq', [77, 88])],
+            order=['-started_at'], limit=2)
+        rs.fieldMapping = {'builderid': 'builds.builderid',
+                           'started_at': 'builds.started_at'}
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        self.assertEqual(list(bdicts),
+                         [self.threeBdicts[52], self.threeBdicts[51]])
+        self.assertEqual((bdicts.offset, bdicts.total, bdicts.limit),
+                         (None, 3, 2))
+        # everything was applied in the database
+        self.assertEqual((rs.filters, rs.order, rs.limit), ([], None, None))
+
     @defer.inlineCallbacks
     def test_addBuild_existing_race(self):
         clock = task.Clock()
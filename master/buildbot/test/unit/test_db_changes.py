@@ -15,6 +15,7 @@
 
 import sqlalchemy as sa
 
+from buildbot.data import resultspec
 from buildbot.db import builds
 from buildbot.db import changes
 from buildbot.db import sourcestamps
@@ -89,6 +90,11 @@ class Tests(interfaces.InterfaceTests):
                       project='', uid=None):
             pass
 
+    def test_signature_addChanges(self):
+        @self.assertArgSpecMatches(self.db.changes.addChanges)
+        def addChanges(self, changes):
+            pass
+
     def test_signature_getChange(self):
         @self.assertArgSpecMatches(self.db.changes.getChange)
         def getChange(self, key, no_cache=False):
@@ -206,6 +212,37 @@ class Tests(interfaces.InterfaceTests):
             'when_timestamp': epoch2datetime(OTHERTIME),
         })
 
+    @defer.inlineCallbacks
+    def test_addChanges_getChange(self):
+        clock = task.Clock()
+        clock.advance(SOMETIME)
+        changeids = yield self.db.changes.addChanges([
+            dict(author=u'dustin', files=[u'a.txt'], comments=u'first',
+                 revision=u'2d6caa52', when_timestamp=epoch2datetime(OTHERTIME),
+                 branch=u'master', repository=u'', codebase=u'', project=u'',
+                 revlink=None,
+                 properties={u'platform': (u'linux', u'Change')}),
+            dict(author=u'warner', files=[], comments=u'second',
+                 revision=u'0e92a098b', when_timestamp=None,
+                 branch=u'release', repository=u'', codebase=u'',
+                 project=u'', revlink=None),
+        ], _reactor=clock)
+        self.assertEqual(len(changeids), 2)
+        first = yield self.db.changes.getChange(changeids[0])
+        second = yield self.db.changes.getChange(changeids[1])
+        for chdict in first, second:
+            validation.verifyDbDict(self, 'chdict', chdict)
+        self.assertEqual(
+            (first['author'], first['files'], first['comments'],
+             first['properties'], first['when_timestamp']),
+            (u'dustin', [u'a.txt'], u'first',
+             {u'platform': (u'linux', u'Change')}, epoch2datetime(OTHERTIME)))
+        self.assertEqual(
+            (second['author'], second['files'], second['branch'],
+             second['when_timestamp']),
+            (u'warner', [], u'release', epoch2datetime(SOMETIME)))
+        self.assertNotEqual(first['sourcestampid'], second['sourcestampid'])
+
     def test_getChange_chdict(self):
         d = self.insertTestData(self.change14_rows)
 
@@ -280,7 +317,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getChanges(self):
         @self.assertArgSpecMatches(self.db.changes.getChanges)
-        def getChanges(self):
+        def getChanges(self, resultSpec=None):
             pass
 
     def insert7Changes(self):
@@ -417,6 +454,50 @@ class RealTests(Tests):
 
     # tests that only "real" implementations will pass
 
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec(self):
+        yield self.insert7Changes()
+        rs = resultspec.ResultSpec(order=['-changeid'], offset=1, limit=3)
+        rs.fieldMapping = {'changeid': 'changes.changeid'}
+        changes = yield self.db.changes.getChanges(resultSpec=rs)
+        self.assertEqual([ch['changeid'] for ch in changes], [13, 12, 11])
+        self.assertEqual((changes.offset, changes.total, changes.limit),
+                         (1, 7, 3))
+
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec_fields(self):
+        yield self.insertTestData(self.change14_rows)
+        rs = resultspec.ResultSpec(fields=['changeid', 'author'])
+        rs.fieldMapping = {'changeid': 'changes.changeid',
+                           'author': 'changes.author'}
+        changes = yield self.db.changes.getChanges(resultSpec=rs)
+        # only the selected columns are fetched, and files and properties
+        # are not queried at all
+        self.assertEqual(len(changes), 1)
+        ch = changes[0]
+        self.assertEqual((ch['changeid'], ch['author']), (14, u'warner'))
+        self.assertEqual((ch['comments'], ch['files'], ch['properties']),
+                         (None, [], {}))
+
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec_ancillary(self):
+        yield self.insert7Changes()
+        # the files and properties of the whole page are fetched together,
+        # not change by change
+        self.patch(self.db.changes, '_chdict_from_change_row_thd',
+                   lambda conn, row: self.fail("fetched one change at a time"))
+        rs = resultspec.ResultSpec(order=['-changeid'], limit=3)
+        rs.fieldMapping = {'changeid': 'changes.changeid'}
+        changes = yield self.db.changes.getChanges(resultSpec=rs)
+        self.assertEqual([ch['changeid'] for ch in changes], [14, 13, 12])
+        self.assertEqual(changes[0], self.change14_dict)
+        self.assertEqual(changes[1]['files'],
+                         [u'master/README.txt', u'slave/README.txt'])
+        self.assertEqual(changes[1]['properties'],
+                         {u'notest': (u'no', u'Change')})
+        self.assertEqual((changes[2]['files'], changes[2]['properties']),
+                         ([], {}))
+
     def test_addChange(self):
         clock = task.Clock()
         clock.advance(SOMETIME)
@@ -510,6 +591,87 @@ class RealTests(Tests):
         d.addCallback(check_change_sourcestamps)
         return d
 
+    @defer.inlineCallbacks
+    def test_addChanges(self):
+        yield self.insertTestData(self.change14_rows + [
+            fakedb.User(uid=1, identifier="one"),
+        ])
+        clock = task.Clock()
+        clock.advance(SOMETIME)
+
+        def change(revision, branch=u'warnerdb', **kwargs):
+            return dict(author=u'delanne', comments=u'on ' + branch,
+                        revision=revision, branch=branch,
+                        when_timestamp=epoch2datetime(OTHERTIME),
+                        repository=u'git://warner', codebase=u'mainapp',
+                        project=u'Buildbot', **kwargs)
+        changeids = yield self.db.changes.addChanges([
+            change(u'50adad56', files=[u'a', u'b'], uid=1),
+            change(u'50adad56', branch=u'other',
+                   properties={u'p': (1, 'Change')}),
+            change(u'60bebe67', files=[u'c']),
+        ], _reactor=clock)
+
+        def thd(conn):
+            ch_tbl = self.db.model.changes
+            r = conn.execute(sa.select(
+                [ch_tbl.c.changeid, ch_tbl.c.parent_changeids,
+                 ch_tbl.c.sourcestampid, ch_tbl.c.revision],
+                whereclause=ch_tbl.c.changeid.in_(changeids),
+                order_by=ch_tbl.c.changeid))
+            rows = [tuple(row) for row in r.fetchall()]
+            ss_tbl = self.db.model.sourcestamps
+            r = conn.execute(sa.select([ss_tbl.c.id, ss_tbl.c.branch,
+                                        ss_tbl.c.revision, ss_tbl.c.created_at],
+                                       whereclause=ss_tbl.c.id != 233))
+            sourcestamps = dict((row.id, tuple(row)[1:]) for row in r)
+            files = [tuple(row) for row in conn.execute(sa.select(
+                [self.db.model.change_files.c.changeid,
+                 self.db.model.change_files.c.filename],
+                order_by=[self.db.model.change_files.c.changeid,
+                          self.db.model.change_files.c.filename]))]
+            props = [tuple(row) for row in conn.execute(
+                self.db.model.change_properties.select())]
+            users = [tuple(row) for row in conn.execute(
+                self.db.model.change_users.select())]
+            return rows, sourcestamps, files, props, users
+        rows, sourcestamps, files, props, users = yield self.db.pool.do(thd)
+
+        first, second, third = changeids
+        # consecutive changes on the same branch are each other's parents
+        self.assertEqual([(changeid, parent) for changeid, parent, _, _ in rows],
+                         [(first, 14), (second, None), (third, first)])
+        # one sourcestamp per branch and revision
+        self.assertEqual(sorted(sourcestamps[ssid] for _, _, ssid, _ in rows),
+                         [(u'other', u'50adad56', SOMETIME),
+                          (u'warnerdb', u'50adad56', SOMETIME),
+                          (u'warnerdb', u'60bebe67', SOMETIME)])
+        self.assertEqual(files, [(14, u'master/buildbot/__init__.py'),
+                                 (first, u'a'), (first, u'b'),
+                                 (third, u'c')])
+        self.assertEqual(props, [(second, u'p', u'[1, "Change"]')])
+        self.assertEqual(users, [(first, 1)])
+
+    @defer.inlineCallbacks
+    def test_addChanges_existing_sourcestamp(self):
+        clock = task.Clock()
+        clock.advance(SOMETIME)
+        ssid = yield self.db.sourcestamps.findSourceStampId(
+            branch=u'master', revision=u'2d6caa52', repository=u'',
+            project=u'', codebase=u'', _reactor=clock)
+        changeids = yield self.db.changes.addChanges([
+            dict(author=u'dustin', comments=u'again', revision=u'2d6caa52',
+                 branch=u'master', repository=u'', codebase=u'', project=u'',
+                 when_timestamp=epoch2datetime(OTHERTIME)),
+        ], _reactor=clock)
+        chdict = yield self.db.changes.getChange(changeids[0])
+        self.assertEqual(chdict['sourcestampid'], ssid)
+
+    @defer.inlineCallbacks
+    def test_addChanges_empty(self):
+        changeids = yield self.db.changes.addChanges([])
+        self.assertEqual(changeids, [])
+
     def test_addChange_when_timestamp_None(self):
         clock = task.Clock()
         clock.advance(OTHERTIME)
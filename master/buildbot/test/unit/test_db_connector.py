@@ -89,3 +89,17 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
     def test_setup_check_version_good(self):
         self.db.model.is_current = lambda: defer.succeed(True)
         return self.startService(check_version=True)
+
+    @defer.inlineCallbacks
+    def test_stopService_flushes_logs(self):
+        yield self.startService()
+        self.db.logs.flushLogs = mock.Mock(return_value=defer.succeed(None))
+        yield self.db.stopService()
+        self.db.logs.flushLogs.assert_called_with()
+
+    @defer.inlineCallbacks
+    def test_stopService_flushes_state(self):
+        yield self.startService()
+        self.db.state.flushState = mock.Mock(return_value=defer.succeed(None))
+        yield self.db.stopService()
+        self.db.state.flushState.assert_called_with()
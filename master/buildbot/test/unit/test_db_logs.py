@@ -23,6 +23,7 @@ from buildbot.test.util import connector_component
 from buildbot.test.util import interfaces
 from buildbot.test.util import validation
 from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -103,7 +104,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getLogs(self):
         @self.assertArgSpecMatches(self.db.logs.getLogs)
-        def getLogs(self, stepid):
+        def getLogs(self, stepid, resultSpec=None):
             pass
 
     def test_signature_getLogLines(self):
@@ -111,6 +112,11 @@ class Tests(interfaces.InterfaceTests):
         def getLogLines(self, logid, first_line, last_line):
             pass
 
+    def test_signature_getLogLinesEnd(self):
+        @self.assertArgSpecMatches(self.db.logs.getLogLinesEnd)
+        def getLogLinesEnd(self, logid, first_line, size):
+            pass
+
     def test_signature_addLog(self):
         @self.assertArgSpecMatches(self.db.logs.addLog)
         def addLog(self, stepid, name, slug, type):
@@ -121,6 +127,11 @@ class Tests(interfaces.InterfaceTests):
         def appendLog(self, logid, content):
             pass
 
+    def test_signature_flushLogs(self):
+        @self.assertArgSpecMatches(self.db.logs.flushLogs)
+        def flushLogs(self):
+            pass
+
     def test_signature_finishLog(self):
         @self.assertArgSpecMatches(self.db.logs.finishLog)
         def finishLog(self, logid):
@@ -221,6 +232,18 @@ class Tests(interfaces.InterfaceTests):
         self.assertEqual((yield self.db.logs.getLogLines(1470, 0, 0)),
                          content.split('\n')[0] + '\n')
 
+    @defer.inlineCallbacks
+    def test_getLogLinesEnd(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.getLogLinesEnd(201, 5, 30)), 6)
+        # at least one line is always included
+        self.assertEqual((yield self.db.logs.getLogLinesEnd(201, 5, 1)), 5)
+        self.assertEqual((yield self.db.logs.getLogLinesEnd(201, 6, 65536)), 6)
+        self.assertEqual((yield self.db.logs.getLogLinesEnd(201, 7, 65536)),
+                         None)
+        self.assertEqual((yield self.db.logs.getLogLinesEnd(999, 0, 65536)),
+                         None)
+
     @defer.inlineCallbacks
     def test_addLog_getLog(self):
         yield self.insertTestData(self.backgroundData)
@@ -337,8 +360,207 @@ class RealTests(Tests):
         self.assertEqual(len(chunk), 65534)
         chunk.decode('utf-8')
 
-    # TODO: test compressing with >64k
-    # TODO: test compressing compressed size >64k
+    @defer.inlineCallbacks
+    def test_getLogLines_line_offsets_cached(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u''.join(u'%d\n' % i
+                                                   for i in range(1000)))
+        for first_line, last_line in [(500, 510), (7, 7), (1006, 1006),
+                                      (7, 1006), (900, 2000)]:
+            lines = yield self.db.logs.getLogLines(201, first_line, last_line)
+            self.assertEqual(lines, u''.join(u'%d\n' % (i - 7)
+                                             for i in range(first_line,
+                                                            min(last_line, 1006) + 1)))
+        # only the big chunk needed trimming, and its offsets were computed
+        # once
+        self.assertEqual(self.db.logs._lineOffsetsCache.keys(),
+                         [(201, 7, 1006, 0)])
+
+    @defer.inlineCallbacks
+    def test_getLogLines_after_compressLog(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 2000)
+        self.assertEqual((yield self.db.logs.getLogLines(201, 1, 2)),
+                         u'line 1\nline TWO\n')
+        yield self.db.logs.compressLog(201)
+        # the merged chunk gets its own line offsets
+        self.assertEqual((yield self.db.logs.getLogLines(201, 1, 2)),
+                         u'line 1\nline TWO\n')
+        self.assertEqual((yield self.db.logs.getLogLines(201, 6, 8)),
+                         u'yet another line\nabc\nabc\n')
+
+    @defer.inlineCallbacks
+    def test_appendLog_missing(self):
+        yield self.insertTestData(self.backgroundData)
+        self.assertEqual((yield self.db.logs.appendLog(999, u'abc\n')), None)
+
+    @defer.inlineCallbacks
+    def test_appendLog_coalesced(self):
+        self.db.master.config.logBufferTime = 5
+        clock = self.db.logs._reactor = task.Clock()
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        logid = yield self.db.logs.addLog(
+            stepid=102, name=u'another', slug=u'another', type=u's')
+        d = defer.gatherResults([
+            self.db.logs.appendLog(201, u'abc\n'),
+            self.db.logs.appendLog(logid, u'xyz\n'),
+            self.db.logs.appendLog(201, u'def\nghi\n'),
+            self.db.logs.appendLog(999, u'missing\n'),
+        ])
+        self.assertEqual((yield self.getLogChunkRows(logid)), [])
+        clock.advance(5)
+        self.assertEqual((yield d), [(7, 7), (0, 0), (8, 9), None])
+        # appends to each log were written as a single chunk
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['content'])
+                          for r in rows[-1:]], [(7, 9, 'abc\ndef\nghi')])
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 10)
+        self.assertEqual((yield self.db.logs.getLog(logid))['num_lines'], 1)
+
+    @defer.inlineCallbacks
+    def test_appendLog_size_window(self):
+        self.db.master.config.logBufferTime = 5
+        self.db.master.config.logBufferSize = 10
+        self.db.logs._reactor = task.Clock()
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        d1 = self.db.logs.appendLog(201, u'abc\n')
+        # this exceeds the buffer size, so both are written without waiting
+        # for the timer
+        d2 = self.db.logs.appendLog(201, u'defghijk\n')
+        self.assertEqual((yield d1), (7, 7))
+        self.assertEqual((yield d2), (8, 8))
+
+    @defer.inlineCallbacks
+    def test_appendLog_size_window_bytes(self):
+        self.db.master.config.logBufferTime = 5
+        self.db.master.config.logBufferSize = 10
+        clock = self.db.logs._reactor = task.Clock()
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        # eight characters, but sixteen bytes, so this is written without
+        # waiting for the timer
+        d = self.db.logs.appendLog(201, u'\N{SNOWMAN}' * 4 + u'abc\n')
+        self.assertEqual(clock.getDelayedCalls(), [])
+        self.assertEqual((yield d), (7, 7))
+
+    @defer.inlineCallbacks
+    def test_appendLog_num_lines_cached(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n')
+        self.assertEqual(self.db.logs._numLines, {201: 8})
+        yield self.db.logs.appendLog(201, u'def\n')
+        self.assertEqual(self.db.logs._numLines, {201: 9})
+        yield self.db.logs.finishLog(201)
+        self.assertEqual(self.db.logs._numLines, {})
+
+    @defer.inlineCallbacks
+    def test_finishLog_flushes(self):
+        self.db.master.config.logBufferTime = 5
+        self.db.logs._reactor = task.Clock()
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        d = self.db.logs.appendLog(201, u'abc\n')
+        yield self.db.logs.finishLog(201)
+        self.assertTrue(d.called)
+        logdict = yield self.db.logs.getLog(201)
+        self.assertEqual((logdict['num_lines'], logdict['complete']),
+                         (8, True))
+
+    @defer.inlineCallbacks
+    def test_flushLogs(self):
+        self.db.master.config.logBufferTime = 5
+        self.db.logs._reactor = task.Clock()
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        d = self.db.logs.appendLog(201, u'abc\n')
+        yield self.db.logs.flushLogs()
+        self.assertEqual((yield d), (7, 7))
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 7)),
+                         u'abc\n')
+
+    def getLogChunkRows(self, logid):
+        def thd(conn):
+            tbl = self.db.model.logchunks
+            q = tbl.select(whereclause=tbl.c.logid == logid)
+            q = q.order_by(tbl.c.first_line)
+            return [dict(row) for row in conn.execute(q)]
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def test_compressLog_merges_small_chunks(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        # too small to compress, but merged into a single chunk
+        self.assertEqual([(r['first_line'], r['last_line'], r['compressed'])
+                          for r in rows], [(0, 6, 0)])
+        yield self.checkTestLogLines()
+
+    @defer.inlineCallbacks
+    def do_test_compressLog(self, method):
+        self.db.master.config.logCompressionMethod = method
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        for i in range(10):
+            yield self.db.logs.appendLog(201, u'line %d\n' % i * 10000)
+        saved = yield self.db.logs.compressLog(201)
+        self.assertTrue(saved > 0)
+        rows = yield self.getLogChunkRows(201)
+        methodId = logs.COMPRESSION_METHODS[method]['id']
+        # the small leading chunks are merged but stay uncompressed
+        self.assertEqual([r['compressed'] for r in rows],
+                         [0] + [methodId] * (len(rows) - 1))
+        for row in rows:
+            self.assertTrue(len(row['content']) < self.db.logs.MAX_CHUNK_SIZE)
+        # chunks still cover every line exactly once
+        self.assertEqual(rows[0]['first_line'], 0)
+        for prev, next in zip(rows, rows[1:]):
+            self.assertEqual(prev['last_line'] + 1, next['first_line'])
+        self.assertEqual(rows[-1]['last_line'], 100006)
+        lines = yield self.db.logs.getLogLines(201, 0, 6)
+        self.assertEqual(lines, u'line zero\nline 1\nline TWO\n\nline 2**2\n'
+                                u'another line\nyet another line\n')
+        lines = yield self.db.logs.getLogLines(201, 7, 100006)
+        self.assertEqual(lines, u''.join(u'line %d\n' % i * 10000
+                                         for i in range(10)))
+        lines = yield self.db.logs.getLogLines(201, 50005, 50008)
+        self.assertEqual(lines, u'line 4\nline 4\nline 5\nline 5\n')
+
+    def test_compressLog_gz(self):
+        return self.do_test_compressLog('gz')
+
+    def test_compressLog_bz2(self):
+        return self.do_test_compressLog('bz2')
+
+    def test_compressLog_lz4(self):
+        if 'lz4' not in logs.COMPRESSION_METHODS:
+            raise unittest.SkipTest("lz4 is not installed")
+        return self.do_test_compressLog('lz4')
+
+    @defer.inlineCallbacks
+    def test_compressLog_raw(self):
+        self.db.master.config.logCompressionMethod = 'raw'
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 20000)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual(set(r['compressed'] for r in rows), set([0]))
+        lines = yield self.db.logs.getLogLines(201, 7, 20006)
+        self.assertEqual(lines, u'abc\n' * 20000)
+
+    @defer.inlineCallbacks
+    def test_compressLog_limit_disabled(self):
+        self.db.master.config.logCompressionLimit = False
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 20000)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual(set(r['compressed'] for r in rows), set([0]))
+
+    @defer.inlineCallbacks
+    def test_compressLog_twice(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 20000)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual((yield self.db.logs.compressLog(201)), 0)
+        self.assertEqual((yield self.getLogChunkRows(201)), rows)
 
 
 class TestFakeDB(unittest.TestCase, Tests):
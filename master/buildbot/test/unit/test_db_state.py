@@ -16,6 +16,8 @@
 from buildbot.db import state
 from buildbot.test.fake import fakedb
 from buildbot.test.util import connector_component
+from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -190,3 +192,154 @@ class TestStateConnectorComponent(
             return self.db.pool.do(thd)
         d.addCallback(check)
         return d
+
+    def getStateRows(self):
+        def thd(conn):
+            q = self.db.model.object_state.select()
+            return sorted((r.objectid, r.name, r.value_json)
+                          for r in conn.execute(q).fetchall())
+        return self.db.pool.do(thd)
+
+    def updateStateRow(self, objectid, name, value_json):
+        # change the database behind the component's back
+        def thd(conn):
+            tbl = self.db.model.object_state
+            conn.execute(tbl.update(whereclause=((tbl.c.objectid == objectid)
+                                                 & (tbl.c.name == name))),
+                         value_json=value_json)
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def test_getState_not_cached(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='x', class_name='y'),
+            fakedb.ObjectState(objectid=10, name='x', value_json='[1,2]'),
+        ])
+        val = yield self.db.state.getState(10, 'x')
+        val.append(3)
+        # another master took over the object and changed its state
+        yield self.updateStateRow(10, 'x', '99')
+        self.assertEqual((yield self.db.state.getState(10, 'x')), 99)
+
+    @defer.inlineCallbacks
+    def test_getState_missing_not_cached(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='x', class_name='y'),
+        ])
+        self.assertEqual((yield self.db.state.getState(10, 'x', None)), None)
+        yield self.insertTestData([
+            fakedb.ObjectState(objectid=10, name='x', value_json='[1,2]'),
+        ])
+        self.assertEqual((yield self.db.state.getState(10, 'x')), [1, 2])
+
+    @defer.inlineCallbacks
+    def test_setState_getState(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+        ])
+        yield self.db.state.setState(10, 'x', [1, 2])
+        self.assertEqual((yield self.db.state.getState(10, 'x')), [1, 2])
+        yield self.updateStateRow(10, 'x', '99')
+        self.assertEqual((yield self.db.state.getState(10, 'x')), 99)
+
+    @defer.inlineCallbacks
+    def test_setState_after_failover(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+        ])
+        yield self.db.state.setState(10, 'x', [1, 2])
+        # another master changes the value, and this one reads it when it
+        # takes the object over again
+        yield self.updateStateRow(10, 'x', '99')
+        self.assertEqual((yield self.db.state.getState(10, 'x')), 99)
+        yield self.db.state.setState(10, 'x', [1, 2])
+        self.assertEqual((yield self.getStateRows()), [(10, 'x', '[1, 2]')])
+
+    @defer.inlineCallbacks
+    def test_setState_bad_name(self):
+        self.db.master.config.stateBufferTime = 5
+        clock = self.db.state._reactor = task.Clock()
+        self.db.state._isCheckLengthNecessary = True
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+        ])
+        d = self.db.state.setState(10, 'x' * 1000, 1)
+        yield self.assertFailure(d, RuntimeError)
+        # values written in the same flush are not affected
+        d = self.db.state.setState(10, 'y', 2)
+        clock.advance(5)
+        yield d
+        self.assertEqual((yield self.getStateRows()), [(10, 'y', '2')])
+
+    @defer.inlineCallbacks
+    def test_setState_unchanged(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+            fakedb.ObjectState(objectid=10, name='x', value_json='[1, 2]'),
+        ])
+        self.assertEqual((yield self.db.state.getState(10, 'x')), [1, 2])
+        yield self.updateStateRow(10, 'x', '99')
+        # the value is not written again
+        yield self.db.state.setState(10, 'x', [1, 2])
+        self.assertEqual((yield self.getStateRows()), [(10, 'x', '99')])
+
+    @defer.inlineCallbacks
+    def test_setState_unchanged_multiMaster(self):
+        self.db.master.config.multiMaster = True
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+            fakedb.ObjectState(objectid=10, name='x', value_json='[1, 2]'),
+        ])
+        self.assertEqual((yield self.db.state.getState(10, 'x')), [1, 2])
+        # another master changes the row behind the cache
+        yield self.updateStateRow(10, 'x', '99')
+        yield self.db.state.setState(10, 'x', [1, 2])
+        self.assertEqual((yield self.getStateRows()), [(10, 'x', '[1, 2]')])
+
+    @defer.inlineCallbacks
+    def test_setState_coalesced(self):
+        self.db.master.config.stateBufferTime = 5
+        clock = self.db.state._reactor = task.Clock()
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+            fakedb.Object(id=11, name='+', class_name='+'),
+            fakedb.ObjectState(objectid=10, name='x', value_json='0'),
+        ])
+        d = defer.gatherResults([
+            self.db.state.setState(10, 'x', 1),
+            self.db.state.setState(11, 'y', 2),
+            self.db.state.setState(10, 'x', 3),
+        ])
+        self.assertEqual((yield self.getStateRows()), [(10, 'x', '0')])
+        self.assertEqual((yield self.db.state.getState(10, 'x')), 3)
+        clock.advance(5)
+        yield d
+        self.assertEqual((yield self.getStateRows()),
+                         [(10, 'x', '3'), (11, 'y', '2')])
+
+    @defer.inlineCallbacks
+    def test_flushState(self):
+        self.db.master.config.stateBufferTime = 5
+        self.db.state._reactor = task.Clock()
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+        ])
+        d = self.db.state.setState(10, 'x', [1, 2])
+        yield self.db.state.flushState()
+        self.assertTrue(d.called)
+        self.assertEqual((yield self.getStateRows()), [(10, 'x', '[1, 2]')])
+        yield self.db.state.flushState()
+
+    @defer.inlineCallbacks
+    def test_setState_conflict_forgotten(self):
+        yield self.insertTestData([
+            fakedb.Object(id=10, name='-', class_name='-'),
+        ])
+
+        def hook(conn):
+            conn.execute(self.db.model.object_state.insert(),
+                         objectid=10, name='x', value_json='22')
+        self.db.state._test_timing_hook = hook
+        yield self.db.state.setState(10, 'x', [1, 2])
+        # the other master's value is read from the database
+        self.assertEqual((yield self.db.state.getState(10, 'x')), 22)
@@ -27,6 +27,7 @@ from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemq
 from buildbot.test.util import dirs
 from buildbot.test.util import logging
+from buildbot.util import epoch2datetime
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.python import log
@@ -95,6 +96,12 @@ class OldTriggeringMethods(unittest.TestCase):
             kwargs=dict(when=892293875),
             exp_data_kwargs=dict(when_timestamp=892293875))
 
+    def test_addChange_args_when_timestamp(self):
+        # when_timestamp may be given as a datetime
+        return self.do_test_addChange_args(
+            kwargs=dict(when_timestamp=epoch2datetime(892293875)),
+            exp_data_kwargs=dict(when_timestamp=892293875))
+
     def test_addChange_args_properties(self):
         # properties should not be qualified with a source
         return self.do_test_addChange_args(
@@ -15,8 +15,10 @@
 
 import mock
 
+from buildbot.mq import redismq
 from buildbot.mq import simple
 from buildbot.test.fake import fakemaster
+from buildbot.test.fake import fakeredis
 from buildbot.test.util import interfaces
 from buildbot.test.util import tuplematching
 from twisted.internet import defer
@@ -101,6 +103,27 @@ class RealTests(tuplematching.TupleMatchingMixin, Tests):
         self.assertTrue(cb2.called)
         self.assertFalse(cb.called)
 
+    @defer.inlineCallbacks
+    def test_produce_order(self):
+        calls = []
+        yield self.mq.startConsuming(lambda *args: calls.append(1), ('a', None))
+        yield self.mq.startConsuming(lambda *args: calls.append(2), ('a', 'b'))
+        yield self.mq.startConsuming(lambda *args: calls.append(3), (None, 'b'))
+        yield self.mq.startConsuming(lambda *args: calls.append(4), ('a', 'c'))
+        self.mq.produce(('a', 'b'), '{}')
+        self.assertEqual(calls, [1, 2, 3])
+
+    @defer.inlineCallbacks
+    def test_stopConsuming_while_producing(self):
+        cb2 = mock.Mock()
+
+        def cb1(routingKey, data):
+            qref2.stopConsuming()
+        yield self.mq.startConsuming(cb1, ('abc',))
+        qref2 = yield self.mq.startConsuming(cb2, ('abc',))
+        self.mq.produce(('abc',), '{}')
+        self.assertFalse(cb2.called)
+
     @defer.inlineCallbacks
     def test_persistent(self):
         cb = mock.Mock()
@@ -129,3 +152,21 @@ class TestSimpleMQ(unittest.TestCase, RealTests):
     def setUp(self):
         self.master = fakemaster.make_master()
         self.mq = simple.SimpleMQ(self.master)
+
+
+class TestRedisMQ(unittest.TestCase, RealTests):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.server = fakeredis.FakeRedisServer()
+        self.master = fakemaster.make_master()
+        self.master.config.mq = dict(type='redis', url=self.server.start())
+        self.mq = redismq.RedisMQ(self.master)
+        yield self.mq.reconfigServiceWithBuildbotConfig(self.master.config)
+        yield self.mq.startService()
+        yield self.mq.whenConnected()
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.mq.stopService()
+        yield self.server.stop()
@@ -0,0 +1,237 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.mq import redismq
+from buildbot.test.fake import fakemaster
+from buildbot.test.fake import fakeredis
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class ParseReply(unittest.TestCase):
+
+    def test_simple_types(self):
+        self.assertEqual(redismq.parseReply('+OK\r\n', 0), ('OK', 5))
+        self.assertEqual(redismq.parseReply(':42\r\n', 0), (42, 5))
+        self.assertEqual(redismq.parseReply('$3\r\nabc\r\n', 0),
+                         ('abc', 9))
+        self.assertEqual(redismq.parseReply('$-1\r\n', 0), (None, 5))
+
+    def test_error(self):
+        err, pos = redismq.parseReply('-ERR oops\r\n', 0)
+        self.assertIsInstance(err, redismq.RedisError)
+        self.assertEqual(str(err), 'ERR oops')
+
+    def test_nested_array(self):
+        self.assertEqual(
+            redismq.parseReply('*2\r\n*1\r\n$1\r\na\r\n:1\r\n+x', 0),
+            ([['a'], 1], 19))
+
+    def test_incomplete(self):
+        for buf in ['', '+OK', '$3\r\nab', '*2\r\n:1\r\n']:
+            self.assertRaises(redismq.IncompleteReply,
+                              lambda: redismq.parseReply(buf, 0))
+
+
+class RespProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.proto = redismq.RespProtocol()
+        self.proto.factory = mock.Mock()
+        self.proto.transport = mock.Mock()
+
+    def test_sendCommands(self):
+        self.proto.sendCommands([('SET', 'k', 10), ('GET', u'k\xe9')])
+        self.proto.transport.write.assert_called_once_with(
+            '*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$2\r\n10\r\n'
+            '*2\r\n$3\r\nGET\r\n$3\r\nk\xc3\xa9\r\n')
+
+    def test_replies_in_pieces(self):
+        replies = []
+        for cmd in ('A', 'B', 'C'):
+            self.proto.sendCommand(cmd).addBoth(replies.append)
+        for piece in ['+O', 'K\r\n$5\r\nhel', 'lo\r\n-ERR', ' bad\r\n']:
+            self.proto.dataReceived(piece)
+        self.assertEqual(replies[:2], ['OK', 'hello'])
+        replies[2].trap(redismq.RedisError)
+
+    def test_published_message(self):
+        d = self.proto.sendCommand('PING')
+        self.proto.dataReceived('*3\r\n$7\r\nmessage\r\n$2\r\nch\r\n'
+                                '$4\r\ndata\r\n+PONG\r\n')
+        self.proto.factory.messageReceived.assert_called_once_with('ch',
+                                                                   'data')
+        self.assertEqual(self.successResultOf(d), 'PONG')
+
+
+class RedisMQ(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.server = fakeredis.FakeRedisServer()
+        self.url = self.server.start()
+        self.mqs = []
+        self.mq = yield self.makeMQ()
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for mq in self.mqs:
+            if mq.running:
+                yield mq.stopService()
+        yield self.server.stop()
+
+    @defer.inlineCallbacks
+    def makeMQ(self, name=None, **kwargs):
+        master = fakemaster.make_master()
+        if name:
+            master.name = name
+        master.config.mq = dict(type='redis', url=self.url, **kwargs)
+        mq = redismq.RedisMQ(master)
+        self.mqs.append(mq)
+        yield mq.reconfigServiceWithBuildbotConfig(master.config)
+        yield mq.startService()
+        yield mq.whenConnected()
+        yield self.waitFor(lambda: len(self.server.subscribers())
+                           == len([m for m in self.mqs if m.running]))
+        defer.returnValue(mq)
+
+    @defer.inlineCallbacks
+    def waitFor(self, condition):
+        from twisted.internet import reactor
+        while not condition():
+            yield task.deferLater(reactor, 0.001, lambda: None)
+
+    def published(self):
+        return [c for c in self.server.commands if c[0] == 'PUBLISH']
+
+    @defer.inlineCallbacks
+    def test_fanout_between_masters(self):
+        other = yield self.makeMQ()
+        received, otherReceived = [], []
+        yield self.mq.startConsuming(lambda *a: received.append(a), ('a', None))
+        yield other.startConsuming(lambda *a: otherReceived.append(a),
+                                   ('a', None))
+
+        self.mq.produce(('a', 'b'), dict(x=1))
+        # delivered locally right away, and only once
+        self.assertEqual(received, [(('a', 'b'), dict(x=1))])
+        yield self.waitFor(lambda: otherReceived)
+        self.assertEqual(otherReceived, [(('a', 'b'), dict(x=1))])
+        self.assertEqual(received, [(('a', 'b'), dict(x=1))])
+
+    @defer.inlineCallbacks
+    def test_produce_batches(self):
+        other = yield self.makeMQ()
+        otherReceived = []
+        yield other.startConsuming(lambda *a: otherReceived.append(a),
+                                   ('a', None))
+
+        for i in range(5):
+            self.mq.produce(('a', str(i)), dict(i=i))
+        yield self.waitFor(lambda: len(otherReceived) == 5)
+        self.assertEqual(len(self.published()), 1)
+        self.assertEqual(otherReceived,
+                         [(('a', str(i)), dict(i=i)) for i in range(5)])
+
+    @defer.inlineCallbacks
+    def test_prefix(self):
+        other = yield self.makeMQ(prefix='other')
+        otherReceived = []
+        yield other.startConsuming(lambda *a: otherReceived.append(a),
+                                   ('a',))
+        self.mq.produce(('a',), {})
+        yield self.waitFor(lambda: self.published())
+        self.assertEqual(self.published()[0][1], 'buildbot:mq')
+        yield self.mq.whenConnected().addCallback(
+            lambda conn: conn.sendCommand('PING'))
+        self.assertEqual(otherReceived, [])
+
+    @defer.inlineCallbacks
+    def test_persistent_across_restart(self):
+        cb = mock.Mock()
+        qref = yield self.mq.startConsuming(cb, ('abc',),
+                                            persistent_name='ABC')
+        qref.stopConsuming()
+        self.mq.produce(('abc',), dict(n=1))
+        yield self.mq.stopService()
+
+        self.assertEqual(self.server.lists.keys(),
+                         ['buildbot:queue:fake:/master:ABC'])
+        restarted = yield self.makeMQ()
+        yield restarted.startConsuming(cb, ('abc',), persistent_name='ABC')
+        cb.assert_called_once_with(('abc',), dict(n=1))
+        self.assertEqual(self.server.lists, {})
+
+    @defer.inlineCallbacks
+    def test_persistent_produced_while_draining(self):
+        cb = mock.Mock()
+        self.server.lists['buildbot:queue:fake:/master:ABC'] = [
+            '[["abc"], {"n": 1}]']
+        d = self.mq.startConsuming(cb, ('abc',), persistent_name='ABC')
+        self.mq.produce(('abc',), dict(n=2))
+        yield d
+        self.assertEqual(cb.call_args_list,
+                         [mock.call(('abc',), dict(n=1)),
+                          mock.call(('abc',), dict(n=2))])
+        self.assertEqual(self.server.lists, {})
+
+    @defer.inlineCallbacks
+    def test_persistent_multi_master(self):
+        other = yield self.makeMQ(name='other')
+        cb, otherCb = mock.Mock(), mock.Mock()
+        for mq, callback in (self.mq, cb), (other, otherCb):
+            qref = yield mq.startConsuming(callback, ('abc',),
+                                           persistent_name='ABC')
+            qref.stopConsuming()
+        self.mq.produce(('abc',), dict(n=1))
+        yield self.waitFor(lambda: len(self.server.lists) == 2)
+
+        # each master gets the message once, from its own queue
+        yield other.startConsuming(otherCb, ('abc',), persistent_name='ABC')
+        otherCb.assert_called_once_with(('abc',), dict(n=1))
+        yield self.mq.startConsuming(cb, ('abc',), persistent_name='ABC')
+        cb.assert_called_once_with(('abc',), dict(n=1))
+        self.assertEqual(self.server.lists, {})
+
+    @defer.inlineCallbacks
+    def test_bad_database(self):
+        yield self.mq.stopService()
+        master = fakemaster.make_master()
+        master.config.mq = dict(type='redis', url=self.url + '/foo')
+        mq = redismq.RedisMQ(master)
+        self.mqs.append(mq)
+        yield mq.reconfigServiceWithBuildbotConfig(master.config)
+        yield mq.startService()
+        yield self.waitFor(lambda: self.flushLoggedErrors(redismq.RedisError))
+        # the connection is dropped rather than used with the wrong database
+        self.assertIdentical(mq.connection, None)
+        self.assertIdentical(mq.subscription, None)
+
+    @defer.inlineCallbacks
+    def test_reconnect(self):
+        for factory in self.mq.factories:
+            factory.initialDelay = factory.delay = 0.001
+        self.server.disconnectAll()
+        yield self.waitFor(lambda: self.mq.connection is None)
+
+        # produced while disconnected; sent once reconnected
+        self.mq.produce(('a',), dict(x=1))
+        yield self.waitFor(lambda: self.published())
+        self.assertEqual(self.published()[0][1], 'buildbot:mq')
+        # and subscribed again
+        yield self.waitFor(lambda: self.server.subscribers())
@@ -23,6 +23,7 @@ from buildbot.util import epoch2datetime
 from buildbot.util.eventual import fireEventually
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.internet import task
 from twisted.python import failure
 from twisted.trial import unittest
 
@@ -46,6 +47,141 @@ class SkipSlavesThatCantGetLock(buildrequestdistributor.BasicBuildChooser):
         self.rejectedSlaves = None  # disable this feature
 
 
+def brdict(brid, submitted_at, builderid=77):
+    return dict(buildrequestid=brid, builderid=builderid,
+                submitted_at=epoch2datetime(submitted_at))
+
+
+class TestUnclaimedBuildRequests(unittest.TestCase):
+
+    def ids(self, requests):
+        return [brd['buildrequestid'] for brd in requests]
+
+    def test_sorted(self):
+        reqs = buildrequestdistributor.UnclaimedBuildRequests(
+            [brdict(1, 300), brdict(2, 100), brdict(3, 200)])
+        self.assertEqual(self.ids(reqs), [2, 3, 1])
+        self.assertEqual(reqs.first()['buildrequestid'], 2)
+        self.assertEqual(len(reqs), 3)
+
+    def test_add_remove(self):
+        reqs = buildrequestdistributor.UnclaimedBuildRequests([brdict(1, 100)])
+        reqs.add(brdict(2, 200))
+        reqs.add(brdict(3, 50))
+        reqs.add(brdict(2, 200))
+        self.assertEqual(self.ids(reqs), [3, 1, 2])
+        reqs.remove(3)
+        reqs.remove(99)
+        self.assertEqual(self.ids(reqs), [1, 2])
+        self.assertEqual(reqs.get(2), brdict(2, 200))
+        self.assertEqual(reqs.get(3), None)
+
+    def test_first_empty(self):
+        reqs = buildrequestdistributor.UnclaimedBuildRequests()
+        self.assertEqual(reqs.first(), None)
+        self.assertFalse(reqs)
+
+    def test_copy(self):
+        reqs = buildrequestdistributor.UnclaimedBuildRequests(
+            [brdict(1, 100), brdict(2, 200)])
+        copy = reqs.copy()
+        copy.remove(1)
+        self.assertEqual(self.ids(reqs), [1, 2])
+        self.assertEqual(self.ids(copy), [2])
+
+
+class TestBuildRequestIndex(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.master = fakemaster.make_master(testcase=self, wantMq=True,
+                                             wantData=True, wantDb=True)
+        self.master.mq.verifyMessages = False
+        yield self.master.db.insertTestData([
+            fakedb.Builder(id=77, name='A'),
+            fakedb.Buildset(id=11, reason='because'),
+            fakedb.BuildRequest(id=10, buildsetid=11, builderid=77,
+                                submitted_at=130000),
+            fakedb.BuildRequest(id=11, buildsetid=11, builderid=77,
+                                submitted_at=120000),
+        ])
+        self.index = buildrequestdistributor.BuildRequestIndex(self.master)
+        yield self.index.startConsuming()
+
+    @defer.inlineCallbacks
+    def getIds(self, builderid=77):
+        requests = yield self.index.getUnclaimed(builderid)
+        defer.returnValue([brd['buildrequestid'] for brd in requests])
+
+    def message(self, brid, event, submitted_at=140000):
+        self.master.mq.callConsumer(('buildrequests', str(brid), event),
+                                    brdict(brid, submitted_at))
+
+    @defer.inlineCallbacks
+    def test_fetch_once(self):
+        self.assertEqual((yield self.getIds()), [11, 10])
+        yield self.master.db.insertTestData([
+            fakedb.BuildRequest(id=12, buildsetid=11, builderid=77)])
+        # not fetched again
+        self.assertEqual((yield self.getIds()), [11, 10])
+
+    @defer.inlineCallbacks
+    def test_fetch_again_after_max_age(self):
+        clock = self.index._reactor = task.Clock()
+        self.assertEqual((yield self.getIds()), [11, 10])
+        # unclaimed by a master that does not share the message queue
+        yield self.master.db.insertTestData([
+            fakedb.BuildRequest(id=12, buildsetid=11, builderid=77,
+                                submitted_at=140000)])
+        clock.advance(self.index.MAX_AGE - 1)
+        self.assertEqual((yield self.getIds()), [11, 10])
+        clock.advance(1)
+        self.assertEqual((yield self.getIds()), [11, 10, 12])
+
+    @defer.inlineCallbacks
+    def test_messages(self):
+        self.assertEqual((yield self.getIds()), [11, 10])
+        self.message(12, 'new')
+        self.message(11, 'claimed')
+        self.message(10, 'complete')
+        self.message(13, 'unclaimed', submitted_at=100)
+        self.assertEqual((yield self.getIds()), [13, 12])
+
+    @defer.inlineCallbacks
+    def test_messages_before_fetch_ignored(self):
+        self.message(12, 'new')
+        self.assertEqual((yield self.getIds()), [11, 10])
+
+    @defer.inlineCallbacks
+    def test_messages_during_fetch(self):
+        get = self.master.data.get
+
+        def slowGet(*args, **kwargs):
+            # the requests change after they are read, but before the result
+            # is returned
+            d = get(*args, **kwargs)
+            self.message(12, 'new')
+            self.message(10, 'claimed')
+            return d
+        self.patch(self.master.data, 'get', slowGet)
+        self.assertEqual((yield self.getIds()), [11, 12])
+
+    @defer.inlineCallbacks
+    def test_invalidate_removeClaimed(self):
+        self.assertEqual((yield self.getIds()), [11, 10])
+        self.index.removeClaimed(77, [11])
+        self.assertEqual((yield self.getIds()), [10])
+        self.index.invalidate(77)
+        self.assertEqual((yield self.getIds()), [11, 10])
+
+    @defer.inlineCallbacks
+    def test_not_cached_when_not_consuming(self):
+        self.index.stopConsuming()
+        self.assertEqual(self.master.mq.qrefs, [])
+        self.assertEqual((yield self.getIds()), [11, 10])
+        self.assertEqual(self.index.builders, {})
+
+
 class TestBRDBase(unittest.TestCase):
 
     def setUp(self):
@@ -782,6 +918,77 @@ class TestMaybeStartBuilds(TestBRDBase):
         yield self.do_test_maybeStartBuildsOnBuilder(rows=rows,
                                                      exp_claims=[11], exp_builds=[('test-slave1', [11])])
 
+    @defer.inlineCallbacks
+    def test_claim_race_keeps_chooser(self):
+        self.bldr.config.nextSlave = nth_slave(0)
+        # another master claims #10 before this one does
+        old_claimBuildRequests = self.master.data.updates.claimBuildRequests
+
+        def claimBuildRequests(brids, claimed_at=None, _reactor=None):
+            self.master.data.updates.claimBuildRequests = old_claimBuildRequests
+            return defer.succeed(False)
+        self.master.data.updates.claimBuildRequests = claimBuildRequests
+        created = []
+        createBuildChooser = self.brd.createBuildChooser
+
+        def countingCreateBuildChooser(bldr, master):
+            created.append(bldr)
+            return createBuildChooser(bldr, master)
+        self.brd.createBuildChooser = countingCreateBuildChooser
+
+        self.addSlaves({'test-slave1': 1})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, builderid=77,
+                                submitted_at=130000),
+            fakedb.BuildRequest(id=11, buildsetid=11, builderid=77,
+                                submitted_at=135000),
+        ]
+        yield self.do_test_maybeStartBuildsOnBuilder(
+            rows=rows, exp_claims=[11], exp_builds=[('test-slave1', [11])])
+        self.assertEqual(len(created), 1)
+        # the index is refreshed, and another pass retries the requests
+        self.assertNotIn(77, self.brd.requestIndex.builders)
+        self.botmaster.maybeStartBuildsForBuilder.assert_called_with('A')
+
+    @defer.inlineCallbacks
+    def test_unclaimed_requests_not_refetched(self):
+        self.addSlaves({'test-slave1': 1})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, builderid=77,
+                                submitted_at=130000),
+            fakedb.BuildRequest(id=11, buildsetid=11, builderid=77,
+                                submitted_at=135000),
+        ]
+        yield self.master.db.insertTestData(rows)
+        getBuildRequests = mock.Mock(
+            wraps=self.master.db.buildrequests.getBuildRequests)
+        self.patch(self.master.db.buildrequests, 'getBuildRequests',
+                   getBuildRequests)
+        self.patch(self.master.db.buildrequests, 'getBuildRequest',
+                   mock.Mock(side_effect=AssertionError('re-fetched')))
+
+        yield self.brd._maybeStartBuildsOnBuilder(self.bldr)
+        yield self.brd._maybeStartBuildsOnBuilder(self.bldr)
+        self.assertMyClaims([10, 11])
+        self.assertBuildsStarted([('test-slave1', [10]),
+                                  ('test-slave1', [11])])
+        self.assertEqual(getBuildRequests.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_claimed_messages(self):
+        self.addSlaves({'test-slave1': 1})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, builderid=77),
+        ]
+        self.master.mq.clearProductions()
+        yield self.do_test_maybeStartBuildsOnBuilder(
+            rows=rows, exp_claims=[10], exp_builds=[('test-slave1', [10])])
+        self.master.mq.assertProductions([
+            (('buildsets', '11', 'builders', '-1', 'buildrequests', '10',
+              'claimed'),
+             dict(bsid=11, brid=10, buildername=u'A', builderid=-1)),
+        ])
+
     # nextSlave
     @defer.inlineCallbacks
     def do_test_nextSlave(self, nextSlave, exp_choice=None):
@@ -159,6 +159,33 @@ class Tests(unittest.TestCase):
             ('o', u'this is a second line\n'),
             (None, None)])
 
+    @defer.inlineCallbacks
+    def test_subscription_chunks(self):
+        l = yield self.makeLog('s')
+        calls = []
+
+        def gotChunk(stream, chunk):
+            calls.append((stream, chunk and chunk.lines))
+            chunks.append(chunk)
+        chunks = []
+        l.subscribeChunks(gotChunk)
+        l.subscribeChunks(gotChunk)
+
+        yield l.addStdout(u'hello\nworld\n')
+        yield l.addStderr(u'oh ')
+        yield l.addStderr(u'noes\n')
+        yield l.finish()
+        self.assertEqual(calls, [
+            ('o', [u'hello', u'world']),
+            ('o', [u'hello', u'world']),
+            ('e', [u'oh noes']),
+            ('e', [u'oh noes']),
+            (None, None),
+            (None, None),
+        ])
+        # subscribers share the chunk
+        self.assertIdentical(chunks[0], chunks[1])
+
     @defer.inlineCallbacks
     def test_updates_stream(self):
         l = yield self.makeLog('s')
@@ -248,6 +275,11 @@ class InterfaceTests(interfaces.InterfaceTests):
         def subscribe(self, callback):
             pass
 
+    def test_signature_subscribeChunks(self):
+        @self.assertArgSpecMatches(self.log.subscribeChunks)
+        def subscribeChunks(self, callback):
+            pass
+
     def test_signature_unsubscribe(self):
         # method has been removed
         self.failIf(hasattr(self.log, 'unsubscribe'))
@@ -88,6 +88,64 @@ class MyLogLineObserver(logobserver.LogLineObserver):
         self.obs.append(('fin',))
 
 
+class MyLogChunkObserver(logobserver.LogChunkObserver):
+
+    def __init__(self):
+        logobserver.LogChunkObserver.__init__(self)
+        self.obs = []
+
+    def outChunkReceived(self, chunk):
+        self.obs.append(('out', chunk.lines))
+
+    def errChunkReceived(self, chunk):
+        self.obs.append(('err', chunk.lines))
+
+    def headerChunkReceived(self, chunk):
+        self.obs.append(('hdr', chunk.lines))
+
+    def finishReceived(self):
+        self.obs.append(('fin',))
+
+
+class TestLogChunkObserver(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master(testcase=self, wantData=True)
+
+    @defer.inlineCallbacks
+    def test_sequence(self):
+        logid = yield self.master.data.updates.addLog(1, u'mine', u's')
+        l = log.Log.new(self.master, 'mine', 's', logid, 'utf-8')
+        lo = MyLogChunkObserver()
+        lo.setLog(l)
+
+        yield l.addStdout(u'hello\n')
+        yield l.addStderr(u'cruel\n')
+        yield l.addStdout(u'multi\nline\nchunk\n')
+        yield l.addHeader(u'H1\nH2\n')
+        yield l.finish()
+
+        self.assertEqual(lo.obs, [
+            ('out', [u'hello']),
+            ('err', [u'cruel']),
+            ('out', [u'multi', u'line', u'chunk']),
+            ('hdr', [u'H1', u'H2']),
+            ('fin',),
+        ])
+
+    def test_gotData(self):
+        # text delivered directly is made into chunks
+        lo = MyLogChunkObserver()
+        lo.gotData('o', u'a\nb\n')
+        lo.gotData('h', u'c\n')
+        lo.gotData(None, None)
+        self.assertEqual(lo.obs, [
+            ('out', [u'a', u'b']),
+            ('hdr', [u'c']),
+            ('fin',),
+        ])
+
+
 class TestLineConsumerLogObesrver(unittest.TestCase):
 
     def setUp(self):
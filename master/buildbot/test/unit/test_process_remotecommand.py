@@ -13,10 +13,15 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
+import zlib
+
 from buildbot.process import remotecommand
 from buildbot.test.fake import logfile
 from buildbot.test.fake import remotecommand as fakeremotecommand
 from buildbot.test.util import interfaces
+from buildbot.util.eventual import fireEventually
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -51,6 +56,27 @@ class TestRemoteShellCommand(unittest.TestCase):
         self.assertEqual(cmd.command, command)
         self.assertEqual(cmd.fake_command, command)
 
+    def startCommand(self, compress_updates, version):
+        cmd = remotecommand.RemoteShellCommand("build", "make")
+        cmd.buildslave = mock.Mock(compress_updates=compress_updates)
+        cmd.step = mock.Mock()
+        cmd.step.slaveVersion.return_value = version
+        cmd.step.slaveVersionIsOlderThan.side_effect = \
+            lambda command, minversion: (map(int, version.split('.')) <
+                                         map(int, minversion.split('.')))
+        cmd.conn = mock.Mock()
+        cmd._start()
+        return cmd.args
+
+    def test_compress_updates(self):
+        self.assertEqual(self.startCommand(True, "2.20")['compress'], 'zlib')
+
+    def test_compress_updates_disabled(self):
+        self.assertNotIn('compress', self.startCommand(False, "2.20"))
+
+    def test_compress_updates_old_slave(self):
+        self.assertNotIn('compress', self.startCommand(True, "2.19"))
+
 # NOTE:
 #
 # This interface is considered private to Buildbot and may change without
@@ -149,6 +175,112 @@ class TestRunCommand(unittest.TestCase, Tests):
         self.failUnlessEqual(log.header, 'some header')
 
 
+class RecordingLog(object):
+
+    def __init__(self, name, record):
+        self.name = name
+        self.record = record
+
+    def getName(self):
+        return self.name
+
+    def addStdout(self, data):
+        self.record.append((self.name, 'o', data))
+        return defer.succeed(None)
+
+    def addStderr(self, data):
+        self.record.append((self.name, 'e', data))
+        return defer.succeed(None)
+
+    def addHeader(self, data):
+        self.record.append((self.name, 'h', data))
+        return defer.succeed(None)
+
+
+class TestRemoteUpdate(unittest.TestCase):
+
+    def makeCommand(self):
+        cmd = remotecommand.RemoteCommand('shell', {})
+        cmd.buildslave = mock.Mock()
+        cmd.active = True
+        cmd.deferred = defer.Deferred()
+        self.record = []
+        cmd.useLog(RecordingLog('stdio', self.record))
+        cmd.useLog(RecordingLog('other', self.record))
+        return cmd
+
+    def test_interleaved(self):
+        cmd = self.makeCommand()
+        acked = cmd.remote_update([[{'stdout': 'out1\n'}, 0],
+                                   [{'stderr': 'err\n'}, 0],
+                                   [{'log': ('other', 'x')}, 0],
+                                   [{'stdout': 'out2\n'}, 0]])
+        self.assertEqual(acked, 0)
+        self.assertEqual(self.record, [('stdio', 'o', 'out1\n'),
+                                       ('stdio', 'e', 'err\n'),
+                                       ('other', 'o', 'x'),
+                                       ('stdio', 'o', 'out2\n')])
+
+    def test_compressed(self):
+        cmd = self.makeCommand()
+        stdout, other = zlib.compressobj(), zlib.compressobj()
+
+        def compress(compressor, data):
+            return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        cmd.remote_update([
+            [{'zlib': ('stdout', compress(stdout, 'out1\n'))}, 0],
+            [{'stderr': 'err\n'}, 0],
+            [{'zlib': (['log', 'other'], compress(other, 'x'))}, 0],
+            [{'zlib': ('stdout', compress(stdout, 'out2\n'))}, 0]])
+        self.assertEqual(self.record, [('stdio', 'o', 'out1\n'),
+                                       ('stdio', 'e', 'err\n'),
+                                       ('other', 'o', 'x'),
+                                       ('stdio', 'o', 'out2\n')])
+
+    def test_failure_skips_rest(self):
+        cmd = self.makeCommand()
+        handled = []
+
+        def remoteUpdate(update):
+            handled.append(update)
+            if 'stderr' in update:
+                raise RuntimeError('oops')
+        cmd.remoteUpdate = remoteUpdate
+        acked = cmd.remote_update([[{'stdout': 'a'}, 1],
+                                   [{'stderr': 'b'}, 2],
+                                   [{'stdout': 'c'}, 3]])
+        # everything is acked, but nothing after the failure is handled
+        self.assertEqual(acked, 3)
+        self.assertEqual(handled, [{'stdout': 'a'}, {'stderr': 'b'}])
+        self.assertFalse(cmd.active)
+        self.assertFailure(cmd.deferred, RuntimeError)
+        return cmd.deferred
+
+    @defer.inlineCallbacks
+    def test_waits_for_each_update(self):
+        cmd = self.makeCommand()
+        handled = []
+        pending = []
+
+        def remoteUpdate(update):
+            handled.append(update)
+            d = defer.Deferred()
+            pending.append(d)
+            return d
+        cmd.remoteUpdate = remoteUpdate
+        cmd.remote_update([[{'stdout': 'a'}, 1], [{'stdout': 'b'}, 2]])
+        cmd.remote_complete()
+        self.assertEqual(handled, [{'stdout': 'a'}])
+        pending.pop(0).callback(None)
+        self.assertEqual(handled, [{'stdout': 'a'}, {'stdout': 'b'}])
+        # the command only finishes once its updates have been handled
+        yield fireEventually()
+        self.assertFalse(cmd.deferred.called)
+        pending.pop(0).callback(None)
+        yield cmd.deferred
+        self.assertFalse(cmd.active)
+
+
 class TestFakeRunCommand(unittest.TestCase, Tests):
 
     remoteCommandClass = fakeremotecommand.FakeRemoteCommand
@@ -1,9 +1,16 @@
 import os
+import shutil
 import stat
+import tarfile
 import tempfile
 
+from cStringIO import StringIO
+
+from buildbot.process import cache
 from buildbot.process import remotetransfer
+from buildbot.test.fake import fakemaster
 from mock import Mock
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -47,3 +54,150 @@ class TestFileWriter(unittest.TestCase):
         mockedMakedirs.assert_called_once_with(absdir)
         mockedMkstemp.assert_called_once_with(dir=absdir)
         mockedFdopen.assert_called_once_with(7, 'wb')
+
+
+class TestDirectoryWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.srcdir = os.path.abspath('src')
+        self.destdir = os.path.abspath('dest')
+        for d in (self.srcdir, self.destdir):
+            if os.path.exists(d):
+                shutil.rmtree(d)
+        os.makedirs(os.path.join(self.srcdir, 'sub', 'subsub'))
+        self.contents = {
+            'a': 'lots of a' * 1000,
+            'empty': '',
+            os.path.join('sub', 'b'): 'b' * 512,
+            os.path.join('sub', 'subsub', 'c' * 120): 'long name',
+        }
+        for name, content in self.contents.iteritems():
+            with open(os.path.join(self.srcdir, name), 'wb') as f:
+                f.write(content)
+        os.symlink('a', os.path.join(self.srcdir, 'link'))
+
+    def tearDown(self):
+        for d in (self.srcdir, self.destdir):
+            if os.path.exists(d):
+                shutil.rmtree(d)
+
+    def makeArchive(self, compress=None):
+        f = StringIO()
+        archive = tarfile.open(fileobj=f, mode='w|' + (compress or ''))
+        archive.add(self.srcdir, '')
+        archive.close()
+        return f.getvalue()
+
+    def write(self, writer, data, blocksize):
+        for i in range(0, len(data), blocksize):
+            writer.remote_write(data[i:i + blocksize])
+
+    def assertUnpacked(self):
+        for name, content in self.contents.iteritems():
+            with open(os.path.join(self.destdir, name), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(os.readlink(os.path.join(self.destdir, 'link')), 'a')
+
+    def test_unpack(self):
+        for compress in (None, 'gz', 'bz2'):
+            data = self.makeArchive(compress)
+            for blocksize in (1, 7, 512, 16384):
+                writer = remotetransfer.DirectoryWriter(self.destdir, None,
+                                                        compress, 0600)
+                self.write(writer, data, blocksize)
+                writer.remote_unpack()
+                self.assertUnpacked()
+                shutil.rmtree(self.destdir)
+
+    def test_unpacks_as_data_arrives(self):
+        data = self.makeArchive()
+        writer = remotetransfer.DirectoryWriter(self.destdir, None, None, 0600)
+        # everything up to the middle of the content of 'a', which is the
+        # first file in the archive
+        offset = data.index('lots of a') + 4500
+        self.write(writer, data[:offset], 512)
+        with open(os.path.join(self.destdir, 'a'), 'rb') as f:
+            self.assertTrue(f.read().startswith('lots of a'))
+        # and only the header is buffered
+        self.assertEqual(writer.extractor.buffer, '')
+        self.write(writer, data[offset:], 512)
+        writer.remote_unpack()
+        self.assertUnpacked()
+
+    def test_truncated(self):
+        data = self.makeArchive()
+        # maxsize cuts off the content of 'a'
+        writer = remotetransfer.DirectoryWriter(
+            self.destdir, data.index('lots of a') + 100, None, 0600)
+        self.write(writer, data, 512)
+        self.assertRaises(tarfile.ReadError, writer.remote_unpack)
+        # and the partially unpacked directory is removed
+        self.assertFalse(os.path.exists(self.destdir))
+
+    def test_cancel_keeps_existing_files(self):
+        os.makedirs(os.path.join(self.destdir, 'sub'))
+        with open(os.path.join(self.destdir, 'sub', 'old'), 'wb') as f:
+            f.write('old')
+        data = self.makeArchive()
+        writer = remotetransfer.DirectoryWriter(self.destdir, None, None, 0600)
+        self.write(writer, data[:len(data) // 2], 512)
+        writer.cancel()
+        self.assertEqual(sorted(os.listdir(self.destdir)), ['sub'])
+        self.assertEqual(os.listdir(os.path.join(self.destdir, 'sub')),
+                         ['old'])
+        # writes arriving after the cancel are ignored
+        writer.remote_write(data[len(data) // 2:])
+        self.assertEqual(sorted(os.listdir(self.destdir)), ['sub'])
+
+    def test_corrupt(self):
+        writer = remotetransfer.DirectoryWriter(self.destdir, None, None, 0600)
+        self.assertRaises(tarfile.ReadError,
+                          lambda: writer.remote_write('x' * 1024))
+
+
+class TestGetFileDigest(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master(testcase=self)
+        self.master.caches = cache.CacheManager()
+        self.path = os.path.abspath('digested')
+        with open(self.path, 'wb') as f:
+            f.write('some data')
+        self.fileDigest = Mock(wraps=remotetransfer.fileDigest)
+        self.patch(remotetransfer, 'fileDigest', self.fileDigest)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    @defer.inlineCallbacks
+    def test_cached(self):
+        digest = yield remotetransfer.getFileDigest(self.master, self.path)
+        self.assertEqual(len(digest), 64)
+        again = yield remotetransfer.getFileDigest(self.master, 'digested')
+        self.assertEqual(again, digest)
+        self.assertEqual(self.fileDigest.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_changed(self):
+        digest = yield remotetransfer.getFileDigest(self.master, self.path)
+        st = os.stat(self.path)
+        with open(self.path, 'wb') as f:
+            f.write('more data')
+        # same size and modification time
+        os.utime(self.path, (st.st_atime, st.st_mtime))
+        changed = yield remotetransfer.getFileDigest(self.master, self.path)
+        self.assertNotEqual(changed, digest)
+        self.assertEqual(self.fileDigest.call_count, 2)
+
+    @defer.inlineCallbacks
+    def test_evicted(self):
+        self.master.caches.config = dict(digests=1)
+        other = os.path.abspath('other')
+        with open(other, 'wb') as f:
+            f.write('other data')
+        self.addCleanup(os.unlink, other)
+        yield remotetransfer.getFileDigest(self.master, self.path)
+        yield remotetransfer.getFileDigest(self.master, other)
+        # only the last digest is kept
+        yield remotetransfer.getFileDigest(self.master, self.path)
+        self.assertEqual(self.fileDigest.call_count, 3)
@@ -13,10 +13,12 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
 import time
 
 from buildbot.schedulers import timed
 from buildbot.test.util import scheduler
+from buildbot.util import croniter
 try:
     from multiprocessing import Process
     assert Process
@@ -214,3 +216,52 @@ class NightlyBase(scheduler.SchedulerMixin, unittest.TestCase):
                                              ((2011, 1, 4, 22, 19), (2011, 1, 5, 1, 0)),  # 5th
                                              ((2011, 1, 5, 22, 19), (2011, 1, 7, 1, 0)),  # Thurs
                                              )
+
+
+class Timetable(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(timed.Timetable, 'batchSize', 4)
+        self.timetable = timed.Timetable('0,30 * * * *')
+        self.start = time.mktime((2011, 1, 1, 3, 0, 0, 0, 0, -1))
+
+    def expected(self, after):
+        return croniter.croniter('0,30 * * * *', after).get_next(float)
+
+    def test_getNext(self):
+        for offset in [0, 1, 1799, 1800, 5000, 3600 * 20, 10, 3600 * 100]:
+            after = self.start + offset
+            self.assertEqual(self.timetable.getNext(after),
+                             self.expected(after))
+
+    def test_getNext_batches(self):
+        self.timetable.getNext(self.start)
+        self.assertEqual(len(self.timetable.times), 4)
+        # within the batch, nothing is computed
+        with mock.patch.object(self.timetable, '_compute') as compute:
+            self.assertEqual(self.timetable.getNext(self.start + 3600),
+                             self.start + 5400)
+            self.assertFalse(compute.called)
+        # the next batch is added, keeping the previous one
+        self.timetable.getNext(self.start + 7200)
+        self.assertEqual(len(self.timetable.times), 8)
+        self.timetable.getNext(self.start + 14400)
+        self.assertEqual(len(self.timetable.times), 8)
+        self.assertEqual(self.timetable.start, self.start + 7200)
+        self.assertEqual(self.timetable.getNext(self.start + 7200),
+                         self.start + 9000)
+
+    def test_getNext_earlier(self):
+        self.timetable.getNext(self.start)
+        # an earlier time joins up with the computed times
+        self.assertEqual(self.timetable.getNext(self.start - 1900),
+                         self.start - 1800)
+        self.assertEqual(self.timetable.times[:3],
+                         [self.start - 1800, self.start, self.start + 1800])
+
+    def test_getTimetable_shared(self):
+        sched1 = timed.NightlyBase(name='one', builderNames=['a'], minute=5)
+        sched2 = timed.NightlyBase(name='two', builderNames=['b'], minute=5)
+        self.assertIdentical(sched1.getTimetable(), sched2.getTimetable())
+        other = timed.NightlyBase(name='three', builderNames=['b'], minute=6)
+        self.assertNotIdentical(other.getTimetable(), sched1.getTimetable())
@@ -13,8 +13,11 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
+
 from buildbot.schedulers import timed
 from buildbot.test.util import scheduler
+from buildbot.util import timerwheel
 from twisted.internet import defer
 from twisted.internet import task
 from twisted.trial import unittest
@@ -64,3 +67,26 @@ class Timed(scheduler.SchedulerMixin, unittest.TestCase):
 
         d = sched.deactivate()
         return d
+
+    def test_timerWheel(self):
+        sched = self.makeScheduler(name='test', builderNames=['foo'])
+        wheel = timerwheel.TimerWheel()
+        wheel._reactor = self.clock
+        sched.parent = mock.Mock(timerWheel=wheel)
+
+        sched.activate()
+        # the actuation is scheduled on the shared wheel
+        self.assertEqual(wheel.nextCallTime(), 1060)
+        self.assertIdentical(sched.actuateAtTimer.wheel, wheel)
+
+        self.clock.advance(1065)
+        self.assertTrue(sched.started_build)
+        self.assertEqual(wheel.nextCallTime(), 1120)
+
+        d = sched.deactivate()
+
+        @d.addCallback
+        def check(_):
+            self.assertEqual(wheel.nextCallTime(), None)
+            self.assertEqual(self.clock.getDelayedCalls(), [])
+        return d
@@ -93,3 +93,28 @@ class TestEqConnectionPool(unittest.TestCase):
         # of different type
         pool = mtrlogobserver.EqConnectionPool("DummyDb1")
         self.assertTrue(pool != object())
+
+
+class TestMtrLogObserver(unittest.TestCase):
+
+    def test_chunk(self):
+        observer = mtrlogobserver.MtrLogObserver()
+        observer.setStep(mock.Mock())
+        observer.collectTestFail = mock.Mock()
+        observer.outReceived("main.alias  w1  [ pass ]  12\n"
+                             "main.bug  w2  [ fail ]  oops\n"
+                             "some failure output\n"
+                             "main.other  w1  [ pass ]  3\n")
+        self.assertEqual(observer.numTests, 3)
+        observer.collectTestFail.assert_called_once_with(
+            'main.bug', '', 'fail', 'oops',
+            "main.bug  w2  [ fail ]  oops\nsome failure output\n")
+        self.assertEqual(observer.failList, ['F:bug'])
+
+    def test_long_lines_dropped(self):
+        observer = mtrlogobserver.MtrLogObserver()
+        observer.setStep(mock.Mock())
+        observer.setMaxLineLength(40)
+        observer.outReceived("main.alias  w1  [ pass ]  12\n"
+                             "main.long  w1  [ pass ]  " + "x" * 40 + "\n")
+        self.assertEqual(observer.numTests, 1)
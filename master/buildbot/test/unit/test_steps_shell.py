@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
 import re
 import textwrap
 
@@ -899,6 +900,94 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
                          (exp_file, exp_lineNo, exp_text))
 
 
+class WarningScanner(unittest.TestCase):
+
+    def makeScanner(self, **kwargs):
+        self.step = shell.WarningCountingShellCommand(command=['make'],
+                                                      **kwargs)
+        return shell.WarningScanner(self.step)
+
+    def test_requiredLiteral(self):
+        for pattern, exp in [
+            ('(?i).*warning[: ].*', ('warning', True)),
+            (shell.WarningCountingShellCommand.directoryEnterPattern,
+             (': Entering directory ', False)),
+            ('^IN: (.*)', ('IN: ', False)),
+            ('warning|error', None),
+            (r'(.*):(\d+): W', (': W', False)),
+            (u'caf\xe9 warning', (' warning', False)),
+        ]:
+            self.assertEqual(shell._requiredLiteral(re.compile(pattern)), exp,
+                             pattern)
+
+    def test_scanLines(self):
+        scanner = self.makeScanner()
+        scanner.scanLines(['normal', 'a Warning: here', 'not a warning',
+                           'warning in last'])
+        self.assertEqual(self.step.loggedWarnings,
+                         ['a Warning: here', 'warning in last'])
+        self.assertEqual(self.step.warnCount, 2)
+
+    def test_scanLines_no_literal_in_chunk(self):
+        scanner = self.makeScanner()
+        scanner.warningRe = mock.Mock()
+        scanner.scanLines(['compiling a.c', 'compiling b.c'])
+        self.assertFalse(scanner.warningRe.match.called)
+
+    def test_scanLines_directories(self):
+        def warningExtractor(step, line, match):
+            return line.split(':', 2)
+        scanner = self.makeScanner(warningExtractor=warningExtractor)
+        self.step.addSuppression([('sub/a.c', None, None, None)])
+        scanner.scanLines(["a.c:1: warning: top",
+                           "make[1]: Entering directory 'sub'",
+                           "a.c:2: warning: suppressed",
+                           "make[1]: Leaving directory 'sub'",
+                           "a.c:3: warning: top again"])
+        self.assertEqual(self.step.loggedWarnings,
+                         ["a.c:1: warning: top", "a.c:3: warning: top again"])
+        self.assertEqual(self.step.directoryStack, [])
+
+    def test_scanLines_no_literal(self):
+        scanner = self.makeScanner(warningPattern='W|E')
+        scanner.scanLines(['W: one', 'info', 'E: two'])
+        self.assertEqual(self.step.loggedWarnings, ['W: one', 'E: two'])
+
+    def test_getSuppressions(self):
+        step = shell.WarningCountingShellCommand(command=['make'])
+        step.addSuppression([('.*\\.c', 'a', None, None),
+                             ('lib/.*', 'b', None, None),
+                             (None, 'c', None, None),
+                             ('.*\\.c', 'd', None, None)])
+        self.assertEqual([warnRe.pattern for _, warnRe, _, _
+                          in step.getSuppressions('lib/x.c')],
+                         ['a', 'b', 'c', 'd'])
+        self.assertEqual([warnRe.pattern for _, warnRe, _, _
+                          in step.getSuppressions('x.h')],
+                         ['c'])
+        self.assertEqual(len(step.getSuppressions(None)), 4)
+        self.assertIn('x.h', step.suppressionsByFile)
+
+        # adding suppressions forgets the files
+        step.addSuppression([('.*', 'e', None, None)])
+        self.assertEqual(step.suppressionsByFile, {})
+        self.assertEqual(len(step.getSuppressions('x.h')), 2)
+
+    def test_SuppressionIndex(self):
+        suppressions = [(re.compile(fileRe), None, None, None)
+                        for fileRe in [r'.*/foo\.c', r'(?i).*/foo\.c',
+                                       r'src/.*', r'.*/bar_baz\.h$',
+                                       r'.*/foo\.cc']]
+        index = shell.SuppressionIndex(suppressions)
+        self.assertEqual(sorted(index.byWord), ['bar_baz', 'foo'])
+        self.assertEqual(index.unindexed, [1, 2])
+        self.assertEqual(index.match('src/foo.c'), suppressions[:3])
+        self.assertEqual(index.match('lib/FOO.c'), suppressions[1:2])
+        self.assertEqual(index.match('lib/bar_baz.h'), suppressions[3:4])
+        self.assertEqual(index.match('lib/foo.cc'),
+                         [suppressions[0], suppressions[1], suppressions[4]])
+
+
 class Compile(steps.BuildStepMixin, unittest.TestCase):
 
     def setUp(self):
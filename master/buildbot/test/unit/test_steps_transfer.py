@@ -123,6 +123,142 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         d = self.runStep()
         return d
 
+    def testConstructorWindow(self):
+        for window in (0, -1, 1.5, 'x'):
+            self.assertRaises(config.ConfigErrors, lambda:
+                              transfer.FileUpload(slavesrc=__file__, masterdest='xyz', window=window))
+
+    def testWindow(self):
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile, window=4))
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False, window=4,
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        d = self.runStep()
+        return d
+
+    def testWindowOldSlave(self):
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile, window=4),
+            slave_version={'*': "2.16"})
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False,
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        d = self.runStep()
+        return d
+
+    def testDedupIdentical(self):
+        with open(self.destfile, 'wb') as f:
+            f.write("Hello world!")
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile,
+                                mode=0600, dedup=True))
+        writers = []
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False,
+                digest=remotetransfer.fileDigest(self.destfile),
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(lambda cmd: writers.append(cmd.args['writer']))
+            + Expect.update('skipped', 12)
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        d = self.runStep()
+
+        @d.addCallback
+        def check(_):
+            self.assertEqual(self.step.getStatistic('bytes_skipped'), 12)
+            with open(self.destfile, 'rb') as f:
+                self.assertEqual(f.read(), "Hello world!")
+            self.assertEqual(os.stat(self.destfile).st_mode & 0777, 0600)
+            # the temporary file is removed
+            self.assertEqual(writers[0].tmpname, None)
+        return d
+
+    def testDedupDifferent(self):
+        with open(self.destfile, 'wb') as f:
+            f.write("Goodbye world!")
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile,
+                                dedup=True))
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False,
+                digest=remotetransfer.fileDigest(self.destfile),
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        d = self.runStep()
+
+        @d.addCallback
+        def check(_):
+            self.assertFalse(self.step.hasStatistic('bytes_skipped'))
+            with open(self.destfile, 'rb') as f:
+                self.assertEqual(f.read(), "Hello world!\n")
+        return d
+
+    def testDedupNoDestination(self):
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile,
+                                dedup=True))
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False,
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        return self.runStep()
+
+    def testDedupOldSlave(self):
+        with open(self.destfile, 'wb') as f:
+            f.write("Hello world!")
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile,
+                                dedup=True),
+            slave_version={'*': "2.17"})
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=16384, maxsize=None, keepstamp=False,
+                writer=ExpectRemoteRef(remotetransfer.FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="uploading srcfile")
+        return self.runStep()
+
     def testTimestamp(self):
         self.setupStep(
             transfer.FileUpload(slavesrc=__file__, masterdest=self.destfile, keepstamp=True))
@@ -257,6 +393,23 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
         d = self.runStep()
         return d
 
+    def testWindow(self):
+        self.setupStep(
+            transfer.DirectoryUpload(slavesrc="srcdir", masterdest=self.destdir, window=4))
+
+        self.expectCommands(
+            Expect('uploadDirectory', dict(
+                slavesrc="srcdir", workdir='wkdir',
+                blocksize=16384, compress=None, maxsize=None, window=4,
+                writer=ExpectRemoteRef(remotetransfer.DirectoryWriter)))
+            + Expect.behavior(uploadTarFile('fake.tar', test="Hello world!"))
+            + 0)
+
+        self.expectOutcome(result=SUCCESS,
+                           state_string="uploading srcdir")
+        d = self.runStep()
+        return d
+
     def testFailure(self):
         self.setupStep(
             transfer.DirectoryUpload(slavesrc="srcdir", masterdest=self.destdir))
@@ -496,6 +649,42 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
         return d
 
 
+class TestFileDownload(steps.BuildStepMixin, unittest.TestCase):
+
+    def setUp(self):
+        fd, self.srcfile = tempfile.mkstemp()
+        os.write(fd, "Hello world!")
+        os.close(fd)
+        return self.setUpBuildStep()
+
+    def tearDown(self):
+        os.unlink(self.srcfile)
+        return self.tearDownBuildStep()
+
+    def testDedup(self):
+        self.setupStep(
+            transfer.FileDownload(mastersrc=self.srcfile, slavedest='dstfile',
+                                  dedup=True))
+
+        self.expectCommands(
+            Expect('downloadFile', dict(
+                slavedest='dstfile', workdir='wkdir',
+                blocksize=16384, maxsize=None, mode=None,
+                digest=remotetransfer.fileDigest(self.srcfile),
+                reader=ExpectRemoteRef(remotetransfer.FileReader)))
+            + Expect.update('skipped', 12)
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, state_string="downloading to dstfile")
+        d = self.runStep()
+
+        @d.addCallback
+        def check(_):
+            self.assertEqual(self.step.getStatistic('bytes_skipped'), 12)
+        return d
+
+
 class TestStringDownload(steps.BuildStepMixin, unittest.TestCase):
 
     def setUp(self):
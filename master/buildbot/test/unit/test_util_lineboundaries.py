@@ -119,3 +119,20 @@ class LBF(unittest.TestCase):
         def check(_):
             self.assertEqual(self.callbacks, [])
         return d
+
+
+class LineChunk(unittest.TestCase):
+
+    def test_lines(self):
+        for text, lines in [
+            ('abc\ndef\n', ['abc', 'def']),
+            ('abc\n\n', ['abc', '']),
+            ('\n', ['']),
+            ('', []),
+            ('no newline', ['no newline']),
+        ]:
+            self.assertEqual(lineboundaries.LineChunk(text).lines, lines)
+
+    def test_lines_split_once(self):
+        chunk = lineboundaries.LineChunk('abc\ndef\n')
+        self.assertIdentical(chunk.lines, chunk.lines)
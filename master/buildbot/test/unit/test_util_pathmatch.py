@@ -88,3 +88,30 @@ class Matcher(unittest.TestCase):
         self.m[('abc', 'efg')] = 3
         self.assertEqual(self.m[('abc', 'def')], (2, {}))
         self.assertEqual(self.m[('abc', 'efg')], (3, {}))
+
+    def test_literal_before_variable(self):
+        self.m[('A', ':a')] = 'var'
+        self.m[('A', 'new')] = 'literal'
+        self.assertEqual(self.m[('A', 'new')], ('literal', {}))
+        self.assertEqual(self.m[('A', 'old')], ('var', dict(a='old')))
+
+    def test_backtracking(self):
+        self.m[('A', 'x', 'B')] = 'literal'
+        self.m[('A', ':a', 'C', ':c')] = 'var'
+        self.assertEqual(self.m[('A', 'x', 'C', 'y')],
+                         ('var', dict(a='x', c='y')))
+        self.assertRaises(KeyError, lambda: self.m[('A', 'x', 'D')])
+
+    def test_failed_branch_kwargs(self):
+        self.m[('A', 'n:a', 'B')] = 'num'
+        self.m[('A', ':b', 'C')] = 'any'
+        self.assertEqual(self.m[('A', '10', 'C')], ('any', dict(b='10')))
+
+    def test_empty_path(self):
+        self.m[()] = 'root'
+        self.m[('A',)] = 'A'
+        self.assertEqual(self.m[()], ('root', {}))
+
+    def test_bad_type_flag(self):
+        self.m[('A', 'x:a')] = 'AB'
+        self.assertRaises(AssertionError, lambda: self.m[('A', '10')])
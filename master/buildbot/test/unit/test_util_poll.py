@@ -106,6 +106,46 @@ class TestPollerSync(unittest.TestCase):
         self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 2)
         return self.poll.stop()
 
+    def test_delay(self):
+        """The loop starts after the delay"""
+        self.poll.start(interval=10, now=True, delay=3)
+        self.assertEqual(self.calls, 0)
+        self.clock.advance(3)
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(10)
+        self.assertEqual(self.calls, 2)
+        return self.poll.stop()
+
+    def test_call_during_delay(self):
+        """Calling the poll method during the delay starts the loop"""
+        self.poll.start(interval=10, now=False, delay=3)
+        self.poll()
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(10)
+        self.assertEqual(self.calls, 2)
+        return self.poll.stop()
+
+    def test_stop_during_delay(self):
+        """Stopping the poller during the delay cancels the start"""
+        self.poll.start(interval=10, now=True, delay=3)
+        d = self.poll.stop()
+        self.assertTrue(d.called)
+        self.clock.advance(20)
+        self.assertEqual(self.calls, 0)
+
+    def test_setInterval(self):
+        """A new interval counts from now"""
+        self.poll.start(interval=10, now=True)
+        self.clock.advance(5)
+        self.poll.setInterval(30)
+        self.clock.advance(29)
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, 2)
+        self.clock.advance(30)
+        self.assertEqual(self.calls, 3)
+        return self.poll.stop()
+
 
 class TestPollerAsync(unittest.TestCase):
 
@@ -189,6 +229,26 @@ class TestPollerAsync(unittest.TestCase):
         self.assertEqual(self.calls, 2)
         self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 2)
 
+    def test_setInterval_while_running(self):
+        """An interval set while the poll function is running counts from
+        the end of that run"""
+        self.poll.start(interval=10, now=True)
+        self.poll.setInterval(20)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(19)
+        self.assertFalse(self.running)
+        self.clock.advance(1)
+        self.assertTrue(self.running)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, 2)
+        # and stays in effect
+        self.clock.advance(20)
+        self.assertTrue(self.running)
+        self.clock.advance(1)
+        self.assertEqual(self.calls, 3)
+        return self.poll.stop()
+
     def test_stop_while_running(self):
         """If stop is called while the poll function is running, then stop's
         Deferred does not fire until the run is complete."""
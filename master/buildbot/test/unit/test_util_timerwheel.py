@@ -0,0 +1,87 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.util import timerwheel
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class TimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.wheel = timerwheel.TimerWheel()
+        self.wheel._reactor = self.clock
+        self.fired = []
+
+    def callLater(self, delay, name):
+        return self.wheel.callLater(delay, self.fired.append, name)
+
+    def test_single_reactor_timer(self):
+        for delay, name in [(30, 'c'), (10, 'a'), (20, 'b'), (20, 'b2')]:
+            self.callLater(delay, name)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 10)
+
+        self.clock.advance(10)
+        self.assertEqual(self.fired, ['a'])
+        self.clock.advance(10)
+        self.assertEqual(self.fired, ['a', 'b', 'b2'])
+        self.clock.advance(10)
+        self.assertEqual(self.fired, ['a', 'b', 'b2', 'c'])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_cancel(self):
+        a = self.callLater(10, 'a')
+        b = self.callLater(20, 'b')
+        a.cancel()
+        self.assertFalse(a.active())
+        self.clock.advance(10)
+        self.assertEqual(self.fired, [])
+        self.assertTrue(b.active())
+
+        b.cancel()
+        # nothing left, so no reactor timer either
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.clock.advance(10)
+        self.assertEqual(self.fired, [])
+
+    def test_cancelled_calls_compacted(self):
+        calls = [self.callLater(i + 1, i) for i in range(100)]
+        for call in calls[:-1]:
+            call.cancel()
+        self.assertTrue(len(self.wheel.calls) < 20)
+        self.assertEqual(self.wheel.nextCallTime(), 100)
+
+    def test_call_scheduled_from_call(self):
+        def fire():
+            self.fired.append('a')
+            self.callLater(0, 'b')
+            self.callLater(5, 'c')
+        self.wheel.callLater(10, fire)
+        self.clock.advance(10)
+        self.clock.advance(0)
+        self.assertEqual(self.fired, ['a', 'b'])
+        self.clock.advance(5)
+        self.assertEqual(self.fired, ['a', 'b', 'c'])
+
+    def test_error_logged(self):
+        def fail():
+            raise RuntimeError('oops')
+        self.wheel.callLater(10, fail)
+        self.callLater(10, 'a')
+        self.clock.advance(10)
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertEqual(self.fired, ['a'])
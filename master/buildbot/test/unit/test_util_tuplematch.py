@@ -28,3 +28,50 @@ class MatchTuple(tuplematching.TupleMatchingMixin, unittest.TestCase):
                          % (routingKey,
                             'should match' if shouldMatch else "shouldn't match",
                             filter))
+
+
+class TupleIndex(tuplematching.TupleMatchingMixin, unittest.TestCase):
+
+    # called by the TupleMatchingMixin methods
+
+    def do_test_match(self, routingKey, shouldMatch, filter):
+        index = tuplematch.TupleIndex()
+        index.add(filter, 'v')
+        result = index.match(routingKey)
+        self.assertEqual(['v'] if shouldMatch else [], result, '%r %s %r'
+                         % (routingKey,
+                            'should match' if shouldMatch else "shouldn't match",
+                            filter))
+
+    def test_match_order(self):
+        index = tuplematch.TupleIndex()
+        index.add(('a', None, 'c'), 1)
+        index.add(('a', 'b', 'c'), 2)
+        index.add((None, None, None), 3)
+        index.add(('a', 'b', 'c'), 4)
+        index.add(('a', 'x', 'c'), 5)
+        index.add(('a', 'b'), 6)
+        self.assertEqual(index.match(('a', 'b', 'c')), [1, 2, 3, 4])
+        self.assertEqual(index.match(('a', 'x', 'c')), [1, 3, 5])
+        self.assertEqual(index.match(('a', 'b')), [6])
+        self.assertEqual(index.match(('a',)), [])
+
+    def test_remove(self):
+        index = tuplematch.TupleIndex()
+        v1, v2 = object(), object()
+        index.add(('a', None), v1)
+        index.add(('a', None), v2)
+        index.remove(('a', None), v1)
+        self.assertEqual(index.match(('a', 'b')), [v2])
+        index.remove(('a', None), v2)
+        self.assertEqual(index.match(('a', 'b')), [])
+        # empty branches are pruned
+        self.assertEqual(index.roots, {})
+
+    def test_remove_missing(self):
+        index = tuplematch.TupleIndex()
+        index.add(('a', 'b'), 1)
+        index.remove(('a', 'c'), 1)
+        index.remove(('a', 'b'), 2)
+        index.remove(('a',), 1)
+        self.assertEqual(index.match(('a', 'b')), [1])
@@ -0,0 +1,213 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.fake.web import fakeMasterForHooks
+from buildbot.www import change_hook
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class ChangeQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.queue = change_hook.ChangeQueue(self.addChanges, maxSize=5,
+                                             batchSize=2)
+
+    def addChanges(self, changes):
+        d = defer.Deferred()
+        self.batches.append((changes, d))
+        return d
+
+    def finishBatch(self, result=None):
+        changes, d = self.batches.pop(0)
+        if result is None:
+            d.callback(None)
+        else:
+            d.errback(result)
+        return changes
+
+    def test_batches(self):
+        self.assertTrue(self.queue.put(['a', 'b', 'c']))
+        self.assertTrue(self.queue.put(['d']))
+        emptied = []
+        self.queue.waitUntilEmpty().addCallback(emptied.append)
+
+        # one batch at a time
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(self.finishBatch(), ['a', 'b'])
+        self.assertEqual(self.finishBatch(), ['c', 'd'])
+        self.assertEqual(self.batches, [])
+        self.assertEqual(emptied, [None])
+
+        # and the worker starts again for more changes
+        self.assertTrue(self.queue.put(['e']))
+        self.assertEqual(self.finishBatch(), ['e'])
+
+    def test_full(self):
+        self.assertTrue(self.queue.put(['a', 'b', 'c']))
+        # the first batch is no longer waiting
+        self.assertTrue(self.queue.put(['d', 'e', 'f', 'g']))
+        self.assertFalse(self.queue.put(['h']))
+        self.finishBatch()
+        self.assertTrue(self.queue.put(['h']))
+
+    def test_large_payload_when_empty(self):
+        self.assertTrue(self.queue.put(list('abcdefg')))
+        self.assertEqual(self.finishBatch(), ['a', 'b'])
+
+    def test_error(self):
+        self.queue.put(['a', 'b', 'c'])
+        self.finishBatch(RuntimeError('oops'))
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        # the rest is still added
+        self.assertEqual(self.finishBatch(), ['c'])
+
+    def test_error_forgets_deliveries(self):
+        forgotten = []
+        self.queue.forgetDelivery = forgotten.append
+        self.queue.put(['a', 'b'], 'one')
+        self.queue.put(['c'], 'two')
+        self.queue.put(['d'])
+        self.finishBatch(RuntimeError('oops'))
+        self.assertEqual(forgotten, ['one'])
+        self.assertEqual(self.finishBatch(RuntimeError('oops')), ['c', 'd'])
+        self.assertEqual(forgotten, ['one', 'two'])
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 2)
+
+    def test_metrics(self):
+        with mock.patch('buildbot.process.metrics.MetricCountEvent.log') as log:
+            self.queue.put(['a', 'b', 'c'])
+            self.finishBatch()
+        self.assertEqual(log.call_args_list, [
+            mock.call('change_hook.queued_changes', 3, absolute=True),
+            mock.call('change_hook.queued_changes', 1, absolute=True),
+        ])
+
+
+class ChangeHookResource(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakeMasterForHooks()
+        self.changeHook = change_hook.ChangeHookResource(
+            dialects={'base': True}, master=self.master)
+
+    def reconfig(self, **www):
+        config = mock.Mock()
+        config.www = dict(change_hook_dialects={'base': True}, **www)
+        self.changeHook.reconfigResource(config)
+
+    def makeRequest(self, revision='abcd', delivery=None):
+        request = FakeRequest(args=dict(revision=[revision], author=['me'],
+                                        comments=['fixed'],
+                                        branch=['master']))
+        request.uri = '/change_hook/base'
+        request.method = 'POST'
+        if delivery:
+            request.received_headers['X-GitHub-Delivery'] = delivery
+        return request
+
+    @defer.inlineCallbacks
+    def test_sync(self):
+        request = self.makeRequest()
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.setResponseCode.call_args,
+                         mock.call(202))
+        self.assertEqual([ch['revision'] for ch in self.master.addedChanges],
+                         [u'abcd'])
+
+    @defer.inlineCallbacks
+    def test_repeated_delivery(self):
+        for _ in range(2):
+            request = self.makeRequest(delivery='1234-5678')
+            yield request.test_render(self.changeHook)
+            self.assertEqual(request.setResponseCode.call_args,
+                             mock.call(202))
+        self.assertEqual(request.written, "repeated delivery ignored")
+        self.assertEqual(len(self.master.addedChanges), 1)
+
+    @defer.inlineCallbacks
+    def test_failed_delivery_retried(self):
+        self.master.data.updates.addChanges = mock.Mock(
+            return_value=defer.fail(RuntimeError('oops')))
+        request = self.makeRequest(delivery='1234-5678')
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.setResponseCode.call_args, mock.call(500))
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+        self.master.data.updates.addChanges = mock.Mock(
+            return_value=defer.succeed([1]))
+        request = self.makeRequest(delivery='1234-5678')
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.setResponseCode.call_args, mock.call(202))
+        self.assertEqual(len(self.master.data.updates.addChanges.mock_calls),
+                         1)
+
+    def test_remembered_deliveries_bounded(self):
+        self.changeHook.maxDeliveries = 2
+        for delivery in 'abc':
+            self.changeHook.rememberDelivery(delivery)
+        self.assertEqual(list(self.changeHook.deliveries), ['b', 'c'])
+
+    @defer.inlineCallbacks
+    def test_queued(self):
+        self.reconfig(change_hook_queue=dict(maxSize=1))
+        added = defer.Deferred()
+        self.master.data.updates.addChanges = mock.Mock(return_value=added)
+
+        request = self.makeRequest()
+        yield request.test_render(self.changeHook)
+        # the response does not wait for the changes to be added
+        self.assertEqual(request.setResponseCode.call_args, mock.call(202))
+        self.assertEqual(request.written, "changes queued")
+        changes = self.master.data.updates.addChanges.call_args[0][0]
+        self.assertEqual([ch['revision'] for ch in changes], [u'abcd'])
+        self.assertEqual(changes[0]['src'], None)
+
+        # the queue is full while the first change waits
+        self.changeHook.queue.put(['x'])
+        request = self.makeRequest(revision='ef01', delivery='1234')
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.setResponseCode.call_args[0][0], 503)
+        self.assertNotIn('1234', self.changeHook.deliveries)
+
+        added.callback([1])
+        yield self.changeHook.queue.waitUntilEmpty()
+
+    @defer.inlineCallbacks
+    def test_queued_failure_forgets_delivery(self):
+        self.reconfig(change_hook_queue=True)
+        self.master.data.updates.addChanges = mock.Mock(
+            return_value=defer.fail(RuntimeError('oops')))
+        request = self.makeRequest(delivery='1234-5678')
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.setResponseCode.call_args, mock.call(202))
+        yield self.changeHook.queue.waitUntilEmpty()
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        # so the sender can deliver the payload again
+        self.assertNotIn('1234-5678', self.changeHook.deliveries)
+
+    def test_reconfig_queue(self):
+        self.reconfig(change_hook_queue=True)
+        queue = self.changeHook.queue
+        self.assertEqual((queue.maxSize, queue.batchSize), (1000, 100))
+        self.reconfig(change_hook_queue=dict(batchSize=10))
+        self.assertIdentical(self.changeHook.queue, queue)
+        self.assertEqual(queue.batchSize, 10)
+        self.reconfig()
+        self.assertIdentical(self.changeHook.queue, None)
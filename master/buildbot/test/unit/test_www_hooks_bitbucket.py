@@ -14,8 +14,6 @@
 # Copyright Buildbot Team Members
 # Copyright Manba Team
 
-import calendar
-
 from twisted.internet.defer import inlineCallbacks
 from twisted.trial import unittest
 
@@ -162,7 +160,7 @@ class TestChangeHookConfiguredWithBitbucketChange(unittest.TestCase):
         self.assertEqual(
             commit['repository'], 'https://bitbucket.org/marcus/project-x/')
         self.assertEqual(
-            calendar.timegm(commit['when_timestamp'].utctimetuple()),
+            commit['when_timestamp'],
             1338350336
         )
         self.assertEqual(
@@ -208,7 +206,7 @@ class TestChangeHookConfiguredWithBitbucketChange(unittest.TestCase):
         self.assertEqual(
             commit['repository'], 'https://bitbucket.org/marcus/project-x/')
         self.assertEqual(
-            calendar.timegm(commit['when_timestamp'].utctimetuple()),
+            commit['when_timestamp'],
             1338350336
         )
         self.assertEqual(
@@ -13,7 +13,6 @@
 #
 # Copyright Buildbot Team Members
 
-from calendar import timegm
 import hmac
 from hashlib import sha1
 from StringIO import StringIO
@@ -352,7 +351,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
         self.assertEquals(change['files'], ['filepath.rb'])
         self.assertEquals(change["repository"],
                           "http://github.com/defunkt/github")
-        self.assertEquals(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEquals(change["when_timestamp"],
                           1203116237)
         self.assertEquals(change["author"],
                           "Fred Flinstone <fred@flinstone.org>")
@@ -369,7 +368,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
         self.assertEquals(change['files'], ['modfile', 'removedFile'])
         self.assertEquals(change["repository"],
                           "http://github.com/defunkt/github")
-        self.assertEquals(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEquals(change["when_timestamp"],
                           1203114994)
         self.assertEquals(change["author"],
                           "Fred Flinstone <fred@flinstone.org>")
@@ -401,7 +400,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
                          ['modfile', 'removedFile'])
         self.assertEqual(change["repository"],
                          "http://github.com/defunkt/github")
-        self.assertEqual(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEqual(change["when_timestamp"],
                          1203114994)
         self.assertEqual(change["author"],
                          "Fred Flinstone <fred@flinstone.org>")
@@ -460,7 +459,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
         change = self.changeHook.master.addedChanges[0]
         self.assertEquals(change["repository"],
                           "https://github.com/defunkt/github.git")
-        self.assertEquals(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEquals(change["when_timestamp"],
                           1412899790)
         self.assertEquals(change["author"],
                           "defunkt")
@@ -499,7 +498,7 @@ class TestChangeHookConfiguredWithStrict(unittest.TestCase):
         self.assertEquals(change['files'], ['filepath.rb'])
         self.assertEquals(change["repository"],
                           "http://github.com/defunkt/github")
-        self.assertEquals(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEquals(change["when_timestamp"],
                           1203116237)
         self.assertEquals(change["author"],
                           "Fred Flinstone <fred@flinstone.org>")
@@ -516,7 +515,7 @@ class TestChangeHookConfiguredWithStrict(unittest.TestCase):
         self.assertEquals(change['files'], ['modfile', 'removedFile'])
         self.assertEquals(change["repository"],
                           "http://github.com/defunkt/github")
-        self.assertEquals(timegm(change["when_timestamp"].utctimetuple()),
+        self.assertEquals(change["when_timestamp"],
                           1203114994)
         self.assertEquals(change["author"],
                           "Fred Flinstone <fred@flinstone.org>")
@@ -14,7 +14,6 @@
 # Copyright Buildbot Team Members
 
 import buildbot.www.change_hook as change_hook
-import calendar
 import mock
 
 from buildbot.test.fake.web import FakeRequest
@@ -77,7 +76,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
 
         self.assertEquals(change["repository"], "git@localhost:diaspora.git")
         self.assertEquals(
-            calendar.timegm(change["when_timestamp"].utctimetuple()),
+            change["when_timestamp"],
             1323692851
         )
         self.assertEquals(change["author"], "Jordi Mallach <jordi@softcatala.org>")
@@ -89,7 +88,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
         change = self.changeHook.master.addedChanges[1]
         self.assertEquals(change["repository"], "git@localhost:diaspora.git")
         self.assertEquals(
-            calendar.timegm(change["when_timestamp"].utctimetuple()),
+            change["when_timestamp"],
             1325626589
         )
         self.assertEquals(change["author"], "GitLab dev user <gitlabdev@dv6700.(none)>")
@@ -13,8 +13,6 @@
 #
 # Copyright Buildbot Team Members
 
-import calendar
-
 import buildbot.www.change_hook as change_hook
 
 from buildbot.test.fake.web import FakeRequest
@@ -86,7 +84,7 @@ class TestChangeHookConfiguredWithGitChange(unittest.TestCase):
             self.assertEquals(change["repository"],
                               "http://gitorious.org/q/mainline")
             self.assertEquals(
-                calendar.timegm(change["when_timestamp"].utctimetuple()),
+                change["when_timestamp"],
                 1326218547
             )
             self.assertEquals(change["author"], "jason <jason@nospam.org>")
@@ -84,7 +84,7 @@ class TestChangeHookConfiguredWithGoogleCodeChange(unittest.TestCase):
             change = self.changeHook.master.addedChanges[0]
             self.assertEquals(change['files'], ['/CMakeLists.txt'])
             self.assertEquals(change["repository"], "https://code.google.com/p/webhook-test/")
-            self.assertEquals(change["when"], 1324082130)
+            self.assertEquals(change["when_timestamp"], 1324082130)
             self.assertEquals(change["author"], "Louis Opter <louis@lse.epitech.net>")
             self.assertEquals(change["revision"], '68e5df283a8e751cdbf95516b20357b2c46f93d4')
             self.assertEquals(change["comments"], "Print a message")
@@ -279,6 +279,37 @@ class V2RootResource_REST(www.WwwTestMixin, unittest.TestCase):
             responseCode=200,
             headers={"content-disposition": ['attachment; filename=test.txt']})
 
+    @defer.inlineCallbacks
+    def test_raw_stream(self):
+        yield self.render_resource(self.rsrc, '/rawstreamtest')
+        self.assertRequest(
+            content=u"value\n\N{SNOWMAN}".encode('utf-8'),
+            contentType='text/test; charset=utf-8',
+            responseCode=200,
+            headers={"content-disposition": ['attachment; filename=test.txt']})
+        self.assertEqual(self.request.producer, None)
+
+    @defer.inlineCallbacks
+    def test_raw_stream_paused(self):
+        request = self.make_request('/rawstreamtest')
+        write = request.write
+
+        def pausingWrite(data):
+            write(data)
+            request.producer.pauseProducing()
+        request.write = pausingWrite
+        d = self.render_resource(self.rsrc, request=request)
+        ep = self.master.data.getEndpoint(('rawstreamtest',))[0]
+        # the next piece was read, but is not written until the consumer
+        # resumes
+        self.assertEqual((request.written, ep.reader.reads), ('val', 2))
+        request.producer.resumeProducing()
+        self.assertEqual((request.written, ep.reader.reads), ('value\n', 3))
+        request.producer.stopProducing()
+        yield d
+        self.assertEqual(request.written, 'value\n')
+        self.assertEqual(ep.reader.reads, 3)
+
     @defer.inlineCallbacks
     def test_api_head(self):
         get = yield self.render_resource(self.rsrc, '/test', method='GET')
@@ -36,6 +36,7 @@ class FakeRequest(object):
     written = ''
     finished = False
     redirected_to = None
+    producer = None
     rendered_resource = None
     failure = None
     method = 'GET'
@@ -61,6 +62,12 @@ class FakeRequest(object):
     def write(self, data):
         self.written = self.written + data
 
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
     def redirect(self, url):
         self.redirected_to = url
 
@@ -51,3 +51,31 @@ class LineBoundaryFinder(object):
             return self.append('\n')
         else:
             return defer.succeed(None)
+
+
+class LineChunk(object):
+
+    """
+    A block of whole lines from one stream of a log, as found by a
+    L{LineBoundaryFinder}.  The lines are split out at most once, however
+    many observers look at them.
+    """
+
+    __slots__ = ['text', '_lines']
+
+    def __init__(self, text):
+        self.text = text
+        self._lines = None
+
+    @property
+    def lines(self):
+        """The lines of the chunk, without their newlines"""
+        if self._lines is None:
+            text = self.text
+            if not text:
+                self._lines = []
+            else:
+                if text.endswith('\n'):
+                    text = text[:-1]
+                self._lines = text.split('\n')
+        return self._lines
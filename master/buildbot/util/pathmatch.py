@@ -16,6 +16,7 @@
 import re
 
 _ident_re = re.compile('^[a-zA-Z_-][.a-zA-Z0-9_-]*$')
+_nomatch = object()
 
 
 def ident(x):
@@ -24,6 +25,22 @@ def ident(x):
     raise TypeError
 
 
+class _Node(object):
+
+    # a node of the compiled pattern tree: literal path elements lead to the
+    # node in LITERALS, and any others are tried against CAPTURES, a list of
+    # (type_flag, arg_name, type_fn, node); VALUE is set if a pattern ends
+    # here
+
+    __slots__ = ['literals', 'captures', 'value', 'hasValue']
+
+    def __init__(self):
+        self.literals = {}
+        self.captures = []
+        self.value = None
+        self.hasValue = False
+
+
 class Matcher(object):
 
     def __init__(self):
@@ -40,43 +57,75 @@ class Matcher(object):
 
     path_elt_re = re.compile('^(.?):([a-z0-9_.]+)$')
     type_fns = dict(n=int, i=ident)
+    # the order in which typed captures are tried; untyped captures, which
+    # match anything, come last
+    type_order = ['n', 'i', '']
 
     def __getitem__(self, path):
         if self._dirty:
             self._compile()
 
-        patterns = self._by_length.get(len(path), {})
-        for pattern in patterns:
-            kwargs = {}
-            for pattern_elt, path_elt in zip(pattern, path):
-                mo = self.path_elt_re.match(pattern_elt)
-                if mo:
-                    type_flag, arg_name = mo.groups()
-                    if type_flag:
-                        try:
-                            type_fn = self.type_fns[type_flag]
-                        except Exception:
-                            assert type_flag in self.type_fns, \
-                                "no such type flag %s" % type_flag
-                        try:
-                            path_elt = type_fn(path_elt)
-                        except Exception:
-                            break
-                    kwargs[arg_name] = path_elt
-                else:
-                    if pattern_elt != path_elt:
-                        break
-            else:
-                # complete match
-                return patterns[pattern], kwargs
-        else:
+        kwargs = {}
+        value = self._match(self._tree, path, 0, kwargs)
+        if value is _nomatch:
             raise KeyError('No match for %r' % (path,))
+        return value, kwargs
+
+    def _match(self, node, path, pos, kwargs):
+        if pos == len(path):
+            return node.value if node.hasValue else _nomatch
+        path_elt = path[pos]
+
+        # literal elements take precedence over captures
+        try:
+            child = node.literals.get(path_elt)
+        except TypeError:  # unhashable
+            child = None
+        if child is not None:
+            value = self._match(child, path, pos + 1, kwargs)
+            if value is not _nomatch:
+                return value
+
+        for _, arg_name, type_fn, child in node.captures:
+            if type_fn:
+                try:
+                    arg = type_fn(path_elt)
+                except Exception:
+                    continue
+            else:
+                arg = path_elt
+            value = self._match(child, path, pos + 1, kwargs)
+            if value is not _nomatch:
+                kwargs[arg_name] = arg
+                return value
+        return _nomatch
 
     def iterPatterns(self):
         return self._patterns.iteritems()
 
     def _compile(self):
-        self._by_length = {}
-        for k, v in self.iterPatterns():
-            l = len(k)
-            self._by_length.setdefault(l, {})[k] = v
+        self._tree = _Node()
+        for pattern, value in self.iterPatterns():
+            node = self._tree
+            for pattern_elt in pattern:
+                mo = self.path_elt_re.match(pattern_elt)
+                if mo:
+                    type_flag, arg_name = mo.groups()
+                    assert type_flag in self.type_order, \
+                        "no such type flag %s" % type_flag
+                    node = self._captureNode(node, type_flag, arg_name)
+                else:
+                    node = node.literals.setdefault(pattern_elt, _Node())
+            node.value = value
+            node.hasValue = True
+        self._dirty = False
+
+    def _captureNode(self, node, type_flag, arg_name):
+        for capture in node.captures:
+            if capture[:2] == (type_flag, arg_name):
+                return capture[3]
+        child = _Node()
+        node.captures.append((type_flag, arg_name,
+                              self.type_fns.get(type_flag), child))
+        node.captures.sort(key=lambda c: self.type_order.index(c[0]))
+        return child
@@ -23,16 +23,20 @@ _poller_instances = None
 
 class Poller(object):
 
-    __slots__ = ['fn', 'instance', 'loop', 'started', 'running',
-                 'pending', 'stopDeferreds', '_reactor']
+    __slots__ = ['fn', 'instance', 'loop', 'startCall', 'started', 'running',
+                 'pending', 'newInterval', 'stopDeferreds', '_reactor']
 
     def __init__(self, fn, instance):
         self.fn = fn
         self.instance = instance
         self.loop = None
+        # the delayed start of the loop, if any
+        self.startCall = None
         self.started = False
         self.running = False
         self.pending = False
+        # an interval set while running, applied when the run finishes
+        self.newInterval = None
         self.stopDeferreds = []
         self._reactor = reactor
 
@@ -45,6 +49,10 @@ class Poller(object):
         @d.addCallback
         def done(_):
             self.running = False
+            if self.newInterval is not None:
+                # the loop schedules the next call once this returns, so
+                # restart it with the new interval just after that
+                self._reactor.callLater(0, self._applyInterval)
             # loop if there's another pending call
             if self.pending:
                 self.pending = False
@@ -52,7 +60,12 @@ class Poller(object):
         return d
 
     def __call__(self):
-        if self.started:
+        if self.startCall:
+            # start the loop early, with this call
+            interval = self.startCall.args[0]
+            self.startCall.cancel()
+            self._startLoop(interval, now=True)
+        elif self.started:
             if self.running:
                 self.pending = True
             else:
@@ -62,11 +75,24 @@ class Poller(object):
                 self.loop.reset()
                 self.loop.interval = old_interval
 
-    def start(self, interval, now=False):
+    def start(self, interval, now=False, delay=0):
+        """
+        Call the function every INTERVAL seconds, starting immediately if NOW
+        is true.  The loop starts DELAY seconds from now.
+        """
         assert not self.started
         if not self.loop:
             self.loop = task.LoopingCall(self._run)
             self.loop.clock = self._reactor
+        self.started = True
+        if delay:
+            self.startCall = self._reactor.callLater(delay, self._startLoop,
+                                                     interval, now)
+        else:
+            self._startLoop(interval, now)
+
+    def _startLoop(self, interval, now):
+        self.startCall = None
         stopDeferred = self.loop.start(interval, now=now)
 
         @stopDeferred.addCallback
@@ -74,9 +100,33 @@ class Poller(object):
             self.started = False
             while self.stopDeferreds:
                 self.stopDeferreds.pop().callback(None)
-        self.started = True
+
+    def setInterval(self, interval):
+        """
+        Change the interval between calls.  The next call comes INTERVAL
+        seconds after the running one finishes, or, if none is running,
+        INTERVAL seconds from now.
+        """
+        if self.loop and self.loop.running:
+            if self.running:
+                self.newInterval = interval
+            else:
+                self.loop.interval = interval
+                self.loop.reset()
+
+    def _applyInterval(self):
+        if self.running or self.newInterval is None:
+            return
+        interval, self.newInterval = self.newInterval, None
+        if self.loop.running:
+            self.loop.interval = interval
+            self.loop.reset()
 
     def stop(self):
+        if self.startCall:
+            self.startCall.cancel()
+            self.startCall = None
+            self.started = False
         if self.loop and self.loop.running:
             self.loop.stop()
         if self.started:
@@ -0,0 +1,127 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import heapq
+
+from twisted.internet import reactor
+from twisted.python import log
+
+
+class WheelCall(object):
+
+    """
+    A call scheduled on a L{TimerWheel}.  Like the reactor's delayed calls, it
+    can be cancelled and checked with C{active}.
+    """
+
+    __slots__ = ['wheel', 'time', 'fn', 'args', 'kwargs', 'cancelled',
+                 'called']
+
+    def __init__(self, wheel, time, fn, args, kwargs):
+        self.wheel = wheel
+        self.time = time
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.called = False
+
+    def getTime(self):
+        return self.time
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+    def cancel(self):
+        if not self.active():
+            return
+        self.cancelled = True
+        self.wheel._callCancelled(self)
+
+
+class TimerWheel(object):
+
+    """
+    Run many timed calls from a single reactor timer, which is always set for
+    the earliest of them.  Cancelled calls stay in the queue until they reach
+    its head, or until most of the queue is cancelled.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.live = 0
+        self.timer = None
+        self.seq = 0
+        # for tests
+        self._reactor = reactor
+
+    def seconds(self):
+        return self._reactor.seconds()
+
+    def callLater(self, delay, fn, *args, **kwargs):
+        call = WheelCall(self, self.seconds() + delay, fn, args, kwargs)
+        self.seq += 1
+        heapq.heappush(self.calls, (call.time, self.seq, call))
+        self.live += 1
+        if self.calls[0][2] is call:
+            self._setTimer()
+        return call
+
+    def nextCallTime(self):
+        self._dropCancelled()
+        if self.calls:
+            return self.calls[0][0]
+
+    def _callCancelled(self, call):
+        self.live -= 1
+        if not self.live:
+            self.calls = []
+            self._setTimer()
+        elif len(self.calls) > 2 * self.live + 10:
+            self.calls = [c for c in self.calls if c[2].active()]
+            heapq.heapify(self.calls)
+
+    def _dropCancelled(self):
+        while self.calls and not self.calls[0][2].active():
+            heapq.heappop(self.calls)
+
+    def _setTimer(self):
+        when = self.nextCallTime()
+        if when is None:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            return
+        delay = max(when - self.seconds(), 0)
+        if self.timer:
+            self.timer.reset(delay)
+        else:
+            self.timer = self._reactor.callLater(delay, self._fire)
+
+    def _fire(self):
+        self.timer = None
+        now = self.seconds()
+        while self.calls and self.calls[0][0] <= now:
+            call = heapq.heappop(self.calls)[2]
+            if not call.active():
+                continue
+            call.called = True
+            self.live -= 1
+            try:
+                call.fn(*call.args, **call.kwargs)
+            except Exception:
+                log.err(None, 'while running a timed call')
+        if self.timer is None:
+            self._setTimer()
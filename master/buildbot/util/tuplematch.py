@@ -23,3 +23,69 @@ def matchTuple(routingKey, filter):
         if f is not None and f != k:
             return False
     return True
+
+
+class TupleIndex(object):
+
+    """
+    An index of filters, as accepted by L{matchTuple}, each with an associated
+    value.  The filters are kept in a trie with one level per tuple element,
+    and a C{None} branch for wildcards, so finding the values whose filters
+    match a routing key does not require testing every filter.
+    """
+
+    def __init__(self):
+        # filter length -> trie; the leaves are lists of (seq, value)
+        self.roots = {}
+        self.seq = itertools.count()
+
+    def add(self, filter, value):
+        node, key = self.roots, len(filter)
+        for f in filter:
+            node, key = node.setdefault(key, {}), f
+        node.setdefault(key, []).append((next(self.seq), value))
+
+    def remove(self, filter, value):
+        path = []
+        node, key = self.roots, len(filter)
+        for f in filter:
+            path.append((node, key))
+            node, key = node.get(key), f
+            if node is None:
+                return
+        leaf = node.get(key, [])
+        for i, (_, v) in enumerate(leaf):
+            if v is value:
+                del leaf[i]
+                break
+        # prune the branches that are now empty
+        while not node.get(key, True):
+            del node[key]
+            if not path:
+                break
+            node, key = path.pop()
+
+    def match(self, routingKey):
+        """
+        Return the values whose filters match ROUTINGKEY, in the order in which
+        they were added.
+        """
+        level = [self.roots]
+        keys = [len(routingKey)]
+        keys.extend(routingKey)
+        for k in keys:
+            nextLevel = []
+            for node in level:
+                child = node.get(k)
+                if child is not None:
+                    nextLevel.append(child)
+                if k is not None:
+                    child = node.get(None)
+                    if child is not None:
+                        nextLevel.append(child)
+            if not nextLevel:
+                return []
+            level = nextLevel
+        if len(level) == 1:
+            return [v for _, v in level[0]]
+        return [v for _, v in sorted(e for leaf in level for e in leaf)]
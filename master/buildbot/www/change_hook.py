@@ -18,14 +18,91 @@
 # otherwise, Andrew Melo <andrew.melo@gmail.com> wrote the rest
 # but "the rest" is pretty minimal
 
+import collections
 import re
 
+from buildbot.changes.changes import convertChangeArgs
+from buildbot.process import metrics
+from buildbot.util import ascii2unicode
 from buildbot.www import resource
 from twisted.internet import defer
 from twisted.python import log
 from twisted.python.reflect import namedModule
 from twisted.web import server
 
+# headers carrying a unique id for each delivery of a payload, which is kept
+# when the payload is delivered again
+DELIVERY_HEADERS = ['X-GitHub-Delivery', 'X-Gitlab-Event-UUID',
+                    'X-Request-UUID']
+
+
+class ChangeQueue(object):
+
+    """
+    Changes accepted by L{ChangeHookResource} that are waiting to be added
+    to the database.  A single worker passes them to C{addChanges} in
+    batches of at most C{batchSize}, oldest first; at most C{maxSize}
+    changes wait at a time, although a single payload with more changes is
+    accepted when the queue is empty.  If a batch cannot be added, the
+    delivery ids of its changes are passed to C{forgetDelivery}, so that
+    their senders can deliver them again.
+    """
+
+    def __init__(self, addChanges, maxSize=1000, batchSize=100,
+                 forgetDelivery=None):
+        self.addChanges = addChanges
+        self.maxSize = maxSize
+        self.batchSize = batchSize
+        self.forgetDelivery = forgetDelivery
+        # (change, delivery id) pairs
+        self.pending = []
+        self.working = False
+        self.emptyWaiters = []
+
+    def put(self, changes, delivery=None):
+        """
+        Queue CHANGES, from the delivery with id DELIVERY if known, returning
+        False if there is no room for them.
+        """
+        if self.pending and len(self.pending) + len(changes) > self.maxSize:
+            return False
+        self.pending.extend((change, delivery) for change in changes)
+        self._reportDepth()
+        if not self.working:
+            self.working = True
+            self._work()
+        return True
+
+    def waitUntilEmpty(self):
+        if not self.working:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.emptyWaiters.append(d)
+        return d
+
+    @defer.inlineCallbacks
+    def _work(self):
+        while self.pending:
+            batch = self.pending[:self.batchSize]
+            del self.pending[:self.batchSize]
+            try:
+                yield self.addChanges([change for change, _ in batch])
+            except Exception:
+                log.err(None, "adding %d queued changes from web hooks"
+                        % (len(batch),))
+                if self.forgetDelivery:
+                    for delivery in set(d for _, d in batch if d):
+                        self.forgetDelivery(delivery)
+            self._reportDepth()
+        self.working = False
+        waiters, self.emptyWaiters = self.emptyWaiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def _reportDepth(self):
+        metrics.MetricCountEvent.log('change_hook.queued_changes',
+                                     len(self.pending), absolute=True)
+
 
 class ChangeHookResource(resource.Resource):
     # this is a cheap sort of template thingy
@@ -33,6 +110,9 @@ class ChangeHookResource(resource.Resource):
     children = {}
     needsReconfig = True
 
+    # the number of delivery ids to remember
+    maxDeliveries = 1000
+
     def __init__(self, dialects=None, master=None):
         """
         The keys of 'dialects' select a modules to load under
@@ -46,10 +126,24 @@ class ChangeHookResource(resource.Resource):
             dialects = {}
         self.dialects = dialects
         self.request_dialect = None
+        self.queue = None
+        self.deliveries = collections.OrderedDict()
 
     def reconfigResource(self, new_config):
         self.dialects = new_config.www.get('change_hook_dialects', {})
 
+        queue = new_config.www.get('change_hook_queue')
+        if not queue:
+            # anything already queued is still added by the old queue
+            self.queue = None
+            return
+        options = queue if isinstance(queue, dict) else {}
+        if self.queue is None:
+            self.queue = ChangeQueue(self.addChanges,
+                                     forgetDelivery=self.forgetDelivery)
+        self.queue.maxSize = options.get('maxSize', 1000)
+        self.queue.batchSize = options.get('batchSize', 100)
+
     def getChild(self, name, request):
         return self
 
@@ -86,6 +180,27 @@ class ChangeHookResource(resource.Resource):
         if not changes:
             log.msg("No changes found")
             return "no changes found"
+
+        delivery = self.getDeliveryId(request)
+        if delivery is not None:
+            if delivery in self.deliveries:
+                log.msg("ignoring repeated delivery %s" % (delivery,))
+                metrics.MetricCountEvent.log(
+                    'change_hook.repeated_deliveries', 1)
+                request.setResponseCode(202)
+                return "repeated delivery ignored"
+            self.rememberDelivery(delivery)
+
+        if self.queue is not None:
+            if not self.queue.put(self.convertChanges(changes, src),
+                                  delivery):
+                self.forgetDelivery(delivery)
+                msg = "Too many changes waiting to be added."
+                request.setResponseCode(503, msg)
+                return msg
+            request.setResponseCode(202)
+            return "changes queued"
+
         d = self.submitChanges(changes, request, src)
 
         def ok(_):
@@ -94,6 +209,8 @@ class ChangeHookResource(resource.Resource):
 
         def err(why):
             log.err(why, "adding changes from web hook")
+            # let the sender try again
+            self.forgetDelivery(delivery)
             request.setResponseCode(500)
             request.finish()
 
@@ -101,6 +218,21 @@ class ChangeHookResource(resource.Resource):
 
         return server.NOT_DONE_YET
 
+    def getDeliveryId(self, request):
+        for header in DELIVERY_HEADERS:
+            delivery = request.getHeader(header)
+            if delivery:
+                return delivery
+        return None
+
+    def rememberDelivery(self, delivery):
+        self.deliveries[delivery] = None
+        while len(self.deliveries) > self.maxDeliveries:
+            self.deliveries.popitem(last=False)
+
+    def forgetDelivery(self, delivery):
+        self.deliveries.pop(delivery, None)
+
     def getChanges(self, request):
         """
         Take the logic from the change hook, and then delegate it
@@ -143,8 +275,16 @@ class ChangeHookResource(resource.Resource):
 
         return (changes, src)
 
-    @defer.inlineCallbacks
+    def convertChanges(self, changes, src):
+        # hooks may still use the arguments of the deprecated
+        # master.addChange
+        return [convertChangeArgs(dict(chdict, src=ascii2unicode(src)))
+                for chdict in changes]
+
     def submitChanges(self, changes, request, src):
-        for chdict in changes:
-            change = yield self.master.addChange(src=src, **chdict)
-            log.msg("injected change %s" % change)
+        return self.addChanges(self.convertChanges(changes, src))
+
+    @defer.inlineCallbacks
+    def addChanges(self, changes):
+        changeids = yield self.master.data.updates.addChanges(changes)
+        log.msg("injected changes %s" % (changeids,))
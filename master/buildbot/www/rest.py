@@ -28,9 +28,11 @@ from buildbot.util import toJson
 from buildbot.www import resource
 from contextlib import contextmanager
 from twisted.internet import defer
+from twisted.internet import interfaces
 from twisted.python import log
 from twisted.web.error import Error
 from urlparse import urlparse
+from zope.interface import implements
 
 
 class BadRequest(Exception):
@@ -56,6 +58,39 @@ URL_ENCODED = "application/x-www-form-urlencoded"
 JSON_ENCODED = "application/json"
 
 
+class RawProducer(object):
+
+    """
+    A push producer that tracks whether the consumer wants more data, for
+    writing raw data a piece at a time.
+    """
+    implements(interfaces.IPushProducer)
+
+    def __init__(self):
+        self.paused = None
+        self.stopped = False
+
+    def waitForResume(self):
+        if self.paused is not None:
+            d = defer.Deferred()
+            self.paused.append(d)
+            return d
+        return defer.succeed(None)
+
+    def pauseProducing(self):
+        if self.paused is None:
+            self.paused = []
+
+    def resumeProducing(self):
+        waiters, self.paused = self.paused, None
+        for d in waiters or []:
+            d.callback(None)
+
+    def stopProducing(self):
+        self.stopped = True
+        self.resumeProducing()
+
+
 class RestRootResource(resource.Resource):
     version_classes = {}
 
@@ -295,13 +330,32 @@ class V2RootResource(resource.Resource):
 
         return rspec
 
+    @defer.inlineCallbacks
     def encodeRaw(self, data, request):
         request.setHeader("content-type",
                           data['mime-type'].encode() + '; charset=utf-8')
         request.setHeader("content-disposition",
                           'attachment; filename=' + data['filename'].encode())
-        request.write(data['raw'].encode('utf-8'))
-        return
+        raw = data['raw']
+        if isinstance(raw, basestring):
+            request.write(raw.encode('utf-8'))
+            return
+
+        # otherwise, this is a reader returning one piece at a time; only
+        # read the next piece once the client has consumed the previous one
+        producer = RawProducer()
+        request.registerProducer(producer, True)
+        try:
+            while not producer.stopped:
+                piece = yield raw.read()
+                if piece is None:
+                    break
+                yield producer.waitForResume()
+                if producer.stopped:
+                    break
+                request.write(piece.encode('utf-8'))
+        finally:
+            request.unregisterProducer()
 
     @defer.inlineCallbacks
     def renderRest(self, request):
@@ -324,7 +378,7 @@ class V2RootResource(resource.Resource):
                 return
 
             if ep.isRaw:
-                self.encodeRaw(data, request)
+                yield self.encodeRaw(data, request)
                 return
 
             # post-process any remaining parts of the resultspec
@@ -0,0 +1,78 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Shared helpers for the scripts in this directory.  These are not part of
+Buildbot proper; they only exist to make the benchmarks short.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from buildbot import config
+from buildbot.db import enginestrategy
+from buildbot.db import model
+from buildbot.db import pool
+from twisted.internet import defer
+from twisted.internet import task
+
+
+class Master(object):
+
+    def __init__(self, **cfg):
+        self.config = config.MasterConfig()
+        for k, v in cfg.iteritems():
+            setattr(self.config, k, v)
+
+
+class DB(object):
+
+    """
+    A minimal stand-in for L{buildbot.db.connector.DBConnector}, with a real
+    engine, thread pool and model, to which connector components can be
+    attached.
+    """
+
+    def __init__(self, master, db_url=None, table_names=None):
+        self.master = master
+        self.basedir = tempfile.mkdtemp(prefix='bbbench')
+        if db_url is None:
+            db_url = 'sqlite:///' + os.path.join(self.basedir, 'state.sqlite')
+        engine = enginestrategy.create_engine(db_url, basedir=self.basedir)
+        self.model = model.Model(self)
+        tables = None
+        if table_names:
+            tables = [self.model.metadata.tables[n] for n in table_names]
+        self.model.metadata.create_all(bind=engine, tables=tables)
+        self.pool = pool.DBThreadPool(engine)
+
+    def close(self):
+        self.pool.shutdown()
+        shutil.rmtree(self.basedir)
+
+
+@defer.inlineCallbacks
+def timed(fn, *args, **kwargs):
+    """Call FN, which may return a Deferred, and return (elapsed, result)"""
+    start = time.time()
+    res = yield fn(*args, **kwargs)
+    defer.returnValue((time.time() - start, res))
+
+
+def run(main):
+    """Run MAIN, a function returning a Deferred, under a reactor"""
+    task.react(lambda reactor: main())
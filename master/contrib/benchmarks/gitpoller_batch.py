@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure how long GitPoller takes to turn a range of new commits into changes
+in a synthetic repository, with one git log per commit attribute and with
+batchMetadata.
+
+usage: python gitpoller_batch.py [num_commits] [files_per_commit]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import benchutil
+
+from buildbot.changes import gitpoller
+from twisted.internet import defer
+
+
+def makeRepository(path, num_commits, files_per_commit):
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    # fast-import builds the history much faster than committing; each
+    # commit's parent is the previous one on the same branch
+    stream = []
+    for i in xrange(num_commits):
+        message = 'commit %d\n\nchanging some files\n' % i
+        stream.append('commit refs/heads/master\n'
+                      'committer Some One <one@example.com> %d +0000\n'
+                      'data %d\n%s' % (1400000000 + i, len(message), message))
+        for j in xrange(files_per_commit):
+            content = '%d %d\n' % (i, j)
+            stream.append('M 644 inline dir%d/file%d\ndata %d\n%s\n' % (
+                j % 10, (i + j) % 100, len(content), content))
+    proc = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path,
+                            stdin=subprocess.PIPE)
+    proc.communicate(''.join(stream))
+    assert proc.returncode == 0
+
+
+def revParse(path, rev):
+    proc = subprocess.Popen(['git', 'rev-parse', rev], cwd=path,
+                            stdout=subprocess.PIPE)
+    return proc.communicate()[0].strip()
+
+
+class Updates(object):
+
+    def __init__(self):
+        self.changes = 0
+
+    def addChange(self, **kwargs):
+        self.changes += 1
+        return defer.succeed(None)
+
+
+class Data(object):
+
+    def __init__(self):
+        self.updates = Updates()
+
+
+class Master(object):
+
+    def __init__(self):
+        self.data = Data()
+
+
+@defer.inlineCallbacks
+def bench(path, first, head, num_commits, batchMetadata):
+    poller = gitpoller.GitPoller('file://' + path, workdir=path,
+                                 batchMetadata=batchMetadata)
+    poller.master = Master()
+    poller.lastRev = {'master': first}
+    elapsed, _ = yield benchutil.timed(poller._process_changes, head,
+                                       'master')
+    assert poller.master.data.updates.changes == num_commits - 1
+    print "batchMetadata=%-5s: %7.2fs, %8.1f commits/s" % (
+        batchMetadata, elapsed, (num_commits - 1) / elapsed)
+
+
+@defer.inlineCallbacks
+def main():
+    num_commits = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    files_per_commit = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    basedir = tempfile.mkdtemp(prefix='bbbench')
+    path = os.path.join(basedir, 'repo.git')
+    try:
+        makeRepository(path, num_commits, files_per_commit)
+        first = revParse(path, 'master~%d' % (num_commits - 1))
+        head = revParse(path, 'master')
+        print "%d commits, %d files each" % (num_commits, files_per_commit)
+        for batchMetadata in (False, True):
+            yield bench(path, first, head, num_commits, batchMetadata)
+    finally:
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    benchutil.run(main)
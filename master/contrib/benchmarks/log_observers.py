@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure how long a log takes to deliver its output to observers which count
+lines and look for a marker, with per-line callbacks (LogLineObserver and
+LineConsumerLogObserver) and with a chunk observer.
+
+usage: python log_observers.py [num_lines] [num_observers]
+"""
+
+import sys
+import time
+
+from buildbot.process import log
+from buildbot.process import logobserver
+from buildbot.util import subscription
+from twisted.internet import defer
+
+# the log module expects this to have been imported already
+assert subscription
+
+
+class Updates(object):
+
+    def appendLog(self, logid, content):
+        return defer.succeed(None)
+
+
+class Data(object):
+
+    def __init__(self):
+        self.updates = Updates()
+
+
+class Master(object):
+
+    def __init__(self):
+        self.data = Data()
+
+
+class LineCounter(logobserver.LogLineObserver):
+
+    def __init__(self):
+        logobserver.LogLineObserver.__init__(self)
+        self.lines = self.markers = 0
+
+    def outLineReceived(self, line):
+        self.lines += 1
+        if 'FAILED' in line:
+            self.markers += 1
+
+
+def consumerCounter():
+    counts = {'lines': 0, 'markers': 0}
+
+    def consumer():
+        while True:
+            stream, line = yield
+            counts['lines'] += 1
+            if 'FAILED' in line:
+                counts['markers'] += 1
+    observer = logobserver.LineConsumerLogObserver(consumer)
+    observer.counts = counts
+    return observer
+
+
+class ChunkCounter(logobserver.LogChunkObserver):
+
+    def __init__(self):
+        self.lines = self.markers = 0
+
+    def outChunkReceived(self, chunk):
+        self.lines += len(chunk.lines)
+        self.markers += chunk.text.count('FAILED')
+
+
+def bench(name, makeObserver, chunks, num_observers):
+    l = log.Log.new(Master(), 'stdio', 's', 1, 'utf-8')
+    for _ in xrange(num_observers):
+        makeObserver().setLog(l)
+    start = time.time()
+    for chunk in chunks:
+        l.addStdout(chunk)
+    elapsed = time.time() - start
+    num_lines = sum(c.count('\n') for c in chunks)
+    print "%-9s: %7.3fs, %10.1f lines/s" % (name, elapsed,
+                                            num_lines / elapsed)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    num_observers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    lines = [u'test_%d ... %s\n' % (i, 'FAILED' if i % 1000 == 0 else 'ok')
+             for i in xrange(num_lines)]
+    chunks = [u''.join(lines[i:i + 1000])
+              for i in xrange(0, num_lines, 1000)]
+    print "%d lines, %d observers" % (num_lines, num_observers)
+    bench('lines', LineCounter, chunks, num_observers)
+    bench('consumer', consumerCounter, chunks, num_observers)
+    bench('chunks', ChunkCounter, chunks, num_observers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the space saved by LogsConnectorComponent.compressLog, and the cost
+of reading the log back, for each available compression method.
+
+usage: python logchunks_compression.py [num_lines] [db_url]
+"""
+
+import random
+import sys
+
+import benchutil
+
+from buildbot.db import logs
+from twisted.internet import defer
+
+
+def makeLines(num_lines):
+    # something that looks vaguely like compiler output
+    rnd = random.Random(0)
+    words = ['gcc', '-O2', '-Wall', '-c', 'src/foo.c', '-o', 'build/foo.o',
+             'warning:', 'unused', 'variable', "'x'", '[-Wunused-variable]',
+             'In', 'function', "'main':", 'note:', 'declared', 'here']
+    return [u' '.join(rnd.choice(words) for _ in xrange(rnd.randint(3, 15))) +
+            u'\n' for _ in xrange(num_lines)]
+
+
+@defer.inlineCallbacks
+def benchMethod(method, lines, db_url):
+    master = benchutil.Master(logCompressionMethod=method)
+    db = benchutil.DB(master, db_url, table_names=['logs', 'logchunks'])
+    try:
+        component = logs.LogsConnectorComponent(db)
+        logid = yield component.addLog(stepid=1, name=u'stdio', slug=u'stdio',
+                                       type=u's')
+        # append in small batches, as a running step would
+        for i in xrange(0, len(lines), 20):
+            yield component.appendLog(logid, u''.join(lines[i:i + 20]))
+
+        raw_bytes = sum(len(l.encode('utf-8')) for l in lines)
+        elapsed_c, saved = yield benchutil.timed(component.compressLog, logid)
+
+        num_lines = len(lines)
+        elapsed_full, _ = yield benchutil.timed(
+            component.getLogLines, logid, 0, num_lines - 1)
+
+        rnd = random.Random(1)
+        elapsed_pages = 0
+        for _ in xrange(100):
+            first = rnd.randint(0, num_lines - 1)
+            elapsed, _ = yield benchutil.timed(
+                component.getLogLines, logid, first, first + 50)
+            elapsed_pages += elapsed
+
+        print "%-5s saved %10d of %10d bytes (%5.1f%%); compress %7.3fs; " \
+              "read all %7.3fs; read 50 lines %6.2fms" % (
+                  method, saved, raw_bytes, 100.0 * saved / raw_bytes,
+                  elapsed_c, elapsed_full, elapsed_pages * 10)
+    finally:
+        db.close()
+
+
+@defer.inlineCallbacks
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    db_url = sys.argv[2] if len(sys.argv) > 2 else None
+    lines = makeLines(num_lines)
+    for method in sorted(logs.COMPRESSION_METHODS):
+        yield benchMethod(method, lines, db_url)
+
+if __name__ == '__main__':
+    benchutil.run(main)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure random-offset paging (as done by /logs/n:logid/contents?offset=&limit=)
+into a large log, with and without the per-chunk line offset cache.
+
+usage: python logchunks_paging.py [num_lines] [line_length] [num_pages]
+"""
+
+import random
+import sys
+
+import benchutil
+
+from buildbot.db import logs
+from buildbot.util import lru
+from twisted.internet import defer
+
+
+@defer.inlineCallbacks
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    line_length = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    num_pages = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    db = benchutil.DB(benchutil.Master(),
+                      table_names=['logs', 'logchunks'])
+    try:
+        component = logs.LogsConnectorComponent(db)
+        logid = yield component.addLog(stepid=1, name=u'stdio', slug=u'stdio',
+                                       type=u's')
+        line = u'x' * line_length + u'\n'
+        batch = 100000
+        for i in xrange(0, num_lines, batch):
+            yield component.appendLog(logid, line * min(batch, num_lines - i))
+        yield component.compressLog(logid)
+
+        rnd = random.Random(0)
+        offsets = [rnd.randint(0, num_lines - 1) for _ in xrange(num_pages)]
+
+        for label, clear in [('uncached', True), ('cached', False)]:
+            elapsed = 0
+            for offset in offsets:
+                if clear:
+                    component._lineOffsetsCache = lru.LRUCache(
+                        lambda key: None, component.LINE_OFFSETS_CACHE_SIZE)
+                t, _ = yield benchutil.timed(component.getLogLines,
+                                             logid, offset, offset + 99)
+                elapsed += t
+            print "%-8s %d lines, %d pages of 100 lines: %8.3fms per page" % (
+                label, num_lines, num_pages, elapsed * 1000 / num_pages)
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    benchutil.run(main)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure how long the slave's LogFileWatcher takes to pick up appends to a
+watched logfile, and how many times it checks idle logfiles, with polling
+and with inotify.  The buildslave package must be importable, e.g. with
+PYTHONPATH=../../../slave.
+
+usage: python logfile_watcher.py [num_files] [num_appends]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import benchutil
+
+from buildslave import runprocess
+from twisted.internet import defer
+from twisted.internet import reactor
+
+
+class Command(object):
+
+    def __init__(self):
+        self.waiting = None
+
+    def addLogfile(self, name, data):
+        if self.waiting:
+            d, self.waiting = self.waiting, None
+            reactor.callLater(0, d.callback, time.time())
+
+
+def sleep(seconds):
+    d = defer.Deferred()
+    reactor.callLater(seconds, d.callback, None)
+    return d
+
+
+@defer.inlineCallbacks
+def bench(basedir, num_files, num_appends, notify):
+    command = Command()
+    watchers = []
+    polls = [0]
+    for i in range(num_files):
+        open(os.path.join(basedir, 'log%d' % i), 'wb').close()
+        w = runprocess.LogFileWatcher(
+            command, 'log%d' % i, os.path.join(basedir, 'log%d' % i))
+        if not notify:
+            w.notifier = None
+        poll = w.poll
+
+        def countingPoll(poll=poll):
+            polls[0] += 1
+            poll()
+        w.poll = countingPoll
+        w.poller.f = countingPoll
+        watchers.append(w)
+    for w in watchers:
+        w.start()
+
+    # appends to the first file, waiting for each to be seen
+    latencies = []
+    with open(watchers[0].logfile, 'ab') as f:
+        for i in range(num_appends):
+            yield sleep(0.1)
+            command.waiting = defer.Deferred()
+            start = time.time()
+            f.write('line %d\n' % i)
+            f.flush()
+            seen = yield command.waiting
+            latencies.append(seen - start)
+
+    # and leave all of the files idle for a while
+    polls[0] = 0
+    yield sleep(5)
+    idle = polls[0]
+
+    for w in watchers:
+        w.stop()
+    for i in range(num_files):
+        os.remove(os.path.join(basedir, 'log%d' % i))
+    latencies.sort()
+    print ("%-8s: median latency %7.1fms, max %7.1fms, "
+           "%4d checks of idle files in 5s" % (
+               'inotify' if notify else 'polling',
+               latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000,
+               idle))
+
+
+@defer.inlineCallbacks
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_appends = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    basedir = tempfile.mkdtemp(prefix='bbbench')
+    print "%d watched files, %d appends" % (num_files, num_appends)
+    try:
+        yield bench(basedir, num_files, num_appends, False)
+        if runprocess.LogFileWatcher.notifier:
+            yield bench(basedir, num_files, num_appends, True)
+        else:
+            print "inotify is not available"
+    finally:
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    benchutil.run(main)
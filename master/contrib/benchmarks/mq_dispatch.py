@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the rate at which SimpleMQ dispatches messages to a large number of
+subscriptions, like those of many web UI clients, compared to testing every
+subscription's filter in turn.
+
+usage: python mq_dispatch.py [num_subscriptions] [num_messages]
+"""
+
+import random
+import sys
+import time
+
+import benchutil
+
+from buildbot.mq import simple
+from buildbot.util import tuplematch
+
+
+class LinearMQ(simple.SimpleMQ):
+
+    # the previous implementation, for comparison
+
+    def __init__(self, master):
+        simple.SimpleMQ.__init__(self, master)
+        self.qrefs = []
+
+    def produce(self, routingKey, data):
+        for qref in self.qrefs:
+            if tuplematch.matchTuple(routingKey, qref.filter):
+                qref.invoke(routingKey, data)
+
+    def startConsuming(self, callback, filter, persistent_name=None):
+        qref = simple.QueueRef(self, callback, filter)
+        self.qrefs.append(qref)
+        return qref
+
+
+def makeFilters(num_subscriptions, rnd):
+    # mostly subscriptions to a particular log, build or builder, as made by
+    # the web UI, plus a few broad ones like those made by the master itself
+    makers = [
+        lambda: ('logs', rnd.randint(1, 5000), 'append'),
+        lambda: ('logs', rnd.randint(1, 5000), None),
+        lambda: ('builds', rnd.randint(1, 1000), 'steps', None, None),
+        lambda: ('builders', rnd.randint(1, 100), 'builds', None, None),
+    ]
+    broad = [
+        ('builds', None, None),
+        ('buildrequests', None, None),
+        ('changes', None, 'new'),
+    ]
+    filters = [rnd.choice(makers)() for _ in xrange(num_subscriptions)]
+    for i in xrange(0, num_subscriptions, 200):
+        filters[i] = rnd.choice(broad)
+    return filters
+
+
+def makeRoutingKeys(num_messages, rnd):
+    makers = [
+        lambda: ('logs', rnd.randint(1, 5000), 'append'),
+        lambda: ('logs', rnd.randint(1, 5000), 'append'),
+        lambda: ('logs', rnd.randint(1, 5000), 'append'),
+        lambda: ('builds', rnd.randint(1, 1000), 'steps', rnd.randint(1, 10000),
+                 'updated'),
+        lambda: ('builders', rnd.randint(1, 100), 'builds',
+                 rnd.randint(1, 1000), 'new'),
+        lambda: ('builds', rnd.randint(1, 1000), 'finished'),
+    ]
+    return [rnd.choice(makers)() for _ in xrange(num_messages)]
+
+
+def bench(label, mq, filters, routingKeys):
+    delivered = [0]
+
+    def callback(routingKey, data):
+        delivered[0] += 1
+    for filter in filters:
+        mq.startConsuming(callback, filter)
+
+    start = time.time()
+    for routingKey in routingKeys:
+        mq.produce(routingKey, None)
+    elapsed = time.time() - start
+
+    print "%-7s %d subscriptions: %10.0f messages/s, %d deliveries" % (
+        label, len(filters), len(routingKeys) / elapsed, delivered[0])
+
+
+def main():
+    num_subscriptions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    rnd = random.Random(0)
+    filters = makeFilters(num_subscriptions, rnd)
+    routingKeys = makeRoutingKeys(num_messages, rnd)
+
+    master = benchutil.Master()
+    bench('indexed', simple.SimpleMQ(master), filters, routingKeys)
+    # the linear scan is much slower, so use fewer messages
+    bench('linear', LinearMQ(master), filters,
+          routingKeys[:max(1, num_messages // 100)])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure how long a number of Nightly schedulers sharing a few schedules take
+to compute their next build times, with a croniter walk per call and with the
+shared timetables.
+
+usage: python nightly_timetable.py [num_schedulers] [num_schedules]
+"""
+
+import sys
+import time
+
+from buildbot.schedulers import timed
+from buildbot.util import croniter
+
+
+def makeSchedulers(num_schedulers, num_schedules):
+    return [timed.NightlyBase(name='sched%d' % i, builderNames=['b'],
+                              minute=i % num_schedules, hour=[2, 14],
+                              dayOfWeek=[0, 2, 4])
+            for i in xrange(num_schedulers)]
+
+
+def walk(sched, lastActuated):
+    # what getNextBuildTime did before the timetables
+    return croniter.croniter(sched.getTimetable().spec,
+                             lastActuated).get_next(float)
+
+
+def cached(sched, lastActuated):
+    return sched.getTimetable().getNext(lastActuated)
+
+
+def bench(name, fn, scheds, rounds):
+    start = time.time()
+    for sched in scheds:
+        lastActuated = time.time()
+        for _ in xrange(rounds):
+            lastActuated = fn(sched, lastActuated)
+    elapsed = time.time() - start
+    print "%-8s: %7.3fs, %9.1f times/s" % (name, elapsed,
+                                           len(scheds) * rounds / elapsed)
+
+
+def main():
+    num_schedulers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_schedules = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    scheds = makeSchedulers(num_schedulers, num_schedules)
+    print "%d schedulers, %d schedules" % (num_schedulers, num_schedules)
+    for rounds in (1, 10):
+        print "%d builds each" % (rounds,)
+        bench('croniter', walk, scheds, rounds)
+        bench('cached', cached, scheds, rounds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the rate at which the Data API looks up the endpoint for a path,
+using every path pattern registered by the data connector, compared to
+testing every pattern of the same length in turn.
+
+usage: python pathmatch_lookup.py [num_lookups]
+"""
+
+import random
+import sys
+import time
+
+import benchutil
+
+from buildbot.data import connector
+from buildbot.util import pathmatch
+
+
+class LinearMatcher(pathmatch.Matcher):
+
+    # the previous implementation, for comparison; it used to recompile on
+    # every lookup, which is not counted here
+
+    def __getitem__(self, path):
+        if self._dirty:
+            self._compile()
+
+        patterns = self._by_length.get(len(path), {})
+        for pattern in patterns:
+            kwargs = {}
+            for pattern_elt, path_elt in zip(pattern, path):
+                mo = self.path_elt_re.match(pattern_elt)
+                if mo:
+                    type_flag, arg_name = mo.groups()
+                    if type_flag:
+                        type_fn = self.type_fns[type_flag]
+                        try:
+                            path_elt = type_fn(path_elt)
+                        except Exception:
+                            break
+                    kwargs[arg_name] = path_elt
+                else:
+                    if pattern_elt != path_elt:
+                        break
+            else:
+                return patterns[pattern], kwargs
+        raise KeyError('No match for %r' % (path,))
+
+    def _compile(self):
+        self._by_length = {}
+        for k, v in self.iterPatterns():
+            self._by_length.setdefault(len(k), {})[k] = v
+        self._dirty = False
+
+
+def makePath(pattern, rnd):
+    # a concrete path matching PATTERN
+    path = []
+    for elt in pattern:
+        if elt.startswith('n:'):
+            path.append(str(rnd.randint(1, 10000)))
+        elif elt.startswith('i:'):
+            path.append(rnd.choice(['runtests', 'linux-py27', 'stdio']))
+        elif elt.startswith(':'):
+            path.append(rnd.choice(['abc123', 'branch', 'x']))
+        else:
+            path.append(elt)
+    return tuple(path)
+
+
+def bench(label, matcher, paths):
+    start = time.time()
+    for path in paths:
+        matcher[path]
+    elapsed = time.time() - start
+    print "%-8s %d patterns: %10.0f lookups/s" % (
+        label, len(matcher._patterns), len(paths) / elapsed)
+
+
+def main():
+    num_lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rnd = random.Random(0)
+    data = connector.DataConnector(benchutil.Master())
+    patterns = dict(data.matcher.iterPatterns())
+    paths = [makePath(rnd.choice(patterns.keys()), rnd)
+             for _ in xrange(num_lookups)]
+
+    linear = LinearMatcher()
+    for pattern, endpoint in patterns.iteritems():
+        linear[pattern] = endpoint
+
+    # both matchers must agree before their speed is worth comparing
+    for path in paths[:1000]:
+        assert data.matcher[path] == linear[path], path
+
+    bench('compiled', data.matcher, paths)
+    bench('linear', linear, paths)
+
+if __name__ == '__main__':
+    main()
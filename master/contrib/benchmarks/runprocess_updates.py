@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Count the messages the slave's RunProcess sends for a command writing short
+lines alternately to stdout and stderr, at several output rates, on a
+simulated clock.  Each update in a message is one run of output for the same
+stream, which is what used to be sent as a message of its own.  The
+buildslave package must be importable, e.g. with PYTHONPATH=../../../slave.
+
+usage: python runprocess_updates.py [seconds] [line_length]
+"""
+
+import shutil
+import sys
+import tempfile
+
+from buildslave import runprocess
+from buildslave.test.fake.slavebuilder import FakeSlaveBuilder
+from twisted.internet import task
+
+
+def bench(basedir, seconds, line_length, rate):
+    builder = FakeSlaveBuilder(False, basedir)
+    proc = runprocess.RunProcess(builder, ['true'], basedir)
+    proc._reactor = clock = task.Clock()
+    proc.startTime = 0
+    line = 'x' * (line_length - 1) + '\n'
+    # write in 10ms ticks, as a busy process would be read
+    per_tick = max(rate / 100 / line_length, 1)
+    for tick in xrange(seconds * 100):
+        for i in xrange(per_tick):
+            if i % 2:
+                proc.addStderr(line)
+            else:
+                proc.addStdout(line)
+        clock.advance(0.01)
+    proc._sendBuffers()
+    print "%8d B/s: %7d updates in %6d messages (%6.1f/s), buffer %7d" % (
+        rate, len(builder.updates), builder.messages,
+        builder.messages / float(seconds), proc.bufferSize)
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    line_length = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+
+    basedir = tempfile.mkdtemp(prefix='bbbench')
+    try:
+        for rate in (1000, 100 * 1000, 1000 * 1000, 10 * 1000 * 1000):
+            bench(basedir, seconds, line_length, rate)
+    finally:
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    main()
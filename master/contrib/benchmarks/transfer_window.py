@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the throughput of the slave's uploadFile and downloadFile commands
+over a PB connection with an artificial round-trip time, for several window
+sizes.  The buildslave package must be importable, e.g. with
+PYTHONPATH=../../../slave.
+
+usage: python transfer_window.py [rtt_ms] [size_kb] [blocksize]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import benchutil
+
+from buildbot.buildslave.protocols.pb import FileReaderProxy
+from buildbot.buildslave.protocols.pb import FileWriterProxy
+from buildbot.process import remotetransfer
+from buildslave.commands import transfer
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.protocols import portforward
+from twisted.spread import pb
+
+
+class DelayingProxy:
+
+    # mixin for the port forwarder's protocols, forwarding data after half
+    # the round-trip time while preserving its order
+
+    delay = 0
+    queue = None
+
+    def dataReceived(self, data):
+        if self.queue is None:
+            self.queue = []
+        self.queue.append((reactor.seconds() + self.delay, data))
+        if len(self.queue) == 1:
+            reactor.callLater(self.delay, self.flush)
+
+    def flush(self):
+        now = reactor.seconds()
+        while self.queue and self.queue[0][0] <= now:
+            self.peer.transport.write(self.queue.pop(0)[1])
+        if self.queue:
+            reactor.callLater(self.queue[0][0] - now, self.flush)
+
+
+class DelayingProxyClient(DelayingProxy, portforward.ProxyClient):
+    pass
+
+
+class DelayingProxyClientFactory(portforward.ProxyClientFactory):
+    protocol = DelayingProxyClient
+
+
+class DelayingProxyServer(DelayingProxy, portforward.ProxyServer):
+    clientProtocolFactory = DelayingProxyClientFactory
+
+
+class Root(pb.Root):
+
+    def remote_writer(self, path):
+        return FileWriterProxy(remotetransfer.FileWriter(path, None, None))
+
+    def remote_reader(self, path):
+        return FileReaderProxy(remotetransfer.FileReader(open(path, 'rb')))
+
+
+class Builder(object):
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+    def sendUpdate(self, status):
+        pass
+
+
+@defer.inlineCallbacks
+def bench(root, basedir, size, blocksize, window):
+    builder = Builder(basedir)
+
+    writer = yield root.callRemote('writer', os.path.join(basedir, 'up'))
+    cmd = transfer.SlaveFileUploadCommand(builder, 'upload', dict(
+        workdir='.', slavesrc='src', writer=writer, maxsize=None,
+        blocksize=blocksize, window=window))
+    up, _ = yield benchutil.timed(cmd.doStart)
+
+    reader = yield root.callRemote('reader', os.path.join(basedir, 'src'))
+    cmd = transfer.SlaveFileDownloadCommand(builder, 'download', dict(
+        workdir='.', slavedest='down', reader=reader, maxsize=None,
+        blocksize=blocksize, mode=None, window=window))
+    down, _ = yield benchutil.timed(cmd.doStart)
+
+    for name in ('up', 'down'):
+        assert os.path.getsize(os.path.join(basedir, name)) == size
+    mb = size / 1024.0 / 1024.0
+    print "window %3d: upload %8.2f MB/s, download %8.2f MB/s" % (
+        window, mb / up, mb / down)
+
+
+@defer.inlineCallbacks
+def main():
+    rtt = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.02
+    size = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 4096 * 1024
+    blocksize = int(sys.argv[3]) if len(sys.argv) > 3 else 16 * 1024
+
+    basedir = tempfile.mkdtemp(prefix='bbbench')
+    with open(os.path.join(basedir, 'src'), 'wb') as f:
+        f.write(os.urandom(size))
+
+    server = reactor.listenTCP(0, pb.PBServerFactory(Root()),
+                               interface='127.0.0.1')
+    DelayingProxy.delay = rtt / 2
+    proxyFactory = portforward.ProxyFactory('127.0.0.1',
+                                            server.getHost().port)
+    proxyFactory.protocol = DelayingProxyServer
+    proxy = reactor.listenTCP(0, proxyFactory, interface='127.0.0.1')
+
+    clientFactory = pb.PBClientFactory()
+    reactor.connectTCP('127.0.0.1', proxy.getHost().port, clientFactory)
+    root = yield clientFactory.getRootObject()
+
+    print "rtt %.0fms, %dkB file, %d byte blocks" % (rtt * 1000, size // 1024,
+                                                    blocksize)
+    try:
+        for window in (1, 4, 16, 64):
+            yield bench(root, basedir, size, blocksize, window)
+    finally:
+        clientFactory.disconnect()
+        yield proxy.stopListening()
+        yield server.stopListening()
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    benchutil.run(main)
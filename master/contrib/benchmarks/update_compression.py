@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the bytes sent for a synthetic compiler log by the slave's RunProcess,
+with and without compressed updates at several zlib levels, along with the
+CPU time the slave spends buffering and compressing and the master spends
+decompressing.  The buildslave package must be importable, e.g. with
+PYTHONPATH=../../../slave.
+
+usage: python update_compression.py [size_mb]
+"""
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from buildbot.process import remotecommand
+from buildslave import runprocess
+from buildslave.test.fake.slavebuilder import FakeSlaveBuilder
+from twisted.internet import task
+
+
+def makeOutput(size):
+    rnd = random.Random(0)
+    dirs = ['src/core', 'src/net', 'src/ui/widgets', 'lib/util', 'tests']
+    out = []
+    total = 0
+    while total < size:
+        path = '%s/file%d.c' % (rnd.choice(dirs), rnd.randrange(500))
+        r = rnd.random()
+        if r < 0.8:
+            line = ('gcc -O2 -Wall -Iinclude -DNDEBUG -c %s -o %s\n'
+                    % (path, path[:-2] + '.o'))
+            stream = 'stdout'
+        elif r < 0.95:
+            line = ("%s:%d:%d: warning: unused variable 'tmp%d' "
+                    "[-Wunused-variable]\n"
+                    % (path, rnd.randrange(2000), rnd.randrange(80),
+                       rnd.randrange(100)))
+            stream = 'stderr'
+        else:
+            line = ('test_%d ... ok (%.3fs)\n'
+                    % (rnd.randrange(10000), rnd.random()))
+            stream = 'stdout'
+        out.append((stream, line))
+        total += len(line)
+    return out, total
+
+
+def wireSize(update):
+    if 'zlib' in update:
+        return len(update['zlib'][1])
+    return sum(len(v) for v in update.values())
+
+
+def bench(basedir, output, total, level):
+    builder = FakeSlaveBuilder(False, basedir)
+    proc = runprocess.RunProcess(builder, ['true'], basedir,
+                                 compress=level and 'zlib')
+    if level:
+        proc.COMPRESS_LEVEL = level
+    proc._reactor = clock = task.Clock()
+    proc.startTime = 0
+
+    start = time.clock()
+    for i, (stream, line) in enumerate(output):
+        if stream == 'stdout':
+            proc.addStdout(line)
+        else:
+            proc.addStderr(line)
+        if i % 100 == 0:
+            clock.advance(0.01)
+    proc._sendBuffers()
+    slave = time.clock() - start
+
+    cmd = remotecommand.RemoteCommand('shell', {})
+    start = time.clock()
+    received = 0
+    for update in builder.updates:
+        received += sum(len(v) for v in
+                        cmd._decompressUpdate(update).values())
+    master = time.clock() - start
+    assert received == total
+
+    sent = sum(wireSize(u) for u in builder.updates)
+    mb = total / 1024.0 / 1024.0
+    print ("%-6s: %8d kB sent (%5.1f%%) in %4d messages, "
+           "slave %6.1f MB/s CPU, master %7.1f MB/s CPU" % (
+               'level %d' % level if level else 'none', sent // 1024,
+               100.0 * sent / total, builder.messages,
+               mb / slave, mb / master if master else float('inf')))
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 \
+        else 32 * 1024 * 1024
+
+    output, total = makeOutput(size)
+    basedir = tempfile.mkdtemp(prefix='bbbench')
+    print "%d kB of output in %d writes" % (total // 1024, len(output))
+    try:
+        for level in (None, 1, 6, 9):
+            bench(basedir, output, total, level)
+    finally:
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure how fast WarningCountingShellCommand scans a synthetic compiler log
+with many suppressions, with the line-at-a-time scanning and linear
+suppression search it used to do, and with the chunked scanner.
+
+usage: python warning_scanner.py [num_lines] [num_suppressions]
+"""
+
+import random
+import re
+import sys
+import time
+
+from buildbot.steps import shell
+
+
+def warningExtractor(step, line, match):
+    return line.split(':', 2)
+
+
+class LegacyStep(shell.WarningCountingShellCommand):
+
+    # what the step did before the scanner
+
+    def warningLogConsumer(self):
+        wre = re.compile(self.warningPattern)
+        directoryEnterRe = re.compile(self.directoryEnterPattern)
+        directoryLeaveRe = re.compile(self.directoryLeavePattern)
+        self.loggedWarnings = []
+        while True:
+            stream, line = yield
+            match = directoryEnterRe.search(line)
+            if match:
+                self.directoryStack.append(match.group(1))
+                continue
+            if self.directoryStack and directoryLeaveRe.search(line):
+                self.directoryStack.pop()
+                continue
+            match = wre.match(line)
+            if match:
+                self.maybeAddWarning(self.loggedWarnings, line, match)
+
+    def getSuppressions(self, file):
+        return [s for s in self.suppressions
+                if file is None or s[0] is None or s[0].match(file)]
+
+
+def makeLog(num_lines):
+    rnd = random.Random(0)
+    lines = []
+    for i in xrange(num_lines):
+        if i % 5000 == 0:
+            lines.append("make[1]: Entering directory '/src/dir%d'" % (i,))
+        elif i % 5000 == 4999:
+            lines.append("make[1]: Leaving directory '/src/dir%d'" % (i,))
+        elif rnd.random() < 0.05:
+            lines.append('file%d.cpp:%d: warning: unused variable x%d' % (
+                rnd.randrange(200), rnd.randrange(1000), rnd.randrange(50)))
+        else:
+            lines.append('g++ -O2 -c -o obj/file%d.o src/file%d.cpp' % (i, i))
+    return '\n'.join(lines) + '\n'
+
+
+def makeSuppressions(num_suppressions):
+    return [('.*/file%d\\.cpp' % (i,), 'unused variable x%d$' % (i % 50,),
+             None, None) for i in xrange(num_suppressions)]
+
+
+def bench(name, stepClass, log, suppressions):
+    step = stepClass(command=['make'], warningExtractor=warningExtractor)
+    step.addSuppression(suppressions)
+    observer = step._pendingLogObservers[-1][1]
+    chunkSize = 64 * 1024
+    start = time.time()
+    pos = 0
+    while pos < len(log):
+        end = log.find('\n', pos + chunkSize)
+        end = len(log) if end < 0 else end + 1
+        observer.gotData('o', log[pos:end])
+        pos = end
+    observer.gotData(None, None)
+    elapsed = time.time() - start
+    print "%-8s: %7.2fs, %10.1f lines/s, %d warnings" % (
+        name, elapsed, log.count('\n') / elapsed, step.warnCount)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    num_suppressions = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    log = makeLog(num_lines)
+    suppressions = makeSuppressions(num_suppressions)
+    print "%d lines, %d suppressions" % (num_lines, num_suppressions)
+    bench('legacy', LegacyStep, log, suppressions)
+    bench('scanner', shell.WarningCountingShellCommand, log, suppressions)
+
+if __name__ == '__main__':
+    main()
@@ -303,7 +303,8 @@ setup_args = {
             ('buildbot.process.factory', [
                 'BuildFactory', 'GNUAutoconf', 'CPAN', 'Distutils', 'Trial',
                 'BasicBuildFactory', 'QuickBuildFactory', 'BasicSVN']),
-            ('buildbot.process.logobserver', ['LogLineObserver']),
+            ('buildbot.process.logobserver', [
+                'LogLineObserver', 'LogChunkObserver']),
             ('buildbot.process.properties', [
                 'FlattenList', 'Interpolate', 'Property', 'WithProperties',
                 'renderer']),
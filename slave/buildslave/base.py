@@ -176,6 +176,11 @@ class SlaveBuilderBase(service.Service):
         number in the process. It adds the update to a queue, and asks the
         master to acknowledge the update so it can be removed from that
         queue."""
+        self.sendUpdates([data])
+
+    def sendUpdates(self, datas):
+        """Like sendUpdate, but send several updates in a single message.
+        The master handles them in the order given."""
 
         if not self.running:
             # .running comes from service.Service, and says whether the
@@ -186,8 +191,7 @@ class SlaveBuilderBase(service.Service):
         # master still expects to receive. Provide it to avoid significant
         # interoperability issues between new slaves and old masters.
         if self.remoteStep:
-            update = [data, 0]
-            updates = [update]
+            updates = [[data, 0] for data in datas]
             d = self.remoteStep.callRemote("update", updates)
             d.addCallback(self.ackUpdate)
             d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
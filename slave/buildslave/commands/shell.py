@@ -27,6 +27,10 @@ class SlaveShellCommand(base.Command):
         args = self.args
         workdir = os.path.join(self.builder.basedir, args['workdir'])
 
+        kwargs = {}
+        if args.get('compress'):
+            kwargs['compress'] = args['compress']
+
         c = runprocess.RunProcess(
             self.builder,
             args['command'],
@@ -42,6 +46,7 @@ class SlaveShellCommand(base.Command):
             logfiles=args.get('logfiles', {}),
             usePTY=args.get('usePTY', "slave-config"),
             logEnviron=args.get('logEnviron', True),
+            **kwargs
         )
         if args.get('interruptSignal'):
             c.interruptSignal = args['interruptSignal']
@@ -13,16 +13,33 @@
 #
 # Copyright Buildbot Team Members
 
+import hashlib
 import os
 import tarfile
-import tempfile
 
 from twisted.internet import defer
+from twisted.internet import threads
+from twisted.python import failure
 from twisted.python import log
 
 from buildslave.commands.base import Command
 
 
+def fileDigest(path):
+    """Return the hex SHA-256 digest of the content of the file at PATH"""
+    digest = hashlib.sha256()
+    f = open(path, 'rb')
+    try:
+        while True:
+            data = f.read(65536)
+            if not data:
+                break
+            digest.update(data)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
 class TransferCommand(Command):
 
     def finished(self, res):
@@ -47,6 +64,76 @@ class TransferCommand(Command):
         # now we wait for the next trip around the loop.  It abandon the file
         # when it sees self.interrupted set.
 
+    def _digestMatches(self, path, digest):
+        """
+        Return a Deferred firing with True if the file at C{path} has the
+        content digest C{digest}, as given by the master.  The file is hashed
+        in a thread, since it may be large.
+        """
+        if not os.path.isfile(path):
+            return defer.succeed(False)
+        d = threads.deferToThread(fileDigest, path)
+
+        def check(got):
+            return got == digest
+
+        def eb(f):
+            log.err(f, 'while computing the digest of %s' % path)
+            return False
+        d.addCallbacks(check, eb)
+        return d
+
+    def _windowLoop(self, sendBlock, fire_when_done):
+        """
+        Call C{sendBlock} repeatedly, keeping up to C{self.window} blocks in
+        flight rather than waiting for each to be acknowledged before sending
+        the next.  C{sendBlock} returns None when there is nothing more to
+        send, or a Deferred that fires when the block is acknowledged, with
+        True if the transfer is complete.  The replies to remote calls arrive
+        in order, so the blocks are also handled in order.
+        """
+        state = dict(inflight=0, sending=True, filling=False, done=False)
+
+        def fill():
+            if state['filling']:
+                # an acknowledgement arrived synchronously; the loop below
+                # will send the next block
+                return
+            state['filling'] = True
+            try:
+                while state['sending'] and state['inflight'] < self.window:
+                    d = sendBlock()
+                    if d is None:
+                        state['sending'] = False
+                        break
+                    state['inflight'] += 1
+                    d.addCallbacks(acked, failed)
+            except Exception:
+                failed(failure.Failure(), sent=False)
+            state['filling'] = False
+            if not state['inflight'] and not state['done']:
+                state['done'] = True
+                fire_when_done.callback(None)
+
+        def acked(complete):
+            state['inflight'] -= 1
+            if complete:
+                state['sending'] = False
+            if not state['done']:
+                fill()
+
+        def failed(why, sent=True):
+            if sent:
+                state['inflight'] -= 1
+            state['sending'] = False
+            if state['done']:
+                log.err(why, 'after a file transfer failed')
+            else:
+                state['done'] = True
+                fire_when_done.errback(why)
+
+        fill()
+
 
 class SlaveFileUploadCommand(TransferCommand):
 
@@ -60,6 +147,10 @@ class SlaveFileUploadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['keepstamp']: whether to preserve file modified and accessed times
+        - ['window']:    number of blocks to send before waiting for the
+                         first to be written (default 1)
+        - ['digest']:    digest of the master-side file; if the file has the
+                         same content, it is not sent (default None)
     """
     debug = False
     requiredArgs = ['workdir', 'slavesrc', 'writer', 'blocksize']
@@ -71,6 +162,9 @@ class SlaveFileUploadCommand(TransferCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.keepstamp = args.get('keepstamp', False)
+        self.window = args.get('window', 1)
+        self.digest = args.get('digest')
+        self.skipped = False
         self.stderr = None
         self.rc = 0
 
@@ -101,11 +195,19 @@ class SlaveFileUploadCommand(TransferCommand):
         self.sendStatus({'header': "sending %s" % self.path})
 
         d = defer.Deferred()
-        self._reactor.callLater(0, self._loop, d)
+        if self.fp is not None and self.digest:
+            check = self._digestMatches(self.path, self.digest)
+            check.addCallback(self._sendUnlessIdentical, d)
+        else:
+            self._reactor.callLater(0, self._loop, d)
 
         def _close_ok(res):
             self.fp = None
-            d1 = self.writer.callRemote("close")
+            if self.skipped:
+                # the master's file was left alone
+                d1 = defer.succeed(None)
+            else:
+                d1 = self.writer.callRemote("close")
 
             def _utime_ok(res):
                 return self.writer.callRemote("utime", accessed_modified)
@@ -130,7 +232,21 @@ class SlaveFileUploadCommand(TransferCommand):
         d.addBoth(self.finished)
         return d
 
+    def _sendUnlessIdentical(self, identical, fire_when_done):
+        if not identical:
+            return self._loop(fire_when_done)
+        size = os.fstat(self.fp.fileno()).st_size
+        self.fp.close()
+        self.fp = None
+        self.skipped = True
+        self.sendStatus({'header': "%s is unchanged on the master, "
+                                   "not sending it" % self.path,
+                         'skipped': size})
+        fire_when_done.callback(None)
+
     def _loop(self, fire_when_done):
+        if self.window > 1:
+            return self._windowLoop(self._sendWriteBlock, fire_when_done)
         d = defer.maybeDeferred(self._writeBlock)
 
         def _done(finished):
@@ -144,6 +260,13 @@ class SlaveFileUploadCommand(TransferCommand):
         d.addCallbacks(_done, _err)
         return None
 
+    def _sendWriteBlock(self):
+        # for _windowLoop
+        d = self._writeBlock()
+        if d is True:
+            return None
+        return d
+
     def _writeBlock(self):
         """Write a block of data to the remote writer"""
 
@@ -180,6 +303,97 @@ class SlaveFileUploadCommand(TransferCommand):
         return d
 
 
+class _TarStream(object):
+
+    """
+    A read-only file-like object producing a tar archive of the directory
+    at C{path}, optionally compressed, as it is read.  The archive is never
+    stored: each read archives just enough of the directory to return the
+    requested number of bytes, so only about one block is held in memory.
+    """
+
+    def __init__(self, path, compress):
+        if compress == 'bz2':
+            mode = 'w|bz2'
+        elif compress == 'gz':
+            mode = 'w|gz'
+        else:
+            mode = 'w|'
+        # the archive writes its (compressed) output to self.write
+        self.buffer = []
+        self.buffered = 0
+        self.archive = tarfile.open(mode=mode, fileobj=self)
+        self.members = self._members(path, '')
+        self.current = None
+        self.current_remaining = 0
+        self.current_padding = 0
+        self.finished = False
+
+    def _members(self, name, arcname):
+        # walk the directory in the same order as TarFile.add
+        tarinfo = self.archive.gettarinfo(name, arcname)
+        if tarinfo is None:
+            log.msg("tarfile: Unsupported type %r" % name)
+            return
+        yield name, tarinfo
+        if tarinfo.isdir():
+            for f in os.listdir(name):
+                for member in self._members(os.path.join(name, f),
+                                            os.path.join(arcname, f)):
+                    yield member
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+    def read(self, size):
+        while self.buffered < size and not self.finished:
+            self._archiveMore(size)
+        data = ''.join(self.buffer)
+        rest = data[size:]
+        self.buffer = [rest] if rest else []
+        self.buffered = len(rest)
+        return data[:size]
+
+    def _archiveMore(self, size):
+        archive = self.archive
+        if self.current:
+            data = self.current.read(min(size, self.current_remaining))
+            if not data:
+                raise IOError("end of file reached")
+            archive.fileobj.write(data)
+            self.current_remaining -= len(data)
+            if self.current_remaining == 0:
+                self.current.close()
+                self.current = None
+                archive.fileobj.write(tarfile.NUL * self.current_padding)
+            return
+
+        try:
+            name, tarinfo = self.members.next()
+        except StopIteration:
+            archive.close()
+            self.finished = True
+            return
+
+        # the header is written by addfile, but the content of a file is
+        # copied a block at a time on later reads
+        archive.addfile(tarinfo)
+        if tarinfo.isreg() and tarinfo.size:
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            if remainder:
+                blocks += 1
+            archive.offset += blocks * tarfile.BLOCKSIZE
+            self.current = open(name, 'rb')
+            self.current_remaining = tarinfo.size
+            self.current_padding = blocks * tarfile.BLOCKSIZE - tarinfo.size
+
+    def close(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+
+
 class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
     debug = False
     requiredArgs = ['workdir', 'slavesrc', 'writer', 'blocksize']
@@ -191,6 +405,7 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.compress = args['compress']
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -204,22 +419,8 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         if self.debug:
             log.msg("path: %r" % self.path)
 
-        # Create temporary archive
-        fd, self.tarname = tempfile.mkstemp()
-        fileobj = os.fdopen(fd, 'w')
-        if self.compress == 'bz2':
-            mode = 'w|bz2'
-        elif self.compress == 'gz':
-            mode = 'w|gz'
-        else:
-            mode = 'w'
-        archive = tarfile.open(name=self.tarname, mode=mode, fileobj=fileobj)
-        archive.add(self.path, '')
-        archive.close()
-        fileobj.close()
-
-        # Transfer it
-        self.fp = open(self.tarname, 'rb')
+        # Transfer the archive as it is produced
+        self.fp = _TarStream(self.path, self.compress)
 
         self.sendStatus({'header': "sending %s" % self.path})
 
@@ -241,7 +442,6 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
 
     def finished(self, res):
         self.fp.close()
-        os.remove(self.tarname)
         return TransferCommand.finished(self, res)
 
 
@@ -257,6 +457,11 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of blocks to request before waiting for the
+                         first to arrive (default 1)
+        - ['digest']:    digest of the master-side file; if the slave-side
+                         file has the same content, it is not read (default
+                         None)
     """
     debug = False
     requiredArgs = ['workdir', 'slavedest', 'reader', 'blocksize']
@@ -268,6 +473,12 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.bytes_remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.mode = args['mode']
+        self.window = args.get('window', 1)
+        self.digest = args.get('digest')
+        self.fp = None
+        # bytes requested but not yet received, in window mode
+        self.bytes_requested = 0
+        self.eof = False
         self.stderr = None
         self.rc = 0
 
@@ -284,6 +495,33 @@ class SlaveFileDownloadCommand(TransferCommand):
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
+        d = defer.Deferred()
+        if self.digest:
+            check = self._digestMatches(self.path, self.digest)
+            check.addCallback(self._readUnlessIdentical, d)
+        else:
+            self._readUnlessIdentical(False, d)
+
+        def _close(res):
+            # close the file, but pass through any errors from _loop
+            d1 = self.reader.callRemote('close')
+            d1.addErrback(log.err, 'while trying to close reader')
+            d1.addCallback(lambda ignored: res)
+            return d1
+        d.addBoth(_close)
+        d.addBoth(self.finished)
+        return d
+
+    def _readUnlessIdentical(self, identical, fire_when_done):
+        if identical:
+            if self.mode is not None:
+                os.chmod(self.path, self.mode)
+            self.sendStatus({'header': "%s is unchanged, not receiving it"
+                                       % self.path,
+                             'skipped': os.path.getsize(self.path)})
+            fire_when_done.callback(None)
+            return
+
         try:
             self.fp = open(self.path, 'wb')
             if self.debug:
@@ -305,20 +543,14 @@ class SlaveFileDownloadCommand(TransferCommand):
             if self.debug:
                 log.msg("Cannot open file '%s' for download" % self.path)
 
-        d = defer.Deferred()
-        self._reactor.callLater(0, self._loop, d)
-
-        def _close(res):
-            # close the file, but pass through any errors from _loop
-            d1 = self.reader.callRemote('close')
-            d1.addErrback(log.err, 'while trying to close reader')
-            d1.addCallback(lambda ignored: res)
-            return d1
-        d.addBoth(_close)
-        d.addBoth(self.finished)
-        return d
+        self._reactor.callLater(0, self._loop, fire_when_done)
 
     def _loop(self, fire_when_done):
+        if self.window > 1:
+            d = defer.Deferred()
+            d.addCallback(self._checkTruncated)
+            d.chainDeferred(fire_when_done)
+            return self._windowLoop(self._sendReadBlock, d)
         d = defer.maybeDeferred(self._readBlock)
 
         def _done(finished):
@@ -355,11 +587,44 @@ class SlaveFileDownloadCommand(TransferCommand):
             d.addCallback(self._writeData)
             return d
 
+    def _sendReadBlock(self):
+        # for _windowLoop; like _readBlock, but only the bytes received count
+        # towards maxsize, and reaching it is only an error once they arrive
+        if self.interrupted or self.fp is None or self.eof:
+            return None
+
+        length = self.blocksize
+        if self.bytes_remaining is not None:
+            length = min(length, self.bytes_remaining - self.bytes_requested)
+        if length <= 0:
+            return None
+
+        self.bytes_requested += length
+        d = self.reader.callRemote('read', length)
+
+        @d.addCallback
+        def received(data):
+            self.bytes_requested -= length
+            if self.fp is None:
+                return True
+            return self._writeData(data)
+        return d
+
+    def _checkTruncated(self, res):
+        if (self.bytes_remaining is not None and self.bytes_remaining <= 0
+                and not self.eof and self.stderr is None
+                and not self.interrupted):
+            self.stderr = "Maximum filesize reached, truncating file '%s'" \
+                % self.path
+            self.rc = 1
+        return res
+
     def _writeData(self, data):
         if self.debug:
             log.msg('SlaveFileDownloadCommand._readBlock(): readlen=%d' %
                     len(data))
         if len(data) == 0:
+            self.eof = True
             return True
 
         if self.bytes_remaining is not None:
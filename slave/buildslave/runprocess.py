@@ -25,6 +25,7 @@ import subprocess
 import sys
 import traceback
 import types
+import zlib
 
 from collections import deque
 from tempfile import NamedTemporaryFile
@@ -34,6 +35,8 @@ from twisted.internet import error
 from twisted.internet import protocol
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.python import failure
+from twisted.python import filepath
 from twisted.python import log
 from twisted.python import runtime
 from twisted.python.win32 import quoteArguments
@@ -44,6 +47,12 @@ from buildslave.exceptions import AbandonChain
 if runtime.platformType == 'posix':
     from twisted.internet.process import Process
 
+try:
+    from twisted.internet import inotify
+except ImportError:
+    # not Linux, or a libc without inotify
+    inotify = None
+
 
 def win32_batch_quote(cmd_list):
     # Quote cmd_list to a string that is suitable for inclusion in a
@@ -81,8 +90,109 @@ def shell_quote(cmd_list):
         return " ".join([quote(e) for e in cmd_list])
 
 
+class LogFileNotifier:
+
+    """
+    Watch the directories holding logfiles with a single inotify instance,
+    shared by all of the L{LogFileWatcher}s in this process, and call the
+    C{poll} method of the watchers of a file whenever it is created or written
+    to.  A watcher whose C{poll} fails is removed and its C{watchFailed}
+    method is called with the failure; the watchers of a directory that is
+    deleted or moved away are removed and their C{watchLost} method is called.
+    """
+
+    if inotify:
+        MASK = (inotify.IN_CREATE | inotify.IN_MODIFY | inotify.IN_MOVED_TO
+                | inotify.IN_CLOSE_WRITE | inotify.IN_DELETE
+                | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF)
+        LOST_MASK = inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF
+
+    def __init__(self):
+        self.notifier = None
+        # directory -> {filename: [watchers]}
+        self.directories = {}
+
+    def add(self, path, watcher):
+        """
+        Tell WATCHER when the file at PATH changes, whether or not it exists
+        yet.  Raises inotify.INotifyError if its directory cannot be watched,
+        e.g., because it does not exist either.
+        """
+        dirname, basename = os.path.split(os.path.abspath(path))
+        if dirname not in self.directories:
+            if self.notifier is None:
+                self.notifier = inotify.INotify()
+                self.notifier.startReading()
+            try:
+                self.notifier.watch(filepath.FilePath(dirname), self.MASK,
+                                    callbacks=[self._notified])
+            except inotify.INotifyError:
+                self._closeIfUnused()
+                raise
+            self.directories[dirname] = {}
+        self.directories[dirname].setdefault(basename, []).append(watcher)
+
+    def remove(self, path, watcher):
+        dirname, basename = os.path.split(os.path.abspath(path))
+        files = self.directories.get(dirname)
+        if not files or watcher not in files.get(basename, []):
+            return
+        files[basename].remove(watcher)
+        if not files[basename]:
+            del files[basename]
+        if not files:
+            del self.directories[dirname]
+            self._ignore(dirname)
+        self._closeIfUnused()
+
+    def _ignore(self, dirname):
+        try:
+            self.notifier.ignore(filepath.FilePath(dirname))
+        except KeyError:
+            pass  # the directory was deleted, which removed the watch
+
+    def _closeIfUnused(self):
+        if not self.directories and self.notifier is not None:
+            self.notifier.loseConnection()
+            self.notifier = None
+
+    def _notified(self, ignored, path, mask):
+        if mask & self.LOST_MASK:
+            self._lost(path.path, mask)
+            return
+        files = self.directories.get(path.dirname(), {})
+        for watcher in files.get(path.basename(), [])[:]:
+            try:
+                watcher.poll()
+            except Exception:
+                why = failure.Failure()
+                self.remove(path.path, watcher)
+                watcher.watchFailed(why)
+
+    def _lost(self, dirname, mask):
+        # the directory is watched again, if it comes back, the next time one
+        # of its watchers polls it
+        files = self.directories.pop(dirname, None)
+        if files is None:
+            return
+        # inotify removes the watch of a deleted directory itself
+        if not mask & inotify.IN_DELETE_SELF:
+            self._ignore(dirname)
+        self._closeIfUnused()
+        for watchers in files.values():
+            for watcher in watchers:
+                watcher.watchLost()
+
+
 class LogFileWatcher:
     POLL_INTERVAL = 2
+    # where inotify tells us about changes, polling only has to catch what it
+    # misses, such as writes from other hosts to network filesystems
+    NOTIFY_POLL_INTERVAL = 60
+    READ_SIZE = 256 * 1024
+
+    # shared by all watchers; None where inotify is not available
+    notifier = LogFileNotifier() if inotify else None
 
     def __init__(self, command, name, logfile, follow=False):
         self.command = command
@@ -95,23 +205,63 @@ class LogFileWatcher:
         # ctime/mtime so we can tell when it starts to change.
         self.old_logfile_stats = self.statFile()
         self.started = False
+        self.watching = False
 
         # follow the file, only sending back lines
         # added since we started watching
         self.follow = follow
 
-        # every 2 seconds we check on the file again
+        # every 2 seconds we check on the file again, or much less often when
+        # inotify tells us about changes
         self.poller = task.LoopingCall(self.poll)
 
     def start(self):
-        self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
+        self.watch()
+        if self.watching:
+            interval = self.NOTIFY_POLL_INTERVAL
+        else:
+            interval = self.POLL_INTERVAL
+        self.poller.start(interval).addErrback(self._cleanupPoll)
 
     def _cleanupPoll(self, err):
         log.err(err, msg="Polling error")
         self.poller = None
 
+    def watch(self):
+        # watch the file's directory, which also notices the file being
+        # created; if the directory does not exist yet, keep polling and try
+        # again later
+        if self.watching or self.notifier is None:
+            return
+        try:
+            self.notifier.add(self.logfile, self)
+        except inotify.INotifyError:
+            return
+        self.watching = True
+        if self.poller is not None:
+            self.poller.interval = self.NOTIFY_POLL_INTERVAL
+
+    def watchFailed(self, why):
+        # polling failed when the notifier called us, and it has stopped
+        # watching the file
+        self.watching = False
+        if self.poller is not None and self.poller.running:
+            self.poller.stop()
+        self._cleanupPoll(why)
+
+    def watchLost(self):
+        # the file's directory was deleted or moved away, so poll until it
+        # can be watched again
+        self.watching = False
+        if self.poller is not None and self.poller.running:
+            self.poller.interval = self.POLL_INTERVAL
+            self.poller.reset()
+
     def stop(self):
         self.poll()
+        if self.watching:
+            self.notifier.remove(self.logfile, self)
+            self.watching = False
         if self.poller is not None:
             self.poller.stop()
         if self.started:
@@ -124,6 +274,9 @@ class LogFileWatcher:
         return None
 
     def poll(self):
+        if not self.watching and self.poller is not None \
+                and self.poller.running:
+            self.watch()
         if not self.started:
             s = self.statFile()
             if s == self.old_logfile_stats:
@@ -143,7 +296,7 @@ class LogFileWatcher:
             self.started = True
         self.f.seek(self.f.tell(), 0)
         while True:
-            data = self.f.read(10000)
+            data = self.f.read(self.READ_SIZE)
             if not data:
                 return
             self.command.addLogfile(self.name, data)
@@ -244,6 +397,22 @@ class RunProcess:
     BUFFER_SIZE = 64 * 1024
     BUFFER_TIMEOUT = 5
 
+    # Those are only the starting values: the buffer then adapts to the
+    # output rate, aiming for about UPDATE_RATE messages a second, with
+    # between MIN_BUFFER_SIZE and MAX_BUFFER_SIZE bytes held for between
+    # MIN_BUFFER_TIMEOUT and BUFFER_TIMEOUT seconds.  One message carries at
+    # most MAX_BUFFER_SIZE bytes, as a list of updates of at most CHUNK_LIMIT
+    # bytes each.
+    UPDATE_RATE = 4
+    MIN_BUFFER_SIZE = 4 * 1024
+    MAX_BUFFER_SIZE = 1024 * 1024
+    MIN_BUFFER_TIMEOUT = 0.1
+
+    # With compress='zlib', updates of at least COMPRESS_MIN_SIZE bytes are
+    # compressed at COMPRESS_LEVEL, continuing one zlib stream per log stream
+    COMPRESS_MIN_SIZE = 256
+    COMPRESS_LEVEL = 6
+
     # For sending elapsed time:
     startTime = None
     elapsedTime = None
@@ -262,7 +431,7 @@ class RunProcess:
                  timeout=None, maxTime=None, sigtermTime=None,
                  initialStdin=None, keepStdout=False, keepStderr=False,
                  logEnviron=True, logfiles={}, usePTY="slave-config",
-                 useProcGroup=True):
+                 useProcGroup=True, compress=None):
         """
 
         @param keepStdout: if True, we keep a copy of all the stdout text
@@ -276,6 +445,9 @@ class RunProcess:
 
         @param useProcGroup: (default True) use a process group for non-PTY
             process invocations
+
+        @param compress: None to send output as it is, or 'zlib' to send
+            larger updates zlib-compressed
         """
 
         self.builder = builder
@@ -364,6 +536,16 @@ class RunProcess:
         self.buffered = deque()
         self.buflen = 0
         self.sendBuffersTimer = None
+        self.bufferSize = self.BUFFER_SIZE
+        self.bufferTimeout = self.BUFFER_TIMEOUT
+        self.outputRate = None
+        self.lastSendTime = None
+        self.compressors = None
+        if compress == 'zlib':
+            self.compressors = {}
+        elif compress:
+            log.msg("unknown compression %r; not compressing output"
+                    % (compress,))
 
         if usePTY == "slave-config":
             self.usePTY = self.builder.usePTY
@@ -407,7 +589,16 @@ class RunProcess:
         return "<%s '%s'>" % (self.__class__.__name__, self.fake_command)
 
     def sendStatus(self, status):
-        self.builder.sendUpdate(status)
+        self.sendStatuses([status])
+
+    def sendStatuses(self, statuses):
+        """
+        Send a list of status updates to the master in one message
+        """
+        if len(statuses) == 1:
+            self.builder.sendUpdate(statuses[0])
+        else:
+            self.builder.sendUpdates(statuses)
 
     def start(self):
         # return a Deferred which fires (with the exit code) when the command
@@ -609,28 +800,27 @@ class RunProcess:
         for i in range(0, len(data), LIMIT):
             yield data[i:i + LIMIT]
 
-    def _collapseMsg(self, msg):
+    def _collapseUpdate(self, logname, chunks):
         """
-        Take msg, which is a dictionary of lists of output chunks, and
-        concatenate all the chunks into a single string
+        Turn the output chunks for logname into a single update
         """
-        retval = {}
-        for logname in msg:
-            data = "".join(msg[logname])
-            if isinstance(logname, tuple) and logname[0] == 'log':
-                retval['log'] = (logname[1], data)
-            else:
-                retval[logname] = data
-        return retval
-
-    def _sendMessage(self, msg):
+        data = "".join(chunks)
+        if self.compressors is not None and len(data) >= self.COMPRESS_MIN_SIZE:
+            return {'zlib': (logname, self._compress(logname, data))}
+        if isinstance(logname, tuple) and logname[0] == 'log':
+            return {'log': (logname[1], data)}
+        return {logname: data}
+
+    def _compress(self, logname, data):
         """
-        Collapse and send msg to the master
+        Compress data as the next part of the zlib stream for logname, flushed
+        so that the master can decompress all of it right away
         """
-        if not msg:
-            return
-        msg = self._collapseMsg(msg)
-        self.sendStatus(msg)
+        compressor = self.compressors.get(logname)
+        if compressor is None:
+            compressor = zlib.compressobj(self.COMPRESS_LEVEL)
+            self.compressors[logname] = compressor
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
 
     def _bufferTimeout(self):
         self.sendBuffersTimer = None
@@ -640,70 +830,85 @@ class RunProcess:
         """
         Send all the content in our buffers.
         """
-        msg = {}
+        # Each run of output for the same log becomes one update of at most
+        # CHUNK_LIMIT bytes, and the updates are sent in the order the output
+        # arrived, several to a message.  This lets interleaved stdout and
+        # stderr share messages, rather than sending one for each switch.
+        updates = []
         msg_size = 0
         lastlog = None
         logdata = []
+        logsize = 0
         while self.buffered:
-            # Grab the next bits from the buffer
             logname, data = self.buffered.popleft()
-
-            # If this log is different than the last one, then we have to send
-            # out the message so far.  This is because the message is
-            # transferred as a dictionary, which makes the ordering of keys
-            # unspecified, and makes it impossible to interleave data from
-            # different logs.  A future enhancement could be to change the
-            # master to support a list of (logname, data) tuples instead of a
-            # dictionary.
-            # On our first pass through this loop lastlog is None
-            if lastlog is None:
-                lastlog = logname
-            elif logname != lastlog:
-                self._sendMessage(msg)
-                msg = {}
-                msg_size = 0
-            lastlog = logname
-
-            logdata = msg.setdefault(logname, [])
-
-            # Chunkify the log data to make sure we're not sending more than
-            # CHUNK_LIMIT at a time
             for chunk in self._chunkForSend(data):
                 if len(chunk) == 0:
                     continue
+                if logname != lastlog or logsize + len(chunk) > self.CHUNK_LIMIT:
+                    if logdata:
+                        updates.append(self._collapseUpdate(lastlog, logdata))
+                        if msg_size >= self.MAX_BUFFER_SIZE:
+                            self.sendStatuses(updates)
+                            updates = []
+                            msg_size = 0
+                    lastlog = logname
+                    logdata = []
+                    logsize = 0
                 logdata.append(chunk)
+                logsize += len(chunk)
                 msg_size += len(chunk)
-                if msg_size >= self.CHUNK_LIMIT:
-                    # We've gone beyond the chunk limit, so send out our
-                    # message.  At worst this results in a message slightly
-                    # larger than (2*CHUNK_LIMIT)-1
-                    self._sendMessage(msg)
-                    msg = {}
-                    logdata = msg.setdefault(logname, [])
-                    msg_size = 0
-        self.buflen = 0
         if logdata:
-            self._sendMessage(msg)
+            updates.append(self._collapseUpdate(lastlog, logdata))
+        if updates:
+            self.sendStatuses(updates)
+        self._adaptBuffers(self.buflen)
+        self.buflen = 0
         if self.sendBuffersTimer:
             if self.sendBuffersTimer.active():
                 self.sendBuffersTimer.cancel()
             self.sendBuffersTimer = None
 
+    def _adaptBuffers(self, sent):
+        """
+        Update the output rate estimate with the data just sent, and size the
+        buffer to fill about UPDATE_RATE times a second at that rate.
+        """
+        now = util.now(self._reactor)
+        since = self.lastSendTime or self.startTime
+        self.lastSendTime = now
+        if since is None:
+            return
+        rate = float(sent) / max(now - since, self.MIN_BUFFER_TIMEOUT)
+        if self.outputRate is None:
+            self.outputRate = rate
+        else:
+            self.outputRate = (self.outputRate + rate) / 2
+        self.bufferSize = int(min(max(self.outputRate / self.UPDATE_RATE,
+                                      self.MIN_BUFFER_SIZE),
+                                  self.MAX_BUFFER_SIZE))
+        # wait about as long as the buffer takes to fill
+        if self.outputRate:
+            timeout = self.bufferSize / self.outputRate
+        else:
+            timeout = self.BUFFER_TIMEOUT
+        self.bufferTimeout = min(max(timeout, self.MIN_BUFFER_TIMEOUT),
+                                 self.BUFFER_TIMEOUT)
+
     def _addToBuffers(self, logname, data):
         """
         Add data to the buffer for logname
-        Start a timer to send the buffers if BUFFER_TIMEOUT elapses.
-        If adding data causes the buffer size to grow beyond BUFFER_SIZE, then
+        Start a timer to send the buffers if bufferTimeout elapses.
+        If adding data causes the buffer size to grow beyond bufferSize, then
         the buffers will be sent.
         """
         n = len(data)
 
         self.buflen += n
         self.buffered.append((logname, data))
-        if self.buflen > self.BUFFER_SIZE:
+        if self.buflen > self.bufferSize:
             self._sendBuffers()
         elif not self.sendBuffersTimer:
-            self.sendBuffersTimer = self._reactor.callLater(self.BUFFER_TIMEOUT, self._bufferTimeout)
+            self.sendBuffersTimer = self._reactor.callLater(self.bufferTimeout, self._bufferTimeout)
 
     def addStdout(self, data):
         if self.sendStdout:
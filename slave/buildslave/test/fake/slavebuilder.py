@@ -20,13 +20,16 @@ class FakeSlaveBuilder:
 
     """
     Simulates a SlaveBuilder, but just records the updates from sendUpdate
-    in its updates attribute.  Call show() to get a pretty-printed string
-    showing the updates.  Set debug to True to show updates as they happen.
+    and sendUpdates in its updates attribute, and counts the messages that
+    carried them in its messages attribute.  Call show() to get a
+    pretty-printed string showing the updates.  Set debug to True to show
+    updates as they happen.
     """
     debug = False
 
     def __init__(self, usePTY=False, basedir="/slavebuilder/basedir"):
         self.updates = []
+        self.messages = 0
         self.basedir = basedir
         self.usePTY = usePTY
         self.unicode_encoding = 'utf-8'
@@ -34,7 +37,14 @@ class FakeSlaveBuilder:
     def sendUpdate(self, data):
         if self.debug:
             print "FakeSlaveBuilder.sendUpdate", data
+        self.messages += 1
         self.updates.append(data)
 
+    def sendUpdates(self, datas):
+        if self.debug:
+            print "FakeSlaveBuilder.sendUpdates", datas
+        self.messages += 1
+        self.updates.extend(datas)
+
     def show(self):
         return pprint.pformat(self.updates)
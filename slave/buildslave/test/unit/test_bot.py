@@ -260,6 +260,14 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
     def test_startBuild(self):
         return self.sb.callRemote("startBuild")
 
+    def test_sendUpdates(self):
+        st = FakeStep()
+        self.sb.original.remoteStep = FakeRemote(st)
+        self.sb.original.sendUpdates([{'stdout': 'a'}, {'stderr': 'b'}])
+        self.assertEqual(st.actions, [
+            ['update', [[{'stdout': 'a'}, 0], [{'stderr': 'b'}, 0]]],
+        ])
+
     def test_startCommand(self):
         # set up a fake step to receive updates
         st = FakeStep()
@@ -50,4 +50,25 @@ class TestSlaveShellCommand(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_compress(self):
+        self.make_command(shell.SlaveShellCommand, dict(
+            command=['echo', 'hello'],
+            workdir='workdir',
+            compress='zlib',
+        ))
+
+        self.patch_runprocess(
+            Expect(['echo', 'hello'], self.basedir_workdir, compress='zlib')
+            + {'hdr': 'headers'} + {'rc': 0}
+            + 0,
+        )
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([{'hdr': 'headers'}, {'rc': 0}],
+                               self.builder.show())
+        d.addCallback(check)
+        return d
+
     # TODO: test all functionality that SlaveShellCommand adds atop RunProcess
@@ -21,6 +21,7 @@ import tarfile
 
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.internet import task
 from twisted.python import failure
 from twisted.python import runtime
 from twisted.trial import unittest
@@ -47,6 +48,10 @@ class FakeMasterMethods(object):
         self.delay_read = False
         self.count_reads = False
 
+        # if set to a list, writes and reads are not acknowledged until the
+        # test fires the Deferreds added to it
+        self.held = None
+
         self.unpack_fail = False
 
         self.written = False
@@ -68,6 +73,10 @@ class FakeMasterMethods(object):
         if self.keep_data:
             self.data += data
 
+        if self.held is not None:
+            d = defer.Deferred()
+            self.held.append(d)
+            return d
         if self.delay_write:
             d = defer.Deferred()
             reactor.callLater(0.01, d.callback, None)
@@ -84,6 +93,10 @@ class FakeMasterMethods(object):
             return ''
 
         slice, self.data = self.data[:length], self.data[length:]
+        if self.held is not None:
+            d = defer.Deferred()
+            self.held.append((d, slice))
+            return d
         if self.delay_read:
             d = defer.Deferred()
             reactor.callLater(0.01, d.callback, slice)
@@ -149,6 +162,56 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_digest_identical(self):
+        self.fakemaster.count_writes = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            digest=transfer.fileDigest(self.datafile),
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # no writes, and the master's file is not replaced
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                {'header': '%s is unchanged on the master, not sending it'
+                           % self.datafile, 'skipped': 180},
+                {'rc': 0}
+            ])
+        d.addCallback(check)
+        return d
+
+    def test_digest_differs(self):
+        self.fakemaster.count_writes = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            digest='0' * 64,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'write 64', 'write 52', 'close',
+                {'rc': 0}
+            ])
+        d.addCallback(check)
+        return d
+
     def test_truncated(self):
         self.fakemaster.count_writes = True    # get actual byte counts
 
@@ -280,6 +343,142 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def make_window_command(self, window, maxsize=1000):
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=maxsize,
+            blocksize=64,
+            keepstamp=False,
+            window=window,
+        ))
+
+    def test_window(self):
+        self.fakemaster.count_writes = True
+        self.fakemaster.keep_data = True
+        self.make_window_command(3)
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'write 64', 'write 52', 'close',
+                {'rc': 0}
+            ])
+            self.assertEqual(self.fakemaster.data, "this is some data\n" * 10)
+        d.addCallback(check)
+        return d
+
+    @defer.inlineCallbacks
+    def test_window_in_flight(self):
+        self.fakemaster.held = held = []
+        self.fakemaster.count_writes = True
+        self.make_window_command(2)
+
+        d = self.run_command()
+        yield task.deferLater(reactor, 0, lambda: None)
+        # two writes are sent without waiting for the first to complete
+        self.assertEqual(len(held), 2)
+        held.pop(0).callback(None)
+        self.assertEqual(len(held), 2)
+        while held:
+            held.pop(0).callback(None)
+        yield d
+        self.assertUpdates([
+            {'header': 'sending %s' % self.datafile},
+            'write 64', 'write 64', 'write 52', 'close',
+            {'rc': 0}
+        ])
+
+    def test_window_truncated(self):
+        self.fakemaster.count_writes = True
+        self.make_window_command(4, maxsize=100)
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'write 36', 'close',
+                {'rc': 1,
+                 'stderr': "Maximum filesize reached, truncating file '%s'" % self.datafile}
+            ])
+        d.addCallback(check)
+        return d
+
+    def test_window_out_of_space(self):
+        self.fakemaster.write_out_of_space_at = 70
+        self.fakemaster.count_writes = True
+        self.make_window_command(4)
+
+        d = self.run_command()
+        self.assertFailure(d, RuntimeError)
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'close',
+                {'rc': 1}
+            ])
+        d.addCallback(check)
+        return d
+
+
+class TestTarStream(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(self.datadir, 'sub'))
+        self.big = os.urandom(256 * 1024)
+        self.contents = {
+            'big': self.big,
+            'empty': '',
+            'sub/small': 'small' * 100,
+        }
+        for name, content in self.contents.iteritems():
+            open(os.path.join(self.datadir, name), 'wb').write(content)
+
+    def read_all(self, stream, size, bounded=True):
+        data = []
+        while True:
+            chunk = stream.read(size)
+            # never much more than a block is held; bz2 compresses blocks of
+            # up to 900kB at a time
+            if bounded:
+                self.assertTrue(
+                    stream.buffered <= size + 2 * tarfile.RECORDSIZE)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= size)
+            data.append(chunk)
+        return ''.join(data)
+
+    def test_archive(self):
+        for compress in (None, 'gz', 'bz2'):
+            stream = transfer._TarStream(self.datadir, compress)
+            data = self.read_all(stream, 4096, bounded=compress != 'bz2')
+            stream.close()
+            a = tarfile.open(fileobj=StringIO.StringIO(data),
+                             mode='r|' + (compress or ''))
+            got = {}
+            for tarinfo in a:
+                if tarinfo.isreg():
+                    got[tarinfo.name] = a.extractfile(tarinfo).read()
+            a.close()
+            self.assertEqual(got, self.contents)
+
+    def test_file_shrinks(self):
+        stream = transfer._TarStream(self.datadir, None)
+        # archive until the middle of the big file
+        data = ''
+        while self.big[:4096] not in data:
+            data += stream.read(4096)
+        open(os.path.join(self.datadir, 'big'), 'wb').write('shorter')
+        self.assertRaises(IOError, lambda: self.read_all(stream, 4096))
+        stream.close()
+
 
 class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
@@ -374,6 +573,34 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
         return d
 
+    def test_window(self):
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=64,
+            compress='gz',
+            window=8,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datadir},
+                'write(s)', 'unpack',
+                {'rc': 0}
+            ])
+            f = StringIO.StringIO(self.fakemaster.data)
+            a = tarfile.open(fileobj=f, name='check.tar')
+            self.assertEqual(a.extractfile('aa').read(), "lots of a" * 100)
+            a.close()
+        d.addCallback(check)
+        return d
+
     # this is just a subclass of SlaveUpload, so the remaining permutations
     # are already tested
 
@@ -425,6 +652,65 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_digest_identical(self):
+        self.fakemaster.count_reads = True
+        self.fakemaster.data = test_data = '1234' * 13
+        datafile = os.path.join(self.basedir, 'data')
+        open(datafile, 'wb').write(test_data)
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=32,
+            mode=0777,
+            digest=transfer.fileDigest(datafile),
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': '%s is unchanged, not receiving it'
+                           % os.path.join(self.basedir, '.', 'data'),
+                 'skipped': 52},
+                'close',
+                {'rc': 0}
+            ])
+            self.assertEqual(open(datafile).read(), test_data)
+            if runtime.platformType != 'win32':
+                self.assertEqual(os.stat(datafile).st_mode & 0777, 0777)
+        d.addCallback(check)
+        return d
+
+    def test_digest_differs(self):
+        self.fakemaster.count_reads = True
+        self.fakemaster.data = test_data = '1234' * 13
+        datafile = os.path.join(self.basedir, 'data')
+        open(datafile, 'wb').write('old data')
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=32,
+            mode=None,
+            digest='0' * 64,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                'read 32', 'read 32', 'read 32', 'close',
+                {'rc': 0}
+            ])
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
     def test_mkdir(self):
         self.fakemaster.data = test_data = 'hi'
 
@@ -534,3 +820,82 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
             ])
         dl.addCallback(check)
         return dl
+
+    def make_window_command(self, window, maxsize=None, blocksize=32):
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=maxsize,
+            blocksize=blocksize,
+            mode=None,
+            window=window,
+        ))
+
+    def test_window(self):
+        self.fakemaster.count_reads = True
+        self.fakemaster.data = test_data = '1234' * 13
+        self.make_window_command(2)
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                'read 32', 'read 32', 'read 32', 'close',
+                {'rc': 0}
+            ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    @defer.inlineCallbacks
+    def test_window_in_flight(self):
+        self.fakemaster.held = held = []
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+        self.make_window_command(3, blocksize=40)
+
+        d = self.run_command()
+        yield task.deferLater(reactor, 0, lambda: None)
+        # three reads are requested without waiting for the first to arrive
+        self.assertEqual(len(held), 3)
+        while held:
+            rd, data = held.pop(0)
+            rd.callback(data)
+        yield d
+        self.assertUpdates(['read(s)', 'close', {'rc': 0}])
+        datafile = os.path.join(self.basedir, 'data')
+        self.assertEqual(open(datafile).read(), test_data)
+
+    def test_window_maxsize(self):
+        # a file smaller than maxsize is not reported as truncated, even
+        # though more than its size is requested
+        self.fakemaster.data = test_data = 'tenchars--' * 3
+        self.make_window_command(8, maxsize=100, blocksize=10)
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates(['read(s)', 'close', {'rc': 0}])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_window_truncated(self):
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+        self.make_window_command(4, maxsize=50)
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                'read(s)', 'close',
+                {'rc': 1,
+                 'stderr': "Maximum filesize reached, truncating file '%s'"
+                 % os.path.join(self.basedir, '.', 'data')}
+            ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data[:50])
+        d.addCallback(check)
+        return d
@@ -18,6 +18,7 @@ import re
 import signal
 import sys
 import time
+import zlib
 
 from mock import Mock
 
@@ -764,6 +765,106 @@ class TestLogging(BasedirMixin, unittest.TestCase):
         s._addToBuffers('stdout', data)
         self.failUnlessEqual(len(b.updates), 1)
 
+    def testSendInterleavedOneMessage(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s._addToBuffers('stdout', 'hello ')
+        s._addToBuffers('stdout', 'there ')
+        s._addToBuffers('stderr', 'DIEEEEEEE')
+        s._addToBuffers(('log', 'x.log'), 'logged')
+        s._addToBuffers('stdout', 'world')
+        s._sendBuffers()
+        self.failUnlessEqual(b.updates, [
+            {'stdout': 'hello there '},
+            {'stderr': 'DIEEEEEEE'},
+            {'log': ('x.log', 'logged')},
+            {'stdout': 'world'},
+        ])
+        self.failUnlessEqual(b.messages, 1)
+
+    def testSendStatuses(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        sent = []
+        s.sendStatuses = sent.append
+        s.sendStatus({'header': 'starting\n'})
+        s._addToBuffers('stdout', 'hello ')
+        s._addToBuffers('stderr', 'DIEEEEEEE')
+        s._sendBuffers()
+        # single updates and buffered output are sent the same way
+        self.failUnlessEqual(sent, [
+            [{'header': 'starting\n'}],
+            [{'stdout': 'hello '}, {'stderr': 'DIEEEEEEE'}],
+        ])
+        self.failUnlessEqual(b.updates, [])
+
+    def testSendMessageLimit(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s.MAX_BUFFER_SIZE = 10
+        for i in range(6):
+            s._addToBuffers('stdout' if i % 2 else 'stderr', 'xxxx')
+        s._sendBuffers()
+        self.failUnlessEqual(len(b.updates), 6)
+        self.failUnlessEqual(b.messages, 2)
+
+    def testAdaptBuffers(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s._reactor = clock = task.Clock()
+        s.startTime = 0
+
+        # fast output grows the buffer and flushes it more often
+        clock.advance(1)
+        s._addToBuffers('stdout', 'x' * (4 * 1024 * 1024))
+        self.failUnlessEqual(s.bufferSize, s.MAX_BUFFER_SIZE)
+        self.failUnlessEqual(s.bufferTimeout, 0.25)
+
+        # slow output shrinks the buffer, and waits for it up to
+        # BUFFER_TIMEOUT
+        for _ in range(20):
+            clock.advance(10)
+            s._addToBuffers('stdout', 'x')
+            s._sendBuffers()
+        self.failUnlessEqual(s.bufferSize, s.MIN_BUFFER_SIZE)
+        self.failUnlessEqual(s.bufferTimeout, s.BUFFER_TIMEOUT)
+
+    def testSendCompressed(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir,
+                                  compress='zlib')
+        s._addToBuffers('stdout', 'x' * 1000)
+        s._addToBuffers('stderr', 'short')
+        s._addToBuffers(('log', 'x.log'), 'l' * 1000)
+        s._addToBuffers('stdout', 'y' * 1000)
+        s._sendBuffers()
+        self.failUnlessEqual([u.keys() for u in b.updates],
+                             [['zlib'], ['stderr'], ['zlib'], ['zlib']])
+        self.failUnlessEqual(b.updates[1], {'stderr': 'short'})
+        self.failUnlessEqual([u['zlib'][0] for u in b.updates[::2]],
+                             ['stdout', ('log', 'x.log')])
+
+        # each stream continues its own zlib stream
+        stdout = zlib.decompressobj()
+        self.failUnlessEqual(stdout.decompress(b.updates[0]['zlib'][1]),
+                             'x' * 1000)
+        self.failUnlessEqual(stdout.decompress(b.updates[3]['zlib'][1]),
+                             'y' * 1000)
+        self.failUnlessEqual(
+            zlib.decompressobj().decompress(b.updates[2]['zlib'][1]),
+            'l' * 1000)
+
+    def testBufferTimeout(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s._reactor = clock = task.Clock()
+        s.bufferTimeout = 0.5
+        s._addToBuffers('stdout', 'hello')
+        clock.advance(0.4)
+        self.failUnlessEqual(b.updates, [])
+        clock.advance(0.1)
+        self.failUnlessEqual(b.updates, [{'stdout': 'hello'}])
+
 
 class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
 
@@ -792,3 +893,181 @@ class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
         st = lf.statFile()
         self.assertEqual(st and st[2], 2, "statfile.log exists and size is correct")
         os.remove('statfile.log')
+
+    def test_large_reads(self):
+        rp = self.makeRP()
+        open('big.log', 'w').write('x' * (600 * 1024))
+        lf = runprocess.LogFileWatcher(rp, 'test', 'big.log', False)
+        lf.old_logfile_stats = None
+        calls = []
+        rp.addLogfile = lambda name, data: calls.append(len(data))
+        lf.poll()
+        lf.f.close()
+        self.assertEqual(calls, [256 * 1024, 256 * 1024, 88 * 1024])
+        os.remove('big.log')
+
+    def test_polls_without_inotify(self):
+        rp = self.makeRP()
+        lf = runprocess.LogFileWatcher(rp, 'test', 'nothere.log', False)
+        lf.notifier = None
+        lf.start()
+        self.assertFalse(lf.watching)
+        self.assertEqual(lf.poller.interval, lf.POLL_INTERVAL)
+        lf.stop()
+
+
+class TestLogFileWatcherNotify(BasedirMixin, unittest.TestCase):
+
+    # polling would take much longer than the test's timeout
+    timeout = 10
+
+    def setUp(self):
+        if runprocess.inotify is None:
+            raise unittest.SkipTest("inotify is not available")
+        self.setUpBasedir()
+        os.makedirs(self.basedir)
+        self.notifier = runprocess.LogFileNotifier()
+        self.received = []
+        self.waiting = None
+
+    def tearDown(self):
+        self.tearDownBasedir()
+
+    def addLogfile(self, name, data):
+        self.received.append((name, data))
+        if self.waiting:
+            d, self.waiting = self.waiting, None
+            reactor.callLater(0, d.callback, None)
+
+    def waitForData(self):
+        self.waiting = defer.Deferred()
+        return self.waiting
+
+    def makeWatcher(self, name, filename):
+        lf = runprocess.LogFileWatcher(self, name,
+                                       os.path.join(self.basedir, filename))
+        lf.notifier = self.notifier
+        lf.NOTIFY_POLL_INTERVAL = 1000
+        return lf
+
+    @defer.inlineCallbacks
+    def test_appends(self):
+        path = os.path.join(self.basedir, 'test.log')
+        f = open(path, 'w')
+        lf = self.makeWatcher('test', 'test.log')
+        lf.start()
+        self.assertTrue(lf.watching)
+        self.assertEqual(lf.poller.interval, 1000)
+
+        f.write('hello\n')
+        f.flush()
+        yield self.waitForData()
+        f.write('world\n')
+        f.flush()
+        yield self.waitForData()
+        self.assertEqual(self.received, [('test', 'hello\n'),
+                                         ('test', 'world\n')])
+        f.close()
+        lf.stop()
+
+    @defer.inlineCallbacks
+    def test_new_file(self):
+        lf = self.makeWatcher('test', 'new.log')
+        lf.start()
+        d = self.waitForData()
+        open(os.path.join(self.basedir, 'new.log'), 'w').write('created\n')
+        yield d
+        self.assertEqual(self.received, [('test', 'created\n')])
+        lf.stop()
+
+    @defer.inlineCallbacks
+    def test_shared_directory(self):
+        one = self.makeWatcher('one', 'one.log')
+        two = self.makeWatcher('two', 'two.log')
+        one.start()
+        two.start()
+        self.assertEqual(self.notifier.directories.keys(),
+                         [os.path.abspath(self.basedir)])
+
+        d = self.waitForData()
+        open(os.path.join(self.basedir, 'two.log'), 'w').write('2\n')
+        yield d
+        self.assertEqual(self.received, [('two', '2\n')])
+
+        one.stop()
+        self.assertNotEqual(self.notifier.notifier, None)
+        two.stop()
+        self.assertEqual(self.notifier.directories, {})
+        self.assertEqual(self.notifier.notifier, None)
+
+    def test_missing_directory(self):
+        lf = self.makeWatcher('test', os.path.join('sub', 'test.log'))
+        lf.start()
+        # polls until the directory exists, then watches it
+        self.assertFalse(lf.watching)
+        self.assertEqual(lf.poller.interval, lf.POLL_INTERVAL)
+        self.assertEqual(self.notifier.notifier, None)
+        os.makedirs(os.path.join(self.basedir, 'sub'))
+        lf.poll()
+        self.assertTrue(lf.watching)
+        self.assertEqual(lf.poller.interval, 1000)
+        lf.stop()
+
+    @defer.inlineCallbacks
+    def test_failing_watcher(self):
+        bad = self.makeWatcher('bad', 'bad.log')
+        good = self.makeWatcher('good', 'good.log')
+
+        class FailingCommand:
+
+            def addLogfile(self, name, data):
+                raise RuntimeError('oops')
+        bad.command = FailingCommand()
+        bad.start()
+        good.start()
+
+        d = self.waitForData()
+        open(os.path.join(self.basedir, 'bad.log'), 'w').write('bad\n')
+        open(os.path.join(self.basedir, 'good.log'), 'w').write('good\n')
+        yield d
+        self.assertEqual(self.received, [('good', 'good\n')])
+        # the failing watcher is logged and removed
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertFalse(bad.watching)
+        self.assertEqual(bad.poller, None)
+        self.assertEqual(self.notifier.directories.values(),
+                         [{'good.log': [good]}])
+        good.stop()
+
+    @defer.inlineCallbacks
+    def test_directory_deleted(self):
+        subdir = os.path.join(self.basedir, 'sub')
+        os.makedirs(subdir)
+        lf = self.makeWatcher('test', os.path.join('sub', 'test.log'))
+        lf.start()
+        self.assertTrue(lf.watching)
+
+        d = defer.Deferred()
+        watchLost = lf.watchLost
+
+        def lost():
+            watchLost()
+            d.callback(None)
+        lf.watchLost = lost
+        os.rmdir(subdir)
+        yield d
+        self.assertFalse(lf.watching)
+        self.assertEqual(lf.poller.interval, lf.POLL_INTERVAL)
+        self.assertEqual(self.notifier.directories, {})
+
+        # the directory is watched again once it is re-created
+        os.makedirs(subdir)
+        lf.poll()
+        self.assertTrue(lf.watching)
+        self.assertEqual(self.notifier.directories.keys(),
+                         [os.path.abspath(subdir)])
+        d = self.waitForData()
+        open(os.path.join(subdir, 'test.log'), 'w').write('back\n')
+        yield d
+        self.assertEqual(self.received, [('test', 'back\n')])
+        lf.stop()